@@ -4,6 +4,8 @@ import os
 import shutil
 import base64
 import redis
+import threading
+import time
 
 from datetime import datetime
 from pathlib import Path
@@ -24,6 +26,7 @@ from open_webui.env import (
     REDIS_KEY_PREFIX,
     REDIS_SENTINEL_HOSTS,
     REDIS_SENTINEL_PORT,
+    REDIS_CONFIG_SYNC_INTERVAL,
     FRONTEND_BUILD_DIR,
     OFFLINE_MODE,
     OPEN_WEBUI_DIR,
@@ -222,10 +225,23 @@ class PersistentConfig(Generic[T]):
 
 
 class AppConfig:
+    """
+    The app's PersistentConfig values. Reads are dictionary lookups on this worker's
+    snapshot of them.
+
+    With Redis, a change is stored under `{prefix}:config:{key}`, a version counter
+    (`{prefix}:config:version`) is incremented and an invalidation message is published
+    on `{prefix}:config:invalidate`. Every worker's listener thread reloads the changed
+    keys; it reloads all of them when it finds it missed a version (every
+    REDIS_CONFIG_SYNC_INTERVAL seconds at the latest).
+    """
+
     _redis: Union[redis.Redis, redis.cluster.RedisCluster] = None
     _redis_key_prefix: str
 
     _state: dict[str, PersistentConfig]
+    # Last change of the config in Redis this worker's snapshot includes
+    _version: int = 0
 
     def __init__(
         self,
@@ -234,6 +250,8 @@ class AppConfig:
         redis_cluster: Optional[bool] = False,
         redis_key_prefix: str = "open-webui",
     ):
+        super().__setattr__("_state", {})
+
         if redis_url:
             super().__setattr__("_redis_key_prefix", redis_key_prefix)
             super().__setattr__(
@@ -245,42 +263,106 @@ class AppConfig:
                     decode_responses=True,
                 ),
             )
+            super().__setattr__("_version", self._get_version())
 
-        super().__setattr__("_state", {})
+            threading.Thread(
+                target=self._listen, name="config-listener", daemon=True
+            ).start()
 
     def __setattr__(self, key, value):
         if isinstance(value, PersistentConfig):
             self._state[key] = value
+
+            if self._redis:
+                # Changed by another worker before this one started
+                self._apply(key, self._redis.get(self._redis_key(key)))
         else:
             self._state[key].value = value
             self._state[key].save()
 
             if self._redis:
-                redis_key = f"{self._redis_key_prefix}:config:{key}"
-                self._redis.set(redis_key, json.dumps(self._state[key].value))
+                # Not the state's value, which a reload in between may have changed back
+                self._redis.set(self._redis_key(key), json.dumps(value))
+                version = self._redis.incr(self._redis_key("version"))
+                self._redis.publish(
+                    self._redis_key("invalidate"),
+                    json.dumps({"version": version, "keys": [key]}),
+                )
 
     def __getattr__(self, key):
         if key not in self._state:
             raise AttributeError(f"Config key '{key}' not found")
 
-        # If Redis is available, check for an updated value
-        if self._redis:
-            redis_key = f"{self._redis_key_prefix}:config:{key}"
-            redis_value = self._redis.get(redis_key)
+        return self._state[key].value
 
-            if redis_value is not None:
-                try:
-                    decoded_value = json.loads(redis_value)
+    def _redis_key(self, key: str) -> str:
+        return f"{self._redis_key_prefix}:config:{key}"
 
-                    # Update the in-memory value if different
-                    if self._state[key].value != decoded_value:
-                        self._state[key].value = decoded_value
-                        log.info(f"Updated {key} from Redis: {decoded_value}")
+    def _get_version(self) -> int:
+        return int(self._redis.get(self._redis_key("version")) or 0)
 
-                except json.JSONDecodeError:
-                    log.error(f"Invalid JSON format in Redis for {key}: {redis_value}")
+    def _apply(self, key: str, redis_value: Optional[str]):
+        if redis_value is None or key not in self._state:
+            return
 
-        return self._state[key].value
+        try:
+            decoded_value = json.loads(redis_value)
+
+            # Update the in-memory value if different
+            if self._state[key].value != decoded_value:
+                self._state[key].value = decoded_value
+                log.info(f"Updated {key} from Redis: {decoded_value}")
+
+        except json.JSONDecodeError:
+            log.error(f"Invalid JSON format in Redis for {key}: {redis_value}")
+
+    def _reload(self, keys: Optional[list[str]] = None, version: Optional[int] = None):
+        """
+        Reloads `keys` (all of them by default) from Redis, as of `version`.
+        """
+        if version is None:
+            # Read before the values, so a change in between is reloaded next time
+            version = self._get_version()
+        keys = list(self._state) if keys is None else keys
+
+        if keys:
+            values = self._redis.mget([self._redis_key(key) for key in keys])
+            for key, value in zip(keys, values):
+                self._apply(key, value)
+        super().__setattr__("_version", max(self._version, version))
+
+    def _listen(self):
+        channel = self._redis_key("invalidate")
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(channel)
+                # Anything changed before the subscription started
+                self._reload()
+
+                last_check = time.monotonic()
+                while True:
+                    message = pubsub.get_message(timeout=REDIS_CONFIG_SYNC_INTERVAL)
+                    if message is not None and message["type"] == "message":
+                        data = json.loads(message["data"])
+                        if data["version"] > self._version + 1:
+                            # Missed a change in between, reload everything
+                            self._reload()
+                        else:
+                            self._reload(data["keys"], data["version"])
+
+                    if time.monotonic() - last_check >= REDIS_CONFIG_SYNC_INTERVAL:
+                        last_check = time.monotonic()
+                        if self._get_version() > self._version:
+                            self._reload()
+            except Exception as e:
+                log.warning(f"Config invalidation listener failed, restarting: {e}")
+                time.sleep(1)
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
 
 
 ####################################
@@ -1999,6 +2081,13 @@ Ensure that the tools are effectively utilized to achieve the highest-quality an
 
 VECTOR_DB = os.environ.get("VECTOR_DB", "chroma")
 
+# BM25 index for hybrid search, kept next to the vector DB and updated on every write
+ENABLE_BM25_INDEX = os.environ.get("ENABLE_BM25_INDEX", "True").lower() == "true"
+BM25_INDEX_PATH = os.environ.get("BM25_INDEX_PATH", f"{DATA_DIR}/bm25_index")
+BM25_INDEX_MMAP_SIZE = int(
+    os.environ.get("BM25_INDEX_MMAP_SIZE", str(256 * 1024 * 1024))
+)
+
 # Chroma
 CHROMA_DATA_PATH = f"{DATA_DIR}/vector_db"
 
@@ -2612,6 +2701,34 @@ RAG_EMBEDDING_PREFIX_FIELD_NAME = os.environ.get(
     "RAG_EMBEDDING_PREFIX_FIELD_NAME", None
 )
 
+# Cross-encoder scores kept by (query, chunk id), so repeated queries skip the reranker
+RAG_RERANK_SCORE_CACHE_SIZE = int(
+    os.environ.get("RAG_RERANK_SCORE_CACHE_SIZE", "10000")
+)
+
+# Embeddings kept by (engine, model, prefix, text hash), so unchanged chunks and
+# repeated queries skip the embedding model
+ENABLE_RAG_EMBEDDING_CACHE = (
+    os.environ.get("ENABLE_RAG_EMBEDDING_CACHE", "True").lower() == "true"
+)
+RAG_EMBEDDING_CACHE_DIR = os.environ.get(
+    "RAG_EMBEDDING_CACHE_DIR", f"{CACHE_DIR}/embeddings"
+)
+RAG_EMBEDDING_CACHE_MEMORY_SIZE_MB = int(
+    os.environ.get("RAG_EMBEDDING_CACHE_MEMORY_SIZE_MB", "64")
+)
+RAG_EMBEDDING_CACHE_DISK_SIZE_MB = int(
+    os.environ.get("RAG_EMBEDDING_CACHE_DISK_SIZE_MB", "1024")
+)
+
+# Batches sent to the embedding API at once, and how many requests per minute it
+# takes from all workers together (0 for no limit)
+RAG_EMBEDDING_CONCURRENCY = int(os.environ.get("RAG_EMBEDDING_CONCURRENCY", "4"))
+RAG_EMBEDDING_REQUESTS_PER_MINUTE = int(
+    os.environ.get("RAG_EMBEDDING_REQUESTS_PER_MINUTE", "0")
+)
+RAG_EMBEDDING_MAX_RETRIES = int(os.environ.get("RAG_EMBEDDING_MAX_RETRIES", "5"))
+
 RAG_RERANKING_ENGINE = PersistentConfig(
     "RAG_RERANKING_ENGINE",
     "rag.reranking_engine",
@@ -3401,6 +3518,21 @@ WHISPER_VAD_FILTER = PersistentConfig(
 
 WHISPER_LANGUAGE = os.getenv("WHISPER_LANGUAGE", "").lower() or None
 
+# Audio over the STT file size limit is transcribed in chunks of this many seconds
+# at most (cut in silences where possible), this many at a time
+AUDIO_STT_CHUNK_DURATION = int(os.environ.get("AUDIO_STT_CHUNK_DURATION", "600"))
+AUDIO_STT_CHUNK_CONCURRENCY = int(os.environ.get("AUDIO_STT_CHUNK_CONCURRENCY", "4"))
+# How long each ffmpeg pass over such audio may take, in seconds
+AUDIO_STT_FFMPEG_TIMEOUT = int(os.environ.get("AUDIO_STT_FFMPEG_TIMEOUT", "3600"))
+
+# Local (faster-whisper) transcription: how many run at once (0 for one per two CPU
+# cores, up to 4), how many short utterances are transcribed together and how long
+# to wait for them (ms), and whether silence is trimmed with the VAD beforehand
+WHISPER_WORKERS = int(os.environ.get("WHISPER_WORKERS", "0"))
+WHISPER_BATCH_SIZE = int(os.environ.get("WHISPER_BATCH_SIZE", "8"))
+WHISPER_BATCH_WAIT_MS = int(os.environ.get("WHISPER_BATCH_WAIT_MS", "50"))
+WHISPER_VAD_TRIM = os.environ.get("WHISPER_VAD_TRIM", "True").lower() == "true"
+
 # Add Deepgram configuration
 DEEPGRAM_API_KEY = PersistentConfig(
     "DEEPGRAM_API_KEY",
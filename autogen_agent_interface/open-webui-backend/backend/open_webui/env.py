@@ -359,6 +359,39 @@ if DATABASE_USER_ACTIVE_STATUS_UPDATE_INTERVAL is not None:
     except Exception:
         DATABASE_USER_ACTIVE_STATUS_UPDATE_INTERVAL = 0.0
 
+# Seconds between batched writes of the users' last active times
+DATABASE_USER_ACTIVE_STATUS_FLUSH_INTERVAL = os.environ.get(
+    "DATABASE_USER_ACTIVE_STATUS_FLUSH_INTERVAL", "5"
+)
+try:
+    DATABASE_USER_ACTIVE_STATUS_FLUSH_INTERVAL = float(
+        DATABASE_USER_ACTIVE_STATUS_FLUSH_INTERVAL
+    )
+except ValueError:
+    DATABASE_USER_ACTIVE_STATUS_FLUSH_INTERVAL = 5.0
+
+# Seconds a user verified by a token is served without reading the database again
+# (0 to turn off), and how many token/user pairs are kept
+USER_CACHE_TTL = os.environ.get("USER_CACHE_TTL", "60")
+try:
+    USER_CACHE_TTL = float(USER_CACHE_TTL)
+except ValueError:
+    USER_CACHE_TTL = 60.0
+
+USER_CACHE_MAX_SIZE = os.environ.get("USER_CACHE_MAX_SIZE", "10000")
+try:
+    USER_CACHE_MAX_SIZE = int(USER_CACHE_MAX_SIZE)
+except ValueError:
+    USER_CACHE_MAX_SIZE = 10000
+
+# Seconds a user's group ids are reused by access checks on lists of resources
+# (0 to turn off); group changes can take this long to apply
+USER_GROUP_IDS_CACHE_TTL = os.environ.get("USER_GROUP_IDS_CACHE_TTL", "5")
+try:
+    USER_GROUP_IDS_CACHE_TTL = float(USER_GROUP_IDS_CACHE_TTL)
+except ValueError:
+    USER_GROUP_IDS_CACHE_TTL = 5.0
+
 RESET_CONFIG_ON_START = (
     os.environ.get("RESET_CONFIG_ON_START", "False").lower() == "true"
 )
@@ -367,6 +400,21 @@ ENABLE_REALTIME_CHAT_SAVE = (
     os.environ.get("ENABLE_REALTIME_CHAT_SAVE", "False").lower() == "true"
 )
 
+# Realtime saves go through a background writer: the last delta of a message is
+# saved within REALTIME_CHAT_SAVE_INTERVAL_MS, with up to CHAT_SAVE_MAX_BATCH
+# chats written per transaction
+try:
+    REALTIME_CHAT_SAVE_INTERVAL_MS = int(
+        os.environ.get("REALTIME_CHAT_SAVE_INTERVAL_MS", "250")
+    )
+except ValueError:
+    REALTIME_CHAT_SAVE_INTERVAL_MS = 250
+
+try:
+    CHAT_SAVE_MAX_BATCH = int(os.environ.get("CHAT_SAVE_MAX_BATCH", "100"))
+except ValueError:
+    CHAT_SAVE_MAX_BATCH = 100
+
 ENABLE_QUERIES_CACHE = os.environ.get("ENABLE_QUERIES_CACHE", "False").lower() == "true"
 
 ####################################
@@ -390,6 +438,14 @@ try:
 except ValueError:
     REDIS_SENTINEL_MAX_RETRY_COUNT = 2
 
+# Seconds between checks that this worker's config snapshot is current, in case
+# an invalidation message was missed
+REDIS_CONFIG_SYNC_INTERVAL = os.environ.get("REDIS_CONFIG_SYNC_INTERVAL", "5")
+try:
+    REDIS_CONFIG_SYNC_INTERVAL = float(REDIS_CONFIG_SYNC_INTERVAL)
+except ValueError:
+    REDIS_CONFIG_SYNC_INTERVAL = 5.0
+
 ####################################
 # UVICORN WORKERS
 ####################################
@@ -569,6 +625,30 @@ else:
         CHAT_RESPONSE_MAX_TOOL_CALL_RETRIES = 30
 
 
+# Message updates from event emitters are merged in memory, and written at most
+# every CHAT_MESSAGE_WRITE_INTERVAL seconds (or once enough of them piled up)
+try:
+    CHAT_MESSAGE_WRITE_INTERVAL = float(
+        os.environ.get("CHAT_MESSAGE_WRITE_INTERVAL", "1")
+    )
+except ValueError:
+    CHAT_MESSAGE_WRITE_INTERVAL = 1.0
+
+try:
+    CHAT_MESSAGE_WRITE_MAX_EVENTS = int(
+        os.environ.get("CHAT_MESSAGE_WRITE_MAX_EVENTS", "50")
+    )
+except ValueError:
+    CHAT_MESSAGE_WRITE_MAX_EVENTS = 50
+
+try:
+    CHAT_MESSAGE_WRITE_MAX_BYTES = int(
+        os.environ.get("CHAT_MESSAGE_WRITE_MAX_BYTES", str(64 * 1024))
+    )
+except ValueError:
+    CHAT_MESSAGE_WRITE_MAX_BYTES = 64 * 1024
+
+
 ####################################
 # WEBSOCKET SUPPORT
 ####################################
@@ -595,6 +675,19 @@ except ValueError:
 WEBSOCKET_SENTINEL_HOSTS = os.environ.get("WEBSOCKET_SENTINEL_HOSTS", "")
 WEBSOCKET_SENTINEL_PORT = os.environ.get("WEBSOCKET_SENTINEL_PORT", "26379")
 
+# Seconds the session and user pools are read from a local copy, 0 to always read Redis
+try:
+    WEBSOCKET_POOL_CACHE_TTL = float(os.environ.get("WEBSOCKET_POOL_CACHE_TTL", "2"))
+except ValueError:
+    WEBSOCKET_POOL_CACHE_TTL = 2.0
+
+# Collaborative documents keep their Yjs updates as one snapshot plus the updates
+# since, merged into the snapshot once there are more than this many
+try:
+    YDOC_COMPACTION_THRESHOLD = int(os.environ.get("YDOC_COMPACTION_THRESHOLD", "500"))
+except ValueError:
+    YDOC_COMPACTION_THRESHOLD = 500
+
 
 AIOHTTP_CLIENT_TIMEOUT = os.environ.get("AIOHTTP_CLIENT_TIMEOUT", "")
 
@@ -644,6 +737,30 @@ AIOHTTP_CLIENT_SESSION_TOOL_SERVER_SSL = (
     os.environ.get("AIOHTTP_CLIENT_SESSION_TOOL_SERVER_SSL", "True").lower() == "true"
 )
 
+# A backend failing this many requests in a row is skipped for
+# OLLAMA_BACKEND_EJECTION_TIME seconds, twice as long each time it fails again
+try:
+    OLLAMA_BACKEND_MAX_FAILURES = int(
+        os.environ.get("OLLAMA_BACKEND_MAX_FAILURES", "3")
+    )
+except ValueError:
+    OLLAMA_BACKEND_MAX_FAILURES = 3
+
+try:
+    OLLAMA_BACKEND_EJECTION_TIME = int(
+        os.environ.get("OLLAMA_BACKEND_EJECTION_TIME", "10")
+    )
+except ValueError:
+    OLLAMA_BACKEND_EJECTION_TIME = 10
+
+# Most connections open at once to each Ollama host (0 means no limit)
+try:
+    OLLAMA_BACKEND_CONNECTION_LIMIT = int(
+        os.environ.get("OLLAMA_BACKEND_CONNECTION_LIMIT", "0")
+    )
+except ValueError:
+    OLLAMA_BACKEND_CONNECTION_LIMIT = 0
+
 
 ####################################
 # SENTENCE TRANSFORMERS
@@ -800,6 +917,37 @@ OTEL_LOGS_OTLP_SPAN_EXPORTER = os.environ.get(
     "OTEL_LOGS_OTLP_SPAN_EXPORTER", OTEL_OTLP_SPAN_EXPORTER
 ).lower()  # grpc or http
 
+####################################
+# CODE INTERPRETER (JUPYTER KERNEL POOL)
+####################################
+
+# Kernels kept started on the Jupyter server, 0 to start a new kernel for every execution
+try:
+    JUPYTER_KERNEL_POOL_SIZE = int(os.environ.get("JUPYTER_KERNEL_POOL_SIZE", "4"))
+except ValueError:
+    JUPYTER_KERNEL_POOL_SIZE = 4
+
+# Started ahead of time, so an execution doesn't wait for a kernel to start
+try:
+    JUPYTER_KERNEL_POOL_WARM = int(os.environ.get("JUPYTER_KERNEL_POOL_WARM", "1"))
+except ValueError:
+    JUPYTER_KERNEL_POOL_WARM = 1
+
+# Seconds a chat keeps its kernel, and its variables, between executions
+try:
+    JUPYTER_KERNEL_IDLE_TTL = int(os.environ.get("JUPYTER_KERNEL_IDLE_TTL", "600"))
+except ValueError:
+    JUPYTER_KERNEL_IDLE_TTL = 600
+
+# Kernels using more memory than this after an execution are restarted, 0 to never check
+try:
+    JUPYTER_KERNEL_MEMORY_LIMIT_MB = int(
+        os.environ.get("JUPYTER_KERNEL_MEMORY_LIMIT_MB", "1024")
+    )
+except ValueError:
+    JUPYTER_KERNEL_MEMORY_LIMIT_MB = 1024
+
+
 ####################################
 # TOOLS/FUNCTIONS PIP OPTIONS
 ####################################
@@ -66,7 +66,10 @@ from open_webui.socket.main import (
     get_event_emitter,
     get_models_in_use,
     get_active_user_ids,
+    MESSAGE_WRITE_BUFFER,
 )
+from open_webui.utils.chat_writer import CHAT_WRITER
+from open_webui.utils.code_interpreter import close_kernel_pools
 from open_webui.routers import (
     audio,
     images,
@@ -106,7 +109,7 @@ from open_webui.internal.db import Session, engine
 
 from open_webui.models.functions import Functions
 from open_webui.models.models import Models
-from open_webui.models.users import UserModel, Users
+from open_webui.models.users import LAST_ACTIVE_BUFFER, UserModel, Users
 from open_webui.models.chats import Chats
 
 from open_webui.config import (
@@ -621,6 +624,23 @@ async def lifespan(app: FastAPI):
 
     yield
 
+    # Write chat message updates still waiting in the buffer, then the realtime saves
+    await MESSAGE_WRITE_BUFFER.flush_all()
+    await asyncio.to_thread(CHAT_WRITER.stop)
+
+    # Save the last active times still waiting to be written
+    await asyncio.to_thread(LAST_ACTIVE_BUFFER.stop)
+
+    # Stop the local transcription workers
+    if app.state.whisper_service is not None:
+        await asyncio.to_thread(app.state.whisper_service.stop)
+
+    # Shut down the code interpreter's Jupyter kernels
+    await close_kernel_pools()
+
+    # Close the keep-alive connections to the Ollama servers
+    await ollama.OLLAMA_BACKENDS.close()
+
     if hasattr(app.state, "redis_task_command_listener"):
         app.state.redis_task_command_listener.cancel()
 
@@ -1164,6 +1184,7 @@ app.state.config.TTS_AZURE_SPEECH_OUTPUT_FORMAT = AUDIO_TTS_AZURE_SPEECH_OUTPUT_
 
 
 app.state.faster_whisper_model = None
+app.state.whisper_service = None
 app.state.speech_synthesiser = None
 app.state.speech_speaker_embeddings_dataset = None
 
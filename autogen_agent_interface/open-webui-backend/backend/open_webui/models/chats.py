@@ -2,7 +2,7 @@ import logging
 import json
 import time
 import uuid
-from typing import Optional
+from typing import Callable, Optional
 
 from open_webui.internal.db import Base, get_db
 from open_webui.models.tags import TagModel, Tag, Tags
@@ -14,6 +14,7 @@ from sqlalchemy import BigInteger, Boolean, Column, String, Text, JSON, Index
 from sqlalchemy import or_, func, select, and_, text
 from sqlalchemy.sql import exists
 from sqlalchemy.sql.expression import bindparam
+from sqlalchemy.orm.attributes import flag_modified
 
 ####################
 # Chat DB Schema
@@ -279,6 +280,58 @@ class ChatTable:
         chat["history"] = history
         return self.update_chat_by_id(id, chat)
 
+    def update_messages_by_id(
+        self, id: str, update: Callable[[dict], bool]
+    ) -> Optional[ChatModel]:
+        """
+        Reads the chat once, lets `update` change its history in place,
+        and writes it back if `update` returned True.
+        """
+        chat = self.get_chat_by_id(id)
+        if chat is None:
+            return None
+
+        chat = chat.chat
+        history = chat.get("history", {})
+        history.setdefault("messages", {})
+
+        if not update(history):
+            return None
+
+        chat["history"] = history
+        return self.update_chat_by_id(id, chat)
+
+    def update_messages_by_ids(
+        self, updates: dict[str, Callable[[dict], bool]]
+    ) -> list[str]:
+        """
+        Like update_messages_by_id for many chats, written in one transaction.
+        Returns the ids of the chats that were written.
+        """
+        with get_db() as db:
+            chat_items = db.query(Chat).filter(Chat.id.in_(list(updates))).all()
+
+            updated_at = int(time.time())
+            written = []
+            for chat_item in chat_items:
+                chat = chat_item.chat
+                history = chat.get("history", {})
+                history.setdefault("messages", {})
+
+                if not updates[chat_item.id](history):
+                    continue
+
+                chat["history"] = history
+                chat_item.chat = chat
+                # Changed in place, the JSON column wouldn't notice
+                flag_modified(chat_item, "chat")
+                chat_item.title = chat["title"] if "title" in chat else "New Chat"
+                chat_item.updated_at = updated_at
+                written.append(chat_item.id)
+
+            db.commit()
+            return written
+
     def add_message_status_to_chat_by_id_and_message_id(
         self, id: str, message_id: str, status: dict
     ) -> Optional[ChatModel]:
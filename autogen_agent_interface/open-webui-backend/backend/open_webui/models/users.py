@@ -4,15 +4,27 @@ from typing import Optional
 from open_webui.internal.db import Base, JSONField, get_db
 
 
-from open_webui.env import DATABASE_USER_ACTIVE_STATUS_UPDATE_INTERVAL
+from open_webui.env import (
+    DATABASE_USER_ACTIVE_STATUS_UPDATE_INTERVAL,
+    DATABASE_USER_ACTIVE_STATUS_FLUSH_INTERVAL,
+    USER_CACHE_TTL,
+    USER_CACHE_MAX_SIZE,
+    REDIS_URL,
+    REDIS_SENTINEL_HOSTS,
+    REDIS_SENTINEL_PORT,
+    REDIS_CLUSTER,
+    REDIS_KEY_PREFIX,
+)
 from open_webui.models.chats import Chats
 from open_webui.models.groups import Groups
 from open_webui.utils.misc import throttle
+from open_webui.utils.redis import get_redis_connection, get_sentinels_from_env
+from open_webui.utils.user_cache import LastActiveBuffer, UserCache
 
 
 from pydantic import BaseModel, ConfigDict
 from sqlalchemy import BigInteger, Column, String, Text, Date
-from sqlalchemy import or_
+from sqlalchemy import case, or_
 
 import datetime
 
@@ -327,6 +339,7 @@ class UsersTable:
             with get_db() as db:
                 db.query(User).filter_by(id=id).update({"role": role})
                 db.commit()
+                USER_CACHE.invalidate(id)
                 user = db.query(User).filter_by(id=id).first()
                 return UserModel.model_validate(user)
         except Exception:
@@ -341,6 +354,7 @@ class UsersTable:
                     {"profile_image_url": profile_image_url}
                 )
                 db.commit()
+                USER_CACHE.invalidate(id)
 
                 user = db.query(User).filter_by(id=id).first()
                 return UserModel.model_validate(user)
@@ -361,6 +375,17 @@ class UsersTable:
         except Exception:
             return None
 
+    def update_users_last_active_by_ids(self, last_active: dict[str, int]):
+        """
+        Sets the last active times of many users, {user_id: timestamp}, in one statement.
+        """
+        with get_db() as db:
+            db.query(User).filter(User.id.in_(last_active)).update(
+                {User.last_active_at: case(last_active, value=User.id)},
+                synchronize_session=False,
+            )
+            db.commit()
+
     def update_user_oauth_sub_by_id(
         self, id: str, oauth_sub: str
     ) -> Optional[UserModel]:
@@ -368,6 +393,7 @@ class UsersTable:
             with get_db() as db:
                 db.query(User).filter_by(id=id).update({"oauth_sub": oauth_sub})
                 db.commit()
+                USER_CACHE.invalidate(id)
 
                 user = db.query(User).filter_by(id=id).first()
                 return UserModel.model_validate(user)
@@ -379,6 +405,7 @@ class UsersTable:
             with get_db() as db:
                 db.query(User).filter_by(id=id).update(updated)
                 db.commit()
+                USER_CACHE.invalidate(id)
 
                 user = db.query(User).filter_by(id=id).first()
                 return UserModel.model_validate(user)
@@ -399,6 +426,7 @@ class UsersTable:
 
                 db.query(User).filter_by(id=id).update({"settings": user_settings})
                 db.commit()
+                USER_CACHE.invalidate(id)
 
                 user = db.query(User).filter_by(id=id).first()
                 return UserModel.model_validate(user)
@@ -417,6 +445,7 @@ class UsersTable:
                     # Delete User
                     db.query(User).filter_by(id=id).delete()
                     db.commit()
+                USER_CACHE.invalidate(id)
 
                 return True
             else:
@@ -429,6 +458,7 @@ class UsersTable:
             with get_db() as db:
                 result = db.query(User).filter_by(id=id).update({"api_key": api_key})
                 db.commit()
+                USER_CACHE.invalidate(id)
                 return True if result == 1 else False
         except Exception:
             return False
@@ -456,3 +486,28 @@ class UsersTable:
 
 
 Users = UsersTable()
+
+# Users verified by a token (see utils.auth.get_current_user), dropped by the
+# methods above whenever a user changes, on every worker
+USER_CACHE = UserCache(
+    ttl=USER_CACHE_TTL,
+    maxsize=USER_CACHE_MAX_SIZE,
+    redis=(
+        get_redis_connection(
+            redis_url=REDIS_URL,
+            redis_sentinels=get_sentinels_from_env(
+                REDIS_SENTINEL_HOSTS, REDIS_SENTINEL_PORT
+            ),
+            redis_cluster=REDIS_CLUSTER,
+            decode_responses=True,
+        )
+        if REDIS_URL and USER_CACHE_TTL > 0
+        else None
+    ),
+    redis_key_prefix=REDIS_KEY_PREFIX,
+)
+
+LAST_ACTIVE_BUFFER = LastActiveBuffer(
+    Users.update_users_last_active_by_ids,
+    interval=DATABASE_USER_ACTIVE_STATUS_FLUSH_INTERVAL,
+)
@@ -0,0 +1,269 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+from open_webui.env import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["RAG"])
+
+# Rows per SQL statement, under SQLite's bound parameter limit
+SQL_BATCH_SIZE = 500
+
+
+def get_embedding_key(engine: str, model: str, prefix: Optional[str], text: str) -> str:
+    text_hash = hashlib.sha256(text.encode()).hexdigest()
+    return hashlib.sha256(
+        "\0".join([engine, model, prefix or "", text_hash]).encode()
+    ).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embeddings by (engine, model, prefix, sha256 of the text), shared by every request.
+
+    - An LRU in memory, up to `memory_size` bytes of vectors, in front of a SQLite
+      file at `path` (None to keep them in memory only), up to `disk_size` bytes.
+      The file outlives restarts and is shared by the app's workers.
+    - When the file grows over `disk_size`, the least recently read or written
+      entries are dropped until it's back under 90% of it.
+    - Vectors are kept as float32, which is what the vector databases store anyway.
+    """
+
+    def __init__(self, path: Optional[str], memory_size: int, disk_size: int):
+        self.path = path
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+
+        # key -> float32 vector bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+
+        self.connection = None
+        self.disk_bytes = 0
+
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+        if path:
+            try:
+                self._open(path)
+            except Exception as e:
+                log.warning(f"Embedding cache at {path} unavailable, memory only: {e}")
+                self.connection = None
+
+    def _open(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.connection = sqlite3.connect(
+            os.path.join(path, "embeddings.db"),
+            check_same_thread=False,
+            timeout=10,
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, embedding BLOB NOT NULL, "
+            "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed)"
+        )
+        self.connection.commit()
+        self.disk_bytes = self._disk_usage()
+
+    def _disk_usage(self) -> int:
+        (size,) = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()
+        return size
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.memory_size:
+            return
+        if key in self.memory:
+            self.memory_bytes -= len(self.memory[key])
+        self.memory[key] = data
+        self.memory.move_to_end(key)
+        self.memory_bytes += len(data)
+
+        while self.memory_bytes > self.memory_size:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+            self.stats["memory_evictions"] += 1
+
+    def get_many(self, keys: list[str]) -> list[Optional[list[float]]]:
+        found = {}
+        with self.lock:
+            for key in keys:
+                data = self.memory.get(key)
+                if data is not None:
+                    self.memory.move_to_end(key)
+                    found[key] = data
+            self.stats["memory_hits"] += len(found)
+
+            missing = [key for key in dict.fromkeys(keys) if key not in found]
+            if missing and self.connection is not None:
+                try:
+                    from_disk = self._read(missing)
+                except sqlite3.Error as e:
+                    log.warning(f"Embedding cache read failed: {e}")
+                    from_disk = {}
+                for key, data in from_disk.items():
+                    self._remember(key, data)
+                found.update(from_disk)
+                self.stats["disk_hits"] += len(from_disk)
+            self.stats["misses"] += sum(1 for key in missing if key not in found)
+
+        return [
+            (
+                np.frombuffer(found[key], dtype=np.float32).tolist()
+                if key in found
+                else None
+            )
+            for key in keys
+        ]
+
+    def _read(self, keys: list[str]) -> dict[str, bytes]:
+        rows = []
+        for offset in range(0, len(keys), SQL_BATCH_SIZE):
+            batch = keys[offset : offset + SQL_BATCH_SIZE]
+            rows.extend(
+                self.connection.execute(
+                    f"SELECT key, embedding FROM embeddings "
+                    f"WHERE key IN ({', '.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+            )
+
+        if rows:
+            # Keeps entries in use from being evicted
+            now = time.time()
+            self.connection.executemany(
+                "UPDATE embeddings SET accessed = ? WHERE key = ?",
+                [(now, key) for key, _ in rows],
+            )
+            self.connection.commit()
+        return dict(rows)
+
+    def put_many(self, items: dict[str, list[float]]):
+        entries = {
+            key: np.asarray(embedding, dtype=np.float32).tobytes()
+            for key, embedding in items.items()
+        }
+
+        with self.lock:
+            for key, data in entries.items():
+                self._remember(key, data)
+            self.stats["writes"] += len(entries)
+
+            if self.connection is not None:
+                try:
+                    self._write(entries)
+                except sqlite3.Error as e:
+                    log.warning(f"Embedding cache write failed: {e}")
+
+    def _write(self, entries: dict[str, bytes]):
+        now = time.time()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, embedding, size, accessed) "
+            "VALUES (?, ?, ?, ?)",
+            [(key, data, len(data), now) for key, data in entries.items()],
+        )
+        self.connection.commit()
+        self.disk_bytes += sum(len(data) for data in entries.values())
+
+        if self.disk_bytes > self.disk_size:
+            # Other workers write to the same file, and replaced entries were counted twice
+            self.disk_bytes = self._disk_usage()
+            if self.disk_bytes > self.disk_size:
+                self._evict(self.disk_bytes - int(self.disk_size * 0.9))
+
+    def _evict(self, size: int):
+        keys = []
+        freed = 0
+        for key, entry_size in self.connection.execute(
+            "SELECT key, size FROM embeddings ORDER BY accessed"
+        ):
+            keys.append(key)
+            freed += entry_size
+            if freed >= size:
+                break
+
+        for offset in range(0, len(keys), SQL_BATCH_SIZE):
+            batch = keys[offset : offset + SQL_BATCH_SIZE]
+            self.connection.execute(
+                f"DELETE FROM embeddings WHERE key IN ({', '.join('?' * len(batch))})",
+                batch,
+            )
+        self.connection.commit()
+
+        self.disk_bytes -= freed
+        self.stats["disk_evictions"] += len(keys)
+        log.info(f"Embedding cache evicted {len(keys)} entries ({freed} bytes)")
+
+    def get_or_embed(
+        self,
+        engine: str,
+        model: str,
+        prefix: Optional[str],
+        texts: list[str],
+        embed: Callable[[list[str]], Optional[list]],
+    ) -> Optional[list]:
+        """
+        The embeddings of `texts`, calling `embed` only with the ones not cached yet.
+        """
+        keys = [get_embedding_key(engine, model, prefix, text) for text in texts]
+        embeddings = self.get_many(keys)
+
+        # Each text missing is embedded once, however many times it's repeated
+        missing = {}
+        for key, text, embedding in zip(keys, texts, embeddings):
+            if embedding is None:
+                missing.setdefault(key, text)
+        if not missing:
+            return embeddings
+
+        new_embeddings = embed(list(missing.values()))
+        if not isinstance(new_embeddings, list) or len(new_embeddings) != len(missing):
+            log.warning(
+                f"Expected {len(missing)} embeddings, got "
+                f"{len(new_embeddings) if isinstance(new_embeddings, list) else new_embeddings}"
+            )
+            # Nothing to line up with the texts, as the caller would have gotten without the cache
+            return new_embeddings if len(missing) == len(texts) else None
+
+        new_embeddings = dict(zip(missing, new_embeddings))
+        self.put_many(new_embeddings)
+        return [
+            embedding if embedding is not None else new_embeddings[key]
+            for key, embedding in zip(keys, embeddings)
+        ]
+
+    def metrics(self) -> dict:
+        with self.lock:
+            metrics = dict(self.stats)
+            metrics["memory_entries"] = len(self.memory)
+            metrics["memory_bytes"] = self.memory_bytes
+            metrics["disk_bytes"] = self.disk_bytes if self.connection else 0
+        lookups = metrics["memory_hits"] + metrics["disk_hits"] + metrics["misses"]
+        metrics["hit_rate"] = (
+            (metrics["memory_hits"] + metrics["disk_hits"]) / lookups
+            if lookups
+            else 0.0
+        )
+        return metrics
@@ -0,0 +1,336 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+import requests
+
+from open_webui.env import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["RAG"])
+
+
+class EmbeddingRequestError(Exception):
+    """
+    A batch the embedding backend didn't embed. `status` is None when it couldn't be reached.
+    `refused` when the batch itself was the problem (e.g. over the token limit),
+    so smaller batches may go through.
+    """
+
+    def __init__(
+        self,
+        message: str,
+        status: Optional[int] = None,
+        retry_after: Optional[float] = None,
+        retryable: Optional[bool] = None,
+        refused: Optional[bool] = None,
+    ):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.retryable = (
+            retryable
+            if retryable is not None
+            else status is None or status in (408, 429) or status >= 500
+        )
+        self.refused = refused if refused is not None else status in (400, 413, 422)
+
+
+def raise_for_embedding_status(r: requests.Response):
+    if r.ok:
+        return
+
+    retry_after = None
+    try:
+        retry_after = float(r.headers.get("Retry-After", ""))
+    except ValueError:
+        pass
+
+    raise EmbeddingRequestError(
+        f"{r.status_code} {r.reason}: {r.text[:200]}",
+        status=r.status_code,
+        retry_after=retry_after,
+    )
+
+
+def post_embedding_request(url: str, **kwargs) -> requests.Response:
+    try:
+        return requests.post(url, **kwargs)
+    except requests.RequestException as e:
+        raise EmbeddingRequestError(f"Embedding request to {url} failed: {e}")
+
+
+# Takes a token from the bucket in KEYS[1], refilled at ARGV[1] per second up to ARGV[2].
+# Returns how long to wait for one, 0 when it was taken.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated', 'paused_until')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+local paused_until = tonumber(state[3]) or 0
+if paused_until > now then
+    return tostring(paused_until - now)
+end
+
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+# Stops handing out tokens from the bucket in KEYS[1] for ARGV[1] seconds
+PAUSE_SCRIPT = """
+local time = redis.call('TIME')
+local paused_until = tonumber(time[1]) + tonumber(time[2]) / 1000000 + tonumber(ARGV[1])
+local current = tonumber(redis.call('HGET', KEYS[1], 'paused_until')) or 0
+if paused_until > current then
+    redis.call('HSET', KEYS[1], 'paused_until', tostring(paused_until))
+    redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[1])) + 60)
+end
+return 1
+"""
+
+
+class RateLimiter:
+    """
+    Token bucket of `requests_per_minute` requests to one embedding backend.
+
+    With `redis`, the bucket is shared by every worker; without (or if Redis fails),
+    by the threads of this process. A 429 `pause`s everyone for its Retry-After.
+    """
+
+    def __init__(self, requests_per_minute: float, redis=None, key: str = ""):
+        self.rate = requests_per_minute / 60
+        # Up to a second's worth of requests at once
+        self.capacity = max(1.0, self.rate)
+        self.redis = redis
+        self.key = key
+
+        self.lock = threading.Lock()
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _take_local(self) -> float:
+        with self.lock:
+            now = time.monotonic()
+            if self.paused_until > now:
+                return self.paused_until - now
+
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def _take(self) -> float:
+        if self.redis is not None:
+            try:
+                return float(
+                    self.redis.eval(
+                        TOKEN_BUCKET_SCRIPT, 1, self.key, self.rate, self.capacity
+                    )
+                )
+            except Exception as e:
+                log.warning(f"Shared embedding rate limit unavailable, local only: {e}")
+                self.redis = None
+        return self._take_local()
+
+    def acquire(self):
+        while True:
+            wait = self._take()
+            if wait <= 0:
+                return
+            time.sleep(min(wait, 1.0))
+
+    def pause(self, seconds: float):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        if self.redis is not None:
+            try:
+                self.redis.eval(PAUSE_SCRIPT, 1, self.key, seconds)
+            except Exception as e:
+                log.warning(f"Failed to share embedding rate limit pause: {e}")
+
+
+RATE_LIMITERS = {}
+RATE_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(
+    key: str, requests_per_minute: float, redis=None
+) -> Optional[RateLimiter]:
+    """
+    The rate limiter of a backend, shared by every pipeline sending to it.
+    """
+    if not requests_per_minute or requests_per_minute <= 0:
+        return None
+
+    with RATE_LIMITERS_LOCK:
+        limiter = RATE_LIMITERS.get(key)
+        if limiter is None or limiter.rate != requests_per_minute / 60:
+            limiter = RATE_LIMITERS[key] = RateLimiter(
+                requests_per_minute, redis=redis, key=key
+            )
+        return limiter
+
+
+class EmbeddingPipeline:
+    """
+    Embeds a list of texts in batches, `concurrency` requests at a time, in order.
+
+    - `embed(texts, embed_batch)`: `embed_batch(texts)` returns one embedding per text,
+      or raises EmbeddingRequestError.
+    - Retryable failures (connection errors, 408, 429, 5xx) are retried up to
+      `max_retries` times after an exponential backoff with full jitter, or the
+      backend's Retry-After. A 429 also pauses the `rate_limiter` for everyone.
+    - A batch the backend refuses as invalid (e.g. over its token limit) is split in
+      half until it goes through, and the following batches are made smaller.
+      The batch size grows back towards `batch_size` with each call nothing was refused in.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        concurrency: int = 1,
+        rate_limiter: Optional[RateLimiter] = None,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ):
+        self.max_batch_size = max(1, batch_size)
+        self.batch_size = self.max_batch_size
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def _embed(
+        self, texts: list[str], embed_batch: Callable, cancelled: threading.Event
+    ) -> list:
+        for attempt in range(self.max_retries + 1):
+            if cancelled.is_set():
+                raise EmbeddingRequestError("Cancelled", retryable=False)
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            try:
+                embeddings = embed_batch(texts)
+                if not isinstance(embeddings, list) or len(embeddings) != len(texts):
+                    raise EmbeddingRequestError(
+                        f"Expected {len(texts)} embeddings, got "
+                        f"{len(embeddings) if isinstance(embeddings, list) else embeddings}",
+                        retryable=False,
+                        refused=True,
+                    )
+                return embeddings
+            except EmbeddingRequestError as e:
+                if not e.retryable or attempt == self.max_retries:
+                    raise
+
+                if e.retry_after is not None:
+                    delay = e.retry_after * random.uniform(1, 1.2)
+                else:
+                    delay = random.uniform(
+                        0, min(self.max_backoff, self.backoff * 2**attempt)
+                    )
+                if e.status == 429 and self.rate_limiter is not None:
+                    self.rate_limiter.pause(delay)
+
+                log.warning(
+                    f"Embedding batch of {len(texts)} failed ({e}), "
+                    f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+                )
+                # Cut short once the whole embedding is given up on
+                cancelled.wait(delay)
+
+    def embed(
+        self, texts: list[str], embed_batch: Callable[[list[str]], list]
+    ) -> Optional[list]:
+        """
+        The embeddings of `texts`, in order, or None if a batch failed for good.
+        """
+        start = time.perf_counter()
+        results = [None] * len(texts)
+        # Spans of texts split off a refused batch, sent before the next new batch
+        retries = deque()
+        offset = 0
+        batches = 0
+        refused = False
+
+        # Not a `with`: giving up mustn't wait for workers sleeping through a backoff
+        executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="embedding"
+        )
+        cancelled = threading.Event()
+        try:
+            running = {}
+            while offset < len(texts) or retries or running:
+                while len(running) < self.concurrency and (
+                    retries or offset < len(texts)
+                ):
+                    if retries:
+                        span = retries.popleft()
+                    else:
+                        span = (offset, min(offset + self.batch_size, len(texts)))
+                        offset = span[1]
+                    future = executor.submit(
+                        self._embed, texts[span[0] : span[1]], embed_batch, cancelled
+                    )
+                    running[future] = span
+                    batches += 1
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    span_start, span_end = running.pop(future)
+                    size = span_end - span_start
+                    try:
+                        results[span_start:span_end] = future.result()
+                    except EmbeddingRequestError as e:
+                        # Only worth trying smaller batches if it was about the batch
+                        if e.retryable or not e.refused or size == 1:
+                            log.error(f"Failed to embed a batch of {size} texts: {e}")
+                            return None
+
+                        middle = span_start + size // 2
+                        retries.extendleft([(middle, span_end), (span_start, middle)])
+                        self.batch_size = max(1, min(self.batch_size, size // 2))
+                        refused = True
+                        log.warning(
+                            f"Embedding batch of {size} refused ({e}), "
+                            f"batch size now {self.batch_size}"
+                        )
+        finally:
+            # Workers still retrying stop at their next attempt
+            cancelled.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if not refused:
+            self.batch_size = min(
+                self.max_batch_size,
+                self.batch_size + max(1, self.max_batch_size // 8),
+            )
+
+        log.info(
+            f"Embedded {len(texts)} texts in {batches} batches in "
+            f"{(time.perf_counter() - start) * 1000:.0f}ms"
+        )
+        return results
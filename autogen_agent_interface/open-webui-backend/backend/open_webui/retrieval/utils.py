@@ -2,7 +2,6 @@ import logging
 import os
 from typing import Optional, Union
 
-import requests
 import hashlib
 from concurrent.futures import ThreadPoolExecutor
 import time
@@ -26,6 +25,7 @@ from open_webui.models.chats import Chats
 from open_webui.models.notes import Notes
 
 from open_webui.retrieval.vector.main import GetResult
+from open_webui.retrieval.vector.bm25 import BM25Index, BM25IndexedVectorDB
 from open_webui.utils.access_control import has_access
 from open_webui.utils.misc import get_message_list
 
@@ -37,16 +37,48 @@ from open_webui.env import (
     SRC_LOG_LEVELS,
     OFFLINE_MODE,
     ENABLE_FORWARD_USER_INFO_HEADERS,
+    REDIS_URL,
+    REDIS_SENTINEL_HOSTS,
+    REDIS_SENTINEL_PORT,
+    REDIS_CLUSTER,
+    REDIS_KEY_PREFIX,
 )
 from open_webui.config import (
     RAG_EMBEDDING_QUERY_PREFIX,
     RAG_EMBEDDING_CONTENT_PREFIX,
     RAG_EMBEDDING_PREFIX_FIELD_NAME,
+    RAG_RERANK_SCORE_CACHE_SIZE,
+    ENABLE_RAG_EMBEDDING_CACHE,
+    RAG_EMBEDDING_CACHE_DIR,
+    RAG_EMBEDDING_CACHE_MEMORY_SIZE_MB,
+    RAG_EMBEDDING_CACHE_DISK_SIZE_MB,
+    RAG_EMBEDDING_CONCURRENCY,
+    RAG_EMBEDDING_REQUESTS_PER_MINUTE,
+    RAG_EMBEDDING_MAX_RETRIES,
 )
+from open_webui.retrieval.embedding_cache import EmbeddingCache
+from open_webui.retrieval.embedding_pipeline import (
+    EmbeddingPipeline,
+    EmbeddingRequestError,
+    get_rate_limiter,
+    post_embedding_request,
+    raise_for_embedding_status,
+)
+from open_webui.utils.redis import get_redis_connection, get_sentinels_from_env
 
 log = logging.getLogger(__name__)
 log.setLevel(SRC_LOG_LEVELS["RAG"])
 
+EMBEDDING_CACHE = (
+    EmbeddingCache(
+        RAG_EMBEDDING_CACHE_DIR or None,
+        memory_size=RAG_EMBEDDING_CACHE_MEMORY_SIZE_MB * 1024 * 1024,
+        disk_size=RAG_EMBEDDING_CACHE_DISK_SIZE_MB * 1024 * 1024,
+    )
+    if ENABLE_RAG_EMBEDDING_CACHE
+    else None
+)
+
 
 from typing import Any
 
@@ -86,6 +118,8 @@ class VectorSearchRetriever(BaseRetriever):
     collection_name: Any
     embedding_function: Any
     top_k: int
+    # Filled with the stored vector of each result (by chunk id), for RerankCompressor
+    vectors: Optional[dict] = None
 
     def _get_relevant_documents(
         self,
@@ -103,10 +137,14 @@ class VectorSearchRetriever(BaseRetriever):
         metadatas = result.metadatas[0]
         documents = result.documents[0]
 
+        if self.vectors is not None and result.vectors:
+            self.vectors.update(zip(ids, result.vectors[0]))
+
         results = []
         for idx in range(len(ids)):
             results.append(
                 Document(
+                    id=ids[idx],
                     metadata=metadatas[idx],
                     page_content=documents[idx],
                 )
@@ -114,6 +152,32 @@ class VectorSearchRetriever(BaseRetriever):
         return results
 
 
+class BM25IndexRetriever(BaseRetriever):
+    index: Any
+    top_k: int
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun,
+    ) -> list[Document]:
+        return [
+            Document(id=id, metadata=metadata, page_content=text)
+            for _, id, text, metadata in self.index.search(query, self.top_k)
+        ]
+
+
+def get_bm25_source(collection_name: str) -> Union[BM25Index, GetResult, None]:
+    """
+    What hybrid search builds its BM25 retriever from: the collection's persistent
+    BM25 index when ENABLE_BM25_INDEX is on, else the whole collection.
+    """
+    if isinstance(VECTOR_DB_CLIENT, BM25IndexedVectorDB):
+        return VECTOR_DB_CLIENT.get_bm25_index(collection_name)
+    return VECTOR_DB_CLIENT.get(collection_name=collection_name)
+
+
 def query_doc(
     collection_name: str, query_embedding: list[float], k: int, user: UserModel = None
 ):
@@ -150,7 +214,7 @@ def get_doc(collection_name: str, user: UserModel = None):
 
 def query_doc_with_hybrid_search(
     collection_name: str,
-    collection_result: GetResult,
+    collection_result: Union[BM25Index, GetResult],
     query: str,
     embedding_function,
     k: int,
@@ -160,7 +224,11 @@ def query_doc_with_hybrid_search(
     hybrid_bm25_weight: float,
 ) -> dict:
     try:
-        if (
+        if isinstance(collection_result, BM25Index):
+            if collection_result.count() == 0:
+                log.warning(f"query_doc_with_hybrid_search:no_docs {collection_name}")
+                return {"documents": [], "metadatas": [], "distances": []}
+        elif (
             not collection_result
             or not hasattr(collection_result, "documents")
             or not collection_result.documents
@@ -172,16 +240,21 @@ def query_doc_with_hybrid_search(
 
         log.debug(f"query_doc_with_hybrid_search:doc {collection_name}")
 
-        bm25_retriever = BM25Retriever.from_texts(
-            texts=collection_result.documents[0],
-            metadatas=collection_result.metadatas[0],
-        )
-        bm25_retriever.k = k
+        if isinstance(collection_result, BM25Index):
+            bm25_retriever = BM25IndexRetriever(index=collection_result, top_k=k)
+        else:
+            bm25_retriever = BM25Retriever.from_texts(
+                texts=collection_result.documents[0],
+                metadatas=collection_result.metadatas[0],
+            )
+            bm25_retriever.k = k
 
+        stored_vectors = {}
         vector_search_retriever = VectorSearchRetriever(
             collection_name=collection_name,
             embedding_function=embedding_function,
             top_k=k,
+            vectors=stored_vectors,
         )
 
         if hybrid_bm25_weight <= 0:
@@ -203,6 +276,7 @@ def query_doc_with_hybrid_search(
             top_n=k_reranker,
             reranking_function=reranking_function,
             r_score=r,
+            vectors=stored_vectors,
         )
 
         compression_retriever = ContextualCompressionRetriever(
@@ -392,17 +466,15 @@ def query_collection_with_hybrid_search(
 ) -> dict:
     results = []
     error = False
-    # Fetch collection data once per collection sequentially
-    # Avoid fetching the same data multiple times later
+    # Get the BM25 source (persistent index, or the whole collection without one)
+    # once per collection, shared by every query
     collection_results = {}
     for collection_name in collection_names:
         try:
             log.debug(
-                f"query_collection_with_hybrid_search:VECTOR_DB_CLIENT.get:collection {collection_name}"
-            )
-            collection_results[collection_name] = VECTOR_DB_CLIENT.get(
-                collection_name=collection_name
+                f"query_collection_with_hybrid_search:get_bm25_source:collection {collection_name}"
             )
+            collection_results[collection_name] = get_bm25_source(collection_name)
         except Exception as e:
             log.exception(f"Failed to fetch collection {collection_name}: {e}")
             collection_results[collection_name] = None
@@ -456,6 +528,31 @@ def query_collection_with_hybrid_search(
     return merge_and_sort_query_results(results, k=k)
 
 
+def get_embedding_rate_limiter(embedding_engine, url):
+    if RAG_EMBEDDING_REQUESTS_PER_MINUTE <= 0:
+        return None
+
+    redis = None
+    if REDIS_URL:
+        try:
+            redis = get_redis_connection(
+                redis_url=REDIS_URL,
+                redis_sentinels=get_sentinels_from_env(
+                    REDIS_SENTINEL_HOSTS, REDIS_SENTINEL_PORT
+                ),
+                redis_cluster=REDIS_CLUSTER,
+                decode_responses=True,
+            )
+        except Exception as e:
+            log.warning(f"Embedding rate limit not shared between workers: {e}")
+
+    return get_rate_limiter(
+        f"{REDIS_KEY_PREFIX}:embedding:rate_limit:{embedding_engine}:{url}",
+        RAG_EMBEDDING_REQUESTS_PER_MINUTE,
+        redis=redis,
+    )
+
+
 def get_embedding_function(
     embedding_engine,
     embedding_model,
@@ -466,7 +563,7 @@ def get_embedding_function(
     azure_api_version=None,
 ):
     if embedding_engine == "":
-        return lambda query, prefix=None, user=None: embedding_function.encode(
+        embed_function = lambda query, prefix=None, user=None: embedding_function.encode(
             query, **({"prompt": prefix} if prefix else {})
         ).tolist()
     elif embedding_engine in ["ollama", "openai", "azure_openai"]:
@@ -481,30 +578,51 @@ def get_embedding_function(
             azure_api_version=azure_api_version,
         )
 
-        def generate_multiple(query, prefix, user, func):
-            if isinstance(query, list):
-                embeddings = []
-                for i in range(0, len(query), embedding_batch_size):
-                    batch_embeddings = func(
-                        query[i : i + embedding_batch_size],
-                        prefix=prefix,
-                        user=user,
-                    )
+        # Kept with the function, so the batch size it settles on carries over
+        pipeline = EmbeddingPipeline(
+            batch_size=embedding_batch_size,
+            concurrency=RAG_EMBEDDING_CONCURRENCY,
+            rate_limiter=get_embedding_rate_limiter(embedding_engine, url),
+            max_retries=RAG_EMBEDDING_MAX_RETRIES,
+        )
 
-                    if isinstance(batch_embeddings, list):
-                        embeddings.extend(batch_embeddings)
+        def generate_multiple(query, prefix, user, func):
+            embeddings = pipeline.embed(
+                query if isinstance(query, list) else [query],
+                lambda texts: func(texts, prefix=prefix, user=user),
+            )
+            if isinstance(query, list) or embeddings is None:
                 return embeddings
-            else:
-                return func(query, prefix, user)
+            return embeddings[0]
 
-        return lambda query, prefix=None, user=None: generate_multiple(
+        embed_function = lambda query, prefix=None, user=None: generate_multiple(
             query, prefix, user, func
         )
     else:
         raise ValueError(f"Unknown embedding engine: {embedding_engine}")
 
+    if EMBEDDING_CACHE is None:
+        return embed_function
+
+    def cached(query, prefix=None, user=None):
+        # Only the texts not embedded with this model and prefix before are sent
+        embeddings = EMBEDDING_CACHE.get_or_embed(
+            embedding_engine,
+            embedding_model,
+            prefix,
+            query if isinstance(query, list) else [query],
+            lambda texts: embed_function(texts, prefix=prefix, user=user),
+        )
+        if isinstance(query, list) or not isinstance(embeddings, list):
+            return embeddings
+        return embeddings[0]
+
+    return cached
+
 
 def get_reranking_function(reranking_engine, reranking_model, reranking_function):
+    # Scores of the previous reranker don't apply to this one
+    RERANK_SCORE_CACHE.clear()
     if reranking_function is None:
         return None
     if reranking_engine == "external":
@@ -852,7 +970,7 @@ def generate_openai_batch_embeddings(
         if isinstance(RAG_EMBEDDING_PREFIX_FIELD_NAME, str) and isinstance(prefix, str):
             json_data[RAG_EMBEDDING_PREFIX_FIELD_NAME] = prefix
 
-        r = requests.post(
+        r = post_embedding_request(
             f"{url}/embeddings",
             headers={
                 "Content-Type": "application/json",
@@ -870,12 +988,14 @@ def generate_openai_batch_embeddings(
             },
             json=json_data,
         )
-        r.raise_for_status()
+        raise_for_embedding_status(r)
         data = r.json()
         if "data" in data:
             return [elem["embedding"] for elem in data["data"]]
         else:
             raise "Something went wrong :/"
+    except EmbeddingRequestError:
+        raise
     except Exception as e:
         log.exception(f"Error generating openai batch embeddings: {e}")
         return None
@@ -900,36 +1020,33 @@ def generate_azure_openai_batch_embeddings(
 
         url = f"{url}/openai/deployments/{model}/embeddings?api-version={version}"
 
-        for _ in range(5):
-            r = requests.post(
-                url,
-                headers={
-                    "Content-Type": "application/json",
-                    "api-key": key,
-                    **(
-                        {
-                            "X-OpenWebUI-User-Name": quote(user.name, safe=" "),
-                            "X-OpenWebUI-User-Id": user.id,
-                            "X-OpenWebUI-User-Email": user.email,
-                            "X-OpenWebUI-User-Role": user.role,
-                        }
-                        if ENABLE_FORWARD_USER_INFO_HEADERS and user
-                        else {}
-                    ),
-                },
-                json=json_data,
-            )
-            if r.status_code == 429:
-                retry = float(r.headers.get("Retry-After", "1"))
-                time.sleep(retry)
-                continue
-            r.raise_for_status()
-            data = r.json()
-            if "data" in data:
-                return [elem["embedding"] for elem in data["data"]]
-            else:
-                raise Exception("Something went wrong :/")
-        return None
+        # Rate limits (429) are retried by the EmbeddingPipeline, after Retry-After
+        r = post_embedding_request(
+            url,
+            headers={
+                "Content-Type": "application/json",
+                "api-key": key,
+                **(
+                    {
+                        "X-OpenWebUI-User-Name": quote(user.name, safe=" "),
+                        "X-OpenWebUI-User-Id": user.id,
+                        "X-OpenWebUI-User-Email": user.email,
+                        "X-OpenWebUI-User-Role": user.role,
+                    }
+                    if ENABLE_FORWARD_USER_INFO_HEADERS and user
+                    else {}
+                ),
+            },
+            json=json_data,
+        )
+        raise_for_embedding_status(r)
+        data = r.json()
+        if "data" in data:
+            return [elem["embedding"] for elem in data["data"]]
+        else:
+            raise Exception("Something went wrong :/")
+    except EmbeddingRequestError:
+        raise
     except Exception as e:
         log.exception(f"Error generating azure openai batch embeddings: {e}")
         return None
@@ -951,7 +1068,7 @@ def generate_ollama_batch_embeddings(
         if isinstance(RAG_EMBEDDING_PREFIX_FIELD_NAME, str) and isinstance(prefix, str):
             json_data[RAG_EMBEDDING_PREFIX_FIELD_NAME] = prefix
 
-        r = requests.post(
+        r = post_embedding_request(
             f"{url}/api/embed",
             headers={
                 "Content-Type": "application/json",
@@ -969,13 +1086,15 @@ def generate_ollama_batch_embeddings(
             },
             json=json_data,
         )
-        r.raise_for_status()
+        raise_for_embedding_status(r)
         data = r.json()
 
         if "embeddings" in data:
             return data["embeddings"]
         else:
             raise "Something went wrong :/"
+    except EmbeddingRequestError:
+        raise
     except Exception as e:
         log.exception(f"Error generating ollama batch embeddings: {e}")
         return None
@@ -1030,51 +1149,132 @@ def generate_embeddings(
 
 
 import operator
+import threading
+from collections import OrderedDict
 from typing import Optional, Sequence
 
+import numpy as np
+
 from langchain_core.callbacks import Callbacks
 from langchain_core.documents import BaseDocumentCompressor, Document
 
 
+class RerankScoreCache:
+    """
+    LRU of reranker scores by (query, chunk id), shared by every request.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.scores = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[float]:
+        with self.lock:
+            score = self.scores.get(key)
+            if score is not None:
+                self.scores.move_to_end(key)
+            return score
+
+    def put(self, key: tuple, score: float):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.scores[key] = score
+            self.scores.move_to_end(key)
+            while len(self.scores) > self.maxsize:
+                self.scores.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.scores.clear()
+
+
+RERANK_SCORE_CACHE = RerankScoreCache(RAG_RERANK_SCORE_CACHE_SIZE)
+
+
+def get_chunk_id(doc: Document) -> str:
+    # Documents from the vector DB or the BM25 index carry their chunk id
+    return doc.id or hashlib.sha256(doc.page_content.encode()).hexdigest()
+
+
 class RerankCompressor(BaseDocumentCompressor):
     embedding_function: Any
     top_n: int
     reranking_function: Any
     r_score: float
+    # Stored vectors of the candidates, by chunk id (see VectorSearchRetriever)
+    vectors: Optional[dict] = None
 
     class Config:
         extra = "forbid"
         arbitrary_types_allowed = True
 
+    def rerank(self, documents: Sequence[Document], query: str) -> list[float]:
+        keys = [(query, get_chunk_id(doc)) for doc in documents]
+        scores = [RERANK_SCORE_CACHE.get(key) for key in keys]
+
+        missing = [idx for idx, score in enumerate(scores) if score is None]
+        if missing:
+            new_scores = self.reranking_function(
+                [(query, documents[idx].page_content) for idx in missing]
+            )
+            if new_scores is None:
+                return None
+            if not isinstance(new_scores, list):
+                new_scores = new_scores.tolist()
+            for idx, score in zip(missing, new_scores):
+                scores[idx] = score
+                RERANK_SCORE_CACHE.put(keys[idx], score)
+
+        return scores
+
+    def similarity(self, documents: Sequence[Document], query: str) -> list[float]:
+        vectors = self.vectors or {}
+        document_vectors = [vectors.get(doc.id) for doc in documents]
+
+        # Only embed candidates the vector search didn't return (e.g. BM25 only hits)
+        missing = [idx for idx, vector in enumerate(document_vectors) if vector is None]
+        if missing:
+            embeddings = self.embedding_function(
+                [documents[idx].page_content for idx in missing],
+                RAG_EMBEDDING_CONTENT_PREFIX,
+            )
+            for idx, embedding in zip(missing, embeddings):
+                document_vectors[idx] = embedding
+
+        query_vector = np.asarray(
+            self.embedding_function(query, RAG_EMBEDDING_QUERY_PREFIX),
+            dtype=np.float32,
+        )
+        matrix = np.asarray(document_vectors, dtype=np.float32)
+
+        # Cosine similarity of every candidate in one matrix product
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_vector)
+        scores = (matrix @ query_vector) / np.maximum(norms, 1e-12)
+        return scores.tolist()
+
     def compress_documents(
         self,
         documents: Sequence[Document],
         query: str,
         callbacks: Optional[Callbacks] = None,
     ) -> Sequence[Document]:
-        reranking = self.reranking_function is not None
+        if not documents:
+            return []
 
-        scores = None
-        if reranking:
-            scores = self.reranking_function(
-                [(query, doc.page_content) for doc in documents]
-            )
+        start = time.perf_counter()
+        if self.reranking_function is not None:
+            scores = self.rerank(documents, query)
         else:
-            from sentence_transformers import util
-
-            query_embedding = self.embedding_function(query, RAG_EMBEDDING_QUERY_PREFIX)
-            document_embedding = self.embedding_function(
-                [doc.page_content for doc in documents], RAG_EMBEDDING_CONTENT_PREFIX
-            )
-            scores = util.cos_sim(query_embedding, document_embedding)[0]
+            scores = self.similarity(documents, query)
+        log.debug(
+            f"RerankCompressor: scored {len(documents)} documents in {(time.perf_counter() - start) * 1000:.1f}ms "
+            f"({'reranker' if self.reranking_function is not None else 'cosine'})"
+        )
 
         if scores is not None:
-            docs_with_scores = list(
-                zip(
-                    documents,
-                    scores.tolist() if not isinstance(scores, list) else scores,
-                )
-            )
+            docs_with_scores = list(zip(documents, scores))
             if self.r_score:
                 docs_with_scores = [
                     (d, s) for d, s in docs_with_scores if s >= self.r_score
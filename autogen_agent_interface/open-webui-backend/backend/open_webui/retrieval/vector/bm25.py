@@ -0,0 +1,478 @@
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from open_webui.retrieval.vector.main import (
+    VectorDBBase,
+    VectorItem,
+    GetResult,
+    SearchResult,
+)
+from open_webui.env import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["RAG"])
+
+# BM25 Okapi parameters (same as rank_bm25, which BM25Retriever uses). The idf is
+# log(1 + (N - df + 0.5) / (df + 0.5)) rather than rank_bm25's, whose epsilon floor for
+# negative idfs needs the average idf of every term, so scores differ from BM25Retriever's
+K1 = 1.5
+B = 0.75
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS docs (
+    doc_id INTEGER PRIMARY KEY,
+    id TEXT UNIQUE NOT NULL,
+    text TEXT NOT NULL,
+    metadata TEXT,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc_id ON postings (doc_id);
+"""
+
+
+def tokenize(text: str) -> list[str]:
+    # Same as BM25Retriever's default preprocessing, so the same terms match
+    return text.split()
+
+
+class BM25Index:
+    """
+    Inverted index of one collection, stored in a SQLite file on local disk.
+
+    The file is shared by every thread and worker process: each thread keeps its own
+    connection (WAL mode, so readers never block the writer), and reads go through
+    SQLite's memory map. Updates are incremental, a query only reads the postings of its terms.
+
+    An index is "complete" once it holds every item of its collection. Indexes of collections
+    that existed before indexing was enabled are built from one full fetch, the first time they are queried.
+
+    Every write bumps the "generation" in `meta`, so a build can tell whether the index changed
+    while it was fetching the collection.
+    """
+
+    def __init__(self, path: str, mmap_size: int):
+        self.path = path
+        self.mmap_size = mmap_size
+        self.local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Another worker may have deleted (and recreated) the file: reopen it then
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+
+        conn = getattr(self.local, "conn", None)
+        if conn is not None and inode is not None and self.local.inode == inode:
+            return conn
+        if conn is not None:
+            conn.close()
+
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.executescript(SCHEMA)
+        self.local.conn = conn
+        self.local.inode = os.stat(self.path).st_ino
+        return conn
+
+    def _write(self, func: Callable[[sqlite3.Cursor], Any]) -> Any:
+        conn = self._connection()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(cursor)
+            cursor.execute("COMMIT")
+            return result
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+
+    def _has_meta(self, cursor: sqlite3.Cursor, key: str) -> bool:
+        return (
+            cursor.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone()
+            is not None
+        )
+
+    def _meta(self, cursor: sqlite3.Cursor, key: str) -> int:
+        row = cursor.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _add_to_meta(self, cursor: sqlite3.Cursor, key: str, delta: int):
+        cursor.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+            (key, delta),
+        )
+
+    def _set_meta(self, cursor: sqlite3.Cursor, key: str, value: int):
+        cursor.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+
+    def _insert(self, cursor: sqlite3.Cursor, items: list[dict]):
+        existing = [
+            row
+            for item in items
+            for row in cursor.execute(
+                "SELECT doc_id, length FROM docs WHERE id = ?", (item["id"],)
+            )
+        ]
+        self._remove(cursor, existing)
+
+        total_length = 0
+        for item in items:
+            tokens = tokenize(item["text"])
+            total_length += len(tokens)
+            cursor.execute(
+                "INSERT INTO docs (id, text, metadata, length) VALUES (?, ?, ?, ?)",
+                (
+                    item["id"],
+                    item["text"],
+                    json.dumps(item.get("metadata"), default=str),
+                    len(tokens),
+                ),
+            )
+            doc_id = cursor.lastrowid
+            counts = Counter(tokens)
+            cursor.executemany(
+                "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                [(term, doc_id, tf) for term, tf in counts.items()],
+            )
+            cursor.executemany(
+                "INSERT INTO terms (term, df) VALUES (?, 1) "
+                "ON CONFLICT(term) DO UPDATE SET df = df + 1",
+                [(term,) for term in counts],
+            )
+
+        self._add_to_meta(cursor, "doc_count", len(items))
+        self._add_to_meta(cursor, "total_length", total_length)
+
+    def _remove(self, cursor: sqlite3.Cursor, docs: list[tuple]):
+        for doc_id, _ in docs:
+            terms = [
+                (row[0],)
+                for row in cursor.execute(
+                    "SELECT term FROM postings WHERE doc_id = ?", (doc_id,)
+                )
+            ]
+            cursor.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", terms)
+            cursor.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+            cursor.execute("DELETE FROM docs WHERE doc_id = ?", (doc_id,))
+
+        if docs:
+            cursor.execute("DELETE FROM terms WHERE df <= 0")
+            self._add_to_meta(cursor, "doc_count", -len(docs))
+            self._add_to_meta(cursor, "total_length", -sum(l for _, l in docs))
+
+    def _clear(self, cursor: sqlite3.Cursor):
+        for table in ("postings", "terms", "docs"):
+            cursor.execute(f"DELETE FROM {table}")
+        cursor.execute("DELETE FROM meta WHERE key != 'generation'")
+
+    def add(self, items: list[dict], new_collection: bool = False):
+        """
+        Adds (or replaces, by id) items with "id", "text" and "metadata".
+
+        `new_collection` means the items are the first ones of their collection. An empty index
+        that was never built is then complete with them. Otherwise another write got there first
+        (or the index is stale), and it's left to be rebuilt from the collection.
+        """
+
+        def add(cursor):
+            if new_collection:
+                fresh = not self._has_meta(cursor, "complete") and not self._meta(
+                    cursor, "doc_count"
+                )
+                self._set_meta(cursor, "complete", int(fresh))
+            self._insert(cursor, items)
+            self._add_to_meta(cursor, "generation", 1)
+
+        self._write(add)
+
+    def delete(self, ids: Optional[list[str]] = None, filter: Optional[dict] = None):
+        """
+        Removes items by id, or whose metadata matches every key of `filter`.
+        """
+
+        def delete(cursor):
+            if ids:
+                docs = [
+                    row
+                    for id in ids
+                    for row in cursor.execute(
+                        "SELECT doc_id, length FROM docs WHERE id = ?", (id,)
+                    )
+                ]
+            elif filter:
+                where = " AND ".join("json_extract(metadata, ?) = ?" for _ in filter)
+                params = [
+                    value
+                    for key, value in filter.items()
+                    for value in (f'$."{key}"', value)
+                ]
+                docs = cursor.execute(
+                    f"SELECT doc_id, length FROM docs WHERE {where}", params
+                ).fetchall()
+            else:
+                docs = []
+            self._remove(cursor, docs)
+            self._add_to_meta(cursor, "generation", 1)
+
+        self._write(delete)
+
+    def clear(self, complete: bool = False):
+        def clear(cursor):
+            self._clear(cursor)
+            self._set_meta(cursor, "complete", int(complete))
+            self._add_to_meta(cursor, "generation", 1)
+
+        self._write(clear)
+
+    def mark_complete(self):
+        self._write(lambda cursor: self._set_meta(cursor, "complete", 1))
+
+    def is_complete(self) -> bool:
+        return bool(self._meta(self._connection().cursor(), "complete"))
+
+    def count(self) -> int:
+        return self._meta(self._connection().cursor(), "doc_count")
+
+    def build(self, fetch: Callable[[], Optional[GetResult]], attempts: int = 3):
+        """
+        Fills the index from `fetch` (the whole collection), unless another thread or worker just did.
+
+        The collection is fetched before the write transaction, so other writers aren't blocked
+        while it's fetched. If one of them changed the index meanwhile, the fetch may have missed
+        that change and is done again. Only the last attempt fetches inside the transaction.
+        """
+        for attempt in range(attempts):
+            cursor = self._connection().cursor()
+            if self._meta(cursor, "complete"):
+                return
+            generation = self._meta(cursor, "generation")
+            last = attempt == attempts - 1
+            result = None if last else fetch()
+
+            def build(cursor):
+                if self._meta(cursor, "complete"):
+                    return True
+                if not last and self._meta(cursor, "generation") != generation:
+                    return False
+                self._fill(cursor, fetch() if last else result)
+                return True
+
+            if self._write(build):
+                return
+
+    def _fill(self, cursor: sqlite3.Cursor, result: Optional[GetResult]):
+        self._clear(cursor)
+        if result and result.ids and result.ids[0]:
+            self._insert(
+                cursor,
+                [
+                    {"id": id, "text": text, "metadata": metadata}
+                    for id, text, metadata in zip(
+                        result.ids[0], result.documents[0], result.metadatas[0]
+                    )
+                ],
+            )
+        self._set_meta(cursor, "complete", 1)
+        self._add_to_meta(cursor, "generation", 1)
+
+    def search(self, query: str, k: int) -> list[tuple[float, str, str, Any]]:
+        """
+        Returns the top `k` (score, id, text, metadata), best first.
+        """
+        terms = set(tokenize(query))
+        if not terms or k <= 0:
+            return []
+
+        cursor = self._connection().cursor()
+        doc_count = self._meta(cursor, "doc_count")
+        if not doc_count:
+            return []
+        avg_length = self._meta(cursor, "total_length") / doc_count
+
+        scores: Dict[int, float] = {}
+        for term in terms:
+            row = cursor.execute(
+                "SELECT df FROM terms WHERE term = ?", (term,)
+            ).fetchone()
+            if not row:
+                continue
+            df = row[0]
+            idf = math.log((doc_count - df + 0.5) / (df + 0.5) + 1)
+            for doc_id, tf, length in cursor.execute(
+                "SELECT p.doc_id, p.tf, d.length FROM postings p "
+                "JOIN docs d ON d.doc_id = p.doc_id WHERE p.term = ?",
+                (term,),
+            ):
+                norm = tf + K1 * (1 - B + B * length / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / norm
+
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        results = []
+        for doc_id, score in top:
+            id, text, metadata = cursor.execute(
+                "SELECT id, text, metadata FROM docs WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+            results.append((score, id, text, json.loads(metadata) if metadata else {}))
+        return results
+
+
+class BM25Indexes:
+    """
+    One BM25Index per collection, under `path`.
+    """
+
+    def __init__(self, path: str, mmap_size: int):
+        self.path = path
+        self.mmap_size = mmap_size
+        self.indexes: Dict[str, BM25Index] = {}
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def file_path(self, collection_name: str) -> str:
+        # Collection names are mostly safe already, the hash keeps sanitized names from colliding
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", collection_name)[:100]
+        digest = hashlib.sha1(collection_name.encode()).hexdigest()[:8]
+        return os.path.join(self.path, f"{safe_name}-{digest}.sqlite")
+
+    def get(self, collection_name: str) -> BM25Index:
+        with self.lock:
+            index = self.indexes.get(collection_name)
+            if index is None:
+                index = BM25Index(self.file_path(collection_name), self.mmap_size)
+                self.indexes[collection_name] = index
+            return index
+
+    def remove(self, collection_name: str):
+        path = self.file_path(collection_name)
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    def remove_all(self):
+        for name in os.listdir(self.path):
+            if ".sqlite" in name:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    pass
+
+
+def _to_dict(item: Union[VectorItem, dict]) -> dict:
+    return item.model_dump() if isinstance(item, VectorItem) else item
+
+
+class BM25IndexedVectorDB(VectorDBBase):
+    """
+    Wraps a vector DB client and keeps a BM25 index of each collection in sync with it,
+    so hybrid search never has to fetch a whole collection to build a BM25 retriever.
+
+    Index maintenance never fails a vector DB write: if it breaks, the index is dropped
+    and rebuilt on its next query.
+    """
+
+    def __init__(self, client: VectorDBBase, path: str, mmap_size: int):
+        self.client = client
+        self.bm25_indexes = BM25Indexes(path, mmap_size)
+
+    def __getattr__(self, name):
+        # Anything backend specific goes straight to the client
+        return getattr(self.client, name)
+
+    def _update_index(self, collection_name: str, update: Callable[[BM25Index], None]):
+        try:
+            update(self.bm25_indexes.get(collection_name))
+        except Exception as e:
+            log.exception(f"Dropping BM25 index of {collection_name}: {e}")
+            try:
+                self.bm25_indexes.remove(collection_name)
+            except Exception:
+                pass
+
+    def get_bm25_index(self, collection_name: str) -> BM25Index:
+        """
+        Returns the collection's index, building it first if it was never complete.
+        """
+        index = self.bm25_indexes.get(collection_name)
+        if not index.is_complete():
+            log.info(f"Building BM25 index of {collection_name}")
+            index.build(lambda: self.client.get(collection_name=collection_name))
+        return index
+
+    def has_collection(self, collection_name: str) -> bool:
+        return self.client.has_collection(collection_name)
+
+    def delete_collection(self, collection_name: str) -> None:
+        self.client.delete_collection(collection_name)
+        self._update_index(
+            collection_name, lambda _: self.bm25_indexes.remove(collection_name)
+        )
+
+    def _write(self, method, collection_name: str, items: List[VectorItem]) -> None:
+        # A new collection's index is complete from its first write
+        is_new = not self.client.has_collection(collection_name)
+        method(collection_name, items)
+        self._update_index(
+            collection_name,
+            lambda index: index.add(
+                [_to_dict(item) for item in items], new_collection=is_new
+            ),
+        )
+
+    def insert(self, collection_name: str, items: List[VectorItem]) -> None:
+        self._write(self.client.insert, collection_name, items)
+
+    def upsert(self, collection_name: str, items: List[VectorItem]) -> None:
+        self._write(self.client.upsert, collection_name, items)
+
+    def search(
+        self, collection_name: str, vectors: List[List[Union[float, int]]], limit: int
+    ) -> Optional[SearchResult]:
+        return self.client.search(collection_name, vectors, limit)
+
+    def query(
+        self, collection_name: str, filter: Dict, limit: Optional[int] = None
+    ) -> Optional[GetResult]:
+        return self.client.query(collection_name, filter, limit)
+
+    def get(self, collection_name: str) -> Optional[GetResult]:
+        return self.client.get(collection_name)
+
+    def delete(
+        self,
+        collection_name: str,
+        ids: Optional[List[str]] = None,
+        filter: Optional[Dict] = None,
+    ) -> None:
+        self.client.delete(collection_name, ids=ids, filter=filter)
+        self._update_index(collection_name, lambda index: index.delete(ids, filter))
+
+    def reset(self) -> None:
+        self.client.reset()
+        self.bm25_indexes.remove_all()
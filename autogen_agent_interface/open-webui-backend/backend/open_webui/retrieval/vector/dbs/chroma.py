@@ -80,6 +80,7 @@ class ChromaClient(VectorDBBase):
                 result = collection.query(
                     query_embeddings=vectors,
                     n_results=limit,
+                    include=["documents", "metadatas", "distances", "embeddings"],
                 )
 
                 # chromadb has cosine distance, 2 (worst) -> 0 (best). Re-odering to 0 -> 1
@@ -94,6 +95,11 @@ class ChromaClient(VectorDBBase):
                         "distances": distances,
                         "documents": result["documents"],
                         "metadatas": result["metadatas"],
+                        "vectors": (
+                            [list(embeddings) for embeddings in result["embeddings"]]
+                            if result.get("embeddings") is not None
+                            else None
+                        ),
                     }
                 )
             return None
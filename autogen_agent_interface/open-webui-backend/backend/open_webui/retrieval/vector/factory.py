@@ -4,6 +4,9 @@ from open_webui.config import (
     VECTOR_DB,
     ENABLE_QDRANT_MULTITENANCY_MODE,
     ENABLE_MILVUS_MULTITENANCY_MODE,
+    ENABLE_BM25_INDEX,
+    BM25_INDEX_PATH,
+    BM25_INDEX_MMAP_SIZE,
 )
 
 
@@ -72,3 +75,10 @@ class Vector:
 
 
 VECTOR_DB_CLIENT = Vector.get_vector(VECTOR_DB)
+
+if ENABLE_BM25_INDEX:
+    from open_webui.retrieval.vector.bm25 import BM25IndexedVectorDB
+
+    VECTOR_DB_CLIENT = BM25IndexedVectorDB(
+        VECTOR_DB_CLIENT, BM25_INDEX_PATH, BM25_INDEX_MMAP_SIZE
+    )
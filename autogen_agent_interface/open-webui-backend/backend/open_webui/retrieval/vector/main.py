@@ -18,6 +18,8 @@ class GetResult(BaseModel):
 
 class SearchResult(GetResult):
     distances: Optional[List[List[float | int]]]
+    # Stored vector of each result, for backends that return them
+    vectors: Optional[List[List[Any]]] = None
 
 
 class VectorDBBase(ABC):
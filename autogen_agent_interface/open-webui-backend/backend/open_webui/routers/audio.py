@@ -2,13 +2,14 @@ import hashlib
 import json
 import logging
 import os
+import shutil
+import threading
 import uuid
 import html
 import base64
 from functools import lru_cache
 from pydub import AudioSegment
 from pydub.silence import split_on_silence
-from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 from fnmatch import fnmatch
@@ -34,13 +35,27 @@ from fastapi.responses import FileResponse
 from pydantic import BaseModel
 
 
+from open_webui.utils.audio import (
+    detect_silences,
+    get_cut_points,
+    iter_audio_chunks,
+    transcribe_chunks,
+)
 from open_webui.utils.auth import get_admin_user, get_verified_user
+from open_webui.utils.whisper_service import WhisperService, get_whisper_workers
 from open_webui.config import (
     WHISPER_MODEL_AUTO_UPDATE,
     WHISPER_MODEL_DIR,
     CACHE_DIR,
     WHISPER_LANGUAGE,
     ELEVENLABS_API_BASE_URL,
+    AUDIO_STT_CHUNK_DURATION,
+    AUDIO_STT_CHUNK_CONCURRENCY,
+    AUDIO_STT_FFMPEG_TIMEOUT,
+    WHISPER_WORKERS,
+    WHISPER_BATCH_SIZE,
+    WHISPER_BATCH_WAIT_MS,
+    WHISPER_VAD_TRIM,
 )
 
 from open_webui.constants import ERROR_MESSAGES
@@ -127,10 +142,14 @@ def set_faster_whisper_model(model: str, auto_update: bool = False):
     if model:
         from faster_whisper import WhisperModel
 
+        # One model replica per worker, sharing the CPU cores between them
+        workers, cpu_threads = get_whisper_workers(WHISPER_WORKERS)
         faster_whisper_kwargs = {
             "model_size_or_path": model,
             "device": DEVICE_TYPE if DEVICE_TYPE and DEVICE_TYPE == "cuda" else "cpu",
             "compute_type": "int8",
+            "cpu_threads": cpu_threads,
+            "num_workers": workers,
             "download_root": WHISPER_MODEL_DIR,
             "local_files_only": not auto_update,
         }
@@ -146,6 +165,32 @@ def set_faster_whisper_model(model: str, auto_update: bool = False):
     return whisper_model
 
 
+WHISPER_SERVICE_LOCK = threading.Lock()
+
+
+def get_whisper_service(request) -> WhisperService:
+    """
+    The service transcribing with the loaded faster-whisper model, loading it on first use.
+    """
+    with WHISPER_SERVICE_LOCK:
+        if request.app.state.faster_whisper_model is None:
+            request.app.state.faster_whisper_model = set_faster_whisper_model(
+                request.app.state.config.WHISPER_MODEL
+            )
+
+        service = request.app.state.whisper_service
+        if service is None:
+            model = request.app.state.faster_whisper_model
+            service = request.app.state.whisper_service = WhisperService(
+                model,
+                workers=model.model.num_workers,
+                batch_size=WHISPER_BATCH_SIZE,
+                batch_wait=WHISPER_BATCH_WAIT_MS / 1000,
+                vad=WHISPER_VAD_TRIM,
+            )
+        return service
+
+
 ##########################################
 #
 # Audio API
@@ -278,6 +323,12 @@ async def update_audio_config(
     else:
         request.app.state.faster_whisper_model = None
 
+    # Started again with the new model when needed
+    with WHISPER_SERVICE_LOCK:
+        if request.app.state.whisper_service is not None:
+            request.app.state.whisper_service.stop(wait=False)
+            request.app.state.whisper_service = None
+
     return {
         "tts": {
             "ENGINE": request.app.state.config.TTS_ENGINE,
@@ -583,25 +634,15 @@ def transcription_handler(request, file_path, metadata):
     ]
 
     if request.app.state.config.STT_ENGINE == "":
-        if request.app.state.faster_whisper_model is None:
-            request.app.state.faster_whisper_model = set_faster_whisper_model(
-                request.app.state.config.WHISPER_MODEL
-            )
-
-        model = request.app.state.faster_whisper_model
-        segments, info = model.transcribe(
+        # Queued with the other requests, short ones transcribed together
+        result = get_whisper_service(request).transcribe(
             file_path,
-            beam_size=5,
-            vad_filter=request.app.state.config.WHISPER_VAD_FILTER,
             language=languages[0],
+            vad_filter=request.app.state.config.WHISPER_VAD_FILTER,
         )
-        log.info(
-            "Detected language '%s' with probability %f"
-            % (info.language, info.language_probability)
-        )
+        log.info("Detected language '%s'" % result["language"])
 
-        transcript = "".join([segment.text for segment in list(segments)])
-        data = {"text": transcript.strip()}
+        data = {"text": result["text"], "segments": result["segments"]}
 
         # save the transcript to a json file
         transcript_file = f"{file_dir}/{id}.json"
@@ -1030,116 +1071,102 @@ def transcription_handler(request, file_path, metadata):
 def transcribe(request: Request, file_path: str, metadata: Optional[dict] = None):
     log.info(f"transcribe: {file_path} {metadata}")
 
-    if is_audio_conversion_required(file_path):
+    if is_audio_conversion_required(file_path) and (
+        os.path.getsize(file_path) <= MAX_FILE_SIZE
+    ):
         file_path = convert_audio_to_mp3(file_path)
 
+    if os.path.getsize(file_path) <= MAX_FILE_SIZE:
+        try:
+            result = transcription_handler(request, file_path, metadata)
+        except Exception as transcribe_exc:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error transcribing chunk: {transcribe_exc}",
+            )
+        return {
+            "text": result["text"],
+            **({"segments": result["segments"]} if result.get("segments") else {}),
+        }
+
+    # Too large to send at once: ffmpeg streams the file into chunks (16kHz mono
+    # 32kbps mp3, well under the limit), transcribed as soon as they're written
+    chunk_duration = min(AUDIO_STT_CHUNK_DURATION, MAX_FILE_SIZE * 0.9 / (32000 / 8))
+    chunk_dir = f"{os.path.splitext(file_path)[0]}_chunks"
+
     try:
-        file_path = compress_audio(file_path)
+        silences, duration = detect_silences(
+            file_path, timeout=AUDIO_STT_FFMPEG_TIMEOUT
+        )
+        chunks = iter_audio_chunks(
+            file_path,
+            chunk_dir,
+            chunk_duration,
+            cut_points=get_cut_points(duration, chunk_duration, silences),
+            timeout=AUDIO_STT_FFMPEG_TIMEOUT,
+        )
     except Exception as e:
         log.exception(e)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=ERROR_MESSAGES.DEFAULT(e),
+        )
+
+    def transcribe_chunk(chunk):
+        try:
+            return transcription_handler(request, chunk.path, metadata)
+        except Exception as transcribe_exc:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error transcribing chunk: {transcribe_exc}",
+            )
 
-    # Always produce a list of chunk paths (could be one entry if small)
     try:
-        chunk_paths = split_audio(file_path, MAX_FILE_SIZE)
-        print(f"Chunk paths: {chunk_paths}")
+        results = transcribe_chunks(
+            chunks, transcribe_chunk, concurrency=AUDIO_STT_CHUNK_CONCURRENCY
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         log.exception(e)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=ERROR_MESSAGES.DEFAULT(e),
         )
-
-    results = []
-    try:
-        with ThreadPoolExecutor() as executor:
-            # Submit tasks for each chunk_path
-            futures = [
-                executor.submit(transcription_handler, request, chunk_path, metadata)
-                for chunk_path in chunk_paths
-            ]
-            # Gather results as they complete
-            for future in futures:
-                try:
-                    results.append(future.result())
-                except Exception as transcribe_exc:
-                    raise HTTPException(
-                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                        detail=f"Error transcribing chunk: {transcribe_exc}",
-                    )
     finally:
-        # Clean up only the temporary chunks, never the original file
-        for chunk_path in chunk_paths:
-            if chunk_path != file_path and os.path.isfile(chunk_path):
-                try:
-                    os.remove(chunk_path)
-                except Exception:
-                    pass
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+    # Timestamps relative to the whole file
+    segments = []
+    for result in results:
+        if result.get("segments"):
+            segments.extend(
+                {
+                    **segment,
+                    "start": result["start"] + segment["start"],
+                    "end": result["start"] + segment["end"],
+                }
+                for segment in result["segments"]
+            )
+        else:
+            segments.append(
+                {
+                    "start": result["start"],
+                    "end": result["end"],
+                    "text": result["text"],
+                }
+            )
 
     return {
         "text": " ".join([result["text"] for result in results]),
+        "segments": segments,
     }
 
 
-def compress_audio(file_path):
-    if os.path.getsize(file_path) > MAX_FILE_SIZE:
-        id = os.path.splitext(os.path.basename(file_path))[
-            0
-        ]  # Handles names with multiple dots
-        file_dir = os.path.dirname(file_path)
-
-        audio = AudioSegment.from_file(file_path)
-        audio = audio.set_frame_rate(16000).set_channels(1)  # Compress audio
-
-        compressed_path = os.path.join(file_dir, f"{id}_compressed.mp3")
-        audio.export(compressed_path, format="mp3", bitrate="32k")
-        # log.debug(f"Compressed audio to {compressed_path}")  # Uncomment if log is defined
-
-        return compressed_path
-    else:
-        return file_path
-
-
-def split_audio(file_path, max_bytes, format="mp3", bitrate="32k"):
-    """
-    Splits audio into chunks not exceeding max_bytes.
-    Returns a list of chunk file paths. If audio fits, returns list with original path.
-    """
-    file_size = os.path.getsize(file_path)
-    if file_size <= max_bytes:
-        return [file_path]  # Nothing to split
-
-    audio = AudioSegment.from_file(file_path)
-    duration_ms = len(audio)
-    orig_size = file_size
-
-    approx_chunk_ms = max(int(duration_ms * (max_bytes / orig_size)) - 1000, 1000)
-    chunks = []
-    start = 0
-    i = 0
-
-    base, _ = os.path.splitext(file_path)
-
-    while start < duration_ms:
-        end = min(start + approx_chunk_ms, duration_ms)
-        chunk = audio[start:end]
-        chunk_path = f"{base}_chunk_{i}.{format}"
-        chunk.export(chunk_path, format=format, bitrate=bitrate)
-
-        # Reduce chunk duration if still too large
-        while os.path.getsize(chunk_path) > max_bytes and (end - start) > 5000:
-            end = start + ((end - start) // 2)
-            chunk = audio[start:end]
-            chunk.export(chunk_path, format=format, bitrate=bitrate)
-
-        if os.path.getsize(chunk_path) > max_bytes:
-            os.remove(chunk_path)
-            raise Exception("Audio chunk cannot be reduced below max file size.")
-
-        chunks.append(chunk_path)
-        start = end
-        i += 1
-
-    return chunks
+@router.get("/transcriptions/metrics")
+async def get_transcription_metrics(request: Request, user=Depends(get_admin_user)):
+    service = request.app.state.whisper_service
+    return service.metrics() if service is not None else {}
 
 
 @router.post("/transcriptions")
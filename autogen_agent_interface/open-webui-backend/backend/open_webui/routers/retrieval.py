@@ -71,6 +71,8 @@ from open_webui.retrieval.web.firecrawl import search_firecrawl
 from open_webui.retrieval.web.external import search_external
 
 from open_webui.retrieval.utils import (
+    EMBEDDING_CACHE,
+    get_bm25_source,
     get_content_from_url,
     get_embedding_function,
     get_reranking_function,
@@ -298,6 +300,14 @@ class EmbeddingModelUpdateForm(BaseModel):
     embedding_batch_size: Optional[int] = 1
 
 
+@router.get("/embedding/cache")
+async def get_embedding_cache_metrics(user=Depends(get_admin_user)):
+    return {
+        "enabled": EMBEDDING_CACHE is not None,
+        **(EMBEDDING_CACHE.metrics() if EMBEDDING_CACHE is not None else {}),
+    }
+
+
 @router.post("/embedding/update")
 async def update_embedding_config(
     request: Request, form_data: EmbeddingModelUpdateForm, user=Depends(get_admin_user)
@@ -2233,8 +2243,8 @@ def query_doc_handler(
             form_data.hybrid is None or form_data.hybrid
         ):
             collection_results = {}
-            collection_results[form_data.collection_name] = VECTOR_DB_CLIENT.get(
-                collection_name=form_data.collection_name
+            collection_results[form_data.collection_name] = get_bm25_source(
+                form_data.collection_name
             )
             return query_doc_with_hybrid_search(
                 collection_name=form_data.collection_name,
@@ -1,4 +1,5 @@
 import asyncio
+import atexit
 import random
 
 import socketio
@@ -31,10 +32,21 @@ from open_webui.env import (
     WEBSOCKET_REDIS_LOCK_TIMEOUT,
     WEBSOCKET_SENTINEL_PORT,
     WEBSOCKET_SENTINEL_HOSTS,
+    WEBSOCKET_POOL_CACHE_TTL,
     REDIS_KEY_PREFIX,
+    CHAT_MESSAGE_WRITE_INTERVAL,
+    CHAT_MESSAGE_WRITE_MAX_EVENTS,
+    CHAT_MESSAGE_WRITE_MAX_BYTES,
 )
 from open_webui.utils.auth import decode_token
-from open_webui.socket.utils import RedisDict, RedisLock, YdocManager
+from open_webui.socket.utils import (
+    RedisDict,
+    LocalDict,
+    RedisLock,
+    YdocManager,
+    MessageWriteBuffer,
+)
+from open_webui.utils.chat_writer import CHAT_WRITER
 from open_webui.tasks import create_task, stop_item_tasks
 from open_webui.utils.redis import get_redis_connection
 from open_webui.utils.access_control import has_access, get_users_with_access
@@ -102,17 +114,20 @@ if WEBSOCKET_MANAGER == "redis":
     redis_sentinels = get_sentinels_from_env(
         WEBSOCKET_SENTINEL_HOSTS, WEBSOCKET_SENTINEL_PORT
     )
+    # Read on every event, and only changed when sockets connect and disconnect
     SESSION_POOL = RedisDict(
         f"{REDIS_KEY_PREFIX}:session_pool",
         redis_url=WEBSOCKET_REDIS_URL,
         redis_sentinels=redis_sentinels,
         redis_cluster=WEBSOCKET_REDIS_CLUSTER,
+        cache_ttl=WEBSOCKET_POOL_CACHE_TTL,
     )
     USER_POOL = RedisDict(
         f"{REDIS_KEY_PREFIX}:user_pool",
         redis_url=WEBSOCKET_REDIS_URL,
         redis_sentinels=redis_sentinels,
         redis_cluster=WEBSOCKET_REDIS_CLUSTER,
+        cache_ttl=WEBSOCKET_POOL_CACHE_TTL,
     )
     USAGE_POOL = RedisDict(
         f"{REDIS_KEY_PREFIX}:usage_pool",
@@ -132,9 +147,9 @@ if WEBSOCKET_MANAGER == "redis":
     renew_func = clean_up_lock.renew_lock
     release_func = clean_up_lock.release_lock
 else:
-    SESSION_POOL = {}
-    USER_POOL = {}
-    USAGE_POOL = {}
+    SESSION_POOL = LocalDict()
+    USER_POOL = LocalDict()
+    USAGE_POOL = LocalDict()
 
     aquire_func = release_func = renew_func = lambda: True
 
@@ -174,7 +189,9 @@ async def periodic_usage_pool_cleanup():
 
             now = int(time.time())
             send_usage = False
-            for model_id, connections in list(USAGE_POOL.items()):
+            updated = {}
+            removed = []
+            for model_id, connections in await USAGE_POOL.aitems():
                 # Creating a list of sids to remove if they have timed out
                 expired_sids = [
                     sid
@@ -187,11 +204,14 @@ async def periodic_usage_pool_cleanup():
 
                 if not connections:
                     log.debug(f"Cleaning up model {model_id} from usage pool")
-                    del USAGE_POOL[model_id]
-                else:
-                    USAGE_POOL[model_id] = connections
+                    removed.append(model_id)
+                elif expired_sids:
+                    updated[model_id] = connections
 
                 send_usage = True
+
+            # Only the entries that changed, in one go
+            await USAGE_POOL.aupdate(updated, delete=removed)
             await asyncio.sleep(TIMEOUT_DURATION)
     finally:
         release_func()
@@ -235,12 +255,11 @@ def get_session_ids_from_room(room):
     return [session_id[0] for session_id in active_session_ids]
 
 
-def get_user_ids_from_room(room):
+async def get_user_ids_from_room(room):
     active_session_ids = get_session_ids_from_room(room)
 
-    active_user_ids = list(
-        set([SESSION_POOL.get(session_id)["id"] for session_id in active_session_ids])
-    )
+    sessions = await SESSION_POOL.aget_many(active_session_ids)
+    active_user_ids = list(set([user["id"] for user in sessions.values()]))
     return active_user_ids
 
 
@@ -252,16 +271,19 @@ def get_active_status_by_user_id(user_id):
 
 @sio.on("usage")
 async def usage(sid, data):
-    if sid in SESSION_POOL:
+    if await SESSION_POOL.acontains(sid):
         model_id = data["model"]
         # Record the timestamp for the last update
         current_time = int(time.time())
 
         # Store the new usage data and task
-        USAGE_POOL[model_id] = {
-            **(USAGE_POOL[model_id] if model_id in USAGE_POOL else {}),
-            sid: {"updated_at": current_time},
-        }
+        await USAGE_POOL.aset(
+            model_id,
+            {
+                **(await USAGE_POOL.aget(model_id, {})),
+                sid: {"updated_at": current_time},
+            },
+        )
 
 
 @sio.event
@@ -274,13 +296,10 @@ async def connect(sid, environ, auth):
             user = Users.get_user_by_id(data["id"])
 
         if user:
-            SESSION_POOL[sid] = user.model_dump(
-                exclude=["date_of_birth", "bio", "gender"]
+            await SESSION_POOL.aset(
+                sid, user.model_dump(exclude=["date_of_birth", "bio", "gender"])
             )
-            if user.id in USER_POOL:
-                USER_POOL[user.id] = USER_POOL[user.id] + [sid]
-            else:
-                USER_POOL[user.id] = [sid]
+            await USER_POOL.aappend(user.id, sid)
 
 
 @sio.on("user-join")
@@ -298,11 +317,10 @@ async def user_join(sid, data):
     if not user:
         return
 
-    SESSION_POOL[sid] = user.model_dump(exclude=["date_of_birth", "bio", "gender"])
-    if user.id in USER_POOL:
-        USER_POOL[user.id] = USER_POOL[user.id] + [sid]
-    else:
-        USER_POOL[user.id] = [sid]
+    await SESSION_POOL.aset(
+        sid, user.model_dump(exclude=["date_of_birth", "bio", "gender"])
+    )
+    await USER_POOL.aappend(user.id, sid)
 
     # Join all the channels
     channels = Channels.get_channels_by_user_id(user.id)
@@ -386,7 +404,7 @@ async def channel_events(sid, data):
                 "channel_id": data["channel_id"],
                 "message_id": data.get("message_id", None),
                 "data": event_data,
-                "user": UserNameResponse(**SESSION_POOL[sid]).model_dump(),
+                "user": UserNameResponse(**await SESSION_POOL.aget(sid)).model_dump(),
             },
             room=room,
         )
@@ -395,7 +413,7 @@ async def channel_events(sid, data):
 @sio.on("ydoc:document:join")
 async def ydoc_document_join(sid, data):
     """Handle user joining a document"""
-    user = SESSION_POOL.get(sid)
+    user = await SESSION_POOL.aget(sid)
 
     try:
         document_id = data["document_id"]
@@ -565,7 +583,7 @@ async def yjs_document_update(sid, data):
         async def debounced_save():
             await asyncio.sleep(0.5)
             await document_save_handler(
-                document_id, data.get("data", {}), SESSION_POOL.get(sid)
+                document_id, data.get("data", {}), await SESSION_POOL.aget(sid)
             )
 
         if data.get("data"):
@@ -630,15 +648,9 @@ async def yjs_awareness_update(sid, data):
 
 @sio.event
 async def disconnect(sid):
-    if sid in SESSION_POOL:
-        user = SESSION_POOL[sid]
-        del SESSION_POOL[sid]
-
-        user_id = user["id"]
-        USER_POOL[user_id] = [_sid for _sid in USER_POOL[user_id] if _sid != sid]
-
-        if len(USER_POOL[user_id]) == 0:
-            del USER_POOL[user_id]
+    user = await SESSION_POOL.apop(sid)
+    if user:
+        await USER_POOL.aremove(user["id"], sid)
 
         await YDOC_MANAGER.remove_user_from_all_documents(sid)
     else:
@@ -646,13 +658,50 @@ async def disconnect(sid):
         # print(f"Unknown session ID {sid} disconnected")
 
 
+MESSAGE_WRITE_BUFFER = MessageWriteBuffer(
+    # Through the chat writer, so a chat's updates are never written by two writers at once
+    lambda chat_id, update: CHAT_WRITER.update(
+        chat_id, update, immediate=True
+    ).result(),
+    interval=CHAT_MESSAGE_WRITE_INTERVAL,
+    max_events=CHAT_MESSAGE_WRITE_MAX_EVENTS,
+    max_bytes=CHAT_MESSAGE_WRITE_MAX_BYTES,
+)
+
+# Don't lose buffered updates if the process exits without a clean shutdown
+atexit.register(MESSAGE_WRITE_BUFFER.flush_all_sync)
+
+
+async def flush_message_updates(chat_id: str, message_id: str, done: bool = True):
+    """
+    Writes the message's buffered updates. Call it before reading or writing
+    the message directly, with `done` once its completion ended.
+    """
+    if chat_id and message_id and not chat_id.startswith("local:"):
+        if done:
+            await MESSAGE_WRITE_BUFFER.finish(chat_id, message_id)
+        else:
+            await MESSAGE_WRITE_BUFFER.flush((chat_id, message_id))
+
+        # And the realtime saves of the streamed content
+        await asyncio.wrap_future(CHAT_WRITER.flush(chat_id))
+
+
+def get_message_write_metrics():
+    return MESSAGE_WRITE_BUFFER.metrics()
+
+
+def get_chat_writer_metrics():
+    return CHAT_WRITER.metrics()
+
+
 def get_event_emitter(request_info, update_db=True):
     async def __event_emitter__(event_data):
         user_id = request_info["user_id"]
 
         session_ids = list(
             set(
-                USER_POOL.get(user_id, [])
+                await USER_POOL.aget(user_id, [])
                 + (
                     [request_info.get("session_id")]
                     if request_info.get("session_id")
@@ -683,94 +732,10 @@ def get_event_emitter(request_info, update_db=True):
             and message_id
             and not request_info.get("chat_id", "").startswith("local:")
         ):
-            if "type" in event_data and event_data["type"] == "status":
-                Chats.add_message_status_to_chat_by_id_and_message_id(
-                    request_info["chat_id"],
-                    request_info["message_id"],
-                    event_data.get("data", {}),
-                )
-
-            if "type" in event_data and event_data["type"] == "message":
-                message = Chats.get_message_by_id_and_message_id(
-                    request_info["chat_id"],
-                    request_info["message_id"],
-                )
-
-                if message:
-                    content = message.get("content", "")
-                    content += event_data.get("data", {}).get("content", "")
-
-                    Chats.upsert_message_to_chat_by_id_and_message_id(
-                        request_info["chat_id"],
-                        request_info["message_id"],
-                        {
-                            "content": content,
-                        },
-                    )
-
-            if "type" in event_data and event_data["type"] == "replace":
-                content = event_data.get("data", {}).get("content", "")
-
-                Chats.upsert_message_to_chat_by_id_and_message_id(
-                    request_info["chat_id"],
-                    request_info["message_id"],
-                    {
-                        "content": content,
-                    },
-                )
-
-            if "type" in event_data and event_data["type"] == "embeds":
-                message = Chats.get_message_by_id_and_message_id(
-                    request_info["chat_id"],
-                    request_info["message_id"],
-                )
-
-                embeds = event_data.get("data", {}).get("embeds", [])
-                embeds.extend(message.get("embeds", []))
-
-                Chats.upsert_message_to_chat_by_id_and_message_id(
-                    request_info["chat_id"],
-                    request_info["message_id"],
-                    {
-                        "embeds": embeds,
-                    },
-                )
-
-            if "type" in event_data and event_data["type"] == "files":
-                message = Chats.get_message_by_id_and_message_id(
-                    request_info["chat_id"],
-                    request_info["message_id"],
-                )
-
-                files = event_data.get("data", {}).get("files", [])
-                files.extend(message.get("files", []))
-
-                Chats.upsert_message_to_chat_by_id_and_message_id(
-                    request_info["chat_id"],
-                    request_info["message_id"],
-                    {
-                        "files": files,
-                    },
-                )
-
-            if event_data.get("type") in ["source", "citation"]:
-                data = event_data.get("data", {})
-                if data.get("type") == None:
-                    message = Chats.get_message_by_id_and_message_id(
-                        request_info["chat_id"],
-                        request_info["message_id"],
-                    )
-
-                    sources = message.get("sources", [])
-                    sources.append(data)
-
-                    Chats.upsert_message_to_chat_by_id_and_message_id(
-                        request_info["chat_id"],
-                        request_info["message_id"],
-                        {
-                            "sources": sources,
-                        },
-                    )
+            # Merged with the message's other pending updates, written in the background
+            await MESSAGE_WRITE_BUFFER.add(
+                request_info["chat_id"], request_info["message_id"], event_data
+            )
 
     return __event_emitter__
 
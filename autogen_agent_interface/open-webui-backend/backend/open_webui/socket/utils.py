@@ -1,10 +1,18 @@
+import asyncio
+import base64
 import json
+import logging
+import threading
+import time
 import uuid
+from collections import OrderedDict
 from open_webui.utils.redis import get_redis_connection
-from open_webui.env import REDIS_KEY_PREFIX
+from open_webui.env import REDIS_KEY_PREFIX, YDOC_COMPACTION_THRESHOLD
 from typing import Optional, List, Tuple
 import pycrdt as Y
 
+log = logging.getLogger(__name__)
+
 
 class RedisLock:
     def __init__(
@@ -46,8 +54,48 @@ class RedisLock:
             self.redis.delete(self.lock_name)
 
 
+# Adds (ARGV[2] == "add") or removes the JSON item ARGV[3] from the JSON list in field
+# ARGV[1] of the hash KEYS[1]. An item is never there twice, and an emptied list is deleted.
+# Returns the new list, or nil once it's deleted.
+LIST_UPDATE_SCRIPT = """
+local value = redis.call('HGET', KEYS[1], ARGV[1])
+local item = cjson.decode(ARGV[3])
+local items = {}
+for _, existing in ipairs(value and cjson.decode(value) or {}) do
+    if existing ~= item then
+        table.insert(items, existing)
+    end
+end
+if ARGV[2] == 'add' then
+    table.insert(items, item)
+end
+if #items == 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    return false
+end
+value = cjson.encode(items)
+redis.call('HSET', KEYS[1], ARGV[1], value)
+return value
+"""
+
+
 class RedisDict:
-    def __init__(self, name, redis_url, redis_sentinels=[], redis_cluster=False):
+    """
+    A dict of JSON values in a Redis hash.
+
+    The dict interface makes one Redis call per operation. The async methods
+    (`aget`, `aget_many`, `aupdate`, ...) go through an async connection and
+    pipeline whatever they read or write in one round trip.
+
+    With `cache_ttl`, reads are answered from a local copy for that many seconds.
+    Writes publish the keys they change on `<name>:invalidate`, and every other
+    process drops those keys from its copy. Expired entries are dropped, so the copy
+    only holds keys read or written in the last `cache_ttl` seconds.
+    """
+
+    def __init__(
+        self, name, redis_url, redis_sentinels=[], redis_cluster=False, cache_ttl=0
+    ):
         self.name = name
         self.redis = get_redis_connection(
             redis_url,
@@ -55,23 +103,112 @@ class RedisDict:
             redis_cluster=redis_cluster,
             decode_responses=True,
         )
+        self.async_redis = get_redis_connection(
+            redis_url,
+            redis_sentinels,
+            redis_cluster=redis_cluster,
+            async_mode=True,
+            decode_responses=True,
+        )
+
+        # key -> (expires at, serialized value, None if the key doesn't exist),
+        # oldest first. Also changed by the invalidation thread, hence the lock.
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.cache_ttl = cache_ttl
+        self.channel = f"{name}:invalidate"
+        self.instance_id = str(uuid.uuid4())
+        self.subscriber = None
+        if cache_ttl:
+            self._subscribe()
+
+    def _subscribe(self):
+        def invalidate(message):
+            instance_id, keys = json.loads(message["data"])
+            if instance_id == self.instance_id:
+                return
+            with self.cache_lock:
+                if keys is None:
+                    # Cleared
+                    self.cache.clear()
+                for key in keys or []:
+                    self.cache.pop(key, None)
+
+        def on_error(e, pubsub, thread):
+            # Invalidations may have been missed while disconnected
+            log.warning(f"Lost invalidations of {self.name}, retrying: {e}")
+            with self.cache_lock:
+                self.cache.clear()
+            time.sleep(1)
+
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.channel: invalidate})
+        self.subscriber = pubsub.run_in_thread(
+            sleep_time=1, daemon=True, exception_handler=on_error
+        )
+
+    def _cached(self, key):
+        """(True, serialized value or None) if the key is cached, (False, None) otherwise"""
+        if self.cache_ttl:
+            with self.cache_lock:
+                entry = self.cache.get(key)
+                if entry is not None:
+                    if entry[0] > time.monotonic():
+                        return True, entry[1]
+                    del self.cache[key]
+        return False, None
+
+    def _cache(self, values: dict):
+        if not self.cache_ttl:
+            return
+        now = time.monotonic()
+        with self.cache_lock:
+            for key, value in values.items():
+                self.cache[key] = (now + self.cache_ttl, value)
+                self.cache.move_to_end(key)
+            # Entries are in the order they expire, drop the expired ones
+            while self.cache:
+                key, (expires_at, _) = next(iter(self.cache.items()))
+                if expires_at > now:
+                    break
+                del self.cache[key]
+
+    def _write(self, pipe, serialized: dict, deleted=()):
+        if serialized:
+            pipe.hset(self.name, mapping=serialized)
+        if deleted:
+            pipe.hdel(self.name, *deleted)
+        if self.cache_ttl:
+            pipe.publish(
+                self.channel,
+                json.dumps([self.instance_id, [*serialized, *deleted]]),
+            )
+            self._cache({**serialized, **dict.fromkeys(deleted)})
 
     def __setitem__(self, key, value):
-        serialized_value = json.dumps(value)
-        self.redis.hset(self.name, key, serialized_value)
+        pipe = self.redis.pipeline(transaction=False)
+        self._write(pipe, {key: json.dumps(value)})
+        pipe.execute()
 
     def __getitem__(self, key):
-        value = self.redis.hget(self.name, key)
+        cached, value = self._cached(key)
+        if not cached:
+            value = self.redis.hget(self.name, key)
+            self._cache({key: value})
         if value is None:
             raise KeyError(key)
         return json.loads(value)
 
     def __delitem__(self, key):
-        result = self.redis.hdel(self.name, key)
-        if result == 0:
+        pipe = self.redis.pipeline(transaction=False)
+        self._write(pipe, {}, [key])
+        if pipe.execute()[0] == 0:
             raise KeyError(key)
 
     def __contains__(self, key):
+        cached, value = self._cached(key)
+        if cached:
+            return value is not None
         return self.redis.hexists(self.name, key)
 
     def __len__(self):
@@ -94,6 +231,10 @@ class RedisDict:
 
     def clear(self):
         self.redis.delete(self.name)
+        if self.cache_ttl:
+            with self.cache_lock:
+                self.cache.clear()
+            self.redis.publish(self.channel, json.dumps([self.instance_id, None]))
 
     def update(self, other=None, **kwargs):
         if other is not None:
@@ -107,37 +248,303 @@ class RedisDict:
             self[key] = default
         return self[key]
 
+    async def aget_many(self, keys) -> dict:
+        """
+        The values of the keys that exist, read in one round trip.
+        """
+        values = {}
+        missing = []
+        for key in keys:
+            cached, value = self._cached(key)
+            if cached:
+                values[key] = value
+            else:
+                missing.append(key)
+
+        if missing:
+            fetched = await self.async_redis.hmget(self.name, missing)
+            fetched = dict(zip(missing, fetched))
+            self._cache(fetched)
+            values.update(fetched)
+
+        return {
+            key: json.loads(value) for key, value in values.items() if value is not None
+        }
+
+    async def aget(self, key, default=None):
+        return (await self.aget_many([key])).get(key, default)
+
+    async def acontains(self, key) -> bool:
+        cached, value = self._cached(key)
+        if cached:
+            return value is not None
+        return await self.async_redis.hexists(self.name, key)
+
+    async def aitems(self) -> list:
+        items = await self.async_redis.hgetall(self.name)
+        return [(k, json.loads(v)) for k, v in items.items()]
+
+    async def aupdate(self, values: Optional[dict] = None, delete=()):
+        """
+        Sets the values and deletes the keys in `delete`, in one round trip.
+        """
+        serialized = {key: json.dumps(value) for key, value in (values or {}).items()}
+        if not serialized and not delete:
+            return
+
+        async with self.async_redis.pipeline(transaction=False) as pipe:
+            self._write(pipe, serialized, list(delete))
+            await pipe.execute()
+
+    async def aset(self, key, value):
+        await self.aupdate({key: value})
+
+    async def adelete(self, *keys):
+        await self.aupdate(delete=keys)
+
+    async def _aupdate_list(self, key, action, item):
+        async with self.async_redis.pipeline(transaction=False) as pipe:
+            pipe.eval(LIST_UPDATE_SCRIPT, 1, self.name, key, action, json.dumps(item))
+            if self.cache_ttl:
+                pipe.publish(self.channel, json.dumps([self.instance_id, [key]]))
+            value = (await pipe.execute())[0]
+        self._cache({key: value})
+
+    async def aappend(self, key, item):
+        """
+        Adds the item (a string or number) to the list at the key, atomically in Redis,
+        so concurrent writers never lose each other's items.
+        """
+        await self._aupdate_list(key, "add", item)
+
+    async def aremove(self, key, item):
+        """
+        Removes the item from the list at the key, deleting the key if that emptied it.
+        """
+        await self._aupdate_list(key, "remove", item)
+
+    async def apop(self, key, default=None):
+        """
+        Removes the key and returns its value, in one round trip.
+        """
+        async with self.async_redis.pipeline(transaction=False) as pipe:
+            pipe.hget(self.name, key)
+            self._write(pipe, {}, [key])
+            value = (await pipe.execute())[0]
+        return default if value is None else json.loads(value)
+
+
+class LocalDict(dict):
+    """
+    A dict with RedisDict's async methods, for a single process without Redis.
+    """
+
+    async def aget_many(self, keys) -> dict:
+        return {key: self[key] for key in keys if key in self}
+
+    async def aget(self, key, default=None):
+        return self.get(key, default)
+
+    async def acontains(self, key) -> bool:
+        return key in self
+
+    async def aitems(self) -> list:
+        return list(self.items())
+
+    async def aupdate(self, values: Optional[dict] = None, delete=()):
+        self.update(values or {})
+        for key in delete:
+            self.pop(key, None)
+
+    async def aset(self, key, value):
+        self[key] = value
+
+    async def adelete(self, *keys):
+        await self.aupdate(delete=keys)
+
+    async def aappend(self, key, item):
+        items = [existing for existing in self.get(key, []) if existing != item]
+        self[key] = items + [item]
+
+    async def aremove(self, key, item):
+        items = [existing for existing in self.get(key, []) if existing != item]
+        if items:
+            self[key] = items
+        else:
+            self.pop(key, None)
+
+    async def apop(self, key, default=None):
+        return self.pop(key, default)
+
+
+# Replaces the first ARGV[2] updates in KEYS[1] with the snapshot ARGV[5], if the
+# compaction lock KEYS[2] is still held with the token ARGV[1] and the list still
+# starts with the merged updates (first ARGV[3], last ARGV[4]): a document cleared
+# or recreated meanwhile is left as it is. Returns whether it was replaced.
+COMPACT_SCRIPT = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+local count = tonumber(ARGV[2])
+if redis.call('LLEN', KEYS[1]) < count
+    or redis.call('LINDEX', KEYS[1], 0) ~= ARGV[3]
+    or redis.call('LINDEX', KEYS[1], count - 1) ~= ARGV[4] then
+    return 0
+end
+redis.call('LTRIM', KEYS[1], count, -1)
+redis.call('LPUSH', KEYS[1], ARGV[5])
+return 1
+"""
+
+# Deletes the lock KEYS[1] if it is still held with the token ARGV[1]
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
 
 class YdocManager:
+    """
+    Yjs updates of collaborative documents, in Redis or in memory.
+
+    Updates are stored base64 encoded, and once a document has more than
+    `compaction_threshold` of them, they are merged into one snapshot update
+    that replaces them at the head of the list. Joining a document then
+    loads the snapshot and the updates since.
+    """
+
     def __init__(
         self,
         redis=None,
         redis_key_prefix: str = f"{REDIS_KEY_PREFIX}:ydoc:documents",
+        compaction_threshold: int = YDOC_COMPACTION_THRESHOLD,
     ):
         self._updates = {}
         self._users = {}
         self._redis = redis
         self._redis_key_prefix = redis_key_prefix
+        self._compaction_threshold = compaction_threshold
+        self._compactions = {}
+        self._user_documents = {}
+
+    @staticmethod
+    def _encode_update(update) -> str:
+        return base64.b64encode(bytes(update)).decode()
+
+    @staticmethod
+    def _decode_update(update: str) -> bytes:
+        if update.startswith("["):
+            # Stored as a JSON list of ints before updates were base64 encoded
+            return bytes(json.loads(update))
+        return base64.b64decode(update)
 
     async def append_to_updates(self, document_id: str, update: bytes):
         document_id = document_id.replace(":", "_")
         if self._redis:
             redis_key = f"{self._redis_key_prefix}:{document_id}:updates"
-            await self._redis.rpush(redis_key, json.dumps(list(update)))
+            length = await self._redis.rpush(redis_key, self._encode_update(update))
         else:
             if document_id not in self._updates:
                 self._updates[document_id] = []
-            self._updates[document_id].append(update)
+            self._updates[document_id].append(bytes(update))
+            length = len(self._updates[document_id])
+
+        if length > self._compaction_threshold:
+            self._schedule_compaction(document_id)
 
     async def get_updates(self, document_id: str) -> List[bytes]:
+        """
+        The document's snapshot, if it has one, followed by the updates since.
+        """
         document_id = document_id.replace(":", "_")
 
         if self._redis:
             redis_key = f"{self._redis_key_prefix}:{document_id}:updates"
             updates = await self._redis.lrange(redis_key, 0, -1)
-            return [bytes(json.loads(update)) for update in updates]
+            updates = [self._decode_update(update) for update in updates]
         else:
-            return self._updates.get(document_id, [])
+            updates = list(self._updates.get(document_id, []))
+
+        # Documents stored before compaction existed get compacted on their next join
+        if len(updates) > self._compaction_threshold:
+            self._schedule_compaction(document_id)
+        return updates
+
+    def _schedule_compaction(self, document_id: str):
+        if document_id in self._compactions:
+            return
+
+        task = asyncio.create_task(self.compact(document_id))
+        self._compactions[document_id] = task
+        task.add_done_callback(lambda _: self._compactions.pop(document_id, None))
+
+    @staticmethod
+    def _merge_updates(updates: List[bytes]) -> bytes:
+        ydoc = Y.Doc()
+        for update in updates:
+            ydoc.apply_update(update)
+        return ydoc.get_update()
+
+    async def compact(self, document_id: str):
+        """
+        Merges the document's updates into one snapshot update. Updates appended
+        meanwhile stay after it.
+        """
+        document_id = document_id.replace(":", "_")
+
+        try:
+            if self._redis:
+                redis_key = f"{self._redis_key_prefix}:{document_id}:updates"
+                # Only one worker compacts a document at a time, so the head of the
+                # list doesn't change under us, appends only go to its tail
+                lock_key = f"{self._redis_key_prefix}:{document_id}:compaction"
+                lock_token = str(uuid.uuid4())
+                if not await self._redis.set(lock_key, lock_token, nx=True, ex=60):
+                    return
+
+                try:
+                    updates = await self._redis.lrange(redis_key, 0, -1)
+                    count = len(updates)
+                    if count < 2:
+                        return
+
+                    snapshot = await asyncio.to_thread(
+                        self._merge_updates,
+                        [self._decode_update(update) for update in updates],
+                    )
+
+                    # Cleared (or the lock lost) while merging
+                    if not await self._redis.eval(
+                        COMPACT_SCRIPT,
+                        2,
+                        redis_key,
+                        lock_key,
+                        lock_token,
+                        count,
+                        updates[0],
+                        updates[-1],
+                        self._encode_update(snapshot),
+                    ):
+                        return
+                finally:
+                    await self._redis.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, lock_token)
+            else:
+                updates = self._updates.get(document_id, [])
+                count = len(updates)
+                if count < 2:
+                    return
+
+                snapshot = await asyncio.to_thread(self._merge_updates, updates[:count])
+
+                # Cleared while merging
+                if self._updates.get(document_id) is updates:
+                    updates[:count] = [snapshot]
+
+            log.debug(f"Compacted {count} updates of document {document_id}")
+        except Exception as e:
+            log.error(f"Failed to compact document {document_id}: {e}")
 
     async def document_exists(self, document_id: str) -> bool:
         document_id = document_id.replace(":", "_")
@@ -158,41 +565,75 @@ class YdocManager:
         else:
             return self._users.get(document_id, [])
 
+    def _user_documents_key(self, user_id: str) -> str:
+        return f"{self._redis_key_prefix}:user_documents:{user_id}"
+
     async def add_user(self, document_id: str, user_id: str):
         document_id = document_id.replace(":", "_")
 
         if self._redis:
             redis_key = f"{self._redis_key_prefix}:{document_id}:users"
-            await self._redis.sadd(redis_key, user_id)
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.sadd(redis_key, user_id)
+                # Reverse index, so disconnecting only touches the user's own documents
+                pipe.sadd(self._user_documents_key(user_id), document_id)
+                await pipe.execute()
         else:
             if document_id not in self._users:
                 self._users[document_id] = set()
             self._users[document_id].add(user_id)
+            self._user_documents.setdefault(user_id, set()).add(document_id)
 
     async def remove_user(self, document_id: str, user_id: str):
         document_id = document_id.replace(":", "_")
 
         if self._redis:
             redis_key = f"{self._redis_key_prefix}:{document_id}:users"
-            await self._redis.srem(redis_key, user_id)
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.srem(redis_key, user_id)
+                pipe.srem(self._user_documents_key(user_id), document_id)
+                await pipe.execute()
         else:
             if document_id in self._users and user_id in self._users[document_id]:
                 self._users[document_id].remove(user_id)
+            documents = self._user_documents.get(user_id)
+            if documents is not None:
+                documents.discard(document_id)
+                if not documents:
+                    del self._user_documents[user_id]
 
     async def remove_user_from_all_documents(self, user_id: str):
         if self._redis:
-            keys = await self._redis.keys(f"{self._redis_key_prefix}:*")
-            for key in keys:
-                if key.endswith(":users"):
-                    await self._redis.srem(key, user_id)
-
-                    document_id = key.split(":")[-2]
-                    if len(await self.get_users(document_id)) == 0:
-                        await self.clear_document(document_id)
+            user_documents_key = self._user_documents_key(user_id)
+            document_ids = await self._redis.smembers(user_documents_key)
+            if not document_ids:
+                return
+
+            document_ids = list(document_ids)
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for document_id in document_ids:
+                    redis_key = f"{self._redis_key_prefix}:{document_id}:users"
+                    pipe.srem(redis_key, user_id)
+                    pipe.scard(redis_key)
+                pipe.delete(user_documents_key)
+                results = await pipe.execute()
+
+            # Documents nobody has open anymore
+            empty_document_ids = [
+                document_id
+                for document_id, count in zip(document_ids, results[1::2])
+                if count == 0
+            ]
+            if empty_document_ids:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    for document_id in empty_document_ids:
+                        pipe.delete(f"{self._redis_key_prefix}:{document_id}:updates")
+                        pipe.delete(f"{self._redis_key_prefix}:{document_id}:users")
+                    await pipe.execute()
 
         else:
-            for document_id in list(self._users.keys()):
-                if user_id in self._users[document_id]:
+            for document_id in self._user_documents.pop(user_id, set()):
+                if user_id in self._users.get(document_id, set()):
                     self._users[document_id].remove(user_id)
                     if not self._users[document_id]:
                         del self._users[document_id]
@@ -212,3 +653,258 @@ class YdocManager:
                 del self._updates[document_id]
             if document_id in self._users:
                 del self._users[document_id]
+
+
+class MessagePatch:
+    """
+    Pending changes to one chat message, merged from event emitter events
+    in the order they came in, so they can be written in one go.
+    """
+
+    def __init__(self):
+        # Replaces the message content (a "replace" event), then `appended_content` goes after it
+        self.content = None
+        self.appended_content = ""
+        # New embeds and files go first, like the events do one by one
+        self.embeds = []
+        self.files = []
+        self.sources = []
+        self.statuses = []
+        self.events = 0
+        self.size = 0
+        self.failures = 0
+
+    def add(self, event_data: dict) -> bool:
+        """
+        Merges an event in. Returns False for events that don't change the message.
+        """
+        event_type = event_data.get("type")
+        data = event_data.get("data", {})
+
+        if event_type == "status":
+            self.statuses.append(data)
+        elif event_type == "message":
+            content = data.get("content", "")
+            self.appended_content += content
+            self.size += len(content)
+        elif event_type == "replace":
+            self.content = data.get("content", "")
+            self.appended_content = ""
+            self.size += len(self.content)
+        elif event_type == "embeds":
+            self.embeds = data.get("embeds", []) + self.embeds
+        elif event_type == "files":
+            self.files = data.get("files", []) + self.files
+        elif event_type in ["source", "citation"] and data.get("type") == None:
+            self.sources.append(data)
+        else:
+            return False
+
+        self.events += 1
+        return True
+
+    def merge(self, later: "MessagePatch"):
+        """
+        Merges in a patch made after this one.
+        """
+        if later.content is not None:
+            self.content = later.content
+            self.appended_content = later.appended_content
+        else:
+            self.appended_content += later.appended_content
+        self.embeds = later.embeds + self.embeds
+        self.files = later.files + self.files
+        self.sources += later.sources
+        self.statuses += later.statuses
+        self.events += later.events
+        self.size += later.size
+
+    def apply(self, history: dict, message_id: str) -> bool:
+        """
+        Applies the patch to a chat history, in place. Returns whether anything changed.
+        """
+        upsert = bool(
+            self.content is not None
+            or self.appended_content
+            or self.embeds
+            or self.files
+            or self.sources
+        )
+
+        messages = history["messages"]
+        message = messages.get(message_id)
+        if message is None:
+            if not upsert:
+                return False
+            message = messages[message_id] = {}
+
+        if self.content is not None:
+            message["content"] = self.content + self.appended_content
+        elif self.appended_content:
+            message["content"] = message.get("content", "") + self.appended_content
+        if "content" in message and isinstance(message["content"], str):
+            message["content"] = message["content"].replace("\x00", "")
+
+        if self.embeds:
+            message["embeds"] = self.embeds + message.get("embeds", [])
+        if self.files:
+            message["files"] = self.files + message.get("files", [])
+        if self.sources:
+            message["sources"] = message.get("sources", []) + self.sources
+        if self.statuses:
+            message["statusHistory"] = message.get("statusHistory", []) + self.statuses
+
+        if upsert:
+            history["currentId"] = message_id
+        return True
+
+
+class MessageWriteBuffer:
+    """
+    Write-behind buffer of chat message updates, keyed by (chat_id, message_id).
+
+    Events are merged into a MessagePatch in memory. A message's patch is written
+    `interval` seconds after its first pending event, as soon as it holds `max_events`
+    events or `max_bytes` of content, and when its completion ends (`finish`).
+    Writes run in a thread, one at a time per message so they land in order.
+    A failed write is merged back in front of newer changes and retried.
+
+    `write(chat_id, update)` is Chats.update_messages_by_id.
+    """
+
+    MAX_FAILURES = 3
+
+    def __init__(self, write, interval=1.0, max_events=50, max_bytes=64 * 1024):
+        self.write = write
+        self.interval = interval
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+
+        self.pending = {}
+        self.timers = {}
+        self.locks = {}
+        self.writes = {}
+        self.tasks = set()
+
+        self.stats = {
+            "events": 0,
+            "db_writes": 0,
+            "failed_writes": 0,
+            "completions": 0,
+            "completion_db_writes": 0,
+        }
+
+    async def add(self, chat_id: str, message_id: str, event_data: dict):
+        key = (chat_id, message_id)
+        patch = self.pending.get(key) or MessagePatch()
+        if not patch.add(event_data):
+            return
+        self.pending[key] = patch
+        self.stats["events"] += 1
+
+        if patch.events >= self.max_events or patch.size >= self.max_bytes:
+            await self.flush(key)
+        elif key not in self.timers:
+            self._schedule(key)
+
+    def _schedule(self, key):
+        def start_flush():
+            task = asyncio.create_task(self.flush(key))
+            # Keep a reference until it's done, or it may be garbage collected
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        self.timers[key] = asyncio.get_running_loop().call_later(
+            self.interval, start_flush
+        )
+
+    async def flush(self, key):
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            patch = self.pending.pop(key, None)
+            if patch is None:
+                return
+
+            chat_id, message_id = key
+            try:
+                await asyncio.to_thread(
+                    self.write,
+                    chat_id,
+                    lambda history: patch.apply(history, message_id),
+                )
+                self.stats["db_writes"] += 1
+                self.writes[key] = self.writes.get(key, 0) + 1
+            except Exception as e:
+                self.stats["failed_writes"] += 1
+                patch.failures += 1
+                if patch.failures >= self.MAX_FAILURES:
+                    log.error(
+                        f"Dropping {patch.events} updates of message {message_id} in chat {chat_id}: {e}"
+                    )
+                    return
+
+                log.warning(
+                    f"Failed to write updates of message {message_id} in chat {chat_id}, retrying: {e}"
+                )
+                newer = self.pending.get(key)
+                if newer is not None:
+                    patch.merge(newer)
+                self.pending[key] = patch
+                if key not in self.timers:
+                    self._schedule(key)
+
+    async def finish(self, chat_id: str, message_id: str):
+        """
+        Writes whatever is pending for the message, at the end of its completion.
+        """
+        key = (chat_id, message_id)
+        await self.flush(key)
+
+        lock = self.locks.get(key)
+        if lock is not None and not lock.locked() and key not in self.pending:
+            del self.locks[key]
+
+        writes = self.writes.pop(key, 0)
+        self.stats["completions"] += 1
+        self.stats["completion_db_writes"] += writes
+        log.debug(f"Message {message_id} in chat {chat_id}: {writes} DB writes")
+
+    async def flush_all(self):
+        for key in list(self.pending):
+            await self.flush(key)
+
+    def flush_all_sync(self):
+        """
+        Last resort at interpreter exit, when the event loop may be gone.
+        """
+        for timer in self.timers.values():
+            timer.cancel()
+        self.timers = {}
+
+        pending, self.pending = self.pending, {}
+        for (chat_id, message_id), patch in pending.items():
+            try:
+                self.write(
+                    chat_id,
+                    lambda history, patch=patch, message_id=message_id: patch.apply(
+                        history, message_id
+                    ),
+                )
+                self.stats["db_writes"] += 1
+            except Exception as e:
+                log.error(
+                    f"Lost updates of message {message_id} in chat {chat_id}: {e}"
+                )
+
+    def metrics(self) -> dict:
+        metrics = dict(self.stats)
+        metrics["pending"] = len(self.pending)
+        completions = metrics["completions"]
+        metrics["db_writes_per_completion"] = (
+            metrics["completion_db_writes"] / completions if completions else 0.0
+        )
+        return metrics
@@ -0,0 +1,178 @@
+"""
+Transcribing a long recording that's over the STT file size limit (MAX_FILE_SIZE).
+
+Makes a synthetic 16kHz mono WAV (5s of tone, 2s of silence, over and over) and
+transcribes it with a stub STT call that takes 0.3s + 0.5ms per second of audio.
+Each case runs in its own process, for its peak memory.
+
+- before: compress_audio then split_audio as they were: the whole file decoded into
+  a pydub AudioSegment, re-exported, chunks sized from the byte ratio and re-exported
+  until they fit, then every chunk transcribed at once. (mp3 is decoded the way
+  pydub does it, ffmpeg to an in-memory WAV, without needing ffprobe.)
+- after: utils.audio: one streaming silencedetect pass, one streaming ffmpeg segment
+  pass, chunks transcribed AUDIO_STT_CHUNK_CONCURRENCY at a time as they're written.
+
+120 minutes (220MB): before 50.7s, peak 640MB; after 29.6s, peak 62MB.
+20 minutes (37MB): before 5.4s, peak 135MB; after 4.6s, peak 61MB.
+
+Usage:
+  PYTHONPATH=. python open_webui/test/benchmarks/bench_audio_chunking.py [minutes]
+"""
+
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pydub import AudioSegment
+
+from open_webui.utils.audio import (
+    detect_silences,
+    get_cut_points,
+    iter_audio_chunks,
+    transcribe_chunks,
+)
+
+MAX_FILE_SIZE = 20 * 1024 * 1024
+CHUNK_DURATION = 600
+CONCURRENCY = 4
+
+
+def stub_transcribe(path, duration):
+    time.sleep(0.3 + 0.0005 * duration)
+    return {"text": os.path.basename(path)}
+
+
+def load_mp3(path):
+    wav = subprocess.run(
+        [AudioSegment.converter, "-loglevel", "error", "-i", path, "-f", "wav", "-"],
+        capture_output=True,
+        check=True,
+    ).stdout
+    return AudioSegment.from_wav(io.BytesIO(wav))
+
+
+def before(file_path):
+    # compress_audio
+    audio = AudioSegment.from_file(file_path)
+    audio = audio.set_frame_rate(16000).set_channels(1)
+    compressed_path = os.path.splitext(file_path)[0] + "_compressed.mp3"
+    audio.export(compressed_path, format="mp3", bitrate="32k")
+
+    # split_audio
+    chunk_paths = [compressed_path]
+    durations = [len(audio) / 1000]
+    del audio
+    if os.path.getsize(compressed_path) > MAX_FILE_SIZE:
+        audio = load_mp3(compressed_path)
+        duration_ms = len(audio)
+        approx_chunk_ms = max(
+            int(duration_ms * (MAX_FILE_SIZE / os.path.getsize(compressed_path)))
+            - 1000,
+            1000,
+        )
+        chunk_paths = []
+        durations = []
+        start = 0
+        while start < duration_ms:
+            end = min(start + approx_chunk_ms, duration_ms)
+            chunk_path = f"{compressed_path}_chunk_{len(chunk_paths)}.mp3"
+            audio[start:end].export(chunk_path, format="mp3", bitrate="32k")
+            while os.path.getsize(chunk_path) > MAX_FILE_SIZE and end - start > 5000:
+                end = start + (end - start) // 2
+                audio[start:end].export(chunk_path, format="mp3", bitrate="32k")
+            chunk_paths.append(chunk_path)
+            durations.append((end - start) / 1000)
+            start = end
+
+    with ThreadPoolExecutor() as executor:
+        futures = [
+            executor.submit(stub_transcribe, path, duration)
+            for path, duration in zip(chunk_paths, durations)
+        ]
+        return len([future.result() for future in futures])
+
+
+def after(file_path):
+    chunk_duration = min(CHUNK_DURATION, MAX_FILE_SIZE * 0.9 / (32000 / 8))
+    silences, duration = detect_silences(file_path)
+    chunks = iter_audio_chunks(
+        file_path,
+        os.path.splitext(file_path)[0] + "_chunks",
+        chunk_duration,
+        cut_points=get_cut_points(duration, chunk_duration, silences),
+    )
+    results = transcribe_chunks(
+        chunks,
+        lambda chunk: stub_transcribe(chunk.path, chunk.end - chunk.start),
+        concurrency=CONCURRENCY,
+    )
+    return len(results)
+
+
+def run_case(name, file_path):
+    start = time.perf_counter()
+    chunks = {"before": before, "after": after}[name](file_path)
+    print(
+        json.dumps(
+            {
+                "seconds": time.perf_counter() - start,
+                "chunks": chunks,
+                # kB on Linux
+                "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            }
+        )
+    )
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--case":
+        return run_case(sys.argv[2], sys.argv[3])
+
+    minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 120
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = os.path.join(tmp, "recording.wav")
+        subprocess.run(
+            [
+                AudioSegment.converter,
+                "-loglevel",
+                "error",
+                "-f",
+                "lavfi",
+                "-i",
+                f"sine=f=440:d={minutes * 60},volume='if(lt(mod(t,7),5),1,0)':eval=frame",
+                "-ar",
+                "16000",
+                "-ac",
+                "1",
+                file_path,
+            ],
+            check=True,
+        )
+        print(
+            f"{minutes:.0f} minute WAV, {os.path.getsize(file_path) / 1024 / 1024:.0f}MB"
+        )
+
+        for name in ("before", "after"):
+            r = subprocess.run(
+                [sys.executable, __file__, "--case", name, file_path],
+                capture_output=True,
+                text=True,
+            )
+            if r.returncode != 0:
+                print(f"{name:>6}: failed\n{r.stderr[-1000:]}")
+                continue
+            result = json.loads(r.stdout.strip().splitlines()[-1])
+            print(
+                f"{name:>6}: {result['seconds']:6.1f}s, {result['chunks']:3d} chunks, "
+                f"peak {result['peak_mb']:5.0f}MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Reading request.app.state.config values, as a request does dozens of times.
+
+Every read goes through AppConfig.__getattr__. Runs against a local fake Redis
+server over TCP (fakeredis), or the Redis at REDIS_URL if set.
+
+- before: with Redis, every read is a GET round trip and a json.loads.
+- after: reads come from the worker's snapshot, kept current by the invalidation
+  messages published on writes. Also times how long a write by one worker takes
+  to show up in another.
+
+Usage:
+  DATA_DIR=/tmp/bench-data STATIC_DIR=/tmp/bench-static PYTHONPATH=. python open_webui/test/benchmarks/bench_config_reads.py [seconds]
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+import redis
+from fakeredis import TcpFakeServer
+
+from open_webui.config import PERSISTENT_CONFIG_REGISTRY, AppConfig
+
+PREFIX = "bench-config"
+# About what a chat completion request reads
+READS_PER_REQUEST = 40
+
+
+class RedisGetAppConfig(AppConfig):
+    """AppConfig.__getattr__ as it was: a GET for every read"""
+
+    def __init__(self, redis_url):
+        super().__init__()
+        object.__setattr__(self, "_redis_key_prefix", PREFIX)
+        object.__setattr__(
+            self, "_redis", redis.Redis.from_url(redis_url, decode_responses=True)
+        )
+
+    def __setattr__(self, key, value):
+        self._state[key] = value
+
+    def __getattr__(self, key):
+        if key not in self._state:
+            raise AttributeError(f"Config key '{key}' not found")
+
+        redis_value = self._redis.get(f"{self._redis_key_prefix}:config:{key}")
+        if redis_value is not None:
+            decoded_value = json.loads(redis_value)
+            if self._state[key].value != decoded_value:
+                self._state[key].value = decoded_value
+        return self._state[key].value
+
+
+def make_config(config, items):
+    for item in items:
+        setattr(config, item.env_name, item)
+    return config
+
+
+def reads_per_second(config, keys, seconds):
+    reads = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for key in keys:
+            getattr(config, key)
+        reads += len(keys)
+    return reads / (time.perf_counter() - start)
+
+
+def propagation(writer, reader, key, rounds=20):
+    latencies = []
+    for i in range(rounds):
+        value = f"bench-{i}"
+        start = time.perf_counter()
+        setattr(writer, key, value)
+        while getattr(reader, key) != value:
+            time.sleep(0.0001)
+        latencies.append(time.perf_counter() - start)
+    return sorted(latencies)[len(latencies) // 2]
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+
+    server = None
+    redis_url = os.environ.get("REDIS_URL")
+    if not redis_url:
+        server = TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        redis_url = "redis://%s:%d" % server.server_address
+
+    # Each worker has its own PersistentConfig objects, and so does each case here
+    items = PERSISTENT_CONFIG_REGISTRY[:READS_PER_REQUEST]
+    keys = [item.env_name for item in items]
+    redis.Redis.from_url(redis_url).set(
+        f"{PREFIX}:config:{keys[0]}", json.dumps(items[0].value)
+    )
+
+    results = {
+        "no Redis": reads_per_second(make_config(AppConfig(), items), keys, seconds),
+        "before, Redis": reads_per_second(
+            make_config(RedisGetAppConfig(redis_url), items), keys, seconds
+        ),
+        "after, Redis": reads_per_second(
+            make_config(AppConfig(redis_url=redis_url, redis_key_prefix=PREFIX), items),
+            keys,
+            seconds,
+        ),
+    }
+    for name, rate in results.items():
+        print(
+            f"{name:>14}: {rate:12,.0f} reads/s, "
+            f"{READS_PER_REQUEST / rate * 1e6:9.1f}us per request ({READS_PER_REQUEST} reads)"
+        )
+
+    # Two workers, with their own copies of a config value
+    item = next(item for item in items if isinstance(item.value, str))
+    key = item.env_name
+    original = item.value
+    workers = []
+    for _ in range(2):
+        config = AppConfig(redis_url=redis_url, redis_key_prefix=PREFIX)
+        config._state[key] = type(item)(item.env_name, item.config_path, item.env_value)
+        workers.append(config)
+    # Both listeners subscribed
+    time.sleep(0.5)
+
+    try:
+        latency = propagation(*workers, key)
+        print(
+            f"write on one worker seen by another after {latency * 1000:.2f}ms (median)"
+        )
+    finally:
+        item.value = original
+        item.save()
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+CPU per streamed token of Open WebUI's content block handling (process_chat_response).
+
+Replays a stream of reasoning tokens inside <think> tags followed by the answer, and runs what
+the middleware runs for every delta: tag detection for reasoning, solution and code interpreter
+tags, then serializing the content blocks.
+
+- before: tags are searched in the whole accumulated content, and every block is serialized again.
+- after: IncrementalSearch only scans what was streamed since the last delta,
+  and ContentBlockSerializer reuses the closed blocks and the reasoning lines it already quoted.
+
+Usage:
+  PYTHONPATH=. python open_webui/test/benchmarks/bench_content_blocks.py [tokens]
+"""
+
+import random
+import re
+import sys
+import time
+
+from open_webui.utils.content_blocks import (
+    ContentBlockSerializer,
+    IncrementalSearch,
+    serialize_content_blocks,
+    tag_content_handler,
+)
+
+REASONING_TAGS = [
+    ("<think>", "</think>"),
+    ("<thinking>", "</thinking>"),
+    ("<reason>", "</reason>"),
+    ("<reasoning>", "</reasoning>"),
+    ("<thought>", "</thought>"),
+    ("<Thought>", "</Thought>"),
+    ("<|begin_of_thought|>", "<|end_of_thought|>"),
+    ("◁think▷", "◁/think▷"),
+]
+SOLUTION_TAGS = [("<|begin_of_solution|>", "<|end_of_solution|>")]
+CODE_INTERPRETER_TAGS = [("<code_interpreter>", "</code_interpreter>")]
+
+WORDS = "the model thinks about a & b < c and whether > 3 steps are needed".split()
+
+
+def make_stream(tokens):
+    rng = random.Random(0)
+    reasoning = tokens * 4 // 5
+    stream = ["<think>", "\n"]
+    for i in range(tokens - 4):
+        stream.append(rng.choice(WORDS) + ("\n" if i % 15 == 14 else " "))
+        if i == reasoning:
+            stream.append("</think>")
+    return stream
+
+
+def replay(stream, incremental):
+    content = ""
+    content_blocks = [{"type": "text", "content": ""}]
+    serialize = ContentBlockSerializer() if incremental else serialize_content_blocks
+    tag_search = IncrementalSearch() if incremental else None
+    timings = []
+
+    for value in stream:
+        start = time.process_time()
+
+        content = f"{content}{value}"
+        content_blocks[-1]["content"] = content_blocks[-1]["content"] + value
+        content, content_blocks, _ = tag_content_handler(
+            "reasoning", REASONING_TAGS, content, content_blocks, tag_search
+        )
+        content, content_blocks, _ = tag_content_handler(
+            "solution", SOLUTION_TAGS, content, content_blocks, tag_search
+        )
+        content, content_blocks, _ = tag_content_handler(
+            "code_interpreter",
+            CODE_INTERPRETER_TAGS,
+            content,
+            content_blocks,
+            tag_search,
+        )
+        serialized = serialize(content_blocks)
+
+        timings.append(time.process_time() - start)
+
+    return serialized, content_blocks, timings
+
+
+def main():
+    tokens = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    stream = make_stream(tokens)
+
+    results = {}
+    for name, incremental in (("before", False), ("after", True)):
+        serialized, content_blocks, timings = replay(stream, incremental)
+        # The reasoning took longer in one run than the other
+        serialized = re.sub(r"\d+( seconds|\")", r"N\1", serialized)
+        results[name] = (serialized, [block["type"] for block in content_blocks])
+        last = timings[-len(timings) // 10 :]
+        print(
+            f"{name:>6}: {sum(timings):7.2f}s CPU, "
+            f"{sum(timings) / len(timings) * 1e6:8.1f}us/token avg, "
+            f"{sum(last) / len(last) * 1e6:8.1f}us/token over the last 10%"
+        )
+
+    assert results["before"] == results["after"], "serialized content differs"
+    print(
+        f"{len(stream)} tokens, {len(results['after'][0])} chars serialized, same output"
+    )
+
+
+if __name__ == "__main__":
+    main()
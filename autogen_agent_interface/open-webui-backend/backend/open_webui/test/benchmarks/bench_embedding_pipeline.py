@@ -0,0 +1,174 @@
+"""
+Embedding a large document's chunks through an OpenAI compatible /embeddings API.
+
+Runs a local stub server that takes 40ms + 0.2ms per text for each request, serves up
+to 8 requests at once (429 with Retry-After beyond that) and refuses more than 256
+texts per request (413).
+
+- before: RAG_EMBEDDING_BATCH_SIZE batches sent one after the other (get_embedding_function).
+- after: EmbeddingPipeline, RAG_EMBEDDING_CONCURRENCY batches in flight, 429s retried,
+  refused batches split, results put back in order.
+
+Usage:
+  PYTHONPATH=. python open_webui/test/benchmarks/bench_embedding_pipeline.py [texts]
+"""
+
+import json
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from open_webui.retrieval.embedding_pipeline import (
+    EmbeddingPipeline,
+    post_embedding_request,
+    raise_for_embedding_status,
+)
+
+DIMENSIONS = 16
+MAX_CONCURRENT = 8
+MAX_BATCH = 256
+
+
+def embedding(text):
+    seed = zlib.crc32(text.encode())
+    return [((seed >> i) & 0xFF) / 255 for i in range(DIMENSIONS)]
+
+
+class StubEmbeddingHandler(BaseHTTPRequestHandler):
+    in_flight = 0
+    lock = threading.Lock()
+    stats = {"requests": 0, "rate_limited": 0, "too_large": 0}
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        texts = json.loads(self.rfile.read(int(self.headers["Content-Length"])))[
+            "input"
+        ]
+
+        cls = StubEmbeddingHandler
+        with cls.lock:
+            cls.stats["requests"] += 1
+            if cls.in_flight >= MAX_CONCURRENT:
+                cls.stats["rate_limited"] += 1
+                return self.respond(
+                    429, {"error": "rate limited"}, {"Retry-After": "0.1"}
+                )
+            if len(texts) > MAX_BATCH:
+                cls.stats["too_large"] += 1
+                return self.respond(413, {"error": "too many inputs"})
+            cls.in_flight += 1
+
+        try:
+            time.sleep(0.04 + 0.0002 * len(texts))
+            self.respond(
+                200, {"data": [{"embedding": embedding(text)} for text in texts]}
+            )
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+
+def post(url, texts):
+    return post_embedding_request(
+        f"{url}/embeddings", json={"input": texts, "model": "stub"}, timeout=30
+    )
+
+
+def before(url, texts, batch_size):
+    embeddings = []
+    for i in range(0, len(texts), batch_size):
+        r = requests.post(
+            f"{url}/embeddings",
+            json={"input": texts[i : i + batch_size], "model": "stub"},
+        )
+        r.raise_for_status()
+        embeddings.extend(elem["embedding"] for elem in r.json()["data"])
+    return embeddings
+
+
+def after(url, texts, batch_size, concurrency=8):
+    def embed_batch(batch):
+        r = post(url, batch)
+        raise_for_embedding_status(r)
+        return [elem["embedding"] for elem in r.json()["data"]]
+
+    pipeline = EmbeddingPipeline(
+        batch_size=batch_size, concurrency=concurrency, backoff=0.05
+    )
+    return pipeline.embed(texts, embed_batch)
+
+
+def run(name, func, expected):
+    StubEmbeddingHandler.stats = dict.fromkeys(StubEmbeddingHandler.stats, 0)
+    start = time.perf_counter()
+    try:
+        embeddings = func()
+    except Exception as e:
+        print(f"{name:>36}: failed ({e.__class__.__name__}: {str(e)[:60]})")
+        return
+    elapsed = time.perf_counter() - start
+
+    assert embeddings == expected, f"{name}: embeddings out of order"
+    stats = StubEmbeddingHandler.stats
+    print(
+        f"{name:>36}: {elapsed:6.2f}s, {len(expected) / elapsed:7.0f} texts/s, "
+        f"{stats['requests']} requests ({stats['rate_limited']} 429, {stats['too_large']} 413)"
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    texts = [f"chunk {i} of a long document" for i in range(count)]
+    expected = [embedding(text) for text in texts]
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubEmbeddingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    try:
+        for batch_size in (16, 64):
+            run(
+                f"before, batch {batch_size}",
+                lambda: before(url, texts, batch_size),
+                expected,
+            )
+            run(
+                f"after, batch {batch_size}, 8 at once",
+                lambda: after(url, texts, batch_size),
+                expected,
+            )
+        run(
+            "after, batch 64, 16 at once (429s)",
+            lambda: after(url, texts, 64, concurrency=16),
+            expected,
+        )
+        run("before, batch 1024 (413s)", lambda: before(url, texts, 1024), expected)
+        run(
+            "after, batch 1024 (413s)",
+            lambda: after(url, texts, 1024),
+            expected,
+        )
+    finally:
+        server.shutdown()
+
+    print(f"{count} texts")
+
+
+if __name__ == "__main__":
+    main()
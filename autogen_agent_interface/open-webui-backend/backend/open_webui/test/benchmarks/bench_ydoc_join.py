@@ -0,0 +1,115 @@
+"""
+Joining a collaborative note (ydoc:document:join) that has accumulated many Yjs updates.
+
+Types a document one character at a time into Redis (fakeredis), then times what a join
+does: load the stored updates, apply them to a Y.Doc and encode its state.
+
+- before: every update stored as a JSON list of ints, all of them replayed on join.
+- after: YdocManager stores base64 updates and merges them into a snapshot once there
+  are more than YDOC_COMPACTION_THRESHOLD, so a join loads the snapshot and the tail.
+
+Usage:
+  PYTHONPATH=. python open_webui/test/benchmarks/bench_ydoc_join.py [updates]
+"""
+
+import asyncio
+import json
+import sys
+import time
+
+import pycrdt as Y
+from fakeredis import aioredis
+
+from open_webui.socket.utils import YdocManager
+
+PREFIX = "bench:ydoc:documents"
+DOCUMENT_ID = "note:bench"
+JOINS = 5
+
+
+def make_updates(count):
+    ydoc = Y.Doc()
+    ydoc["prosemirror"] = text = Y.Text()
+    updates = []
+    ydoc.observe(lambda event: updates.append(event.update))
+    for i in range(count):
+        if i % 10 == 9:
+            # Some typos fixed along the way
+            del text[len(text) - 1]
+        else:
+            text += "abcdefghijklmnopqrstuvwxyz "[i % 27]
+    return updates, str(text)
+
+
+async def stored_bytes(redis):
+    key = f"{PREFIX}:{DOCUMENT_ID.replace(':', '_')}:updates"
+    return sum(len(update) for update in await redis.lrange(key, 0, -1))
+
+
+def load(updates):
+    ydoc = Y.Doc()
+    for update in updates:
+        ydoc.apply_update(bytes(update))
+    state = ydoc.get_update()
+
+    check = Y.Doc()
+    check.apply_update(state)
+    check["prosemirror"] = text = Y.Text()
+    return str(text)
+
+
+async def before(updates):
+    redis = aioredis.FakeRedis(decode_responses=True)
+    key = f"{PREFIX}:{DOCUMENT_ID.replace(':', '_')}:updates"
+
+    start = time.perf_counter()
+    for update in updates:
+        await redis.rpush(key, json.dumps(list(update)))
+    append = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(JOINS):
+        stored = await redis.lrange(key, 0, -1)
+        text = load([bytes(json.loads(update)) for update in stored])
+    join = (time.perf_counter() - start) / JOINS
+
+    return append, join, await stored_bytes(redis), text
+
+
+async def after(updates):
+    redis = aioredis.FakeRedis(decode_responses=True)
+    manager = YdocManager(redis=redis, redis_key_prefix=PREFIX)
+
+    start = time.perf_counter()
+    for update in updates:
+        await manager.append_to_updates(DOCUMENT_ID, update)
+    append = time.perf_counter() - start
+    # The last compaction finishing in the background
+    await asyncio.gather(*manager._compactions.values())
+
+    start = time.perf_counter()
+    for _ in range(JOINS):
+        text = load(await manager.get_updates(DOCUMENT_ID))
+    join = (time.perf_counter() - start) / JOINS
+
+    return append, join, await stored_bytes(redis), text
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    updates, expected = make_updates(count)
+
+    for name, run in (("before", before), ("after", after)):
+        append, join, size, text = await run(updates)
+        assert text == expected, f"{name}: document differs"
+        print(
+            f"{name:>6}: join {join * 1000:8.1f}ms, "
+            f"append {append / count * 1e6:6.1f}us/update, "
+            f"{size / 1024:8.1f}KiB stored"
+        )
+
+    print(f"{count} updates, {len(expected)} chars, same document")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,266 @@
+import math
+import threading
+from collections import Counter
+
+import pytest
+
+from open_webui.retrieval.vector.bm25 import B, K1, BM25Index, BM25IndexedVectorDB
+from open_webui.retrieval.vector.main import GetResult, VectorDBBase, VectorItem
+
+DOCUMENTS = {
+    "1": "the quick brown fox",
+    "2": "the lazy dog sleeps all day",
+    "3": "a quick dog and a quick fox",
+    "4": "foxes and dogs are not the same",
+}
+
+
+class FakeVectorDB(VectorDBBase):
+    """Keeps collections in memory, counting full fetches"""
+
+    def __init__(self):
+        self.collections = {}
+        self.gets = 0
+
+    def has_collection(self, collection_name):
+        return collection_name in self.collections
+
+    def delete_collection(self, collection_name):
+        self.collections.pop(collection_name, None)
+
+    def insert(self, collection_name, items):
+        self.upsert(collection_name, items)
+
+    def upsert(self, collection_name, items):
+        collection = self.collections.setdefault(collection_name, {})
+        for item in items:
+            collection[item.id] = item
+
+    def search(self, collection_name, vectors, limit):
+        return None
+
+    def query(self, collection_name, filter, limit=None):
+        return None
+
+    def get(self, collection_name):
+        self.gets += 1
+        items = list(self.collections.get(collection_name, {}).values())
+        return GetResult(
+            ids=[[item.id for item in items]],
+            documents=[[item.text for item in items]],
+            metadatas=[[item.metadata for item in items]],
+        )
+
+    def delete(self, collection_name, ids=None, filter=None):
+        collection = self.collections.get(collection_name, {})
+        for id, item in list(collection.items()):
+            if (ids and id in ids) or (
+                filter
+                and all(
+                    item.metadata.get(key) == value for key, value in filter.items()
+                )
+            ):
+                del collection[id]
+
+    def reset(self):
+        self.collections.clear()
+
+
+def make_items(documents):
+    return [
+        VectorItem(id=id, text=text, vector=[0.0], metadata={"file_id": f"f{id}"})
+        for id, text in documents.items()
+    ]
+
+
+def bm25_scores(documents, query):
+    """BM25 Okapi over whitespace tokens, as BM25Index scores it"""
+    tokenized = {id: text.split() for id, text in documents.items()}
+    avg_length = sum(len(tokens) for tokens in tokenized.values()) / len(tokenized)
+    scores = {}
+    for term in set(query.split()):
+        df = sum(term in tokens for tokens in tokenized.values())
+        if not df:
+            continue
+        idf = math.log((len(tokenized) - df + 0.5) / (df + 0.5) + 1)
+        for id, tokens in tokenized.items():
+            tf = Counter(tokens)[term]
+            if tf:
+                norm = tf + K1 * (1 - B + B * len(tokens) / avg_length)
+                scores[id] = scores.get(id, 0.0) + idf * tf * (K1 + 1) / norm
+    return scores
+
+
+def search_ids(index, query, k=10):
+    return [id for _, id, _, _ in index.search(query, k)]
+
+
+class TestBM25Index:
+    def test_scores_match_bm25_okapi(self, tmp_path):
+        index = BM25Index(str(tmp_path / "index.sqlite"), 0)
+        index.add(
+            [{"id": id, "text": text, "metadata": {}} for id, text in DOCUMENTS.items()]
+        )
+
+        expected = bm25_scores(DOCUMENTS, "quick fox dog")
+        results = index.search("quick fox dog", 10)
+        assert [id for _, id, _, _ in results] == sorted(
+            expected, key=expected.get, reverse=True
+        )
+        for score, id, text, _ in results:
+            assert score == pytest.approx(expected[id])
+            assert text == DOCUMENTS[id]
+
+        assert search_ids(index, "quick", 1) == ["3"]
+        assert index.search("missing", 10) == []
+
+    def test_replace_and_delete(self, tmp_path):
+        index = BM25Index(str(tmp_path / "index.sqlite"), 0)
+        index.add(
+            [
+                {"id": id, "text": text, "metadata": {"file_id": f"f{id}"}}
+                for id, text in DOCUMENTS.items()
+            ]
+        )
+
+        # Same id: replaced, not added
+        index.add([{"id": "1", "text": "zebra", "metadata": {"file_id": "f1"}}])
+        assert index.count() == 4
+        assert search_ids(index, "zebra") == ["1"]
+        assert "1" not in search_ids(index, "brown")
+
+        index.delete(ids=["2"])
+        index.delete(filter={"file_id": "f3"})
+        assert index.count() == 2
+        assert search_ids(index, "quick dog") == []
+
+        documents = {"1": "zebra", "4": DOCUMENTS["4"]}
+        expected = bm25_scores(documents, "zebra foxes")
+        assert {id: score for score, id, _, _ in index.search("zebra foxes", 10)} == (
+            pytest.approx(expected)
+        )
+
+
+class TestBM25IndexedVectorDB:
+    def test_writes_keep_the_index_in_sync(self, tmp_path):
+        client = FakeVectorDB()
+        db = BM25IndexedVectorDB(client, str(tmp_path), 0)
+
+        db.insert("docs", make_items(DOCUMENTS))
+        index = db.get_bm25_index("docs")
+        # Complete from its first write, never fetched
+        assert client.gets == 0
+        assert index.count() == 4
+
+        db.upsert("docs", make_items({"1": "zebra"}))
+        assert search_ids(index, "zebra") == ["1"]
+
+        db.delete("docs", ids=["2"])
+        db.delete("docs", filter={"file_id": "f3"})
+        assert sorted(search_ids(index, "the zebra foxes")) == ["1", "4"]
+        assert client.gets == 0
+
+        db.delete_collection("docs")
+        assert db.get_bm25_index("docs").count() == 0
+
+    def test_existing_collections_are_built_once(self, tmp_path):
+        client = FakeVectorDB()
+        client.insert("docs", make_items(DOCUMENTS))
+        db = BM25IndexedVectorDB(client, str(tmp_path), 0)
+
+        assert search_ids(db.get_bm25_index("docs"), "quick", 1) == ["3"]
+        assert search_ids(db.get_bm25_index("docs"), "lazy") == ["2"]
+        assert client.gets == 1
+
+        # Another worker's index of the same file is complete, too
+        other = BM25IndexedVectorDB(client, str(tmp_path), 0)
+        assert other.get_bm25_index("docs").count() == 4
+        assert client.gets == 1
+
+    def test_concurrent_first_writes_keep_each_other(self, tmp_path):
+        client = FakeVectorDB()
+        db = BM25IndexedVectorDB(client, str(tmp_path), 0)
+        # Both writes checked for the collection before either created it
+        client.has_collection = lambda collection_name: False
+
+        db.insert("docs", make_items({"1": DOCUMENTS["1"]}))
+        db.insert("docs", make_items({"2": DOCUMENTS["2"]}))
+
+        index = db.get_bm25_index("docs")
+        assert search_ids(index, "fox") == ["1"]
+        assert search_ids(index, "lazy") == ["2"]
+        assert client.gets == 1
+
+    def test_failed_update_drops_the_index(self, tmp_path, monkeypatch):
+        client = FakeVectorDB()
+        db = BM25IndexedVectorDB(client, str(tmp_path), 0)
+        db.insert("docs", make_items(DOCUMENTS))
+
+        def fail(*args, **kwargs):
+            raise RuntimeError("disk full")
+
+        monkeypatch.setattr(BM25Index, "add", fail)
+        db.upsert("docs", make_items({"5": "zebra"}))
+        monkeypatch.undo()
+
+        # The vector DB write went through, and the index is rebuilt from it
+        assert search_ids(db.get_bm25_index("docs"), "zebra") == ["5"]
+        assert client.gets == 1
+
+    def test_reset_removes_every_index(self, tmp_path):
+        client = FakeVectorDB()
+        db = BM25IndexedVectorDB(client, str(tmp_path), 0)
+        db.insert("a", make_items(DOCUMENTS))
+        db.insert("b", make_items(DOCUMENTS))
+
+        db.reset()
+        assert db.get_bm25_index("a").count() == 0
+        assert db.get_bm25_index("b").count() == 0
+
+
+class TestBuild:
+    def test_writers_are_not_blocked_while_fetching(self, tmp_path):
+        client = FakeVectorDB()
+        client.insert("docs", make_items(DOCUMENTS))
+        db = BM25IndexedVectorDB(client, str(tmp_path), 0)
+        writes = []
+
+        get = client.get
+
+        def get_while_writing(collection_name):
+            result = get(collection_name)
+            if not writes:
+                # A write from another thread while the collection is being fetched
+                writer = threading.Thread(
+                    target=lambda: writes.append(
+                        db.upsert("docs", make_items({"5": "zebra"}))
+                    )
+                )
+                writer.start()
+                writer.join(5)
+                assert writes, "The index write waited for the fetch"
+            return result
+
+        client.get = get_while_writing
+        index = db.get_bm25_index("docs")
+
+        # The first fetch missed the write, so the build fetched again
+        assert client.gets == 2
+        assert index.count() == 5
+        assert search_ids(index, "zebra") == ["5"]
+
+    def test_last_attempt_fetches_in_the_transaction(self, tmp_path):
+        index = BM25Index(str(tmp_path / "index.sqlite"), 0)
+        fetches = []
+
+        def fetch():
+            fetches.append(1)
+            if len(fetches) < 3:
+                # Always changed meanwhile
+                index.add([{"id": f"x{len(fetches)}", "text": "x", "metadata": {}}])
+            return GetResult(ids=[["1"]], documents=[["one"]], metadatas=[[{}]])
+
+        index.build(fetch, attempts=3)
+        assert len(fetches) == 3
+        assert index.is_complete()
+        assert search_ids(index, "one") == ["1"]
@@ -0,0 +1,112 @@
+import numpy as np
+
+from open_webui.retrieval.embedding_cache import EmbeddingCache
+
+DIMENSIONS = 8
+# Bytes of one float32 vector
+VECTOR_SIZE = DIMENSIONS * 4
+
+
+class FakeEmbeddings:
+    """Embeds texts deterministically, recording what it was asked to embed"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return [
+            np.random.default_rng(abs(hash(text)) % 2**32)
+            .random(DIMENSIONS, dtype=np.float32)
+            .tolist()
+            for text in texts
+        ]
+
+
+class TestEmbeddingCache:
+    def test_only_new_texts_are_embedded(self, tmp_path):
+        cache = EmbeddingCache(str(tmp_path), memory_size=1024**2, disk_size=1024**2)
+        embed = FakeEmbeddings()
+
+        first = cache.get_or_embed("", "model", "passage: ", ["a", "b", "a"], embed)
+        assert embed.calls == [["a", "b"]]
+        assert first[0] == first[2]
+
+        second = cache.get_or_embed("", "model", "passage: ", ["b", "c", "a"], embed)
+        assert embed.calls[1:] == [["c"]]
+        assert second[0] == first[1]
+        assert second[2] == first[0]
+
+        metrics = cache.metrics()
+        assert metrics["memory_hits"] == 2
+        assert metrics["misses"] == 3
+
+    def test_keyed_by_engine_model_and_prefix(self, tmp_path):
+        cache = EmbeddingCache(str(tmp_path), memory_size=1024**2, disk_size=1024**2)
+        embed = FakeEmbeddings()
+
+        cache.get_or_embed("", "model", None, ["a"], embed)
+        cache.get_or_embed("", "model", "query: ", ["a"], embed)
+        cache.get_or_embed("", "other-model", None, ["a"], embed)
+        cache.get_or_embed("ollama", "model", None, ["a"], embed)
+        cache.get_or_embed("", "model", None, ["a"], embed)
+
+        assert len(embed.calls) == 4
+
+    def test_persisted_across_instances(self, tmp_path):
+        embed = FakeEmbeddings()
+        cache = EmbeddingCache(str(tmp_path), memory_size=1024**2, disk_size=1024**2)
+        first = cache.get_or_embed("", "model", None, ["a", "b"], embed)
+
+        cache = EmbeddingCache(str(tmp_path), memory_size=1024**2, disk_size=1024**2)
+        second = cache.get_or_embed("", "model", None, ["a", "b"], embed)
+
+        assert len(embed.calls) == 1
+        assert second == first
+        assert cache.metrics()["disk_hits"] == 2
+
+    def test_memory_budget(self):
+        cache = EmbeddingCache(None, memory_size=3 * VECTOR_SIZE, disk_size=0)
+        embed = FakeEmbeddings()
+
+        cache.get_or_embed("", "model", None, ["a", "b", "c", "d"], embed)
+        metrics = cache.metrics()
+        assert metrics["memory_entries"] == 3
+        assert metrics["memory_bytes"] <= 3 * VECTOR_SIZE
+        assert metrics["memory_evictions"] == 1
+
+        # The oldest one was dropped
+        cache.get_or_embed("", "model", None, ["a", "d"], embed)
+        assert embed.calls[1:] == [["a"]]
+
+    def test_disk_budget_drops_least_recently_used(self, tmp_path):
+        cache = EmbeddingCache(str(tmp_path), memory_size=0, disk_size=10 * VECTOR_SIZE)
+        embed = FakeEmbeddings()
+
+        for i in range(10):
+            cache.get_or_embed("", "model", None, [f"text {i}"], embed)
+        # Read again, so it's the most recently used
+        cache.get_or_embed("", "model", None, ["text 0"], embed)
+        cache.get_or_embed("", "model", None, ["text 10"], embed)
+
+        metrics = cache.metrics()
+        assert metrics["disk_bytes"] <= 10 * VECTOR_SIZE
+        assert metrics["disk_evictions"] >= 1
+
+        embed.calls = []
+        cache.get_or_embed("", "model", None, ["text 0", "text 10"], embed)
+        assert embed.calls == []
+        cache.get_or_embed("", "model", None, ["text 1"], embed)
+        assert embed.calls == [["text 1"]]
+
+    def test_failed_embeddings_are_not_cached(self, tmp_path):
+        cache = EmbeddingCache(str(tmp_path), memory_size=1024**2, disk_size=1024**2)
+        embed = FakeEmbeddings()
+        cache.get_or_embed("", "model", None, ["a"], embed)
+
+        assert cache.get_or_embed("", "model", None, ["b"], lambda texts: None) is None
+        # Some cached, the rest failed: nothing to line them up with
+        assert (
+            cache.get_or_embed("", "model", None, ["a", "b"], lambda texts: []) is None
+        )
+        assert cache.metrics()["writes"] == 1
@@ -0,0 +1,142 @@
+import threading
+import time
+
+import fakeredis
+
+from open_webui.retrieval.embedding_pipeline import (
+    EmbeddingPipeline,
+    EmbeddingRequestError,
+    RateLimiter,
+)
+
+
+class FakeBackend:
+    """Embeds each text as [its number], failing as told, recording the batches it got"""
+
+    def __init__(self, max_batch=None, failures=()):
+        self.max_batch = max_batch
+        self.failures = list(failures)
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, texts):
+        with self.lock:
+            self.batches.append(len(texts))
+            failure = self.failures.pop(0) if self.failures else None
+        if failure:
+            raise failure
+        if self.max_batch and len(texts) > self.max_batch:
+            raise EmbeddingRequestError("Too many inputs", status=413)
+        # Slower for the first texts, so batches finish out of order
+        time.sleep(0.01 if int(texts[0]) < 20 else 0)
+        return [[float(text)] for text in texts]
+
+
+class TestEmbeddingPipeline:
+    def test_results_in_order(self):
+        backend = FakeBackend()
+        pipeline = EmbeddingPipeline(batch_size=4, concurrency=4)
+
+        texts = [str(i) for i in range(50)]
+        assert pipeline.embed(texts, backend) == [[float(i)] for i in range(50)]
+        assert sorted(backend.batches) == [2] + [4] * 12
+
+    def test_refused_batches_are_split(self):
+        backend = FakeBackend(max_batch=10)
+        pipeline = EmbeddingPipeline(batch_size=32, concurrency=2)
+
+        texts = [str(i) for i in range(64)]
+        assert pipeline.embed(texts, backend) == [[float(i)] for i in range(64)]
+        assert pipeline.batch_size <= 10
+
+    def test_retries(self):
+        backend = FakeBackend(
+            failures=[
+                EmbeddingRequestError("Rate limited", status=429, retry_after=0.01),
+                EmbeddingRequestError("Unavailable", status=503),
+            ]
+        )
+        pipeline = EmbeddingPipeline(batch_size=8, concurrency=1, backoff=0.01)
+
+        texts = [str(i) for i in range(8)]
+        assert pipeline.embed(texts, backend) == [[float(i)] for i in range(8)]
+        assert backend.batches == [8, 8, 8]
+
+    def test_gives_up(self):
+        backend = FakeBackend(
+            failures=[EmbeddingRequestError("Unauthorized", status=401)]
+        )
+        pipeline = EmbeddingPipeline(batch_size=8, concurrency=1)
+        assert pipeline.embed([str(i) for i in range(8)], backend) is None
+        assert backend.batches == [8]
+
+        backend = FakeBackend(failures=[EmbeddingRequestError("Unreachable")] * 3)
+        pipeline = EmbeddingPipeline(
+            batch_size=8, concurrency=1, max_retries=2, backoff=0.01
+        )
+        assert pipeline.embed([str(i) for i in range(8)], backend) is None
+        assert backend.batches == [8, 8, 8]
+
+    def test_wrong_embedding_count_is_split(self):
+        def embed_batch(texts):
+            # Drops texts past the 4th, like a backend truncating the input
+            return [[float(text)] for text in texts[:4]]
+
+        pipeline = EmbeddingPipeline(batch_size=16, concurrency=1)
+        texts = [str(i) for i in range(16)]
+        assert pipeline.embed(texts, embed_batch) == [[float(i)] for i in range(16)]
+        assert pipeline.batch_size == 4
+
+    def test_other_failures_are_not_split(self):
+        backend = FakeBackend(
+            failures=[EmbeddingRequestError("Invalid response", retryable=False)]
+        )
+        pipeline = EmbeddingPipeline(batch_size=8, concurrency=1)
+        assert pipeline.embed([str(i) for i in range(8)], backend) is None
+        assert backend.batches == [8]
+        assert pipeline.batch_size == 8
+
+    def test_gives_up_without_waiting_for_retries(self):
+        calls = []
+
+        def embed_batch(texts):
+            calls.append(texts[0])
+            if texts[0] == "0":
+                raise EmbeddingRequestError("Unavailable", status=503, retry_after=5)
+            time.sleep(0.05)
+            raise EmbeddingRequestError("Unauthorized", status=401)
+
+        pipeline = EmbeddingPipeline(batch_size=4, concurrency=2)
+        start = time.monotonic()
+        assert pipeline.embed([str(i) for i in range(8)], embed_batch) is None
+        assert time.monotonic() - start < 1
+
+        # The batch waiting for its retry isn't sent again
+        time.sleep(0.1)
+        assert calls == ["0", "4"]
+
+
+class TestRateLimiter:
+    def test_shared_through_redis(self):
+        redis = fakeredis.FakeRedis(decode_responses=True)
+        # Two workers, 1200 requests per minute (20/s) between them
+        limiters = [
+            RateLimiter(1200, redis=redis, key="test:embedding:rate_limit")
+            for _ in range(2)
+        ]
+
+        start = time.monotonic()
+        for i in range(40):
+            limiters[i % 2].acquire()
+        elapsed = time.monotonic() - start
+
+        # 20 at once, then 20 more at 20/s
+        assert 0.8 < elapsed < 1.6
+
+    def test_pause(self):
+        limiter = RateLimiter(6000)
+        limiter.pause(0.2)
+
+        start = time.monotonic()
+        limiter.acquire()
+        assert time.monotonic() - start >= 0.2
@@ -0,0 +1,155 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from open_webui.retrieval.utils import (
+    RERANK_SCORE_CACHE,
+    RerankCompressor,
+    RerankScoreCache,
+    get_reranking_function,
+)
+
+DIMENSIONS = 8
+
+
+class FakeEmbeddings:
+    """Embeds texts deterministically, recording what it was asked to embed"""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed(self, text):
+        return (
+            np.random.default_rng(abs(hash(text)) % 2**32)
+            .standard_normal(DIMENSIONS)
+            .tolist()
+        )
+
+    def __call__(self, texts, prefix=None):
+        self.calls.append(texts)
+        if isinstance(texts, str):
+            return self.embed(texts)
+        return [self.embed(text) for text in texts]
+
+
+class FakeReranker:
+    """Scores a pair by the length of its text, recording the pairs it scored"""
+
+    def __init__(self):
+        self.pairs = []
+
+    def predict(self, sentences, user=None):
+        self.pairs.extend(sentences)
+        return np.array([len(text) / 100 for _, text in sentences])
+
+
+def make_documents(count):
+    return [
+        Document(id=f"chunk-{i}", page_content=f"document {i} " + "x" * i, metadata={})
+        for i in range(count)
+    ]
+
+
+@pytest.fixture(autouse=True)
+def clear_rerank_cache():
+    RERANK_SCORE_CACHE.clear()
+    yield
+    RERANK_SCORE_CACHE.clear()
+
+
+class TestSimilarity:
+    def test_stored_vectors_score_like_embedding_again(self):
+        documents = make_documents(6)
+        embeddings = FakeEmbeddings()
+        vectors = {doc.id: embeddings.embed(doc.page_content) for doc in documents}
+
+        embedded = RerankCompressor(
+            embedding_function=embeddings,
+            top_n=6,
+            reranking_function=None,
+            r_score=0,
+        ).similarity(documents, "query")
+        assert embeddings.calls[0] == [doc.page_content for doc in documents]
+
+        # One candidate (like a BM25 only hit) has no stored vector
+        embeddings.calls = []
+        stored = RerankCompressor(
+            embedding_function=embeddings,
+            top_n=6,
+            reranking_function=None,
+            r_score=0,
+            vectors={id: vector for id, vector in vectors.items() if id != "chunk-3"},
+        ).similarity(documents, "query")
+
+        assert stored == pytest.approx(embedded, abs=1e-6)
+        assert embeddings.calls == [[documents[3].page_content], "query"]
+
+    def test_top_n_and_threshold(self):
+        documents = make_documents(6)
+        embeddings = FakeEmbeddings()
+        compressor = RerankCompressor(
+            embedding_function=embeddings,
+            top_n=3,
+            reranking_function=None,
+            r_score=0,
+        )
+        scores = compressor.similarity(documents, "query")
+
+        results = compressor.compress_documents(make_documents(6), "query")
+        assert [doc.metadata["score"] for doc in results] == pytest.approx(
+            sorted(scores, reverse=True)[:3]
+        )
+
+
+class TestRerankScoreCache:
+    def test_scores_are_cached_by_query_and_chunk(self):
+        reranker = FakeReranker()
+        compressor = RerankCompressor(
+            embedding_function=None,
+            top_n=3,
+            reranking_function=get_reranking_function("", "model", reranker),
+            r_score=0,
+        )
+        documents = make_documents(4)
+
+        first = compressor.rerank(documents, "query")
+        assert len(reranker.pairs) == 4
+
+        # Only the new chunk and the new query are scored
+        second = compressor.rerank(documents + make_documents(5)[4:], "query")
+        assert second[:4] == first
+        assert len(reranker.pairs) == 5
+
+        compressor.rerank(documents[:1], "other query")
+        assert reranker.pairs[-1] == ("other query", documents[0].page_content)
+        assert len(reranker.pairs) == 6
+
+    def test_cleared_when_the_reranker_changes(self):
+        reranker = FakeReranker()
+        compressor = RerankCompressor(
+            embedding_function=None,
+            top_n=3,
+            reranking_function=get_reranking_function("", "model", reranker),
+            r_score=0,
+        )
+        documents = make_documents(2)
+        compressor.rerank(documents, "query")
+
+        other = FakeReranker()
+        compressor.reranking_function = get_reranking_function("", "other", other)
+        compressor.rerank(documents, "query")
+        assert len(other.pairs) == 2
+
+    def test_lru(self):
+        cache = RerankScoreCache(2)
+        cache.put(("q", "a"), 0.1)
+        cache.put(("q", "b"), 0.2)
+        assert cache.get(("q", "a")) == 0.1
+        cache.put(("q", "c"), 0.3)
+        # "b" was the least recently used
+        assert cache.get(("q", "b")) is None
+        assert cache.get(("q", "a")) == 0.1
+
+        disabled = RerankScoreCache(0)
+        disabled.put(("q", "a"), 0.1)
+        assert disabled.get(("q", "a")) is None
@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+
+from open_webui.socket.utils import MessageWriteBuffer
+
+
+class FakeChats:
+    """Chat histories in memory, written like Chats.update_messages_by_id"""
+
+    def __init__(self):
+        self.histories = {}
+        self.writes = []
+        self.failures = 0
+
+    def write(self, chat_id, update):
+        self.writes.append(chat_id)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database is locked")
+        history = self.histories.setdefault(chat_id, {"messages": {}})
+        update(history)
+
+    def message(self, chat_id, message_id):
+        return self.histories[chat_id]["messages"][message_id]
+
+
+def message_event(content):
+    return {"type": "message", "data": {"content": content}}
+
+
+class TestMessageWriteBuffer:
+    @pytest.mark.asyncio
+    async def test_events_are_coalesced(self):
+        chats = FakeChats()
+        buffer = MessageWriteBuffer(chats.write, interval=0.05)
+
+        for word in ("Hello", " ", "world"):
+            await buffer.add("chat", "m1", message_event(word))
+        await buffer.add("chat", "m1", {"type": "status", "data": {"done": True}})
+        # Not a message change
+        await buffer.add("chat", "m1", {"type": "chat:title", "data": "title"})
+        assert chats.writes == []
+
+        await asyncio.sleep(0.1)
+        assert chats.writes == ["chat"]
+        message = chats.message("chat", "m1")
+        assert message["content"] == "Hello world"
+        assert message["statusHistory"] == [{"done": True}]
+        assert chats.histories["chat"]["currentId"] == "m1"
+        assert buffer.metrics()["events"] == 4
+
+    @pytest.mark.asyncio
+    async def test_replace_and_embeds_keep_event_order(self):
+        chats = FakeChats()
+        buffer = MessageWriteBuffer(chats.write, interval=10)
+
+        await buffer.add("chat", "m1", message_event("draft"))
+        await buffer.add("chat", "m1", {"type": "replace", "data": {"content": "A"}})
+        await buffer.add("chat", "m1", message_event("B"))
+        await buffer.add("chat", "m1", {"type": "embeds", "data": {"embeds": [1]}})
+        await buffer.add("chat", "m1", {"type": "embeds", "data": {"embeds": [2]}})
+        await buffer.flush(("chat", "m1"))
+
+        message = chats.message("chat", "m1")
+        assert message["content"] == "AB"
+        # Like the events applied one by one: each new embed goes first
+        assert message["embeds"] == [2, 1]
+
+    @pytest.mark.asyncio
+    async def test_written_at_max_events(self):
+        chats = FakeChats()
+        buffer = MessageWriteBuffer(chats.write, interval=10, max_events=3)
+
+        for i in range(7):
+            await buffer.add("chat", "m1", message_event(str(i)))
+        assert len(chats.writes) == 2
+        assert chats.message("chat", "m1")["content"] == "012345"
+        assert buffer.metrics()["pending"] == 1
+
+    @pytest.mark.asyncio
+    async def test_written_at_max_bytes(self):
+        chats = FakeChats()
+        buffer = MessageWriteBuffer(chats.write, interval=10, max_bytes=10)
+
+        await buffer.add("chat", "m1", message_event("x" * 6))
+        assert chats.writes == []
+        await buffer.add("chat", "m1", message_event("x" * 6))
+        assert chats.writes == ["chat"]
+
+    @pytest.mark.asyncio
+    async def test_finish_and_flush_all(self):
+        chats = FakeChats()
+        buffer = MessageWriteBuffer(chats.write, interval=10)
+
+        await buffer.add("a", "m1", message_event("one"))
+        await buffer.add("b", "m2", message_event("two"))
+        await buffer.finish("a", "m1")
+        assert chats.writes == ["a"]
+        assert ("a", "m1") not in buffer.locks
+
+        await buffer.flush_all()
+        assert sorted(chats.writes) == ["a", "b"]
+        assert chats.message("b", "m2")["content"] == "two"
+        assert buffer.timers == {}
+
+        metrics = buffer.metrics()
+        assert metrics["db_writes"] == 2
+        assert metrics["completions"] == 1
+        assert metrics["db_writes_per_completion"] == 1.0
+
+    @pytest.mark.asyncio
+    async def test_failed_write_is_retried_before_newer_events(self):
+        chats = FakeChats()
+        chats.failures = 1
+        buffer = MessageWriteBuffer(chats.write, interval=0.05)
+
+        await buffer.add("chat", "m1", message_event("first "))
+        await buffer.flush(("chat", "m1"))
+        assert buffer.metrics()["failed_writes"] == 1
+
+        await buffer.add("chat", "m1", message_event("second"))
+        await asyncio.sleep(0.1)
+        assert chats.writes == ["chat", "chat"]
+        assert chats.message("chat", "m1")["content"] == "first second"
+
+    @pytest.mark.asyncio
+    async def test_dropped_after_max_failures(self):
+        chats = FakeChats()
+        chats.failures = MessageWriteBuffer.MAX_FAILURES
+        buffer = MessageWriteBuffer(chats.write, interval=10)
+
+        await buffer.add("chat", "m1", message_event("lost"))
+        for _ in range(MessageWriteBuffer.MAX_FAILURES):
+            await buffer.flush(("chat", "m1"))
+
+        assert len(chats.writes) == MessageWriteBuffer.MAX_FAILURES
+        assert buffer.metrics()["pending"] == 0
+        assert "chat" not in chats.histories
+
+    def test_flush_all_sync(self):
+        chats = FakeChats()
+        buffer = MessageWriteBuffer(chats.write, interval=10)
+
+        async def add():
+            await buffer.add("a", "m1", message_event("one"))
+            await buffer.add("b", "m2", message_event("two"))
+
+        asyncio.run(add())
+        # The write of "a" fails: its updates are lost, the others still written
+        chats.failures = 1
+        buffer.flush_all_sync()
+
+        assert chats.writes == ["a", "b"]
+        assert "a" not in chats.histories
+        assert chats.message("b", "m2")["content"] == "two"
+        assert buffer.pending == {}
+        assert buffer.metrics()["db_writes"] == 1
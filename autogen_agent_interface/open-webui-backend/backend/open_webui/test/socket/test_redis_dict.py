@@ -0,0 +1,204 @@
+import time
+
+import fakeredis
+import pytest
+from fakeredis import aioredis
+from fakeredis._clients._async import FakeAsyncRedisConnection
+
+from open_webui.socket import utils
+from open_webui.socket.utils import LocalDict, RedisDict
+
+
+class CountingConnection(FakeAsyncRedisConnection):
+    """Records the commands sent to Redis"""
+
+    commands = []
+
+    def pack_command(self, *args):
+        CountingConnection.commands.append(args[0].upper())
+        return super().pack_command(*args)
+
+
+@pytest.fixture
+def make_dict(monkeypatch):
+    """RedisDicts of one fake Redis server, as separate processes would have them"""
+    server = fakeredis.FakeServer()
+    dicts = []
+
+    def get_redis_connection(redis_url, redis_sentinels, async_mode=False, **kwargs):
+        if async_mode:
+            redis = aioredis.FakeRedis(server=server, decode_responses=True)
+            redis.connection_pool.connection_class = CountingConnection
+            return redis
+        return fakeredis.FakeRedis(server=server, decode_responses=True)
+
+    monkeypatch.setattr(utils, "get_redis_connection", get_redis_connection)
+
+    def make_dict(cache_ttl=0):
+        redis_dict = RedisDict("test:dict", "redis://fake", cache_ttl=cache_ttl)
+        dicts.append(redis_dict)
+        return redis_dict
+
+    yield make_dict
+    for redis_dict in dicts:
+        if redis_dict.subscriber is not None:
+            redis_dict.subscriber.stop()
+
+
+async def reset_commands(redis_dict):
+    # The connection handshake isn't counted
+    await redis_dict.async_redis.ping()
+    CountingConnection.commands = []
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+class TestRedisDict:
+    @pytest.mark.asyncio
+    async def test_aget_many_is_one_hmget(self, make_dict):
+        redis_dict = make_dict()
+        for i in range(10):
+            redis_dict[f"key-{i}"] = {"i": i}
+
+        await reset_commands(redis_dict)
+        values = await redis_dict.aget_many(["key-1", "key-5", "missing"])
+        assert values == {"key-1": {"i": 1}, "key-5": {"i": 5}}
+        assert CountingConnection.commands == ["HMGET"]
+
+        assert await redis_dict.aget("key-2") == {"i": 2}
+        assert await redis_dict.aget("missing", "default") == "default"
+
+    @pytest.mark.asyncio
+    async def test_aupdate_and_apop(self, make_dict):
+        redis_dict = make_dict()
+        redis_dict["old"] = 1
+
+        await reset_commands(redis_dict)
+        await redis_dict.aupdate({"a": [1, 2], "b": {"c": None}}, delete=["old"])
+        assert CountingConnection.commands == ["HSET", "HDEL"]
+        assert sorted(await redis_dict.aitems()) == [("a", [1, 2]), ("b", {"c": None})]
+        assert "old" not in redis_dict
+        assert await redis_dict.acontains("a")
+
+        assert await redis_dict.apop("a") == [1, 2]
+        assert await redis_dict.apop("a", "gone") == "gone"
+        assert redis_dict.get("a") is None
+
+        await redis_dict.aset("d", "value")
+        await redis_dict.adelete("b", "d")
+        assert len(redis_dict) == 0
+
+        # Nothing to write, nothing sent
+        CountingConnection.commands = []
+        await redis_dict.aupdate()
+        assert CountingConnection.commands == []
+
+    @pytest.mark.asyncio
+    async def test_missing_keys_are_cached(self, make_dict):
+        redis_dict = make_dict(cache_ttl=60)
+        await redis_dict.aset("a", 1)
+
+        await reset_commands(redis_dict)
+        assert await redis_dict.aget_many(["a", "missing"]) == {"a": 1}
+        assert await redis_dict.aget_many(["a", "missing"]) == {"a": 1}
+        assert not await redis_dict.acontains("missing")
+        # The write cached "a", only the missing key was read, once
+        assert CountingConnection.commands == ["HMGET"]
+
+        with pytest.raises(KeyError):
+            redis_dict["missing"]
+
+    @pytest.mark.asyncio
+    async def test_cache_expires(self, make_dict):
+        redis_dict = make_dict(cache_ttl=0.05)
+        other = make_dict()
+        redis_dict["a"] = 1
+
+        # Written without an invalidation, seen once the cached value expired
+        other.redis.hset("test:dict", "a", "2")
+        assert await redis_dict.aget("a") == 1
+        time.sleep(0.1)
+        assert await redis_dict.aget("a") == 2
+
+    @pytest.mark.asyncio
+    async def test_expired_entries_are_dropped(self, make_dict):
+        redis_dict = make_dict(cache_ttl=0.05)
+        await redis_dict.aupdate({f"sid-{i}": i for i in range(100)})
+        await redis_dict.adelete(*(f"sid-{i}" for i in range(50)))
+        assert await redis_dict.aget_many(["missing-1", "missing-2"]) == {}
+        assert len(redis_dict.cache) == 102
+
+        # Neither deletions nor misses are kept past their TTL
+        time.sleep(0.1)
+        assert await redis_dict.aget("sid-99") == 99
+        assert list(redis_dict.cache) == ["sid-99"]
+
+    @pytest.mark.asyncio
+    async def test_writes_invalidate_other_instances(self, make_dict):
+        first = make_dict(cache_ttl=60)
+        second = make_dict(cache_ttl=60)
+        await first.aset("a", 1)
+        assert await second.aget("missing") is None
+        assert await second.aget("a") == 1
+
+        await first.aupdate({"a": 2, "missing": 3})
+        wait_for(lambda: "a" not in second.cache and "missing" not in second.cache)
+        assert await second.aget_many(["a", "missing"]) == {"a": 2, "missing": 3}
+
+        await first.apop("a")
+        wait_for(lambda: "a" not in second.cache)
+        assert await second.aget("a") is None
+
+        first.clear()
+        wait_for(lambda: not second.cache)
+        assert await second.aget("missing") is None
+
+    @pytest.mark.asyncio
+    async def test_list_updates_are_atomic(self, make_dict):
+        first = make_dict(cache_ttl=60)
+        second = make_dict(cache_ttl=60)
+        # Both cached the user's sessions before either connected
+        assert await first.aget("user") is None
+        assert await second.aget("user") is None
+
+        await first.aappend("user", "sid-1")
+        await second.aappend("user", "sid-2")
+        await second.aappend("user", "sid-2")
+        assert await first.aget("user") == ["sid-1", "sid-2"]
+        assert await second.aget("user") == ["sid-1", "sid-2"]
+
+        await first.aremove("user", "sid-1")
+        wait_for(lambda: "user" not in second.cache)
+        assert await second.aget("user") == ["sid-2"]
+        await second.aremove("user", "sid-2")
+        assert "user" not in second.redis.hkeys("test:dict")
+        assert await second.aget("user") is None
+
+
+class TestLocalDict:
+    @pytest.mark.asyncio
+    async def test_async_methods(self):
+        local_dict = LocalDict()
+        await local_dict.aupdate({"a": 1, "b": 2, "c": 3}, delete=["missing"])
+        assert await local_dict.aget_many(["a", "b", "missing"]) == {"a": 1, "b": 2}
+        assert await local_dict.aget("missing", 0) == 0
+        assert await local_dict.acontains("c")
+
+        await local_dict.aset("d", 4)
+        await local_dict.adelete("a", "b")
+        assert await local_dict.apop("c") == 3
+        assert await local_dict.apop("c", "gone") == "gone"
+        assert await local_dict.aitems() == [("d", 4)]
+
+        await local_dict.aappend("user", "sid-1")
+        await local_dict.aappend("user", "sid-2")
+        await local_dict.aappend("user", "sid-1")
+        assert local_dict["user"] == ["sid-2", "sid-1"]
+        await local_dict.aremove("user", "sid-1")
+        await local_dict.aremove("user", "sid-2")
+        assert "user" not in local_dict
@@ -0,0 +1,219 @@
+import asyncio
+import threading
+
+import pycrdt as Y
+import pytest
+import pytest_asyncio
+from fakeredis import aioredis
+from fakeredis._clients._async import FakeAsyncRedisConnection
+
+from open_webui.socket.utils import YdocManager
+
+PREFIX = "test:ydoc:documents"
+
+
+class CountingConnection(FakeAsyncRedisConnection):
+    """Records the commands sent to Redis, and the round trips they took"""
+
+    commands = []
+    round_trips = 0
+
+    def pack_command(self, *args):
+        CountingConnection.commands.append(args[0].upper())
+        return super().pack_command(*args)
+
+    async def send_packed_command(self, command, check_health=True):
+        CountingConnection.round_trips += 1
+        return await super().send_packed_command(command, check_health)
+
+    @classmethod
+    def reset(cls):
+        cls.commands = []
+        cls.round_trips = 0
+
+
+def make_updates(count):
+    ydoc = Y.Doc()
+    ydoc["prosemirror"] = text = Y.Text()
+    updates = []
+    ydoc.observe(lambda event: updates.append(event.update))
+    for i in range(count):
+        text += str(i % 10)
+    return updates
+
+
+def load(updates):
+    ydoc = Y.Doc()
+    for update in updates:
+        ydoc.apply_update(update)
+    ydoc["prosemirror"] = text = Y.Text()
+    return str(text)
+
+
+class PausedMerge:
+    """Holds a compaction in its merge until `resume`, to change the document meanwhile"""
+
+    def __init__(self, manager):
+        self.merging = threading.Event()
+        self.resumed = threading.Event()
+        merge = manager._merge_updates
+
+        def paused_merge(updates):
+            self.merging.set()
+            self.resumed.wait(5)
+            return merge(updates)
+
+        manager._merge_updates = paused_merge
+
+    async def wait(self):
+        await asyncio.to_thread(self.merging.wait, 5)
+
+    def resume(self):
+        self.resumed.set()
+
+
+@pytest_asyncio.fixture
+async def redis():
+    redis = aioredis.FakeRedis(decode_responses=True)
+    redis.connection_pool.connection_class = CountingConnection
+    # The connection handshake isn't counted
+    await redis.ping()
+    CountingConnection.reset()
+    yield redis
+    await redis.aclose()
+
+
+class TestYdocManagerUsers:
+    @pytest.mark.asyncio
+    async def test_remove_user_from_all_documents(self, redis):
+        manager = YdocManager(redis=redis, redis_key_prefix=PREFIX)
+
+        # Plenty of documents the user never opened
+        for i in range(1000):
+            await manager.add_user(f"note:{i}", f"other-{i}")
+        await manager.add_user("note:1", "sid")
+        await manager.add_user("note:2", "sid")
+        await manager.add_user("note:mine", "sid")
+        await manager.append_to_updates("note:mine", b"\x00\x00")
+
+        CountingConnection.reset()
+        await manager.remove_user_from_all_documents("sid")
+
+        assert "KEYS" not in CountingConnection.commands
+        assert "SCAN" not in CountingConnection.commands
+        # Only the user's 3 documents are touched
+        assert CountingConnection.commands.count("SREM") == 3
+        # Reading the index, removing the user, clearing the document left empty
+        assert CountingConnection.round_trips == 3
+
+        assert await manager.get_users("note:1") == ["other-1"]
+        assert await manager.get_users("note:2") == ["other-2"]
+        assert not await manager.document_exists("note:mine")
+        assert await manager.get_users("note:mine") == []
+        assert not await redis.exists(f"{PREFIX}:user_documents:sid")
+
+    @pytest.mark.asyncio
+    async def test_remove_user_from_all_documents_without_documents(self, redis):
+        manager = YdocManager(redis=redis, redis_key_prefix=PREFIX)
+        await manager.add_user("note:1", "other")
+
+        CountingConnection.reset()
+        await manager.remove_user_from_all_documents("sid")
+
+        assert CountingConnection.commands == ["SMEMBERS"]
+        assert await manager.get_users("note:1") == ["other"]
+
+    @pytest.mark.asyncio
+    async def test_remove_user_updates_index(self, redis):
+        manager = YdocManager(redis=redis, redis_key_prefix=PREFIX)
+        await manager.add_user("note:1", "sid")
+        await manager.add_user("note:2", "sid")
+
+        CountingConnection.reset()
+        await manager.remove_user("note:1", "sid")
+        assert CountingConnection.round_trips == 1
+
+        assert await redis.smembers(f"{PREFIX}:user_documents:sid") == {"note_2"}
+
+    @pytest.mark.asyncio
+    async def test_remove_user_from_all_documents_in_memory(self):
+        manager = YdocManager()
+        await manager.add_user("note:1", "sid")
+        await manager.add_user("note:1", "other")
+        await manager.add_user("note:2", "sid")
+        await manager.append_to_updates("note:2", b"\x00\x00")
+
+        await manager.remove_user_from_all_documents("sid")
+
+        assert await manager.get_users("note:1") == {"other"}
+        assert not await manager.document_exists("note:2")
+
+
+class TestYdocManagerCompaction:
+    @pytest.mark.asyncio
+    async def test_compaction_keeps_later_updates(self, redis):
+        manager = YdocManager(redis=redis, redis_key_prefix=PREFIX)
+        updates = make_updates(30)
+        for update in updates[:20]:
+            await manager.append_to_updates("note:1", update)
+
+        paused = PausedMerge(manager)
+        task = asyncio.create_task(manager.compact("note:1"))
+        await paused.wait()
+        for update in updates[20:]:
+            await manager.append_to_updates("note:1", update)
+        paused.resume()
+        await task
+
+        stored = await manager.get_updates("note:1")
+        assert len(stored) == 11
+        assert load(stored) == load(updates)
+        assert not await redis.exists(f"{PREFIX}:note_1:compaction")
+
+    @pytest.mark.asyncio
+    async def test_cleared_document_is_not_restored(self, redis):
+        manager = YdocManager(redis=redis, redis_key_prefix=PREFIX)
+        for update in make_updates(20):
+            await manager.append_to_updates("note:1", update)
+
+        paused = PausedMerge(manager)
+        task = asyncio.create_task(manager.compact("note:1"))
+        await paused.wait()
+        await manager.clear_document("note:1")
+        # Reopened, with updates of its own
+        updates = make_updates(25)
+        await manager.append_to_updates("note:1", updates[0])
+        paused.resume()
+        await task
+
+        assert await manager.get_updates("note:1") == [updates[0]]
+
+    @pytest.mark.asyncio
+    async def test_lock_of_another_worker_is_kept(self, redis):
+        manager = YdocManager(redis=redis, redis_key_prefix=PREFIX)
+        for update in make_updates(20):
+            await manager.append_to_updates("note:1", update)
+        lock_key = f"{PREFIX}:note_1:compaction"
+
+        paused = PausedMerge(manager)
+        task = asyncio.create_task(manager.compact("note:1"))
+        await paused.wait()
+        # The lock expired mid-merge, and another worker took it
+        await redis.set(lock_key, "other")
+        paused.resume()
+        await task
+
+        assert await redis.get(lock_key) == "other"
+        assert len(await manager.get_updates("note:1")) == 20
+
+    @pytest.mark.asyncio
+    async def test_compaction_in_memory(self):
+        manager = YdocManager(compaction_threshold=10)
+        updates = make_updates(11)
+        for update in updates:
+            await manager.append_to_updates("note:1", update)
+        await asyncio.gather(*manager._compactions.values())
+
+        stored = await manager.get_updates("note:1")
+        assert len(stored) == 1
+        assert load(stored) == load(updates)
@@ -0,0 +1,140 @@
+import json
+import threading
+import time
+
+import fakeredis
+import pytest
+
+from open_webui import config
+from open_webui.config import AppConfig, PersistentConfig
+
+PREFIX = "test"
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+class FlakyPubSub:
+    """A pubsub connection that drops once `drop` is set"""
+
+    def __init__(self, pubsub, drop):
+        self.pubsub = pubsub
+        self.drop = drop
+
+    def __getattr__(self, name):
+        return getattr(self.pubsub, name)
+
+    def get_message(self, **kwargs):
+        if self.drop.is_set():
+            self.drop.clear()
+            raise ConnectionError("Connection reset by peer")
+        return self.pubsub.get_message(**kwargs)
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        config,
+        "get_redis_connection",
+        lambda *args, **kwargs: fakeredis.FakeRedis(
+            server=server, decode_responses=True
+        ),
+    )
+    monkeypatch.setattr(config, "REDIS_CONFIG_SYNC_INTERVAL", 0.2)
+    monkeypatch.setattr(config, "PERSISTENT_CONFIG_REGISTRY", [])
+    # Only Redis is shared between the workers here, not the database
+    monkeypatch.setattr(config, "CONFIG_DATA", {})
+    monkeypatch.setattr(config, "save_to_db", lambda data: None)
+    return fakeredis.FakeRedis(server=server, decode_responses=True)
+
+
+def make_app_config():
+    """The config of one worker"""
+    app_config = AppConfig(redis_url="redis://fake", redis_key_prefix=PREFIX)
+    app_config.WEBUI_NAME = PersistentConfig("WEBUI_NAME", "ui.name", "Open WebUI")
+    app_config.ENABLE_SIGNUP = PersistentConfig(
+        "ENABLE_SIGNUP", "ui.enable_signup", True
+    )
+    return app_config
+
+
+def subscribed(redis):
+    return redis.pubsub_numsub(f"{PREFIX}:config:invalidate")[0][1]
+
+
+class TestAppConfig:
+    def test_changes_are_seen_by_other_workers(self, redis):
+        first = make_app_config()
+        second = make_app_config()
+        wait_for(lambda: subscribed(redis) == 2)
+
+        first.WEBUI_NAME = "Renamed"
+        assert first.WEBUI_NAME == "Renamed"
+        # The version goes last
+        wait_for(lambda: second._version == 1)
+        assert second.WEBUI_NAME == "Renamed"
+
+        second.ENABLE_SIGNUP = False
+        wait_for(lambda: first.ENABLE_SIGNUP is False)
+        assert first.WEBUI_NAME == "Renamed"
+
+    def test_workers_started_later_load_the_changes(self, redis):
+        first = make_app_config()
+        first.WEBUI_NAME = "Renamed"
+
+        second = make_app_config()
+        assert second.WEBUI_NAME == "Renamed"
+        assert second._version == 1
+
+    def test_missed_change_is_reloaded_on_the_next_one(self, redis, monkeypatch):
+        # Long enough not to be a periodic check
+        monkeypatch.setattr(config, "REDIS_CONFIG_SYNC_INTERVAL", 30)
+        first = make_app_config()
+        second = make_app_config()
+        wait_for(lambda: subscribed(redis) == 2)
+        # Past the reload it does once subscribed
+        first.WEBUI_NAME = "Named"
+        wait_for(lambda: second._version == 1)
+
+        # Changed without a message reaching the other worker
+        redis.set(f"{PREFIX}:config:ENABLE_SIGNUP", json.dumps(False))
+        redis.incr(f"{PREFIX}:config:version")
+        first.WEBUI_NAME = "Renamed"
+
+        wait_for(lambda: second._version == 3)
+        assert second.WEBUI_NAME == "Renamed"
+        # The version gap made it reload every key
+        assert second.ENABLE_SIGNUP is False
+
+    def test_missed_change_is_reloaded_periodically(self, redis):
+        second = make_app_config()
+        wait_for(lambda: subscribed(redis) == 1)
+
+        redis.set(f"{PREFIX}:config:WEBUI_NAME", json.dumps("Renamed"))
+        redis.incr(f"{PREFIX}:config:version")
+        wait_for(lambda: second.WEBUI_NAME == "Renamed")
+
+    def test_resubscribed_after_a_disconnect(self, redis, monkeypatch):
+        drop = threading.Event()
+        pubsub = fakeredis.FakeRedis.pubsub
+        monkeypatch.setattr(
+            fakeredis.FakeRedis,
+            "pubsub",
+            lambda self, **kwargs: FlakyPubSub(pubsub(self, **kwargs), drop),
+        )
+        first = make_app_config()
+        second = make_app_config()
+        wait_for(lambda: subscribed(redis) == 2)
+
+        drop.set()
+        wait_for(lambda: not drop.is_set())
+        # Published while the other worker is disconnected
+        first.WEBUI_NAME = "Renamed"
+
+        wait_for(lambda: second.WEBUI_NAME == "Renamed")
+        wait_for(lambda: subscribed(redis) == 2)
@@ -0,0 +1,114 @@
+import os
+import shutil
+import subprocess
+import time
+
+import pytest
+from pydub import AudioSegment
+
+from open_webui.utils.audio import (
+    detect_silences,
+    get_cut_points,
+    iter_audio_chunks,
+    transcribe_chunks,
+)
+
+
+class TestGetCutPoints:
+    def test_cuts_in_silences(self):
+        silences = [(50.0, 52.0), (95.0, 97.0), (150.0, 151.0)]
+        # In the silence at 96s, then at 196s as there's none between 186s and 196s
+        assert get_cut_points(250, 100, silences) == [96.0, 196.0]
+
+    def test_short(self):
+        assert get_cut_points(99, 100) == []
+        assert get_cut_points(250, 100) == [100.0, 200.0]
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    """Replaces ffmpeg with a shell script"""
+
+    def fake_ffmpeg(script):
+        path = tmp_path / "ffmpeg"
+        path.write_text(f"#!/bin/sh\n{script}\n")
+        path.chmod(0o755)
+        monkeypatch.setattr(AudioSegment, "converter", str(path))
+
+    return fake_ffmpeg
+
+
+class TestFfmpegFailures:
+    def test_lots_of_errors(self, tmp_path, fake_ffmpeg):
+        # More than a pipe holds, before exiting
+        fake_ffmpeg(
+            "head -c 1000000 /dev/zero | tr '\\0' x >&2; echo broken >&2; exit 1"
+        )
+
+        start = time.monotonic()
+        with pytest.raises(Exception, match="Failed to split audio: x+broken"):
+            list(iter_audio_chunks("audio.wav", str(tmp_path / "chunks"), 20))
+        assert time.monotonic() - start < 5
+
+    def test_timeout(self, tmp_path, fake_ffmpeg):
+        fake_ffmpeg("exec sleep 10")
+
+        start = time.monotonic()
+        with pytest.raises(Exception, match="timed out"):
+            list(
+                iter_audio_chunks(
+                    "audio.wav", str(tmp_path / "chunks"), 20, timeout=0.3
+                )
+            )
+        with pytest.raises(Exception, match="timed out"):
+            detect_silences("audio.wav", timeout=0.3)
+        assert time.monotonic() - start < 5
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+class TestChunking:
+    def test_chunks_in_order(self, tmp_path):
+        # 5s of tone then 2s of silence, for 60s
+        file_path = str(tmp_path / "audio.wav")
+        subprocess.run(
+            [
+                "ffmpeg",
+                "-loglevel",
+                "error",
+                "-f",
+                "lavfi",
+                "-i",
+                "sine=f=440:d=60,volume='if(lt(mod(t,7),5),1,0)':eval=frame",
+                "-ar",
+                "16000",
+                file_path,
+            ],
+            check=True,
+        )
+
+        silences, duration = detect_silences(file_path)
+        assert duration == pytest.approx(60, abs=0.1)
+        assert silences[0] == pytest.approx((5, 7), abs=0.1)
+
+        cut_points = get_cut_points(duration, 20, silences)
+        assert cut_points == pytest.approx([20, 40], abs=0.1)
+
+        def transcribe_chunk(chunk):
+            # Later chunks finish first
+            time.sleep(0.1 if chunk.start < 1 else 0)
+            return {"text": os.path.basename(chunk.path)}
+
+        chunk_dir = str(tmp_path / "chunks")
+        results = transcribe_chunks(
+            iter_audio_chunks(file_path, chunk_dir, 20, cut_points),
+            transcribe_chunk,
+            concurrency=2,
+        )
+        assert [result["text"] for result in results] == [
+            "chunk_00000.mp3",
+            "chunk_00001.mp3",
+            "chunk_00002.mp3",
+        ]
+        assert results[1]["start"] == pytest.approx(20, abs=0.1)
+        # Chunks are removed once transcribed
+        assert not any(name.endswith(".mp3") for name in os.listdir(chunk_dir))
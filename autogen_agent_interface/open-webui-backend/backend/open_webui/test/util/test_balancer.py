@@ -0,0 +1,236 @@
+import asyncio
+
+import pytest
+
+from open_webui.utils import balancer
+from open_webui.utils.balancer import BackendBalancer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(balancer, "time", clock)
+    return clock
+
+
+def request(backends, url, latency=0.1, status=200, clock=None):
+    call = backends.track(url)
+    if clock is not None:
+        clock.now += latency
+    if status is None:
+        call.failed(ConnectionError("Connection refused"))
+    else:
+        call.responded(status)
+    call.end()
+
+
+class TestChoose:
+    def test_single_candidate(self):
+        backends = BackendBalancer()
+        assert backends.choose([3]) == 3
+        assert backends.backends == {}
+
+    def test_fewest_in_flight(self):
+        backends = BackendBalancer()
+        busy = backends.track("http://a")
+        backends.track("http://b")
+        backends.track("http://b")
+
+        assert backends.choose(["http://a", "http://b", "http://c"]) == "http://c"
+        backends.track("http://c")
+        backends.track("http://c")
+        assert backends.choose(["http://a", "http://b", "http://c"]) == "http://a"
+
+        busy.end()
+        busy.end()
+        assert backends.get("http://a").in_flight == 0
+
+    def test_weighted_by_latency(self, clock):
+        backends = BackendBalancer()
+        request(backends, "http://fast", latency=0.1, clock=clock)
+        request(backends, "http://slow", latency=1.0, clock=clock)
+
+        # The fast one takes requests until 10 in flight on it weigh as much
+        # as one on the slow one
+        for _ in range(9):
+            url = backends.choose(["http://fast", "http://slow"])
+            assert url == "http://fast"
+            backends.track(url)
+        backends.track("http://fast")
+        assert backends.choose(["http://fast", "http://slow"]) == "http://slow"
+
+    def test_untried_backends_get_tried(self, clock):
+        backends = BackendBalancer()
+        request(backends, "http://a", latency=0.1, clock=clock)
+        request(backends, "http://c", latency=1.0, clock=clock)
+        for _ in range(3):
+            backends.track("http://a")
+        # Counted as fast as the fastest one
+        assert backends.choose(["http://a", "http://b", "http://c"]) == "http://b"
+
+    def test_get_url(self):
+        backends = BackendBalancer()
+        urls = ["http://a", "http://b"]
+        backends.track("http://a")
+        assert backends.choose([0, 1], lambda idx: urls[idx]) == 1
+
+
+class TestEjection:
+    def test_ejected_after_max_failures(self, clock):
+        backends = BackendBalancer(max_failures=3, ejection_time=10)
+        candidates = ["http://a", "http://b"]
+        request(backends, "http://a", latency=0.1, clock=clock)
+        request(backends, "http://b", latency=5, clock=clock)
+
+        request(backends, "http://a", status=None)
+        request(backends, "http://a", status=502)
+        assert backends.choose(candidates) == "http://a"
+        request(backends, "http://a", status=None)
+
+        stats = backends.stats("http://a")
+        assert stats["ejected"]
+        assert stats["ejected_for"] == 10
+        assert stats["consecutive_failures"] == 3
+        assert stats["last_error"] == "Connection refused"
+        for _ in range(5):
+            assert backends.choose(candidates) == "http://b"
+
+        clock.now += 10
+        assert not backends.stats("http://a")["ejected"]
+        assert backends.choose(candidates) == "http://a"
+
+    def test_backoff(self, clock):
+        backends = BackendBalancer(
+            max_failures=2, ejection_time=10, max_ejection_time=35
+        )
+
+        ejections = []
+        for _ in range(5):
+            request(backends, "http://a", status=500)
+            ejections.append(backends.stats("http://a")["ejected_for"])
+        assert ejections == [0, 10, 20, 35, 35]
+
+        # A success resets it
+        request(backends, "http://a")
+        stats = backends.stats("http://a")
+        assert not stats["ejected"]
+        assert stats["consecutive_failures"] == 0
+        assert stats["failures"] == 5
+        assert stats["requests"] == 6
+        request(backends, "http://a", status=500)
+        request(backends, "http://a", status=500)
+        assert backends.stats("http://a")["ejected_for"] == 10
+
+    def test_every_backend_ejected(self, clock):
+        backends = BackendBalancer(max_failures=1, ejection_time=10)
+        request(backends, "http://a", status=500)
+        clock.now += 5
+        request(backends, "http://b", status=500)
+
+        # The first one coming back
+        assert backends.choose(["http://b", "http://a"]) == "http://a"
+
+
+class TestBackendCall:
+    def test_recorded_once(self, clock):
+        backends = BackendBalancer(max_failures=1)
+        call = backends.track("http://a")
+        clock.now += 0.2
+        call.responded(200)
+        # A failure later in the stream doesn't count against the backend
+        call.failed(ConnectionError("reset"))
+        call.end()
+
+        stats = backends.stats("http://a")
+        assert stats["latency_ms"] == 200.0
+        assert stats["failures"] == 0
+        assert stats["in_flight"] == 0
+
+    def test_client_errors_are_not_failures(self, clock):
+        backends = BackendBalancer(max_failures=1)
+        request(backends, "http://a", status=404)
+        assert not backends.stats("http://a")["ejected"]
+
+    def test_latency_moving_average(self, clock):
+        backends = BackendBalancer(alpha=0.5)
+        request(backends, "http://a", latency=1.0, clock=clock)
+        request(backends, "http://a", latency=2.0, clock=clock)
+        assert backends.get("http://a").latency == pytest.approx(1.5)
+
+
+class TestBackends:
+    @pytest.mark.asyncio
+    async def test_stats_per_url_sessions_per_host(self):
+        backends = BackendBalancer(max_failures=1)
+        request(backends, "http://host:11434/a", status=500)
+
+        assert backends.stats("http://host:11434/a/")["ejected"]
+        assert not backends.stats("http://host:11434/b")["ejected"]
+        assert backends.choose(["http://host:11434/a", "http://host:11434/b"]) == (
+            "http://host:11434/b"
+        )
+
+        session = backends.get_session("http://host:11434/a/api/chat")
+        assert backends.get_session("http://host:11434/b/api/tags") is session
+        assert backends.get_session("http://other:11434") is not session
+
+        await backends.close()
+        assert session.closed
+        assert backends.get_session("http://host:11434/a") is not session
+        await backends.close()
+
+    @pytest.mark.asyncio
+    async def test_connection_limit(self):
+        # Unlimited by default, like a session per request was
+        backends = BackendBalancer()
+        assert backends.get_session("http://host:11434").connector.limit == 0
+        await backends.close()
+
+        backends = BackendBalancer(connection_limit=10)
+        assert backends.get_session("http://host:11434").connector.limit == 10
+        await backends.close()
+
+
+class TestStreamedRequests:
+    @pytest.mark.asyncio
+    async def test_dropped_stream_ends_the_call(self):
+        from aiohttp import web
+        from aiohttp.test_utils import TestServer
+
+        from open_webui.routers import ollama
+
+        async def chat(request):
+            response = web.StreamResponse()
+            await response.prepare(request)
+            await response.write(b'{"done": true}\n')
+            return response
+
+        app = web.Application()
+        app.router.add_post("/api/chat", chat)
+        server = TestServer(app)
+        await server.start_server()
+        url = str(server.make_url("")).rstrip("/")
+        try:
+            response = await ollama.send_post_request(f"{url}/api/chat", b"{}")
+            assert ollama.OLLAMA_BACKENDS.stats(url)["in_flight"] == 1
+
+            async def receive():
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                # The client goes away before it gets the headers
+                await asyncio.Event().wait()
+
+            await response({"type": "http"}, receive, send)
+            assert ollama.OLLAMA_BACKENDS.stats(url)["in_flight"] == 0
+        finally:
+            await ollama.OLLAMA_BACKENDS.close()
+            await server.close()
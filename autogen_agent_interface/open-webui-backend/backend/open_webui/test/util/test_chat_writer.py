@@ -0,0 +1,214 @@
+import time
+
+import pytest
+
+from open_webui.internal.db import Base, engine, get_db
+from open_webui.models.chats import Chat, Chats
+from open_webui.utils.chat_writer import ChatWriter
+
+
+class FakeWrite:
+    """Chat histories in memory, written like Chats.update_messages_by_ids"""
+
+    def __init__(self, failing=()):
+        self.histories = {}
+        self.batches = []
+        self.failing = set(failing)
+
+    def __call__(self, updates):
+        self.batches.append(sorted(updates))
+        if self.failing.intersection(updates):
+            raise RuntimeError("database is locked")
+        for chat_id, update in updates.items():
+            history = self.histories.setdefault(chat_id, {"messages": {}})
+            update(history)
+        return list(updates)
+
+
+class TestChatWriter:
+    def test_consecutive_saves_are_merged(self):
+        write = FakeWrite()
+        writer = ChatWriter(write, interval=10)
+        seen = []
+
+        def update(history):
+            seen.append(history["messages"]["m1"]["content"])
+            history["messages"]["m1"]["done"] = True
+            return True
+
+        writer.save_message("chat", "m1", {"content": "He"})
+        writer.save_message("chat", "m1", {"content": "Hello", "model": "llama"})
+        writer.update("chat", update)
+        writer.save_message("chat", "m1", {"content": "Hello!"})
+        assert writer.metrics()["queue_depth"] == 3
+
+        writer.flush("chat").result(timeout=5)
+        assert write.batches == [["chat"]]
+        # The update ran between the saves it was queued between
+        assert seen == ["Hello"]
+        assert write.histories["chat"]["messages"]["m1"] == {
+            "content": "Hello!",
+            "model": "llama",
+            "done": True,
+        }
+        assert write.histories["chat"]["currentId"] == "m1"
+
+        metrics = writer.metrics()
+        assert metrics["updates"] == 4
+        assert metrics["merged_updates"] == 1
+        assert metrics["queue_depth"] == 0
+        writer.stop()
+
+    def test_written_within_the_interval(self):
+        write = FakeWrite()
+        writer = ChatWriter(write, interval=0.05)
+
+        future = writer.save_message("chat", "m1", {"content": "Hello"})
+        assert not future.done()
+        future.result(timeout=5)
+        assert write.histories["chat"]["messages"]["m1"]["content"] == "Hello"
+        assert writer.metrics()["save_delay_max"] >= 0.05
+        writer.stop()
+
+    def test_batches_are_split_at_max_batch(self):
+        write = FakeWrite()
+        writer = ChatWriter(write, interval=0.1, max_batch=2)
+
+        futures = [
+            writer.save_message(f"chat-{i}", "m1", {"content": str(i)})
+            for i in range(5)
+        ]
+        for future in futures:
+            future.result(timeout=5)
+
+        assert all(len(batch) <= 2 for batch in write.batches)
+        assert sorted(sum(write.batches, [])) == [f"chat-{i}" for i in range(5)]
+        assert writer.metrics()["chats_written"] == 5
+        writer.stop()
+
+    def test_failed_batch_is_retried_per_chat(self):
+        write = FakeWrite(failing=["bad"])
+        writer = ChatWriter(write, interval=10)
+
+        futures = {
+            chat_id: writer.save_message(chat_id, "m1", {"content": chat_id})
+            for chat_id in ("a", "bad", "b")
+        }
+        writer.stop()
+
+        assert write.batches == [["a", "b", "bad"], ["a"], ["bad"], ["b"]]
+        assert futures["a"].result(timeout=5) is None
+        assert futures["b"].result(timeout=5) is None
+        with pytest.raises(RuntimeError):
+            futures["bad"].result(timeout=5)
+        assert sorted(write.histories) == ["a", "b"]
+
+        metrics = writer.metrics()
+        assert metrics["chats_written"] == 2
+        assert metrics["failed_chats"] == 1
+
+    def test_flush(self):
+        write = FakeWrite()
+        writer = ChatWriter(write, interval=10)
+
+        # Nothing pending
+        assert writer.flush("chat").result(timeout=5) is None
+
+        saved = writer.save_message("chat", "m1", {"content": "Hello"})
+        other = writer.save_message("other", "m1", {"content": "Hi"})
+        flushed = writer.flush("chat")
+        flushed.result(timeout=5)
+        assert saved.done()
+        # Every pending chat goes in the same transaction
+        assert write.batches == [["chat", "other"]]
+        assert other.done()
+        writer.stop()
+
+    def test_immediate_update(self):
+        write = FakeWrite()
+        writer = ChatWriter(write, interval=10)
+
+        future = writer.update("chat", lambda history: True, immediate=True)
+        future.result(timeout=5)
+        assert write.batches == [["chat"]]
+        writer.stop()
+
+    def test_stop_writes_everything_pending(self):
+        write = FakeWrite()
+        writer = ChatWriter(write, interval=10, max_batch=2)
+
+        futures = [
+            writer.save_message(f"chat-{i}", "m1", {"content": str(i)})
+            for i in range(3)
+        ]
+        writer.stop()
+        assert all(future.done() for future in futures)
+        assert not writer.thread.is_alive()
+        assert write.batches == [["chat-0", "chat-1"], ["chat-2"]]
+
+        # Written right away once stopped
+        future = writer.save_message("late", "m1", {"content": "late"})
+        assert future.done()
+        assert write.histories["late"]["messages"]["m1"]["content"] == "late"
+
+
+def make_chat(id, messages):
+    now = int(time.time()) - 100
+    return Chat(
+        id=id,
+        user_id="user",
+        title=f"Chat {id}",
+        chat={"title": f"Chat {id}", "history": {"messages": messages}},
+        created_at=now,
+        updated_at=now,
+    )
+
+
+class TestUpdateMessagesByIds:
+    def setup_method(self):
+        # The table the startup migrations left may predate some of the columns
+        Chat.__table__.drop(engine, checkfirst=True)
+        Base.metadata.create_all(engine, tables=[Chat.__table__])
+        with get_db() as db:
+            db.query(Chat).delete()
+            db.add(make_chat("a", {"m1": {"content": "Hello"}}))
+            db.add(make_chat("b", {"m1": {"content": "Hi"}}))
+            db.commit()
+
+    def test_chats_are_written_in_one_transaction(self):
+        def append(history):
+            history["messages"]["m1"]["content"] += " world"
+            history["messages"]["m2"] = {"content": "new"}
+            return True
+
+        written = Chats.update_messages_by_ids(
+            {"a": append, "b": lambda history: False, "missing": append}
+        )
+        assert written == ["a"]
+
+        chat = Chats.get_chat_by_id("a")
+        assert chat.chat["history"]["messages"] == {
+            "m1": {"content": "Hello world"},
+            "m2": {"content": "new"},
+        }
+        assert chat.updated_at >= int(time.time()) - 1
+        assert chat.title == "Chat a"
+
+        # Not changed, not written
+        chat = Chats.get_chat_by_id("b")
+        assert chat.chat["history"]["messages"] == {"m1": {"content": "Hi"}}
+        assert chat.updated_at < int(time.time()) - 50
+        assert Chats.get_chat_by_id("missing") is None
+
+    def test_chat_writer(self):
+        writer = ChatWriter(Chats.update_messages_by_ids, interval=10)
+        writer.save_message("a", "m1", {"content": "Hello\x00!"})
+        writer.save_message("b", "m2", {"content": "new"})
+        writer.flush("a").result(timeout=5)
+        writer.stop()
+
+        history = Chats.get_chat_by_id("a").chat["history"]
+        assert history["messages"]["m1"]["content"] == "Hello!"
+        assert history["currentId"] == "m1"
+        history = Chats.get_chat_by_id("b").chat["history"]
+        assert history["messages"]["m2"] == {"content": "new"}
@@ -0,0 +1,285 @@
+import asyncio
+import contextlib
+import io
+import json
+import traceback
+import uuid
+
+import pytest
+import pytest_asyncio
+from aiohttp import WSMsgType, web
+from aiohttp.test_utils import TestServer
+
+from open_webui.utils import code_interpreter
+from open_webui.utils.code_interpreter import (
+    KERNEL_POOLS,
+    JupyterKernelPool,
+    close_kernel_pools,
+    execute_code_jupyter,
+)
+
+TOKEN = "secret"
+
+
+class FakeJupyter:
+    """
+    The kernel REST API and channels websocket of a Jupyter server. Kernels run
+    Python code with exec, after sleeping when the code starts with `sleep(seconds);`.
+    """
+
+    def __init__(self):
+        # kernel id -> its namespace
+        self.kernels = {}
+        self.started = 0
+        self.restarts = []
+        self.deleted = []
+
+        self.app = web.Application(middlewares=[self.check_token])
+        self.app.router.add_post("/api/kernels", self.start)
+        self.app.router.add_post("/api/kernels/{id}/restart", self.restart)
+        self.app.router.add_delete("/api/kernels/{id}", self.delete)
+        self.app.router.add_get("/api/kernels/{id}/channels", self.channels)
+
+    @web.middleware
+    async def check_token(self, request, handler):
+        if request.query.get("token") != TOKEN:
+            raise web.HTTPForbidden()
+        return await handler(request)
+
+    def kernel(self, request):
+        kernel_id = request.match_info["id"]
+        if kernel_id not in self.kernels:
+            raise web.HTTPNotFound()
+        return kernel_id
+
+    async def start(self, request):
+        kernel_id = str(uuid.uuid4())
+        self.kernels[kernel_id] = {}
+        self.started += 1
+        return web.json_response({"id": kernel_id}, status=201)
+
+    async def restart(self, request):
+        kernel_id = self.kernel(request)
+        self.kernels[kernel_id] = {}
+        self.restarts.append(kernel_id)
+        return web.json_response({"id": kernel_id})
+
+    async def delete(self, request):
+        kernel_id = self.kernel(request)
+        del self.kernels[kernel_id]
+        self.deleted.append(kernel_id)
+        return web.Response(status=204)
+
+    async def channels(self, request):
+        kernel_id = self.kernel(request)
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        tasks = set()
+        async for message in ws:
+            if message.type == WSMsgType.TEXT:
+                task = asyncio.create_task(
+                    self.execute(ws, kernel_id, json.loads(message.data))
+                )
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        return ws
+
+    async def execute(self, ws, kernel_id, request):
+        code = request["content"]["code"]
+        if code.startswith("sleep("):
+            seconds, _, code = code[len("sleep(") :].partition(");")
+            await asyncio.sleep(float(seconds))
+
+        replies = []
+        stdout = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(stdout):
+                exec(code, self.kernels.get(kernel_id, {}))
+        except Exception as e:
+            replies.append(("error", {"traceback": traceback.format_exception(e)}))
+        if stdout.getvalue():
+            replies.insert(0, ("stream", {"name": "stdout", "text": stdout.getvalue()}))
+        replies.append(("status", {"execution_state": "idle"}))
+
+        for msg_type, content in replies:
+            with contextlib.suppress(Exception):
+                await ws.send_str(
+                    json.dumps(
+                        {
+                            "msg_type": msg_type,
+                            "parent_header": {"msg_id": request["header"]["msg_id"]},
+                            "content": content,
+                        }
+                    )
+                )
+
+
+@pytest_asyncio.fixture
+async def jupyter():
+    jupyter = FakeJupyter()
+    server = TestServer(jupyter.app)
+    await server.start_server()
+    jupyter.url = str(server.make_url("/"))
+    yield jupyter
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def make_pool(jupyter):
+    pools = []
+
+    def make_pool(**kwargs):
+        pool = JupyterKernelPool(jupyter.url, token=TOKEN, **{"warm": 0, **kwargs})
+        pools.append(pool)
+        return pool
+
+    yield make_pool
+    for pool in pools:
+        await pool.close()
+
+
+async def settle(pool):
+    """Waits for the kernels being restarted, started or shut down in the background"""
+    while pool.tasks:
+        await asyncio.gather(*pool.tasks)
+
+
+class TestJupyterKernelPool:
+    @pytest.mark.asyncio
+    async def test_chat_keeps_its_kernel(self, jupyter, make_pool):
+        pool = make_pool(max_size=2)
+
+        await pool.execute("x = 1", chat_id="a")
+        result = await pool.execute("print(x)", chat_id="a")
+        assert result.stdout == "1"
+        assert result.stderr == ""
+
+        # Another chat, another kernel
+        result = await pool.execute("print(x)", chat_id="b")
+        assert "NameError" in result.stderr
+        assert jupyter.started == 2
+        assert pool.chats["a"] is not pool.chats["b"]
+        await settle(pool)
+        assert jupyter.restarts == []
+
+    @pytest.mark.asyncio
+    async def test_executions_without_a_chat_are_restarted_after(
+        self, jupyter, make_pool
+    ):
+        pool = make_pool(max_size=1)
+
+        await pool.execute("x = 1")
+        await settle(pool)
+        result = await pool.execute("print(x)")
+        assert "NameError" in result.stderr
+        assert jupyter.started == 1
+        assert len(jupyter.restarts) == 1
+
+    @pytest.mark.asyncio
+    async def test_chat_idle_the_longest_is_evicted(self, jupyter, make_pool):
+        pool = make_pool(max_size=2)
+
+        await pool.execute("x = 'a'", chat_id="a")
+        await pool.execute("x = 'b'", chat_id="b")
+        await pool.execute("print(x)", chat_id="a")
+        evicted = pool.chats["b"]
+
+        result = await pool.execute("print(x)", chat_id="c")
+        assert "NameError" in result.stderr
+        assert pool.chats["c"] is evicted
+        assert "b" not in pool.chats
+        assert jupyter.started == 2
+        assert jupyter.restarts == [evicted.id]
+
+        result = await pool.execute("print(x)", chat_id="a")
+        assert result.stdout == "a"
+
+    @pytest.mark.asyncio
+    async def test_restarted_after_a_timeout(self, jupyter, make_pool):
+        pool = make_pool(max_size=1)
+
+        await pool.execute("x = 1", chat_id="a")
+        kernel = pool.chats["a"]
+        result = await pool.execute("sleep(1); print('late')", chat_id="a", timeout=0.2)
+        assert "Execution timed out." in result.stderr
+
+        await settle(pool)
+        assert jupyter.restarts == [kernel.id]
+        # The same kernel, without the variables or the late output of the previous run
+        result = await pool.execute("print('next')", chat_id="a")
+        assert pool.chats["a"] is kernel
+        assert result.stdout == "next"
+        result = await pool.execute("print(x)", chat_id="a")
+        assert "NameError" in result.stderr
+
+    @pytest.mark.asyncio
+    async def test_failed_memory_check(self, jupyter, make_pool, monkeypatch):
+        pool = make_pool(max_size=1, memory_limit=2**30)
+
+        async def memory_usage(kernel):
+            raise TimeoutError("Memory check timed out")
+
+        monkeypatch.setattr(pool, "_memory_usage", memory_usage)
+        # The execution's own result is kept, and the kernel is restarted
+        result = await pool.execute("x = 1; print(x)", chat_id="a")
+        assert result.stdout == "1"
+        assert result.stderr == ""
+
+        await settle(pool)
+        assert jupyter.restarts == [pool.chats["a"].id]
+
+    @pytest.mark.asyncio
+    async def test_idle_chats_are_reaped(self, jupyter, make_pool):
+        pool = make_pool(max_size=3, warm=1, idle_ttl=60)
+
+        await pool.execute("x = 1", chat_id="a")
+        await pool.execute("x = 2", chat_id="b")
+        await settle(pool)
+        assert len(pool.kernels) == 3
+        for kernel in pool.kernels:
+            kernel.last_used -= 120
+        pool.chats["b"].last_used += 120
+
+        await pool._reap()
+        await settle(pool)
+        assert list(pool.chats) == ["b"]
+        # The warm kernel is still there, the reaped one is shut down
+        assert len(pool.kernels) == 2
+        assert len(jupyter.deleted) == 1
+        assert jupyter.restarts == []
+
+        result = await pool.execute("print(x)", chat_id="b")
+        assert result.stdout == "2"
+
+
+class TestExecuteCodeJupyter:
+    @pytest.mark.asyncio
+    async def test_without_a_pool(self, jupyter, monkeypatch):
+        monkeypatch.setattr(code_interpreter, "JUPYTER_KERNEL_POOL_SIZE", 0)
+
+        result = await execute_code_jupyter(
+            jupyter.url, "print(1 + 1)", token=TOKEN, chat_id="a"
+        )
+        assert result["stdout"] == "2"
+        assert KERNEL_POOLS == {}
+        # A kernel started for it alone
+        assert jupyter.started == 1
+        assert jupyter.kernels == {}
+
+    @pytest.mark.asyncio
+    async def test_with_a_pool(self, jupyter, monkeypatch):
+        monkeypatch.setattr(code_interpreter, "JUPYTER_KERNEL_POOL_SIZE", 2)
+        monkeypatch.setattr(code_interpreter, "JUPYTER_KERNEL_POOL_WARM", 0)
+        monkeypatch.setattr(code_interpreter, "JUPYTER_KERNEL_MEMORY_LIMIT_MB", 0)
+
+        try:
+            await execute_code_jupyter(jupyter.url, "x = 1", token=TOKEN, chat_id="a")
+            result = await execute_code_jupyter(
+                jupyter.url, "print(x)", token=TOKEN, chat_id="a"
+            )
+            assert result["stdout"] == "1"
+            assert len(KERNEL_POOLS) == 1
+        finally:
+            await close_kernel_pools()
+        assert jupyter.started == 1
+        assert jupyter.kernels == {}
@@ -0,0 +1,150 @@
+import random
+
+import pytest
+
+from open_webui.utils.content_blocks import (
+    ContentBlockSerializer,
+    IncrementalSearch,
+    serialize_content_blocks,
+    tag_content_handler,
+)
+
+TAGS = {
+    "reasoning": [("<think>", "</think>"), ("◁think▷", "◁/think▷")],
+    "solution": [("<|begin_of_solution|>", "<|end_of_solution|>")],
+    "code_interpreter": [("<code_interpreter>", "</code_interpreter>")],
+}
+
+TOKENS = [
+    "the",
+    " model",
+    " a & b",
+    " < c",
+    " > 3",
+    '"quoted"',
+    "\n",
+    "\n\n",
+    "  ",
+    "```",
+    "```python\n",
+    "print(1)",
+    "<think>",
+    "</think>",
+    "◁think▷",
+    "◁/think▷",
+    "<|begin_of_solution|>",
+    "<|end_of_solution|>",
+    '<code_interpreter type="code" lang="python">',
+    "</code_interpreter>",
+]
+
+
+def make_stream(rng):
+    text = "".join(rng.choice(TOKENS) for _ in range(rng.randint(1, 80)))
+    # Deltas split anywhere, tags included
+    cuts = sorted(rng.sample(range(1, len(text) + 1), min(len(text), 20)))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts)]
+
+
+def replay(stream, tag_search=None):
+    """Runs what process_chat_response runs for every delta, yielding the blocks"""
+    content = ""
+    content_blocks = [{"type": "text", "content": ""}]
+
+    for value in stream:
+        content = f"{content}{value}"
+        content_blocks[-1]["content"] = content_blocks[-1]["content"] + value
+        for content_type, tags in TAGS.items():
+            content, content_blocks, _ = tag_content_handler(
+                content_type, tags, content, content_blocks, tag_search
+            )
+        yield content_blocks
+
+
+def without_times(content_blocks):
+    return [
+        {
+            key: value
+            for key, value in block.items()
+            if key not in ("started_at", "ended_at", "duration")
+        }
+        for block in content_blocks
+    ]
+
+
+class TestContentBlockSerializer:
+    @pytest.mark.parametrize("seed", range(10))
+    def test_same_as_serialize_content_blocks(self, seed):
+        rng = random.Random(seed)
+        for _ in range(50):
+            serializers = {
+                False: ContentBlockSerializer(),
+                True: ContentBlockSerializer(),
+            }
+            for content_blocks in replay(make_stream(rng)):
+                for raw, serializer in serializers.items():
+                    assert serializer(content_blocks, raw) == serialize_content_blocks(
+                        content_blocks, raw
+                    )
+
+    def test_changed_and_replaced_blocks(self):
+        serializer = ContentBlockSerializer()
+        content_blocks = [
+            {"type": "text", "content": "Hello"},
+            {
+                "type": "reasoning",
+                "start_tag": "<think>",
+                "end_tag": "</think>",
+                "attributes": {},
+                "content": "a\nb",
+            },
+            {"type": "text", "content": "```python"},
+        ]
+
+        def check():
+            for raw in (False, True):
+                assert serializer(content_blocks, raw) == serialize_content_blocks(
+                    content_blocks, raw
+                )
+
+        check()
+        content_blocks.append(
+            {
+                "type": "tool_calls",
+                "content": [
+                    {"id": "1", "function": {"name": "search", "arguments": "{}"}}
+                ],
+            }
+        )
+        check()
+        # Blocks before the last one are changed in place or replaced
+        content_blocks[-1]["results"] = [{"tool_call_id": "1", "content": "<found>"}]
+        content_blocks.append(
+            {
+                "type": "code_interpreter",
+                "attributes": {"lang": "python"},
+                "content": "print(1)",
+            }
+        )
+        check()
+        content_blocks[1]["duration"] = 3
+        content_blocks.append({"type": "text", "content": ""})
+        check()
+        content_blocks[-2] = dict(content_blocks[-2], output={"stdout": "1 & 2"})
+        check()
+        content_blocks[1]["content"] = "c"
+        check()
+        del content_blocks[2:]
+        check()
+
+
+class TestIncrementalSearch:
+    @pytest.mark.parametrize("seed", range(10))
+    def test_same_blocks_as_a_full_search(self, seed):
+        rng = random.Random(seed)
+        for _ in range(50):
+            stream = make_stream(rng)
+            for searched, incremental in zip(
+                replay(stream), replay(stream, IncrementalSearch())
+            ):
+                assert without_times(incremental) == without_times(searched)
@@ -0,0 +1,107 @@
+import time
+
+from sqlalchemy import event
+
+from open_webui.internal.db import Base, engine, get_db
+from open_webui.models.groups import Group
+from open_webui.models.models import Model, Models
+from open_webui.utils import access_control
+from open_webui.utils.access_control import has_access
+from open_webui.utils.models import get_filtered_models
+
+
+class FakeUser:
+    id = "user"
+    role = "user"
+
+
+class CountQueries:
+    def __enter__(self):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(engine, "before_cursor_execute", self.before_cursor_execute)
+
+    def before_cursor_execute(self, *args):
+        self.count += 1
+
+
+def access_control_of(i):
+    # Public, private to its owner, shared with the user's group or with the user
+    return [
+        None,
+        {},
+        {"read": {"group_ids": ["group"], "user_ids": []}},
+        {"read": {"group_ids": [], "user_ids": ["user"]}},
+        {"read": {"group_ids": ["other-group"], "user_ids": []}},
+    ][i % 5]
+
+
+class TestGetFilteredModels:
+    def setup_method(self):
+        Base.metadata.create_all(engine, tables=[Model.__table__, Group.__table__])
+        now = int(time.time())
+        with get_db() as db:
+            db.query(Model).delete()
+            db.query(Group).delete()
+            db.add(
+                Group(
+                    id="group",
+                    user_id="admin",
+                    name="group",
+                    description="",
+                    user_ids=["user"],
+                    created_at=now,
+                    updated_at=now,
+                )
+            )
+            for i in range(300):
+                db.add(
+                    Model(
+                        id=f"model-{i}",
+                        # Every 7th model is the user's own
+                        user_id="user" if i % 7 == 0 else "admin",
+                        name=f"Model {i}",
+                        params={},
+                        meta={},
+                        access_control=access_control_of(i),
+                        created_at=now,
+                        updated_at=now,
+                    )
+                )
+            db.commit()
+        access_control.USER_GROUP_IDS.clear()
+
+    def test_filtered_in_two_queries(self):
+        user = FakeUser()
+        models = [{"id": f"model-{i}"} for i in range(310)] + [
+            {
+                "id": "arena-model",
+                "arena": True,
+                "info": {"meta": {"access_control": access_control_of(2)}},
+            }
+        ]
+
+        # As it was done model by model
+        expected = [
+            model
+            for model in models[:-1]
+            if (model_info := Models.get_model_by_id(model["id"]))
+            and (
+                model_info.user_id == user.id
+                or has_access(user.id, "read", model_info.access_control)
+            )
+        ] + models[-1:]
+        assert 1 < len(expected) < len(models)
+
+        with CountQueries() as queries:
+            assert get_filtered_models(models, user) == expected
+        # The user's groups, then every model
+        assert queries.count == 2
+
+        # Group ids are reused for a little while
+        with CountQueries() as queries:
+            assert get_filtered_models(models, user) == expected
+        assert queries.count == 1
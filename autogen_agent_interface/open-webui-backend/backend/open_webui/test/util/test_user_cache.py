@@ -0,0 +1,71 @@
+import threading
+import time
+
+from pydantic import BaseModel
+
+from open_webui.utils.user_cache import LastActiveBuffer, UserCache
+
+
+class FakeUser(BaseModel):
+    id: str
+    role: str = "user"
+
+
+class TestUserCache:
+    def test_hit_and_invalidate(self):
+        cache = UserCache(ttl=60, maxsize=10)
+        assert cache.get("token") is None
+
+        cache.set("token", FakeUser(id="a"), cache.version)
+        cache.set("other-token", FakeUser(id="a"), cache.version)
+        user = cache.get("token")
+        assert user == FakeUser(id="a")
+
+        # Changing what was returned doesn't change the cache
+        user.role = "admin"
+        assert cache.get("token").role == "user"
+
+        cache.invalidate("a")
+        assert cache.get("token") is None
+        assert cache.get("other-token") is None
+
+    def test_stale_version_not_cached(self):
+        cache = UserCache(ttl=60, maxsize=10)
+        version = cache.version
+        # The user changes while it's being read
+        cache.invalidate("a")
+        cache.set("token", FakeUser(id="a"), version)
+        assert cache.get("token") is None
+
+    def test_expiry_and_size(self):
+        cache = UserCache(ttl=60, maxsize=2)
+        cache.set("expiring", FakeUser(id="a"), 0, expires_at=time.time() + 0.05)
+        assert cache.get("expiring") is not None
+        time.sleep(0.06)
+        assert cache.get("expiring") is None
+
+        for i in range(3):
+            cache.set(f"token-{i}", FakeUser(id=str(i)), cache.version)
+        assert cache.get("token-0") is None
+        assert cache.get("token-2") is not None
+        assert cache.metrics()["size"] == 2
+
+
+class TestLastActiveBuffer:
+    def test_writes_batched(self):
+        writes = []
+        done = threading.Event()
+
+        def write(last_active):
+            writes.append(last_active)
+            done.set()
+
+        buffer = LastActiveBuffer(write, interval=0.05)
+        for user_id in ("a", "b", "a"):
+            buffer.touch(user_id)
+        assert done.wait(1)
+        assert writes == [{"a": writes[0]["a"], "b": writes[0]["b"]}]
+
+        buffer.touch("c")
+        buffer.stop()
+        assert list(writes[-1]) == ["c"]
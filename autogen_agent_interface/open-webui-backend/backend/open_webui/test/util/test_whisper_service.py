@@ -0,0 +1,113 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faster_whisper")
+
+from open_webui.utils.whisper_service import SAMPLING_RATE, WhisperService
+
+
+class FakePipeline:
+    """Transcribes each clip as the number of the call and the clip's length"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def transcribe(self, audio, language=None, clip_timestamps=None, **kwargs):
+        self.release.wait()
+        self.calls.append(clip_timestamps)
+        segments = [
+            SimpleNamespace(
+                start=clip["start"] / SAMPLING_RATE,
+                end=clip["end"] / SAMPLING_RATE,
+                text=f" {(clip['end'] - clip['start']) // SAMPLING_RATE}s",
+            )
+            for clip in clip_timestamps
+        ]
+        return iter(segments), SimpleNamespace(language=language or "en")
+
+
+def tone(seconds):
+    return np.full(int(seconds * SAMPLING_RATE), 0.1, dtype=np.float32)
+
+
+class TestWhisperService:
+    def make_service(self, **kwargs):
+        service = WhisperService(None, vad=False, batch_wait=0.05, **kwargs)
+        service.pipeline = FakePipeline()
+        return service
+
+    def test_short_requests_batched(self):
+        service = self.make_service(workers=1, batch_size=4)
+        try:
+            # Keeps the worker busy while the others queue up
+            service.pipeline.release.clear()
+            first = service.submit(tone(1))
+            time.sleep(0.1)
+            futures = [service.submit(tone(seconds)) for seconds in (2, 3, 4, 5, 6)]
+            assert service.metrics()["queue_depth"] == 5
+            service.pipeline.release.set()
+
+            assert first.result(timeout=5)["text"] == "1s"
+            results = [future.result(timeout=5) for future in futures]
+        finally:
+            service.stop()
+
+        assert [result["text"] for result in results] == ["2s", "3s", "4s", "5s", "6s"]
+        # Times are in each request's own audio
+        assert results[2]["segments"][0]["start"] == 0
+        assert results[2]["segments"][0]["end"] == 4
+        # The first alone, then 4 and 1
+        assert [len(clips) for clips in service.pipeline.calls] == [1, 4, 1]
+
+        metrics = service.metrics()
+        assert metrics["requests"] == 6
+        assert metrics["batches"] == 3
+        assert metrics["audio_seconds"] == 21
+        assert metrics["real_time_factor"] > 0
+
+    def test_languages_not_mixed(self):
+        service = self.make_service(workers=1, batch_size=8)
+        try:
+            service.pipeline.release.clear()
+            service.submit(tone(1))
+            time.sleep(0.1)
+            futures = [
+                service.submit(tone(1), language=language)
+                for language in ("fr", "de", "fr")
+            ]
+            service.pipeline.release.set()
+            results = [future.result(timeout=5) for future in futures]
+        finally:
+            service.stop()
+
+        assert [result["language"] for result in results] == ["fr", "de", "fr"]
+        assert sorted(len(clips) for clips in service.pipeline.calls) == [1, 1, 2]
+
+    def test_long_audio_alone(self):
+        service = self.make_service(workers=1)
+        try:
+            result = service.transcribe(tone(70))
+        finally:
+            service.stop()
+
+        # 30s clips, times in the whole audio
+        assert result["text"] == "30s 30s 10s"
+        assert [segment["start"] for segment in result["segments"]] == [0, 30, 60]
+
+    def test_silence_skips_the_model(self):
+        service = WhisperService(None, vad=True)
+        service.pipeline = FakePipeline()
+        try:
+            result = service.transcribe(np.zeros(5 * SAMPLING_RATE, dtype=np.float32))
+        finally:
+            service.stop()
+
+        assert result["text"] == ""
+        assert service.pipeline.calls == []
+        assert service.metrics()["silent_requests"] == 1
@@ -1,9 +1,11 @@
+import time
 from typing import Optional, Set, Union, List, Dict, Any
 from open_webui.models.users import Users, UserModel
 from open_webui.models.groups import Groups
 
 
 from open_webui.config import DEFAULT_USER_PERMISSIONS
+from open_webui.env import USER_GROUP_IDS_CACHE_TTL
 import json
 
 
@@ -105,6 +107,31 @@ def has_permission(
     return get_permission(default_permissions, permission_hierarchy)
 
 
+# user id -> (expires, group ids), see get_user_group_ids
+USER_GROUP_IDS = {}
+USER_GROUP_IDS_MAX_SIZE = 10000
+
+
+def get_user_group_ids(user_id: str) -> Set[str]:
+    """
+    The ids of the groups the user is a member of, reused for USER_GROUP_IDS_CACHE_TTL
+    seconds so checking many resources (or requests) in a row is a single query.
+    """
+    now = time.monotonic()
+    entry = USER_GROUP_IDS.get(user_id)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    user_group_ids = frozenset(
+        group.id for group in Groups.get_groups_by_member_id(user_id)
+    )
+    if USER_GROUP_IDS_CACHE_TTL > 0:
+        if len(USER_GROUP_IDS) >= USER_GROUP_IDS_MAX_SIZE:
+            USER_GROUP_IDS.clear()
+        USER_GROUP_IDS[user_id] = (now + USER_GROUP_IDS_CACHE_TTL, user_group_ids)
+    return user_group_ids
+
+
 def has_access(
     user_id: str,
     type: str = "write",
@@ -0,0 +1,257 @@
+import csv
+import logging
+import os
+import re
+import subprocess
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional
+
+from pydub import AudioSegment
+
+from open_webui.env import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["AUDIO"])
+
+SILENCE_RE = re.compile(r"silence_(start|end): (-?\d+(?:\.\d+)?)")
+TIME_RE = re.compile(r"time=(\d+):(\d+):(\d+(?:\.\d+)?)")
+
+
+class AudioChunk(NamedTuple):
+    path: str
+    # Seconds from the start of the original file
+    start: float
+    end: float
+
+
+def detect_silences(
+    file_path: str,
+    noise: str = "-35dB",
+    min_duration: float = 0.5,
+    timeout: Optional[float] = 3600,
+) -> tuple[list[tuple[float, float]], float]:
+    """
+    The silent spans of the file and its duration, from one streaming ffmpeg pass
+    (decoded a few frames at a time, never held in memory).
+    """
+    try:
+        result = subprocess.run(
+            [
+                AudioSegment.converter,
+                "-hide_banner",
+                "-nostdin",
+                "-i",
+                file_path,
+                "-vn",
+                "-ac",
+                "1",
+                "-af",
+                f"silencedetect=noise={noise}:d={min_duration}",
+                "-f",
+                "null",
+                "-",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors="replace",
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        raise Exception(f"Reading audio timed out after {timeout}s")
+    if result.returncode != 0:
+        raise Exception(f"Failed to read audio: {result.stderr[-500:]}")
+
+    silences = []
+    start = None
+    for kind, value in SILENCE_RE.findall(result.stderr):
+        if kind == "start":
+            start = max(0.0, float(value))
+        elif start is not None:
+            silences.append((start, float(value)))
+            start = None
+
+    times = TIME_RE.findall(result.stderr)
+    if not times:
+        raise Exception("Failed to read audio duration")
+    hours, minutes, seconds = times[-1]
+    duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    if start is not None:
+        silences.append((start, duration))
+    return silences, duration
+
+
+def get_cut_points(
+    duration: float,
+    chunk_duration: float,
+    silences: list[tuple[float, float]] = (),
+) -> list[float]:
+    """
+    Where to cut `duration` seconds of audio into chunks of `chunk_duration` seconds at
+    most: in the last silence of the final tenth of each chunk, if there's one.
+    """
+    window = chunk_duration / 10
+    middles = [(start + end) / 2 for start, end in silences]
+
+    cut_points = []
+    start = 0.0
+    while duration - start > chunk_duration:
+        target = start + chunk_duration
+        candidates = [
+            middle for middle in middles if target - window <= middle <= target
+        ]
+        cut = candidates[-1] if candidates else target
+        cut_points.append(cut)
+        start = cut
+    return cut_points
+
+
+def iter_audio_chunks(
+    file_path: str,
+    output_dir: str,
+    chunk_duration: float,
+    cut_points: Optional[list[float]] = None,
+    bitrate: str = "32k",
+    timeout: Optional[float] = 3600,
+) -> Iterator[AudioChunk]:
+    """
+    Cuts the file into 16kHz mono mp3 chunks of `chunk_duration` seconds (or at
+    `cut_points`) in one streaming ffmpeg pass, yielding each chunk as soon as it's
+    written. ffmpeg is stopped if it hasn't finished within `timeout` seconds.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    list_path = os.path.join(output_dir, "chunks.csv")
+
+    command = [
+        AudioSegment.converter,
+        "-hide_banner",
+        "-nostdin",
+        "-loglevel",
+        "error",
+        "-i",
+        file_path,
+        "-vn",
+        "-ac",
+        "1",
+        "-ar",
+        "16000",
+        "-c:a",
+        "libmp3lame",
+        "-b:a",
+        bitrate,
+        "-f",
+        "segment",
+        "-reset_timestamps",
+        "1",
+        "-segment_list",
+        list_path,
+        "-segment_list_type",
+        "csv",
+    ]
+    if cut_points is not None:
+        if cut_points:
+            command += [
+                "-segment_times",
+                ",".join(f"{cut:.3f}" for cut in cut_points),
+            ]
+        else:
+            # One chunk
+            command += ["-segment_time", "1000000000"]
+    else:
+        command += ["-segment_time", f"{chunk_duration:.3f}"]
+    command.append(os.path.join(output_dir, "chunk_%05d.mp3"))
+
+    # A file, not a pipe: nothing reads it until ffmpeg is done, and a full pipe
+    # would block it
+    stderr = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=stderr,
+    )
+    deadline = time.monotonic() + timeout if timeout else None
+    read = 0
+    try:
+        while True:
+            done = process.poll() is not None
+            if not done and deadline is not None and time.monotonic() > deadline:
+                raise Exception(f"Splitting audio timed out after {timeout}s")
+
+            # ffmpeg adds a line to the list when it's done with a chunk
+            lines = []
+            if os.path.exists(list_path):
+                with open(list_path, "rb") as f:
+                    f.seek(read)
+                    data = f.read()
+                complete = data[: data.rfind(b"\n") + 1]
+                read += len(complete)
+                lines = list(csv.reader(complete.decode().splitlines()))
+
+            for name, start, end in lines:
+                yield AudioChunk(
+                    os.path.join(output_dir, name), float(start), float(end)
+                )
+
+            if done:
+                break
+            if not lines:
+                time.sleep(0.05)
+
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise Exception(
+                f"Failed to split audio: {stderr.read().decode(errors='replace')[-500:]}"
+            )
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        stderr.close()
+
+
+def transcribe_chunks(
+    chunks: Iterable[AudioChunk],
+    transcribe_chunk: Callable[[AudioChunk], dict],
+    concurrency: int,
+) -> list[dict]:
+    """
+    Transcribes chunks as they come, `concurrency` at a time, deleting each once
+    it's done. Returns the results in order, with each chunk's `start` and `end`.
+    """
+    results = {}
+    with ThreadPoolExecutor(
+        max_workers=max(1, concurrency), thread_name_prefix="transcription"
+    ) as executor:
+        running = {}
+
+        def collect(return_when):
+            done, _ = wait(running, return_when=return_when)
+            for future in done:
+                index, chunk = running.pop(future)
+                try:
+                    results[index] = {
+                        **future.result(),
+                        "start": chunk.start,
+                        "end": chunk.end,
+                    }
+                finally:
+                    if os.path.isfile(chunk.path):
+                        os.remove(chunk.path)
+
+        try:
+            for index, chunk in enumerate(chunks):
+                while len(running) >= max(1, concurrency):
+                    collect(FIRST_COMPLETED)
+                running[executor.submit(transcribe_chunk, chunk)] = (index, chunk)
+            while running:
+                collect(FIRST_COMPLETED)
+        except BaseException:
+            for future in running:
+                future.cancel()
+            raise
+
+    return [results[index] for index in sorted(results)]
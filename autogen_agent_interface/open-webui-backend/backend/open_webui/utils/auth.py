@@ -21,7 +21,7 @@ from typing import Optional, Union, List, Dict
 
 from opentelemetry import trace
 
-from open_webui.models.users import Users
+from open_webui.models.users import LAST_ACTIVE_BUFFER, USER_CACHE, Users
 
 from open_webui.constants import ERROR_MESSAGES
 
@@ -266,16 +266,26 @@ def get_current_user(
     # auth by jwt token
 
     try:
-        try:
-            data = decode_token(token)
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token",
-            )
+        # Verified before and unchanged since, no need to decode it or read the user
+        user = USER_CACHE.get(token)
+        if user is not None:
+            data = {"id": user.id}
+        else:
+            version = USER_CACHE.version
+            try:
+                data = decode_token(token)
+            except Exception as e:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Invalid token",
+                )
+
+            if data is not None and "id" in data:
+                user = Users.get_user_by_id(data["id"])
+                if user is not None:
+                    USER_CACHE.set(token, user, version, expires_at=data.get("exp"))
 
         if data is not None and "id" in data:
-            user = Users.get_user_by_id(data["id"])
             if user is None:
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
@@ -300,12 +310,9 @@ def get_current_user(
                     current_span.set_attribute("client.user.role", user.role)
                     current_span.set_attribute("client.auth.type", "jwt")
 
-                # Refresh the user's last active timestamp asynchronously
-                # to prevent blocking the request
-                if background_tasks:
-                    background_tasks.add_task(
-                        Users.update_user_last_active_by_id, user.id
-                    )
+                # Refresh the user's last active timestamp, written in batches
+                # by a background thread to prevent blocking the request
+                LAST_ACTIVE_BUFFER.touch(user.id)
             return user
         else:
             raise HTTPException(
@@ -328,7 +335,12 @@ def get_current_user(
 
 
 def get_current_user_by_api_key(api_key: str):
-    user = Users.get_user_by_api_key(api_key)
+    user = USER_CACHE.get(api_key)
+    if user is None:
+        version = USER_CACHE.version
+        user = Users.get_user_by_api_key(api_key)
+        if user is not None:
+            USER_CACHE.set(api_key, user, version)
 
     if user is None:
         raise HTTPException(
@@ -344,7 +356,7 @@ def get_current_user_by_api_key(api_key: str):
             current_span.set_attribute("client.user.role", user.role)
             current_span.set_attribute("client.auth.type", "api_key")
 
-        Users.update_user_last_active_by_id(user.id)
+        LAST_ACTIVE_BUFFER.touch(user.id)
 
     return user
 
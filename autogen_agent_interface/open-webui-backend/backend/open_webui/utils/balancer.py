@@ -0,0 +1,210 @@
+import logging
+import random
+import time
+from typing import Callable
+from urllib.parse import urlparse
+
+import aiohttp
+
+from open_webui.env import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+class Backend:
+    def __init__(self, url: str):
+        self.url = url
+        self.in_flight = 0
+        # Moving average of the time to the response headers, in seconds
+        self.latency = None
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.last_error = None
+
+    def stats(self) -> dict:
+        ejected_for = self.ejected_until - time.monotonic()
+        return {
+            "url": self.url,
+            "in_flight": self.in_flight,
+            "latency_ms": (
+                round(self.latency * 1000, 1) if self.latency is not None else None
+            ),
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "ejected": ejected_for > 0,
+            "ejected_for": max(round(ejected_for, 1), 0),
+            "last_error": self.last_error,
+        }
+
+
+class BackendCall:
+    """
+    One request to a backend, counted as in flight until `end()`.
+    """
+
+    def __init__(self, balancer: "BackendBalancer", backend: Backend):
+        self.balancer = balancer
+        self.backend = backend
+        self.started = time.monotonic()
+        self.recorded = False
+        self.ended = False
+
+        backend.in_flight += 1
+        backend.requests += 1
+
+    def responded(self, status: int):
+        if status >= 500:
+            self.failed(f"HTTP Error: {status}")
+        elif not self.recorded:
+            self.recorded = True
+            self.balancer._succeeded(self.backend, time.monotonic() - self.started)
+
+    def failed(self, error):
+        if not self.recorded:
+            self.recorded = True
+            self.balancer._failed(self.backend, str(error))
+
+    def end(self):
+        if not self.ended:
+            self.ended = True
+            self.backend.in_flight -= 1
+
+
+class BackendBalancer:
+    """
+    Keep-alive connections to a set of HTTP backends, and which one to send a request to.
+
+    - Backends are the configured base URLs, and their stats are kept per URL.
+    - One aiohttp session per scheme and host, for the app's lifetime, with at most
+      `connection_limit` connections open at once (0 means no limit).
+    - `choose` picks the backend with the fewest requests in flight, weighted by its
+      moving average latency, so a slower backend gets proportionally less.
+    - A backend failing `max_failures` requests in a row (connection errors, 5xx)
+      is skipped for `ejection_time` seconds, doubled each time it fails again once
+      it's back. If every backend is out, the first one coming back is used.
+    """
+
+    def __init__(
+        self,
+        max_failures: int = 3,
+        ejection_time: float = 10,
+        max_ejection_time: float = 300,
+        alpha: float = 0.3,
+        connection_limit: int = 0,
+    ):
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self.max_ejection_time = max_ejection_time
+        self.alpha = alpha
+        self.connection_limit = connection_limit
+
+        self.backends = {}
+        self.sessions = {}
+
+    @staticmethod
+    def _session_key(url: str) -> str:
+        parsed_url = urlparse(url)
+        return f"{parsed_url.scheme}://{parsed_url.netloc}"
+
+    def get(self, url: str) -> Backend:
+        key = url.rstrip("/")
+        if key not in self.backends:
+            self.backends[key] = Backend(key)
+        return self.backends[key]
+
+    def get_session(self, url: str) -> aiohttp.ClientSession:
+        key = self._session_key(url)
+        session = self.sessions.get(key)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                trust_env=True,
+                connector=aiohttp.TCPConnector(
+                    limit=self.connection_limit, keepalive_timeout=60
+                ),
+            )
+            self.sessions[key] = session
+        return session
+
+    def choose(self, candidates: list, get_url: Callable = lambda url: url):
+        """
+        The candidate to send the next request to, out of the ones that can serve it.
+        """
+        if len(candidates) == 1:
+            return candidates[0]
+
+        now = time.monotonic()
+        backends = {candidate: self.get(get_url(candidate)) for candidate in candidates}
+
+        available = [
+            candidate
+            for candidate in candidates
+            if backends[candidate].ejected_until <= now
+        ]
+        if not available:
+            return min(
+                candidates, key=lambda candidate: backends[candidate].ejected_until
+            )
+
+        # Backends without a latency yet count as the fastest, so they get tried
+        latencies = [
+            backends[candidate].latency
+            for candidate in available
+            if backends[candidate].latency is not None
+        ]
+        default_latency = min(latencies) if latencies else 0
+
+        def load(candidate):
+            backend = backends[candidate]
+            latency = (
+                backend.latency if backend.latency is not None else default_latency
+            )
+            return (backend.in_flight + 1) * max(latency, 0.001)
+
+        lowest = min(load(candidate) for candidate in available)
+        return random.choice(
+            [candidate for candidate in available if load(candidate) == lowest]
+        )
+
+    def track(self, url: str) -> BackendCall:
+        """
+        Counts a request to the backend with the base URL `url`.
+        """
+        return BackendCall(self, self.get(url))
+
+    def _succeeded(self, backend: Backend, latency: float):
+        backend.consecutive_failures = 0
+        backend.ejected_until = 0.0
+        backend.latency = (
+            latency
+            if backend.latency is None
+            else self.alpha * latency + (1 - self.alpha) * backend.latency
+        )
+
+    def _failed(self, backend: Backend, error: str):
+        backend.failures += 1
+        backend.consecutive_failures += 1
+        backend.last_error = error
+
+        if backend.consecutive_failures >= self.max_failures:
+            ejection_time = min(
+                self.ejection_time
+                * 2 ** (backend.consecutive_failures - self.max_failures),
+                self.max_ejection_time,
+            )
+            backend.ejected_until = time.monotonic() + ejection_time
+            log.warning(
+                f"{backend.url} failed {backend.consecutive_failures} requests in a row, "
+                f"skipping it for {ejection_time}s: {error}"
+            )
+
+    def stats(self, url: str) -> dict:
+        return self.get(url).stats()
+
+    async def close(self):
+        sessions, self.sessions = self.sessions, {}
+        for session in sessions.values():
+            await session.close()
@@ -0,0 +1,276 @@
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+from open_webui.models.chats import Chats
+from open_webui.env import (
+    SRC_LOG_LEVELS,
+    REALTIME_CHAT_SAVE_INTERVAL_MS,
+    CHAT_SAVE_MAX_BATCH,
+)
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MODELS"])
+
+
+def upsert_message(history: dict, message_id: str, message: dict) -> bool:
+    # Same as Chats.upsert_message_to_chat_by_id_and_message_id
+    if isinstance(message.get("content"), str):
+        message["content"] = message["content"].replace("\x00", "")
+
+    messages = history["messages"]
+    messages[message_id] = {**messages.get(message_id, {}), **message}
+    history["currentId"] = message_id
+    return True
+
+
+class ChatWriter:
+    """
+    Writes chat message updates from one background thread, so streams never wait on the database.
+
+    - Updates are queued per chat, in order. Message upserts (`save_message`) that follow
+      one another for the same message are merged, so a stream only keeps its latest content.
+    - Every queued update is written within `interval` seconds of being queued,
+      all pending chats in one transaction (up to `max_batch` chats each).
+    - `flush(chat_id)` writes a chat's updates right away. Every call returns a Future
+      that resolves once its update is committed.
+
+    `write(updates)` is Chats.update_messages_by_ids.
+    """
+
+    def __init__(self, write, interval=0.25, max_batch=100):
+        self.write = write
+        self.interval = interval
+        self.max_batch = max_batch
+
+        # chat_id -> [(message_id, message dict or update function)], and Futures to resolve
+        self.pending = {}
+        self.futures = {}
+        # When the oldest update of each chat was queued, and chats to write right away
+        self.queued_at = {}
+        self.urgent = set()
+
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = False
+
+        self.stats = {
+            "updates": 0,
+            "merged_updates": 0,
+            "batches": 0,
+            "chats_written": 0,
+            "failed_chats": 0,
+            "flush_latency_total": 0.0,
+            "flush_latency_max": 0.0,
+            "flush_latency_last": 0.0,
+            "save_delay_max": 0.0,
+        }
+
+    def save_message(self, chat_id: str, message_id: str, message: dict) -> Future:
+        """
+        Queues an upsert of the message's fields (like `{"content": ...}`).
+        """
+        return self._queue(chat_id, message_id, message)
+
+    def update(
+        self, chat_id: str, update: Callable[[dict], bool], immediate: bool = False
+    ) -> Future:
+        """
+        Queues `update(history)`, which changes the chat's history in place
+        and returns whether it changed anything.
+        """
+        return self._queue(chat_id, None, update, immediate)
+
+    def flush(self, chat_id: str) -> Future:
+        """
+        Writes the chat's pending updates right away.
+        """
+        future = Future()
+        with self.condition:
+            if chat_id not in self.pending:
+                future.set_result(None)
+                return future
+            self.futures[chat_id].append(future)
+            self.urgent.add(chat_id)
+            self.condition.notify()
+        return future
+
+    def _queue(self, chat_id, message_id, update, immediate=False) -> Future:
+        future = Future()
+
+        with self.condition:
+            stopped = self.stopped
+        if stopped:
+            # Shutting down, nobody is left to write it
+            self._write_batch({chat_id: [(message_id, update)]}, {chat_id: [future]})
+            return future
+
+        with self.condition:
+            self.stats["updates"] += 1
+            updates = self.pending.setdefault(chat_id, [])
+            if (
+                message_id is not None
+                and updates
+                and updates[-1][0] == message_id
+                and isinstance(updates[-1][1], dict)
+            ):
+                updates[-1] = (message_id, {**updates[-1][1], **update})
+                self.stats["merged_updates"] += 1
+            else:
+                updates.append((message_id, update))
+
+            self.futures.setdefault(chat_id, []).append(future)
+            self.queued_at.setdefault(chat_id, time.monotonic())
+            if immediate:
+                self.urgent.add(chat_id)
+
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name="chat-writer", daemon=True
+                )
+                self.thread.start()
+            self.condition.notify()
+
+        return future
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if self.stopped:
+                        return
+                    if self.urgent:
+                        break
+                    if self.queued_at:
+                        wait = (
+                            min(self.queued_at.values())
+                            + self.interval
+                            - time.monotonic()
+                        )
+                        if wait <= 0:
+                            break
+                        self.condition.wait(wait)
+                    else:
+                        self.condition.wait()
+
+                # Everything pending goes, the urgent chats first
+                chat_ids = sorted(
+                    self.pending, key=lambda chat_id: chat_id not in self.urgent
+                )
+                chat_ids = chat_ids[: self.max_batch]
+
+                batch = {chat_id: self.pending.pop(chat_id) for chat_id in chat_ids}
+                futures = {chat_id: self.futures.pop(chat_id) for chat_id in chat_ids}
+                queued_at = {
+                    chat_id: self.queued_at.pop(chat_id) for chat_id in chat_ids
+                }
+                self.urgent.difference_update(chat_ids)
+
+            self._write_batch(batch, futures)
+
+            now = time.monotonic()
+            with self.condition:
+                self.stats["save_delay_max"] = max(
+                    self.stats["save_delay_max"],
+                    max(now - queued for queued in queued_at.values()),
+                )
+
+    def _write_batch(self, batch, futures):
+        def history_update(updates):
+            def apply(history):
+                changed = False
+                for message_id, update in updates:
+                    if isinstance(update, dict):
+                        changed = upsert_message(history, message_id, update) or changed
+                    else:
+                        changed = update(history) or changed
+                return changed
+
+            return apply
+
+        start = time.monotonic()
+        failed = {}
+        try:
+            self.write(
+                {chat_id: history_update(updates) for chat_id, updates in batch.items()}
+            )
+        except Exception as e:
+            if len(batch) == 1:
+                log.exception(f"Failed to save chat {next(iter(batch))}: {e}")
+                failed = dict.fromkeys(batch, e)
+            else:
+                log.warning(
+                    f"Batched chat save failed, saving {len(batch)} chats one by one: {e}"
+                )
+                for chat_id, updates in batch.items():
+                    try:
+                        self.write({chat_id: history_update(updates)})
+                    except Exception as e:
+                        log.exception(f"Failed to save chat {chat_id}: {e}")
+                        failed[chat_id] = e
+
+        latency = time.monotonic() - start
+        with self.condition:
+            self.stats["batches"] += 1
+            self.stats["chats_written"] += len(batch) - len(failed)
+            self.stats["failed_chats"] += len(failed)
+            self.stats["flush_latency_total"] += latency
+            self.stats["flush_latency_last"] = latency
+            self.stats["flush_latency_max"] = max(
+                self.stats["flush_latency_max"], latency
+            )
+
+        for chat_id, chat_futures in futures.items():
+            for future in chat_futures:
+                if chat_id in failed:
+                    future.set_exception(failed[chat_id])
+                else:
+                    future.set_result(None)
+
+    def stop(self):
+        """
+        Writes everything still pending and stops the thread.
+        """
+        with self.condition:
+            self.stopped = True
+            batch, self.pending = self.pending, {}
+            futures, self.futures = self.futures, {}
+            self.queued_at = {}
+            self.urgent = set()
+            self.condition.notify()
+        thread = self.thread
+
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=10)
+        for offset in range(0, len(batch), self.max_batch):
+            chat_ids = list(batch)[offset : offset + self.max_batch]
+            self._write_batch(
+                {chat_id: batch[chat_id] for chat_id in chat_ids},
+                {chat_id: futures[chat_id] for chat_id in chat_ids},
+            )
+
+    def metrics(self) -> dict:
+        with self.condition:
+            metrics = dict(self.stats)
+            metrics["queue_depth"] = sum(
+                len(updates) for updates in self.pending.values()
+            )
+            metrics["pending_chats"] = len(self.pending)
+        batches = metrics["batches"]
+        metrics["flush_latency_avg"] = (
+            metrics["flush_latency_total"] / batches if batches else 0.0
+        )
+        return metrics
+
+
+CHAT_WRITER = ChatWriter(
+    Chats.update_messages_by_ids,
+    interval=REALTIME_CHAT_SAVE_INTERVAL_MS / 1000,
+    max_batch=CHAT_SAVE_MAX_BATCH,
+)
+
+# Write what's still queued if the process exits without a clean shutdown
+atexit.register(CHAT_WRITER.stop)
@@ -1,6 +1,7 @@
 import asyncio
 import json
 import logging
+import time
 import uuid
 from typing import Optional
 
@@ -8,7 +9,13 @@ import aiohttp
 import websockets
 from pydantic import BaseModel
 
-from open_webui.env import SRC_LOG_LEVELS
+from open_webui.env import (
+    SRC_LOG_LEVELS,
+    JUPYTER_KERNEL_POOL_SIZE,
+    JUPYTER_KERNEL_POOL_WARM,
+    JUPYTER_KERNEL_IDLE_TTL,
+    JUPYTER_KERNEL_MEMORY_LIMIT_MB,
+)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(SRC_LOG_LEVELS["MAIN"])
@@ -81,49 +88,20 @@ class JupyterCodeExecuter:
         return self.result
 
     async def sign_in(self) -> None:
-        # password authentication
-        if self.password and not self.token:
-            async with self.session.get("login") as response:
-                response.raise_for_status()
-                xsrf_token = response.cookies["_xsrf"].value
-                if not xsrf_token:
-                    raise ValueError("_xsrf token not found")
-                self.session.cookie_jar.update_cookies(response.cookies)
-                self.session.headers.update({"X-XSRFToken": xsrf_token})
-            async with self.session.post(
-                "login",
-                data={"_xsrf": xsrf_token, "password": self.password},
-                allow_redirects=False,
-            ) as response:
-                response.raise_for_status()
-                self.session.cookie_jar.update_cookies(response.cookies)
-
-        # token authentication
-        if self.token:
-            self.params.update({"token": self.token})
+        await sign_in(self.session, self.token, self.password, self.params)
 
     async def init_kernel(self) -> None:
-        async with self.session.post(url="api/kernels", params=self.params) as response:
-            response.raise_for_status()
-            kernel_data = await response.json()
-            self.kernel_id = kernel_data["id"]
+        self.kernel_id = await start_kernel(self.session, self.params)
 
     def init_ws(self) -> (str, dict):
-        ws_base = self.base_url.replace("http", "ws", 1)
-        ws_params = "?" + "&".join([f"{key}={val}" for key, val in self.params.items()])
-        websocket_url = f"{ws_base}api/kernels/{self.kernel_id}/channels{ws_params if len(ws_params) > 1 else ''}"
-        ws_headers = {}
-        if self.password and not self.token:
-            ws_headers = {
-                "Cookie": "; ".join(
-                    [
-                        f"{cookie.key}={cookie.value}"
-                        for cookie in self.session.cookie_jar
-                    ]
-                ),
-                **self.session.headers,
-            }
-        return websocket_url, ws_headers
+        return get_kernel_ws(
+            self.session,
+            self.base_url,
+            self.kernel_id,
+            self.params,
+            self.token,
+            self.password,
+        )
 
     async def execute_code(self) -> None:
         # initialize ws
@@ -135,74 +113,546 @@ class JupyterCodeExecuter:
             await self.execute_in_jupyter(ws)
 
     async def execute_in_jupyter(self, ws) -> None:
-        # send message
-        msg_id = uuid.uuid4().hex
-        await ws.send(
-            json.dumps(
-                {
-                    "header": {
-                        "msg_id": msg_id,
-                        "msg_type": "execute_request",
-                        "username": "user",
-                        "session": uuid.uuid4().hex,
-                        "date": "",
-                        "version": "5.3",
-                    },
-                    "parent_header": {},
-                    "metadata": {},
-                    "content": {
-                        "code": self.code,
-                        "silent": False,
-                        "store_history": True,
-                        "user_expressions": {},
-                        "allow_stdin": False,
-                        "stop_on_error": True,
-                    },
-                    "channel": "shell",
-                }
-            )
+        self.result, _ = await execute_in_jupyter(ws, self.code, self.timeout)
+
+
+async def sign_in(session, token: str, password: str, params: dict) -> None:
+    # password authentication
+    if password and not token:
+        async with session.get("login") as response:
+            response.raise_for_status()
+            xsrf_token = response.cookies["_xsrf"].value
+            if not xsrf_token:
+                raise ValueError("_xsrf token not found")
+            session.cookie_jar.update_cookies(response.cookies)
+            session.headers.update({"X-XSRFToken": xsrf_token})
+        async with session.post(
+            "login",
+            data={"_xsrf": xsrf_token, "password": password},
+            allow_redirects=False,
+        ) as response:
+            response.raise_for_status()
+            session.cookie_jar.update_cookies(response.cookies)
+
+    # token authentication
+    if token:
+        params.update({"token": token})
+
+
+async def start_kernel(session, params: dict) -> str:
+    async with session.post(url="api/kernels", params=params) as response:
+        response.raise_for_status()
+        kernel_data = await response.json()
+        return kernel_data["id"]
+
+
+def get_kernel_ws(
+    session, base_url: str, kernel_id: str, params: dict, token: str, password: str
+) -> (str, dict):
+    ws_base = base_url.replace("http", "ws", 1)
+    ws_params = "?" + "&".join([f"{key}={val}" for key, val in params.items()])
+    websocket_url = f"{ws_base}api/kernels/{kernel_id}/channels{ws_params if len(ws_params) > 1 else ''}"
+    ws_headers = {}
+    if password and not token:
+        ws_headers = {
+            "Cookie": "; ".join(
+                [f"{cookie.key}={cookie.value}" for cookie in session.cookie_jar]
+            ),
+            **session.headers,
+        }
+    return websocket_url, ws_headers
+
+
+async def execute_in_jupyter(
+    ws, code: str, timeout: int, store_history: bool = True
+) -> (ResultModel, bool):
+    """
+    Runs the code on the kernel's websocket. Returns the result, and whether
+    the kernel finished running it (False once it timed out).
+    """
+    # send message
+    msg_id = uuid.uuid4().hex
+    await ws.send(
+        json.dumps(
+            {
+                "header": {
+                    "msg_id": msg_id,
+                    "msg_type": "execute_request",
+                    "username": "user",
+                    "session": uuid.uuid4().hex,
+                    "date": "",
+                    "version": "5.3",
+                },
+                "parent_header": {},
+                "metadata": {},
+                "content": {
+                    "code": code,
+                    "silent": False,
+                    "store_history": store_history,
+                    "user_expressions": {},
+                    "allow_stdin": False,
+                    "stop_on_error": True,
+                },
+                "channel": "shell",
+            }
+        )
+    )
+    # parse message
+    stdout, stderr, result = "", "", []
+    finished = True
+    while True:
+        try:
+            # wait for message
+            message = await asyncio.wait_for(ws.recv(), timeout)
+            message_data = json.loads(message)
+            # msg id not match, skip
+            if message_data.get("parent_header", {}).get("msg_id") != msg_id:
+                continue
+            # check message type
+            msg_type = message_data.get("msg_type")
+            match msg_type:
+                case "stream":
+                    if message_data["content"]["name"] == "stdout":
+                        stdout += message_data["content"]["text"]
+                    elif message_data["content"]["name"] == "stderr":
+                        stderr += message_data["content"]["text"]
+                case "execute_result" | "display_data":
+                    data = message_data["content"]["data"]
+                    if "image/png" in data:
+                        result.append(f"data:image/png;base64,{data['image/png']}")
+                    elif "text/plain" in data:
+                        result.append(data["text/plain"])
+                case "error":
+                    stderr += "\n".join(message_data["content"]["traceback"])
+                case "status":
+                    if message_data["content"]["execution_state"] == "idle":
+                        break
+
+        except asyncio.TimeoutError:
+            stderr += "\nExecution timed out."
+            finished = False
+            break
+
+    return (
+        ResultModel(
+            stdout=stdout.strip(),
+            stderr=stderr.strip(),
+            result="\n".join(result).strip() if result else "",
+        ),
+        finished,
+    )
+
+
+# Prints the kernel's resident memory, without leaving any name behind in it
+MEMORY_PROBE = (
+    "print((lambda os: os.sysconf('SC_PAGE_SIZE')"
+    " * int(open('/proc/self/statm').read().split()[1]))(__import__('os')))"
+)
+
+
+class JupyterKernel:
+    """
+    A kernel of the pool, with its websocket kept open between executions
+    """
+
+    def __init__(self, kernel_id: str):
+        self.id = kernel_id
+        self.ws = None
+        # The chat it's kept for, None while it's warm
+        self.chat_id = None
+        self.busy = False
+        # Restarted before it runs anything else (it failed, or ran someone else's code)
+        self.dirty = False
+        self.last_used = time.monotonic()
+
+
+class JupyterKernelPool:
+    """
+    Kernels started ahead of time on one Jupyter server.
+
+    - A chat keeps the kernel it first ran code on, and its variables, until it has been
+      idle for `idle_ttl` seconds. Executions of one chat run one at a time.
+    - Executions without a chat get a warm kernel, which is restarted afterwards.
+    - There are at most `max_size` kernels, `warm` of them kept started and free. Once
+      all are taken, the chat kernel idle the longest is restarted for the new chat,
+      or the execution waits for a kernel to be free.
+    - Kernels are restarted after executions that failed or timed out, and once they
+      use more than `memory_limit` bytes (0 to never check).
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        token: str = "",
+        password: str = "",
+        max_size: int = 4,
+        warm: int = 1,
+        idle_ttl: int = 600,
+        memory_limit: int = 0,
+    ):
+        self.base_url = base_url if base_url.endswith("/") else base_url + "/"
+        self.token = token or ""
+        self.password = password or ""
+        self.max_size = max(max_size, 1)
+        self.warm = min(warm, self.max_size)
+        self.idle_ttl = idle_ttl
+        self.memory_limit = memory_limit
+
+        self.session = None
+        self.session_lock = asyncio.Lock()
+        self.params = {}
+
+        self.kernels = []
+        self.chats = {}
+        # Kernels being started, and how many of them will be warm
+        self.starting = 0
+        self.warming = 0
+        self.condition = asyncio.Condition()
+        self.tasks = set()
+        self.maintenance = None
+
+    async def execute(
+        self, code: str, chat_id: Optional[str] = None, timeout: int = 60
+    ) -> ResultModel:
+        self._start_maintenance()
+
+        try:
+            kernel = await self._acquire(chat_id)
+        except Exception as err:
+            logger.exception("start kernel failed, %s", err)
+            return ResultModel(stderr=f"Error: {err}")
+        # Replaces the warm kernel it may have taken
+        self._top_up()
+
+        healthy = False
+        try:
+            if kernel.dirty:
+                await self._restart(kernel)
+
+            result, healthy = await execute_in_jupyter(kernel.ws, code, timeout)
+
+            if healthy and kernel.chat_id and self.memory_limit:
+                try:
+                    memory = await self._memory_usage(kernel)
+                except Exception as err:
+                    # The probe may still be running, so the kernel isn't handed out again
+                    logger.warning(f"Memory check of kernel {kernel.id} failed: {err}")
+                    kernel.dirty = True
+                else:
+                    if memory > self.memory_limit:
+                        logger.info(
+                            f"Restarting kernel {kernel.id}, it uses {memory // 2**20}MB"
+                        )
+                        kernel.dirty = True
+        except Exception as err:
+            logger.exception("execute code failed, %s", err)
+            result = ResultModel(stderr=f"Error: {err}")
+        finally:
+            await self._release(kernel, healthy)
+
+        return result
+
+    async def _acquire(self, chat_id: Optional[str]) -> JupyterKernel:
+        async with self.condition:
+            while True:
+                kernel = self.chats.get(chat_id) if chat_id else None
+                if kernel is not None:
+                    # Runs after the chat's previous execution
+                    if not kernel.busy:
+                        break
+                else:
+                    kernel = self._free_kernel()
+                    if kernel is not None:
+                        break
+                    if len(self.kernels) + self.starting < self.max_size:
+                        self.starting += 1
+                        break
+                    kernel = self._evict()
+                    if kernel is not None:
+                        break
+                await self.condition.wait()
+
+            if kernel is not None:
+                self._assign(kernel, chat_id)
+                return kernel
+
+        try:
+            kernel = await self._start_kernel()
+        finally:
+            async with self.condition:
+                self.starting -= 1
+                if kernel is not None:
+                    self.kernels.append(kernel)
+                    self._assign(kernel, chat_id)
+                self.condition.notify_all()
+        return kernel
+
+    def _free_kernel(self) -> Optional[JupyterKernel]:
+        for kernel in self.kernels:
+            if kernel.chat_id is None and not kernel.busy and not kernel.dirty:
+                return kernel
+        return None
+
+    def _evict(self) -> Optional[JupyterKernel]:
+        idle = [kernel for kernel in self.kernels if kernel.chat_id and not kernel.busy]
+        if not idle:
+            return None
+
+        kernel = min(idle, key=lambda kernel: kernel.last_used)
+        del self.chats[kernel.chat_id]
+        kernel.chat_id = None
+        kernel.dirty = True
+        return kernel
+
+    def _assign(self, kernel: JupyterKernel, chat_id: Optional[str]):
+        kernel.busy = True
+        kernel.chat_id = chat_id
+        if chat_id:
+            self.chats[chat_id] = kernel
+
+    async def _release(self, kernel: JupyterKernel, healthy: bool):
+        kernel.last_used = time.monotonic()
+        if not healthy or kernel.chat_id is None:
+            kernel.dirty = True
+
+        if kernel.dirty:
+            # Stays busy until it's restarted
+            self._spawn(self._recycle(kernel))
+        else:
+            async with self.condition:
+                kernel.busy = False
+                self.condition.notify_all()
+
+    async def _recycle(self, kernel: JupyterKernel):
+        try:
+            await self._restart(kernel)
+        except Exception as err:
+            logger.warning(f"Restarting kernel {kernel.id} failed, removing it: {err}")
+            async with self.condition:
+                self._remove(kernel)
+                self.condition.notify_all()
+            await self._shutdown(kernel)
+            return
+
+        async with self.condition:
+            kernel.busy = False
+            self.condition.notify_all()
+
+    def _remove(self, kernel: JupyterKernel):
+        if kernel in self.kernels:
+            self.kernels.remove(kernel)
+        if kernel.chat_id and self.chats.get(kernel.chat_id) is kernel:
+            del self.chats[kernel.chat_id]
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        async with self.session_lock:
+            if self.session is None:
+                session = aiohttp.ClientSession(trust_env=True, base_url=self.base_url)
+                try:
+                    await sign_in(session, self.token, self.password, self.params)
+                except Exception:
+                    await session.close()
+                    raise
+                self.session = session
+        return self.session
+
+    async def _start_kernel(self) -> JupyterKernel:
+        session = await self._get_session()
+        kernel = JupyterKernel(await start_kernel(session, self.params))
+        try:
+            await self._connect(kernel)
+        except Exception:
+            await self._shutdown(kernel)
+            raise
+        return kernel
+
+    async def _connect(self, kernel: JupyterKernel):
+        if kernel.ws is not None:
+            try:
+                await kernel.ws.close()
+            except Exception:
+                pass
+
+        websocket_url, ws_headers = get_kernel_ws(
+            self.session,
+            self.base_url,
+            kernel.id,
+            self.params,
+            self.token,
+            self.password,
+        )
+        kernel.ws = await websockets.connect(
+            websocket_url, additional_headers=ws_headers
         )
-        # parse message
-        stdout, stderr, result = "", "", []
+
+    async def _restart(self, kernel: JupyterKernel):
+        async with self.session.post(
+            f"api/kernels/{kernel.id}/restart", params=self.params
+        ) as response:
+            response.raise_for_status()
+        # A new websocket, so nothing of the previous run is left to read
+        await self._connect(kernel)
+        kernel.dirty = False
+
+    async def _shutdown(self, kernel: JupyterKernel):
+        try:
+            if kernel.ws is not None:
+                await kernel.ws.close()
+            async with self.session.delete(
+                f"api/kernels/{kernel.id}", params=self.params
+            ) as response:
+                response.raise_for_status()
+        except Exception as err:
+            logger.exception("close kernel failed, %s", err)
+
+    async def _memory_usage(self, kernel: JupyterKernel) -> int:
+        result, finished = await execute_in_jupyter(
+            kernel.ws, MEMORY_PROBE, 10, store_history=False
+        )
+        if not finished:
+            raise TimeoutError("Memory check timed out")
+        try:
+            return int(result.stdout)
+        except ValueError:
+            # Not a Linux kernel
+            return 0
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def _start_maintenance(self):
+        if self.maintenance is None or self.maintenance.done():
+            self.maintenance = asyncio.create_task(self._maintain())
+
+    async def _maintain(self):
         while True:
             try:
-                # wait for message
-                message = await asyncio.wait_for(ws.recv(), self.timeout)
-                message_data = json.loads(message)
-                # msg id not match, skip
-                if message_data.get("parent_header", {}).get("msg_id") != msg_id:
-                    continue
-                # check message type
-                msg_type = message_data.get("msg_type")
-                match msg_type:
-                    case "stream":
-                        if message_data["content"]["name"] == "stdout":
-                            stdout += message_data["content"]["text"]
-                        elif message_data["content"]["name"] == "stderr":
-                            stderr += message_data["content"]["text"]
-                    case "execute_result" | "display_data":
-                        data = message_data["content"]["data"]
-                        if "image/png" in data:
-                            result.append(f"data:image/png;base64,{data['image/png']}")
-                        elif "text/plain" in data:
-                            result.append(data["text/plain"])
-                    case "error":
-                        stderr += "\n".join(message_data["content"]["traceback"])
-                    case "status":
-                        if message_data["content"]["execution_state"] == "idle":
-                            break
-
-            except asyncio.TimeoutError:
-                stderr += "\nExecution timed out."
-                break
-        self.result.stdout = stdout.strip()
-        self.result.stderr = stderr.strip()
-        self.result.result = "\n".join(result).strip() if result else ""
+                await self._reap()
+                self._top_up()
+            except Exception as err:
+                logger.exception("kernel pool maintenance failed, %s", err)
+            await asyncio.sleep(max(min(self.idle_ttl, 60), 1))
+
+    async def _reap(self):
+        """
+        Frees the kernels of chats idle for longer than `idle_ttl`.
+        """
+        async with self.condition:
+            now = time.monotonic()
+            expired = [
+                kernel
+                for kernel in self.kernels
+                if kernel.chat_id
+                and not kernel.busy
+                and now - kernel.last_used > self.idle_ttl
+            ]
+            if not expired:
+                return
+
+            free = sum(1 for kernel in self.kernels if kernel.chat_id is None)
+            for kernel in expired:
+                del self.chats[kernel.chat_id]
+                kernel.chat_id = None
+                kernel.busy = True
+                kernel.dirty = True
+
+            # Restarted to be warm again, the others are shut down
+            keep = max(self.warm - free - self.warming, 0)
+            recycled, removed = expired[:keep], expired[keep:]
+            for kernel in removed:
+                self._remove(kernel)
+            self.condition.notify_all()
+
+        for kernel in recycled:
+            self._spawn(self._recycle(kernel))
+        for kernel in removed:
+            self._spawn(self._shutdown(kernel))
+
+    def _top_up(self):
+        """
+        Starts kernels until `warm` of them are free (or soon will be).
+        """
+        warm = self.warming + sum(
+            1 for kernel in self.kernels if kernel.chat_id is None
+        )
+        missing = min(
+            self.warm - warm, self.max_size - len(self.kernels) - self.starting
+        )
+        for _ in range(max(missing, 0)):
+            self.starting += 1
+            self.warming += 1
+            self._spawn(self._warm_up())
+
+    async def _warm_up(self):
+        kernel = None
+        try:
+            kernel = await self._start_kernel()
+        except Exception as err:
+            logger.warning(f"Starting a warm kernel failed: {err}")
+        finally:
+            async with self.condition:
+                self.starting -= 1
+                self.warming -= 1
+                if kernel is not None:
+                    self.kernels.append(kernel)
+                self.condition.notify_all()
+
+    async def close(self):
+        if self.maintenance is not None:
+            self.maintenance.cancel()
+        for task in list(self.tasks):
+            task.cancel()
+
+        kernels, self.kernels, self.chats = self.kernels, [], {}
+        if self.session is not None:
+            await asyncio.gather(*[self._shutdown(kernel) for kernel in kernels])
+            await self.session.close()
+            self.session = None
+
+
+KERNEL_POOLS = {}
+
+
+def get_kernel_pool(base_url: str, token: str = "", password: str = ""):
+    key = (base_url, token or "", password or "")
+    if key not in KERNEL_POOLS:
+        KERNEL_POOLS[key] = JupyterKernelPool(
+            base_url,
+            token,
+            password,
+            max_size=JUPYTER_KERNEL_POOL_SIZE,
+            warm=JUPYTER_KERNEL_POOL_WARM,
+            idle_ttl=JUPYTER_KERNEL_IDLE_TTL,
+            memory_limit=JUPYTER_KERNEL_MEMORY_LIMIT_MB * 2**20,
+        )
+    return KERNEL_POOLS[key]
+
+
+async def close_kernel_pools():
+    pools = list(KERNEL_POOLS.values())
+    KERNEL_POOLS.clear()
+    await asyncio.gather(*[pool.close() for pool in pools])
 
 
 async def execute_code_jupyter(
-    base_url: str, code: str, token: str = "", password: str = "", timeout: int = 60
+    base_url: str,
+    code: str,
+    token: str = "",
+    password: str = "",
+    timeout: int = 60,
+    chat_id: Optional[str] = None,
 ) -> dict:
+    """
+    Runs the code on a kernel of the pool, the chat's own kernel if there's a chat_id.
+    Without a pool (JUPYTER_KERNEL_POOL_SIZE=0), a kernel is started for it alone.
+    """
+    if JUPYTER_KERNEL_POOL_SIZE > 0:
+        pool = get_kernel_pool(base_url, token, password)
+        result = await pool.execute(code, chat_id=chat_id, timeout=timeout)
+        return result.model_dump()
+
     async with JupyterCodeExecuter(
         base_url, code, token, password, timeout
     ) as executor:
@@ -0,0 +1,448 @@
+import html
+import json
+import re
+import time
+from typing import Optional
+
+
+def split_content_and_whitespace(content):
+    content_stripped = content.rstrip()
+    original_whitespace = (
+        content[len(content_stripped) :] if len(content) > len(content_stripped) else ""
+    )
+    return content_stripped, original_whitespace
+
+
+def is_opening_code_block(content):
+    # An odd number of backtick fences means the last ones are opening a new block
+    return content.count("```") % 2 == 1
+
+
+def get_reasoning_display_content(reasoning_content):
+    return html.escape(
+        "\n".join(
+            (f"> {line}" if not line.startswith(">") else line)
+            for line in reasoning_content.splitlines()
+        )
+    )
+
+
+def serialize_content_block(content, block, raw=False, reasoning_display=None):
+    """
+    Returns `content` (what the blocks before `block` serialized to) with `block` added.
+    """
+    if block["type"] == "text":
+        block_content = block["content"].strip()
+        if block_content:
+            content = f"{content}{block_content}\n"
+    elif block["type"] == "tool_calls":
+        attributes = block.get("attributes", {})
+
+        tool_calls = block.get("content", [])
+        results = block.get("results", [])
+
+        if content and not content.endswith("\n"):
+            content += "\n"
+
+        if results:
+
+            tool_calls_display_content = ""
+            for tool_call in tool_calls:
+
+                tool_call_id = tool_call.get("id", "")
+                tool_name = tool_call.get("function", {}).get("name", "")
+                tool_arguments = tool_call.get("function", {}).get("arguments", "")
+
+                tool_result = None
+                tool_result_files = None
+                for result in results:
+                    if tool_call_id == result.get("tool_call_id", ""):
+                        tool_result = result.get("content", None)
+                        tool_result_files = result.get("files", None)
+                        break
+
+                if tool_result is not None:
+                    tool_result_embeds = result.get("embeds", "")
+                    tool_calls_display_content = f'{tool_calls_display_content}<details type="tool_calls" done="true" id="{tool_call_id}" name="{tool_name}" arguments="{html.escape(json.dumps(tool_arguments))}" result="{html.escape(json.dumps(tool_result, ensure_ascii=False))}" files="{html.escape(json.dumps(tool_result_files)) if tool_result_files else ""}" embeds="{html.escape(json.dumps(tool_result_embeds))}">\n<summary>Tool Executed</summary>\n</details>\n'
+                else:
+                    tool_calls_display_content = f'{tool_calls_display_content}<details type="tool_calls" done="false" id="{tool_call_id}" name="{tool_name}" arguments="{html.escape(json.dumps(tool_arguments))}">\n<summary>Executing...</summary>\n</details>\n'
+
+            if not raw:
+                content = f"{content}{tool_calls_display_content}"
+        else:
+            tool_calls_display_content = ""
+
+            for tool_call in tool_calls:
+                tool_call_id = tool_call.get("id", "")
+                tool_name = tool_call.get("function", {}).get("name", "")
+                tool_arguments = tool_call.get("function", {}).get("arguments", "")
+
+                tool_calls_display_content = f'{tool_calls_display_content}\n<details type="tool_calls" done="false" id="{tool_call_id}" name="{tool_name}" arguments="{html.escape(json.dumps(tool_arguments))}">\n<summary>Executing...</summary>\n</details>\n'
+
+            if not raw:
+                content = f"{content}{tool_calls_display_content}"
+
+    elif block["type"] == "reasoning":
+        reasoning_duration = block.get("duration", None)
+
+        start_tag = block.get("start_tag", "")
+        end_tag = block.get("end_tag", "")
+
+        if content and not content.endswith("\n"):
+            content += "\n"
+
+        if raw:
+            content = f'{content}{start_tag}{block["content"]}{end_tag}\n'
+        else:
+            reasoning_display_content = (
+                reasoning_display(block)
+                if reasoning_display
+                else get_reasoning_display_content(block["content"])
+            )
+
+            if reasoning_duration is not None:
+                content = f'{content}<details type="reasoning" done="true" duration="{reasoning_duration}">\n<summary>Thought for {reasoning_duration} seconds</summary>\n{reasoning_display_content}\n</details>\n'
+            else:
+                content = f'{content}<details type="reasoning" done="false">\n<summary>Thinking…</summary>\n{reasoning_display_content}\n</details>\n'
+
+    elif block["type"] == "code_interpreter":
+        attributes = block.get("attributes", {})
+        output = block.get("output", None)
+        lang = attributes.get("lang", "")
+
+        content_stripped, original_whitespace = split_content_and_whitespace(content)
+        if is_opening_code_block(content_stripped):
+            # Remove trailing backticks that would open a new block
+            content = content_stripped.rstrip("`").rstrip() + original_whitespace
+        else:
+            # Keep content as is - either closing backticks or no backticks
+            content = content_stripped + original_whitespace
+
+        if content and not content.endswith("\n"):
+            content += "\n"
+
+        if output:
+            output = html.escape(json.dumps(output))
+
+            if raw:
+                content = f'{content}<code_interpreter type="code" lang="{lang}">\n{block["content"]}\n</code_interpreter>\n```output\n{output}\n```\n'
+            else:
+                content = f'{content}<details type="code_interpreter" done="true" output="{output}">\n<summary>Analyzed</summary>\n```{lang}\n{block["content"]}\n```\n</details>\n'
+        else:
+            if raw:
+                content = f'{content}<code_interpreter type="code" lang="{lang}">\n{block["content"]}\n</code_interpreter>\n'
+            else:
+                content = f'{content}<details type="code_interpreter" done="false">\n<summary>Analyzing...</summary>\n```{lang}\n{block["content"]}\n```\n</details>\n'
+
+    else:
+        block_content = str(block["content"]).strip()
+        if block_content:
+            content = f"{content}{block['type']}: {block_content}\n"
+
+    return content
+
+
+def serialize_content_blocks(content_blocks, raw=False):
+    content = ""
+    for block in content_blocks:
+        content = serialize_content_block(content, block, raw)
+    return content.strip()
+
+
+def join_lines(*parts):
+    # Joins (display, has_lines) parts like "\n".join would have joined all their lines
+    return "\n".join(display for display, has_lines in parts if has_lines)
+
+
+def block_unchanged(block, snapshot):
+    # Blocks are only ever changed by assigning their keys, so identities are enough
+    # (the snapshot holds on to the values, so their ids can't be reused)
+    items = block.items()
+    return len(items) == len(snapshot) and all(
+        key == snapshot_key and value is snapshot_value
+        for (key, value), (snapshot_key, snapshot_value) in zip(items, snapshot)
+    )
+
+
+class ContentBlockSerializer:
+    """
+    serialize_content_blocks for a response that is still streaming, without redoing
+    the whole response on every delta:
+    - What the blocks before the last one serialize to is cached, and reused as long as
+      those blocks weren't replaced or changed.
+    - The reasoning display (quoted and escaped) of a growing reasoning block is only
+      computed for the lines added since the last call.
+    Gives the same result as serialize_content_blocks, for any list of blocks.
+    """
+
+    def __init__(self):
+        # raw -> (blocks, their snapshots, what they serialize to before the final strip)
+        self.prefixes = {}
+        # Reasoning block, its content up to the last line break, and that part's display
+        self.reasoning_block = None
+        self.reasoning_done = ""
+        self.reasoning_display = ""
+
+    def get_reasoning_display(self, block):
+        reasoning_content = block["content"]
+
+        if block is not self.reasoning_block or not reasoning_content.startswith(
+            self.reasoning_done
+        ):
+            self.reasoning_block = block
+            self.reasoning_done = ""
+            self.reasoning_display = ""
+
+        # Lines can't run across a "\n", so everything up to the last one is final
+        end = reasoning_content.rfind("\n") + 1
+        if end > len(self.reasoning_done):
+            new_display = get_reasoning_display_content(
+                reasoning_content[len(self.reasoning_done) : end]
+            )
+            self.reasoning_display = join_lines(
+                (self.reasoning_display, bool(self.reasoning_done)),
+                (new_display, True),
+            )
+            self.reasoning_done = reasoning_content[:end]
+
+        tail = reasoning_content[end:]
+        return join_lines(
+            (self.reasoning_display, bool(self.reasoning_done)),
+            (get_reasoning_display_content(tail), bool(tail)),
+        )
+
+    def __call__(self, content_blocks, raw=False):
+        if not content_blocks:
+            return ""
+
+        cached_blocks, cached_snapshots, cached_content = self.prefixes.get(
+            raw, ((), (), "")
+        )
+
+        reused = 0
+        if len(cached_blocks) < len(content_blocks):
+            for cached_block, snapshot, block in zip(
+                cached_blocks, cached_snapshots, content_blocks
+            ):
+                if cached_block is not block or not block_unchanged(block, snapshot):
+                    break
+                reused += 1
+
+        if reused == len(cached_blocks):
+            content = cached_content
+        else:
+            content = ""
+            reused = 0
+
+        for block in content_blocks[reused:-1]:
+            content = serialize_content_block(content, block, raw)
+
+        prefix_blocks = tuple(content_blocks[:-1])
+        self.prefixes[raw] = (
+            prefix_blocks,
+            tuple(tuple(block.items()) for block in prefix_blocks),
+            content,
+        )
+
+        content = serialize_content_block(
+            content, content_blocks[-1], raw, self.get_reasoning_display
+        )
+        return content.strip()
+
+
+class IncrementalSearch:
+    """
+    re.search over text that grows between calls (like a streamed response).
+
+    After a search that found nothing, the next search of the same pattern only
+    scans what was appended since, plus `lookbehind` characters for matches that
+    started before it. Call `reset` whenever the text changes any other way.
+    """
+
+    def __init__(self, lookbehind: int = 1024):
+        self.lookbehind = lookbehind
+        self.scanned = {}
+
+    def search(self, pattern: str, text: str) -> Optional[re.Match]:
+        start = self.scanned.get(pattern, 0)
+        if start > len(text):
+            start = 0
+
+        match = re.compile(pattern).search(text, max(0, start - self.lookbehind))
+        self.scanned[pattern] = 0 if match else len(text)
+        return match
+
+    def reset(self):
+        self.scanned = {}
+
+
+def tag_content_handler(content_type, tags, content, content_blocks, tag_search=None):
+    """
+    Moves `tags` sections of the streamed `content` into their own `content_type` blocks.
+    With `tag_search` (an IncrementalSearch kept for the whole response), only the text
+    streamed since the last call is scanned for tags.
+    """
+    search = tag_search.search if tag_search else re.search
+    end_flag = False
+
+    def extract_attributes(tag_content):
+        """Extract attributes from a tag if they exist."""
+        attributes = {}
+        if not tag_content:  # Ensure tag_content is not None
+            return attributes
+        # Match attributes in the format: key="value" (ignores single quotes for simplicity)
+        matches = re.findall(r'(\w+)\s*=\s*"([^"]+)"', tag_content)
+        for key, value in matches:
+            attributes[key] = value
+        return attributes
+
+    if content_blocks[-1]["type"] == "text":
+        for start_tag, end_tag in tags:
+
+            start_tag_pattern = rf"{re.escape(start_tag)}"
+            if start_tag.startswith("<") and start_tag.endswith(">"):
+                # Match start tag e.g., <tag> or <tag attr="value">
+                # remove both '<' and '>' from start_tag
+                # Match start tag with attributes
+                start_tag_pattern = rf"<{re.escape(start_tag[1:-1])}(\s.*?)?>"
+
+            match = search(start_tag_pattern, content)
+            if match:
+                if tag_search:
+                    tag_search.reset()
+                try:
+                    attr_content = (
+                        match.group(1) if match.group(1) else ""
+                    )  # Ensure it's not None
+                except:
+                    attr_content = ""
+
+                attributes = extract_attributes(
+                    attr_content
+                )  # Extract attributes safely
+
+                # Capture everything before and after the matched tag
+                before_tag = content[: match.start()]  # Content before opening tag
+                after_tag = content[match.end() :]  # Content after opening tag
+
+                # Remove the start tag and after from the currently handling text block
+                content_blocks[-1]["content"] = content_blocks[-1]["content"].replace(
+                    match.group(0) + after_tag, ""
+                )
+
+                if before_tag:
+                    content_blocks[-1]["content"] = before_tag
+
+                if not content_blocks[-1]["content"]:
+                    content_blocks.pop()
+
+                # Append the new block
+                content_blocks.append(
+                    {
+                        "type": content_type,
+                        "start_tag": start_tag,
+                        "end_tag": end_tag,
+                        "attributes": attributes,
+                        "content": "",
+                        "started_at": time.time(),
+                    }
+                )
+
+                if after_tag:
+                    content_blocks[-1]["content"] = after_tag
+                    tag_content_handler(content_type, tags, after_tag, content_blocks)
+
+                break
+    elif content_blocks[-1]["type"] == content_type:
+        start_tag = content_blocks[-1]["start_tag"]
+        end_tag = content_blocks[-1]["end_tag"]
+
+        if end_tag.startswith("<") and end_tag.endswith(">"):
+            # Match end tag e.g., </tag>
+            end_tag_pattern = rf"{re.escape(end_tag)}"
+        else:
+            # Handle cases where end_tag is just a tag name
+            end_tag_pattern = rf"{re.escape(end_tag)}"
+
+        # Check if the content has the end tag
+        if search(end_tag_pattern, content):
+            end_flag = True
+            if tag_search:
+                tag_search.reset()
+
+            block_content = content_blocks[-1]["content"]
+            # Strip start and end tags from the content
+            start_tag_pattern = rf"<{re.escape(start_tag)}(.*?)>"
+            block_content = re.sub(start_tag_pattern, "", block_content).strip()
+
+            end_tag_regex = re.compile(end_tag_pattern, re.DOTALL)
+            split_content = end_tag_regex.split(block_content, maxsplit=1)
+
+            # Content inside the tag
+            block_content = split_content[0].strip() if split_content else ""
+
+            # Leftover content (everything after `</tag>`)
+            leftover_content = (
+                split_content[1].strip() if len(split_content) > 1 else ""
+            )
+
+            if block_content:
+                content_blocks[-1]["content"] = block_content
+                content_blocks[-1]["ended_at"] = time.time()
+                content_blocks[-1]["duration"] = int(
+                    content_blocks[-1]["ended_at"] - content_blocks[-1]["started_at"]
+                )
+
+                # Reset the content_blocks by appending a new text block
+                if content_type != "code_interpreter":
+                    if leftover_content:
+
+                        content_blocks.append(
+                            {
+                                "type": "text",
+                                "content": leftover_content,
+                            }
+                        )
+                    else:
+                        content_blocks.append(
+                            {
+                                "type": "text",
+                                "content": "",
+                            }
+                        )
+
+            else:
+                # Remove the block if content is empty
+                content_blocks.pop()
+
+                if leftover_content:
+                    content_blocks.append(
+                        {
+                            "type": "text",
+                            "content": leftover_content,
+                        }
+                    )
+                else:
+                    content_blocks.append(
+                        {
+                            "type": "text",
+                            "content": "",
+                        }
+                    )
+
+            # Clean processed content
+            start_tag_pattern = rf"{re.escape(start_tag)}"
+            if start_tag.startswith("<") and start_tag.endswith(">"):
+                # Match start tag e.g., <tag> or <tag attr="value">
+                # remove both '<' and '>' from start_tag
+                # Match start tag with attributes
+                start_tag_pattern = rf"<{re.escape(start_tag[1:-1])}(\s.*?)?>"
+
+            content = re.sub(
+                rf"{start_tag_pattern}(.|\n)*?{re.escape(end_tag)}",
+                "",
+                content,
+                flags=re.DOTALL,
+            )
+
+    return content, content_blocks, end_flag
@@ -18,7 +18,7 @@ from open_webui.utils.plugin import (
     load_function_module_by_id,
     get_function_module_from_cache,
 )
-from open_webui.utils.access_control import has_access
+from open_webui.utils.access_control import get_user_group_ids, has_access
 
 
 from open_webui.config import (
@@ -327,6 +327,7 @@ async def get_all_models(request, refresh: bool = False, user: UserModel = None)
 
 
 def check_model_access(user, model):
+    user_group_ids = get_user_group_ids(user.id)
     if model.get("arena"):
         if not has_access(
             user.id,
@@ -334,6 +335,7 @@ def check_model_access(user, model):
             access_control=model.get("info", {})
             .get("meta", {})
             .get("access_control", {}),
+            user_group_ids=user_group_ids,
         ):
             raise Exception("Model not found")
     else:
@@ -343,18 +345,45 @@ def check_model_access(user, model):
         elif not (
             user.id == model_info.user_id
             or has_access(
-                user.id, type="read", access_control=model_info.access_control
+                user.id,
+                type="read",
+                access_control=model_info.access_control,
+                user_group_ids=user_group_ids,
             )
         ):
             raise Exception("Model not found")
 
 
+def get_accessible_model_ids(user, model_ids: list[str]) -> set[str]:
+    """
+    The ids of the models in `model_ids` the user can read, from one query for the
+    model rows and the user's group ids.
+    """
+    user_group_ids = get_user_group_ids(user.id)
+    return {
+        model_info.id
+        for model_info in Models.get_models_by_ids(model_ids)
+        if user.id == model_info.user_id
+        or has_access(
+            user.id,
+            type="read",
+            access_control=model_info.access_control,
+            user_group_ids=user_group_ids,
+        )
+    }
+
+
 def get_filtered_models(models, user):
     # Filter out models that the user does not have access to
     if (
         user.role == "user"
         or (user.role == "admin" and not BYPASS_ADMIN_ACCESS_CONTROL)
     ) and not BYPASS_MODEL_ACCESS_CONTROL:
+        user_group_ids = get_user_group_ids(user.id)
+        accessible_model_ids = get_accessible_model_ids(
+            user, [model["id"] for model in models if not model.get("arena")]
+        )
+
         filtered_models = []
         for model in models:
             if model.get("arena"):
@@ -364,22 +393,13 @@ def get_filtered_models(models, user):
                     access_control=model.get("info", {})
                     .get("meta", {})
                     .get("access_control", {}),
+                    user_group_ids=user_group_ids,
                 ):
                     filtered_models.append(model)
                 continue
 
-            model_info = Models.get_model_by_id(model["id"])
-            if model_info:
-                if (
-                    (user.role == "admin" and BYPASS_ADMIN_ACCESS_CONTROL)
-                    or user.id == model_info.user_id
-                    or has_access(
-                        user.id,
-                        type="read",
-                        access_control=model_info.access_control,
-                    )
-                ):
-                    filtered_models.append(model)
+            if model["id"] in accessible_model_ids:
+                filtered_models.append(model)
 
         return filtered_models
     else:
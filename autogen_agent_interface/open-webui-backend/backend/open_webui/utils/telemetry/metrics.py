@@ -8,6 +8,10 @@ Metrics collected:
 
 * http.server.requests (counter)
 * http.server.duration (histogram, milliseconds)
+* webui.chat.message.db_writes (counter)
+* webui.chat.message.db_writes_per_completion (gauge)
+* webui.chat.writer.queue_depth (gauge)
+* webui.chat.writer.flush_latency (gauge, milliseconds)
 
 Attributes used: http.method, http.route, http.status_code
 
@@ -45,7 +49,11 @@ from open_webui.env import (
     OTEL_METRICS_OTLP_SPAN_EXPORTER,
     OTEL_METRICS_EXPORTER_OTLP_INSECURE,
 )
-from open_webui.socket.main import get_active_user_ids
+from open_webui.socket.main import (
+    get_active_user_ids,
+    get_message_write_metrics,
+    get_chat_writer_metrics,
+)
 from open_webui.models.users import Users
 
 _EXPORT_INTERVAL_MILLIS = 10_000  # 10 seconds
@@ -99,6 +107,18 @@ def _build_meter_provider(resource: Resource) -> MeterProvider:
         View(
             instrument_name="webui.users.active",
         ),
+        View(
+            instrument_name="webui.chat.message.db_writes",
+        ),
+        View(
+            instrument_name="webui.chat.message.db_writes_per_completion",
+        ),
+        View(
+            instrument_name="webui.chat.writer.queue_depth",
+        ),
+        View(
+            instrument_name="webui.chat.writer.flush_latency",
+        ),
     ]
 
     provider = MeterProvider(
@@ -159,6 +179,73 @@ def setup_metrics(app: FastAPI, resource: Resource) -> None:
         callbacks=[observe_active_users],
     )
 
+    def observe_message_db_writes(
+        options: metrics.CallbackOptions,
+    ) -> Sequence[metrics.Observation]:
+        return [
+            metrics.Observation(
+                value=get_message_write_metrics()["db_writes"],
+            )
+        ]
+
+    def observe_message_db_writes_per_completion(
+        options: metrics.CallbackOptions,
+    ) -> Sequence[metrics.Observation]:
+        return [
+            metrics.Observation(
+                value=get_message_write_metrics()["db_writes_per_completion"],
+            )
+        ]
+
+    meter.create_observable_counter(
+        name="webui.chat.message.db_writes",
+        description="Chat writes made for event emitter message updates",
+        unit="writes",
+        callbacks=[observe_message_db_writes],
+    )
+
+    meter.create_observable_gauge(
+        name="webui.chat.message.db_writes_per_completion",
+        description="Average chat writes for event emitter updates per completion",
+        unit="writes",
+        callbacks=[observe_message_db_writes_per_completion],
+    )
+
+    def observe_chat_writer_queue_depth(
+        options: metrics.CallbackOptions,
+    ) -> Sequence[metrics.Observation]:
+        return [
+            metrics.Observation(
+                value=get_chat_writer_metrics()["queue_depth"],
+            )
+        ]
+
+    def observe_chat_writer_flush_latency(
+        options: metrics.CallbackOptions,
+    ) -> Sequence[metrics.Observation]:
+        chat_writer_metrics = get_chat_writer_metrics()
+        return [
+            metrics.Observation(
+                value=chat_writer_metrics[f"flush_latency_{stat}"] * 1000.0,
+                attributes={"stat": stat},
+            )
+            for stat in ("last", "avg", "max")
+        ]
+
+    meter.create_observable_gauge(
+        name="webui.chat.writer.queue_depth",
+        description="Realtime chat saves waiting to be written",
+        unit="updates",
+        callbacks=[observe_chat_writer_queue_depth],
+    )
+
+    meter.create_observable_gauge(
+        name="webui.chat.writer.flush_latency",
+        description="Time to write one batch of realtime chat saves",
+        unit="ms",
+        callbacks=[observe_chat_writer_flush_latency],
+    )
+
     # FastAPI middleware
     @app.middleware("http")
     async def _metrics_middleware(request: Request, call_next):
@@ -0,0 +1,212 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from open_webui.env import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MODELS"])
+
+
+def get_token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class UserCache:
+    """
+    Users already verified by a token (JWT or API key), by the token's hash.
+
+    - An entry lasts `ttl` seconds at most, or until its token expires, and there are
+      at most `maxsize` of them (least recently used dropped first).
+    - `invalidate(user_id)` drops every entry of the user. The models layer calls it
+      whenever a user changes; with `redis`, it's also published on
+      `{redis_key_prefix}:users:invalidate` for the other workers.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        maxsize: int,
+        redis=None,
+        redis_key_prefix: str = "open-webui",
+    ):
+        self.ttl = ttl
+        self.maxsize = maxsize
+
+        # token hash -> (expires, user)
+        self.entries = OrderedDict()
+        # user id -> token hashes
+        self.tokens = {}
+        self.lock = threading.Lock()
+
+        # Incremented by every invalidation, see `set`
+        self.version = 0
+
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+        self.redis = redis
+        self.channel = f"{redis_key_prefix}:users:invalidate"
+        if redis is not None:
+            threading.Thread(
+                target=self._listen, name="user-cache-listener", daemon=True
+            ).start()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get(self, token: str):
+        if not self.enabled:
+            return None
+
+        token_hash = get_token_hash(token)
+        with self.lock:
+            entry = self.entries.get(token_hash)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    self._drop(token_hash)
+                self.stats["misses"] += 1
+                return None
+
+            self.entries.move_to_end(token_hash)
+            self.stats["hits"] += 1
+        # Callers may change the user they get
+        return entry[1].model_copy(deep=True)
+
+    def set(
+        self,
+        token: str,
+        user,
+        version: int,
+        expires_at: Optional[float] = None,
+    ):
+        """
+        Caches `user` for `token`, which is valid until the `expires_at` timestamp.
+
+        `version` is the cache's version from before the user was read, so a user
+        invalidated in between isn't cached as it was.
+        """
+        if not self.enabled:
+            return
+
+        ttl = self.ttl
+        if expires_at is not None:
+            ttl = min(ttl, expires_at - time.time())
+        if ttl <= 0:
+            return
+
+        token_hash = get_token_hash(token)
+        with self.lock:
+            if version != self.version:
+                return
+            self._drop(token_hash)
+            self.entries[token_hash] = (time.monotonic() + ttl, user)
+            self.tokens.setdefault(user.id, set()).add(token_hash)
+
+            while len(self.entries) > self.maxsize:
+                self._drop(next(iter(self.entries)))
+
+    def _drop(self, token_hash: str):
+        entry = self.entries.pop(token_hash, None)
+        if entry is not None:
+            token_hashes = self.tokens.get(entry[1].id)
+            if token_hashes is not None:
+                token_hashes.discard(token_hash)
+                if not token_hashes:
+                    del self.tokens[entry[1].id]
+
+    def _invalidate(self, user_id: str):
+        with self.lock:
+            for token_hash in self.tokens.pop(user_id, set()):
+                self.entries.pop(token_hash, None)
+            self.version += 1
+            self.stats["invalidations"] += 1
+
+    def invalidate(self, user_id: str):
+        self._invalidate(user_id)
+        if self.redis is not None:
+            try:
+                self.redis.publish(self.channel, user_id)
+            except Exception as e:
+                log.warning(f"Failed to publish user cache invalidation: {e}")
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tokens.clear()
+            self.version += 1
+
+    def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                # Invalidations may have been missed while not subscribed
+                self.clear()
+                for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._invalidate(message["data"])
+            except Exception as e:
+                log.warning(f"User cache invalidation listener failed, restarting: {e}")
+                self.clear()
+                time.sleep(1)
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+    def metrics(self) -> dict:
+        with self.lock:
+            return {**self.stats, "size": len(self.entries)}
+
+
+class LastActiveBuffer:
+    """
+    Collects users' last active times, written together every `interval` seconds
+    by `write({user_id: timestamp})` from a background thread.
+    """
+
+    def __init__(self, write: Callable[[dict], None], interval: float):
+        self.write = write
+        self.interval = interval
+
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def touch(self, user_id: str):
+        with self.lock:
+            self.pending[user_id] = int(time.time())
+            if self.thread is None and not self.stopped.is_set():
+                self.thread = threading.Thread(
+                    target=self._run, name="last-active-writer", daemon=True
+                )
+                self.thread.start()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+
+        try:
+            self.write(pending)
+        except Exception as e:
+            log.warning(
+                f"Failed to save last active times of {len(pending)} users: {e}"
+            )
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout=10)
+        self.flush()
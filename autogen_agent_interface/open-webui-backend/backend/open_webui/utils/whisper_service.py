@@ -0,0 +1,326 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Optional
+
+import numpy as np
+
+from open_webui.env import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["AUDIO"])
+
+SAMPLING_RATE = 16000
+# Whisper's window: audio up to this long is one row of a batch
+CLIP_SECONDS = 30
+
+
+def get_cpu_count() -> int:
+    """The CPU cores this process may run on (e.g. a container's share)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def get_whisper_workers(workers: int = 0) -> tuple[int, int]:
+    """
+    How many transcriptions run at once (`workers`, or one for every two cores, up to
+    4, when 0) and how many threads each gets, so together they use every core once.
+    """
+    cpu_count = get_cpu_count()
+    if workers <= 0:
+        workers = min(4, cpu_count // 2)
+    workers = max(1, min(workers, cpu_count))
+    return workers, max(1, cpu_count // workers)
+
+
+class TranscriptionJob:
+    def __init__(self, audio: np.ndarray, clips: list[dict], language, duration):
+        # Sample ranges to transcribe, CLIP_SECONDS at most each
+        self.clips = clips
+        # Where `audio` starts in the original, in seconds
+        self.offset = 0.0
+        if len(clips) == 1:
+            # Only the speech is kept
+            start, end = clips[0]["start"], clips[0]["end"]
+            audio = audio[start:end].copy()
+            self.clips = [{"start": 0, "end": end - start}]
+            self.offset = start / SAMPLING_RATE
+        self.audio = audio
+        self.language = language
+        self.duration = duration
+        self.future = Future()
+        self.submitted = time.monotonic()
+
+    @property
+    def short(self) -> bool:
+        return len(self.clips) == 1
+
+
+class WhisperService:
+    """
+    Transcribes audio with a faster-whisper model loaded once and kept for every
+    request, on `workers` threads (see get_whisper_workers).
+
+    - Silence is trimmed with the Silero VAD before anything is queued (when `vad`),
+      and audio with no speech never reaches the model.
+    - Short utterances (one clip of CLIP_SECONDS at most) in the same language are
+      micro-batched: a worker takes up to `batch_size` of them, waiting up to
+      `batch_wait` seconds for more, and runs them through the model together.
+    - Longer audio is transcribed alone, its clips batched.
+    - `metrics()`: queue depth, batch sizes and real-time factor (seconds of
+      processing per second of audio).
+    """
+
+    def __init__(
+        self,
+        model,
+        workers: int = 1,
+        batch_size: int = 8,
+        batch_wait: float = 0.05,
+        vad: bool = True,
+        beam_size: int = 5,
+    ):
+        from faster_whisper import BatchedInferencePipeline
+
+        self.model = model
+        self.pipeline = BatchedInferencePipeline(model)
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.vad = vad
+        self.beam_size = beam_size
+
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.stopped = False
+
+        self.stats = {
+            "requests": 0,
+            "silent_requests": 0,
+            "batches": 0,
+            "batched_requests": 0,
+            "audio_seconds": 0.0,
+            "speech_seconds": 0.0,
+            "processing_seconds": 0.0,
+            "wait_seconds": 0.0,
+            "in_flight": 0,
+        }
+        self.stats_lock = threading.Lock()
+
+        self.threads = [
+            threading.Thread(target=self._run, name=f"whisper-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def get_clips(self, audio: np.ndarray, vad: bool) -> list[dict]:
+        if vad:
+            from faster_whisper.vad import (
+                VadOptions,
+                get_speech_timestamps,
+                merge_segments,
+            )
+
+            vad_options = VadOptions(
+                max_speech_duration_s=CLIP_SECONDS, min_silence_duration_ms=160
+            )
+            return [
+                {"start": clip["start"], "end": clip["end"]}
+                for clip in merge_segments(
+                    get_speech_timestamps(audio, vad_options), vad_options
+                )
+            ]
+
+        size = CLIP_SECONDS * SAMPLING_RATE
+        return [
+            {"start": start, "end": min(start + size, len(audio))}
+            for start in range(0, len(audio), size)
+        ]
+
+    def submit(
+        self, audio, language: Optional[str] = None, vad_filter: bool = False
+    ) -> Future:
+        """
+        Queues `audio` (a file path or 16kHz mono float32 samples). The future's result
+        is {"text", "segments", "language"}, with segment times in the original audio.
+        """
+        from faster_whisper.audio import decode_audio
+
+        if not isinstance(audio, np.ndarray):
+            audio = decode_audio(audio, sampling_rate=SAMPLING_RATE)
+        duration = len(audio) / SAMPLING_RATE
+
+        clips = self.get_clips(audio, self.vad or vad_filter)
+        job = TranscriptionJob(audio, clips, language, duration)
+
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            self.stats["audio_seconds"] += duration
+            self.stats["speech_seconds"] += (
+                sum(clip["end"] - clip["start"] for clip in clips) / SAMPLING_RATE
+            )
+            if not clips:
+                self.stats["silent_requests"] += 1
+
+        if not clips:
+            job.future.set_result({"text": "", "segments": [], "language": language})
+            return job.future
+
+        with self.condition:
+            if self.stopped:
+                raise RuntimeError("Whisper service stopped")
+            self.pending.append(job)
+            self.condition.notify()
+        return job.future
+
+    def transcribe(
+        self, audio, language: Optional[str] = None, vad_filter: bool = False
+    ) -> dict:
+        return self.submit(audio, language=language, vad_filter=vad_filter).result()
+
+    def _take_batch(self) -> Optional[list[TranscriptionJob]]:
+        with self.condition:
+            while not self.pending and not self.stopped:
+                self.condition.wait()
+            if self.stopped:
+                return None
+
+            first = self.pending.popleft()
+            batch = [first]
+            if not first.short:
+                return batch
+
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                for job in list(self.pending):
+                    if job.short and job.language == first.language:
+                        self.pending.remove(job)
+                        batch.append(job)
+                        if len(batch) == self.batch_size:
+                            break
+
+                remaining = deadline - time.monotonic()
+                if len(batch) == self.batch_size or remaining <= 0 or self.stopped:
+                    break
+                self.condition.wait(remaining)
+            return batch
+
+    def _transcribe_batch(self, batch: list[TranscriptionJob]) -> list[dict]:
+        # One array holding every job's audio, with each job's clips moved along
+        offsets = np.cumsum([0] + [len(job.audio) for job in batch[:-1]])
+        audio = (
+            np.concatenate([job.audio for job in batch])
+            if len(batch) > 1
+            else batch[0].audio
+        )
+        clips = [
+            {"start": clip["start"] + offset, "end": clip["end"] + offset}
+            for job, offset in zip(batch, offsets)
+            for clip in job.clips
+        ]
+        language = batch[0].language
+
+        segments, info = self.pipeline.transcribe(
+            audio,
+            language=language,
+            multilingual=language is None and len(batch) > 1,
+            beam_size=self.beam_size,
+            clip_timestamps=clips,
+            batch_size=min(len(clips), self.batch_size),
+        )
+
+        # Detected for the first clip only, unless it's the only request
+        detected_language = info.language if language or len(batch) == 1 else None
+        results = [
+            {"text": "", "segments": [], "language": detected_language} for _ in batch
+        ]
+        bounds = [offset / SAMPLING_RATE for offset in offsets[1:]]
+        for segment in segments:
+            # By its middle, as its times are rounded
+            middle = (segment.start + segment.end) / 2
+            index = int(np.searchsorted(bounds, middle, side="right"))
+            offset = offsets[index] / SAMPLING_RATE - batch[index].offset
+            results[index]["segments"].append(
+                {
+                    "start": segment.start - offset,
+                    "end": segment.end - offset,
+                    "text": segment.text,
+                }
+            )
+
+        for result in results:
+            result["text"] = "".join(
+                segment["text"] for segment in result["segments"]
+            ).strip()
+        return results
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+
+            start = time.monotonic()
+            with self.stats_lock:
+                self.stats["in_flight"] += len(batch)
+                self.stats["batches"] += 1
+                if len(batch) > 1:
+                    self.stats["batched_requests"] += len(batch)
+                self.stats["wait_seconds"] += sum(
+                    start - job.submitted for job in batch
+                )
+
+            try:
+                results = self._transcribe_batch(batch)
+                for job, result in zip(batch, results):
+                    job.future.set_result(result)
+            except Exception as e:
+                log.exception(f"Failed to transcribe a batch of {len(batch)}: {e}")
+                for job in batch:
+                    job.future.set_exception(e)
+            finally:
+                with self.stats_lock:
+                    self.stats["in_flight"] -= len(batch)
+                    self.stats["processing_seconds"] += time.monotonic() - start
+
+    def metrics(self) -> dict:
+        with self.condition:
+            queue_depth = len(self.pending)
+        with self.stats_lock:
+            stats = dict(self.stats)
+
+        return {
+            **stats,
+            "queue_depth": queue_depth,
+            "workers": self.workers,
+            "average_batch_size": (
+                (stats["requests"] - stats["silent_requests"]) / stats["batches"]
+                if stats["batches"]
+                else 0
+            ),
+            "real_time_factor": (
+                stats["processing_seconds"] / stats["audio_seconds"]
+                if stats["audio_seconds"]
+                else 0
+            ),
+        }
+
+    def stop(self, wait: bool = True):
+        """
+        Fails the queued requests and stops the workers once they're done with their batch.
+        """
+        with self.condition:
+            self.stopped = True
+            pending, self.pending = list(self.pending), deque()
+            self.condition.notify_all()
+        for job in pending:
+            job.future.set_exception(RuntimeError("Whisper service stopped"))
+        if wait:
+            for thread in self.threads:
+                thread.join(timeout=30)
@@ -4,7 +4,7 @@ Cliente WebSocket para Open Interpreter Server
 import asyncio
 import json
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable
 import websockets
 from websockets.exceptions import ConnectionClosed
 
@@ -16,14 +16,16 @@ class OpenInterpreterClient:
     Cliente WebSocket para se comunicar com o Open Interpreter Server
     """
     
-    def __init__(self, uri: str = "ws://localhost:8000"):
+    def __init__(self, uri: str = "ws://localhost:8000", session_id: Optional[str] = None):
         """
         Inicializa o cliente
         
         Args:
             uri: URI do servidor WebSocket
+            session_id: Sessão a usar no servidor (padrão: uma sessão só desta conexão)
         """
         self.uri = uri
+        self.session_id = session_id
         self.websocket = None
     
     async def connect(self):
@@ -36,6 +38,14 @@ class OpenInterpreterClient:
             logger.error(f"Erro ao conectar: {e}")
             return False
     
+    async def _send(self, payload: Dict[str, Any]):
+        """Envia uma mensagem, com o session_id se houver"""
+        if not self.websocket:
+            await self.connect()
+        if self.session_id:
+            payload["session_id"] = self.session_id
+        await self.websocket.send(json.dumps(payload))
+    
     async def disconnect(self):
         """Desconecta do servidor"""
         if self.websocket:
@@ -52,19 +62,49 @@ class OpenInterpreterClient:
         Returns:
             Resposta do Interpreter
         """
-        if not self.websocket:
-            await self.connect()
-        
         # Enviar mensagem
-        await self.websocket.send(json.dumps({
+        await self._send({
             "type": "chat",
             "message": message,
-        }))
+        })
         
         # Receber resposta
         response = await self.websocket.recv()
         return json.loads(response)
     
+    async def chat_stream(self, message: str, on_event: Optional[Callable[[Dict[str, Any]], None]] = None, request_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Envia mensagem de chat em modo streaming
+        
+        Args:
+            message: Mensagem a enviar
+            on_event: Chamado com cada frame (delta, code_start, code_run, active_line, output, code_end...)
+            request_id: Identificador devolvido em cada frame
+        
+        Returns:
+            Frame final ("done", com status e resumo), ou o erro / "busy" do servidor
+        """
+        await self._send({
+            "type": "chat",
+            "message": message,
+            "stream": True,
+            "request_id": request_id,
+        })
+        
+        # Receber frames até o final
+        while True:
+            frame = json.loads(await self.websocket.recv())
+            if frame.get("type") in ("done", "error", "busy"):
+                return frame
+            if on_event:
+                on_event(frame)
+    
+    async def cancel(self):
+        """Interrompe a execução em andamento (pode ser chamado enquanto chat_stream espera)"""
+        await self._send({
+            "type": "cancel",
+        })
+    
     async def execute_code(self, code: str, language: str = "python") -> Dict[str, Any]:
         """
         Executa código diretamente
@@ -76,15 +116,12 @@ class OpenInterpreterClient:
         Returns:
             Resultado da execução
         """
-        if not self.websocket:
-            await self.connect()
-        
         # Enviar comando
-        await self.websocket.send(json.dumps({
+        await self._send({
             "type": "execute_code",
             "code": code,
             "language": language,
-        }))
+        })
         
         # Receber resposta
         response = await self.websocket.recv()
@@ -92,37 +129,28 @@ class OpenInterpreterClient:
     
     async def reset(self):
         """Reseta o estado do Interpreter"""
-        if not self.websocket:
-            await self.connect()
-        
-        await self.websocket.send(json.dumps({
+        await self._send({
             "type": "reset",
-        }))
+        })
         
         response = await self.websocket.recv()
         return json.loads(response)
     
     async def get_model(self) -> Dict[str, Any]:
         """Obtém informações do modelo atual"""
-        if not self.websocket:
-            await self.connect()
-        
-        await self.websocket.send(json.dumps({
+        await self._send({
             "type": "get_model",
-        }))
+        })
         
         response = await self.websocket.recv()
         return json.loads(response)
     
     async def set_model(self, model: str) -> Dict[str, Any]:
         """Define o modelo a usar"""
-        if not self.websocket:
-            await self.connect()
-        
-        await self.websocket.send(json.dumps({
+        await self._send({
             "type": "set_model",
             "model": model,
-        }))
+        })
         
         response = await self.websocket.recv()
         return json.loads(response)
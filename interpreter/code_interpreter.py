@@ -1,16 +1,22 @@
-import subprocess
 import webbrowser
 import tempfile
 import threading
 import traceback
 import platform
+import codecs
+import signal
+import shlex
+import json
 import time
-import ast
-import astor
+import uuid
 import sys
 import os
 import re
 
+from .repl_pool import get_pool
+from .output_buffer import OutputBuffer
+from . import repl_worker
+
 
 def run_html(html_content):
     # Create a temporary HTML file with the content
@@ -26,26 +32,34 @@ def run_html(html_content):
 # Mapping of languages to their start, run, and print commands
 language_map = {
   "python": {
-    # Python is run from this interpreter with sys.executable
-    # in interactive, quiet, and unbuffered mode
-    "start_cmd": sys.executable + " -i -q -u",
-    "print_cmd": 'print("{}")'
+    # Python is run from this interpreter with sys.executable, in unbuffered mode,
+    # as a worker that speaks the framed protocol (see repl_worker.py)
+    "start_cmd": [sys.executable, "-u", repl_worker.__file__],
+    "framed": True,
   },
   "shell": {
     # On Windows, the shell start command is `cmd.exe`
     # On Unix, it should be the SHELL environment variable (defaults to 'bash' if not set)
     "start_cmd": 'cmd.exe' if platform.system() == 'Windows' else os.environ.get('SHELL', 'bash'),
-    "print_cmd": 'echo "{}"'
+    "print_cmd": 'echo "{}"',
+    # Moves the REPL into a session's working directory (formatted with the path, quoted by `quote`)
+    "chdir_cmd": 'cd /d {}' if platform.system() == 'Windows' else 'cd {}',
+    # cmd.exe only needs the quotes. Anything else in double quotes would still expand $ and backticks
+    "quote": (lambda path: f'"{path}"') if platform.system() == 'Windows' else shlex.quote,
   },
   "javascript": {
     "start_cmd": "node -i",
-    "print_cmd": 'console.log("{}")'
+    "print_cmd": 'console.log("{}")',
+    "chdir_cmd": 'process.chdir({})',
+    "quote": json.dumps,
   },
   "applescript": {
     # Starts from shell, whatever the user's preference (defaults to '/bin/zsh')
     # (We'll prepend "osascript -e" every time, not once at the start, so we want an empty shell)
     "start_cmd": os.environ.get('SHELL', '/bin/zsh'),
-    "print_cmd": 'log "{}"'
+    "print_cmd": 'log "{}"',
+    "chdir_cmd": 'cd {}',
+    "quote": shlex.quote,
   },
   "html": {
     "open_subrocess": False,
@@ -53,6 +67,15 @@ language_map = {
   }
 }
 
+def warm_up(languages):
+  """
+  Creates the REPL pools for these languages, so their workers start spawning before the first run.
+  """
+  for language in languages:
+    config = language_map[language]
+    if config.get("start_cmd"):
+      get_pool(language, config["start_cmd"], config.get("framed", False))
+
 # Get forbidden_commands (disabled)
 """
 with open("interpreter/forbidden_commands.json", "r") as f:
@@ -67,48 +90,104 @@ class CodeInterpreter:
   They can control code blocks on the terminal, then be executed to produce an output which will be displayed in real-time.
   """
 
-  def __init__(self, language, debug_mode):
+  # Redraw the active block at most this often (seconds), however fast output comes in
+  refresh_interval = 1 / 20
+
+  def __init__(self, language, debug_mode, session_id=None, workdir=None):
     self.language = language
+    # Working directory for our REPL (None means wherever it was started)
+    self.workdir = workdir
     self.proc = None
+    self.worker = None
     self.active_line = None
+    self.output_buffer = OutputBuffer()
+    self.spilled_buffers = []
     self.debug_mode = debug_mode
+    # Gets active_line and output events as they happen (see Interpreter.emit)
+    self.event_handler = None
+
+    # Coalescing of active block refreshes
+    self.refresh_lock = threading.RLock()
+    self.last_refresh = 0
+    self.refresh_timer = None
+    self.framed = language_map[language].get("framed", False)
+    self.execution_id = 0
+
+    # Identifies our lease on a pooled REPL worker
+    self.session_id = session_id or uuid.uuid4().hex
+
+  def pool(self):
+    config = language_map[self.language]
+    return get_pool(self.language, config["start_cmd"], self.framed)
 
   def start_process(self):
-    # Get the start_cmd for the selected language
-    start_cmd = language_map[self.language]["start_cmd"]
-
-    # Use the appropriate start_cmd to execute the code
-    self.proc = subprocess.Popen(start_cmd.split(),
-                                 stdin=subprocess.PIPE,
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE,
-                                 text=True,
-                                 bufsize=0)
-
-    # Start watching ^ its `stdout` and `stderr` streams
-    threading.Thread(target=self.save_and_display_stream,
-                     args=(self.proc.stdout, False), # Passes False to is_error_stream
-                     daemon=True).start()
-    threading.Thread(target=self.save_and_display_stream,
-                     args=(self.proc.stderr, True), # Passes True to is_error_stream
-                     daemon=True).start()
-
-  def update_active_block(self):
-      """
-      This will also truncate the output,
-      which we need to do every time we update the active block.
-      """
-      # Strip then truncate the output if necessary
-      self.output = truncate_output(self.output)
-  
-      # Display it
-      self.active_block.active_line = self.active_line
-      self.active_block.output = self.output
-      self.active_block.refresh()
+    # Lease a pre-spawned REPL from the pool for this language.
+    # We keep the same one (and its state) between runs, unless it had to be recycled.
+    self.worker = self.pool().acquire(self.session_id)
+    self.proc = self.worker.proc
 
-  def run(self):
+    # Its output comes to us while we hold the lease
+    self.worker.listener = self.handle_frame if self.framed else self.save_and_display_line
+
+  def release(self):
     """
-    Executes code.
+    Gives up our REPL worker (and its state), and deletes the full outputs we spilled to disk.
+    """
+    if self.worker:
+      self.worker.listener = None
+      self.pool().release(self.session_id)
+    self.worker = None
+    self.proc = None
+
+    for output_buffer in self.spilled_buffers + [self.output_buffer]:
+      output_buffer.close()
+    self.spilled_buffers = []
+
+  @property
+  def output(self):
+    return self.output_buffer.text()
+
+  def reset_output(self):
+    # Keep spilled buffers around until release(), their files are mentioned in the output
+    if self.output_buffer.spill_path:
+      self.spilled_buffers.append(self.output_buffer)
+    self.output_buffer = OutputBuffer()
+
+  def update_active_block(self, force=False):
+    """
+    Displays the output and active line.
+
+    Refreshes are coalesced to `refresh_interval`: if we refreshed too recently,
+    one deferred refresh is scheduled instead. `force` refreshes right away (like at the end of an execution).
+    """
+    with self.refresh_lock:
+      wait = self.refresh_interval - (time.monotonic() - self.last_refresh)
+
+      if force or wait <= 0:
+        if self.refresh_timer:
+          self.refresh_timer.cancel()
+          self.refresh_timer = None
+        self.last_refresh = time.monotonic()
+        self.active_block.active_line = self.active_line
+        self.active_block.output = self.output
+        self.active_block.refresh()
+
+      elif not self.refresh_timer:
+        self.refresh_timer = threading.Timer(wait, self.deferred_refresh)
+        self.refresh_timer.daemon = True
+        self.refresh_timer.start()
+
+  def deferred_refresh(self):
+    with self.refresh_lock:
+      # A forced refresh may have happened since this was scheduled
+      if self.refresh_timer is None:
+        return
+      self.refresh_timer = None
+      self.update_active_block(force=True)
+
+  def run(self, retried=False):
+    """
+    Executes code. If the REPL's pipe is broken, it's retried once on a fresh one.
     """
 
     # Get code to execute
@@ -127,8 +206,9 @@ class CodeInterpreter:
     # Should we keep a subprocess open? True by default
     open_subrocess = language_map[self.language].get("open_subrocess", True)
 
-    # Start the subprocess if it hasn't been started
-    if not self.proc and open_subrocess:
+    # Get our REPL from the pool
+    # (this is cheap if we already hold a healthy one)
+    if open_subrocess:
       try:
         self.start_process()
       except:
@@ -136,17 +216,16 @@ class CodeInterpreter:
         # Like if they don't have `node` installed or something.
         
         traceback_string = traceback.format_exc()
-        self.output = traceback_string
-        self.update_active_block()
-  
-        # Before you return, wait for the display to catch up?
-        # (I'm not sure why this works)
-        time.sleep(0.1)
-  
+        self.reset_output()
+        self.output_buffer.write(traceback_string)
+        self.update_active_block(force=True)
         return self.output
 
+    if self.framed:
+      return self.run_framed(retried)
+
     # Reset output
-    self.output = ""
+    self.reset_output()
 
     # Use the print_cmd for the selected language
     self.print_cmd = language_map[self.language].get("print_cmd")
@@ -161,20 +240,10 @@ class CodeInterpreter:
         # This traceback will be our output.
         
         traceback_string = traceback.format_exc()
-        self.output = traceback_string
-        self.update_active_block()
-  
-        # Before you return, wait for the display to catch up?
-        # (I'm not sure why this works)
-        time.sleep(0.1)
-  
+        self.output_buffer.write(traceback_string)
+        self.update_active_block(force=True)
         return self.output
 
-    if self.language == "python":
-      # This lets us stop execution when error happens (which is not default -i behavior)
-      # And solves a bunch of indentation problems-- if everything's indented, -i treats it as one block
-      code = wrap_in_try_except(code)
-
     # Remove any whitespace lines, as this will break indented blocks
     # (are we sure about this? test this)
     code_lines = code.split("\n")
@@ -211,26 +280,177 @@ class CodeInterpreter:
     self.done = threading.Event()
     self.done.clear()
 
-    # Write code to stdin of the process
+    # Move a REPL we haven't used yet into our working directory
+    chdir_cmd = language_map[self.language].get("chdir_cmd")
+    if self.needs_chdir() and chdir_cmd:
+      code = chdir_cmd.format(language_map[self.language]["quote"](self.workdir)) + "\n" + code
+      self.worker.workdir = self.workdir
+
+    # Our lease is in use until the code is done, however long it runs
+    worker = self.worker
+    self.pool().begin_run(worker)
     try:
-      self.proc.stdin.write(code + "\n")
-      self.proc.stdin.flush()
-    except BrokenPipeError:
-      # It can just.. break sometimes? Let's fix this better in the future
-      # For now, just try again
-      self.start_process()
-      self.run()
-      return
+      # Write code to stdin of the process
+      try:
+        self.proc.stdin.write(code + "\n")
+        self.proc.stdin.flush()
+      except BrokenPipeError:
+        # It can just.. break sometimes?
+        # Retire the worker and try again on a fresh one (run() leases it)
+        self.pool().retire(self.session_id)
+        self.proc = None
+        return self.retry_or_fail(retried)
+
+      self.worker.runs += 1
+
+      # Wait until execution completes
+      self.done.wait()
+
+      # END_OF_EXECUTION comes through stdout, so stderr lines can still be on their way.
+      # Give them a moment. (Framed REPLs don't have this problem, see run_framed.)
+      time.sleep(0.1)
+      self.update_active_block(force=True)
+
+      # Return code output
+      return self.output
+    finally:
+      self.pool().end_run(worker)
+
+  def retry_or_fail(self, retried):
+    """
+    Runs the code again on a fresh REPL after a broken pipe, or reports it if that was the retry.
+    """
+    if not retried:
+      return self.run(retried=True)
+    self.reset_output()
+    self.output_buffer.write(traceback.format_exc())
+    self.update_active_block(force=True)
+    return self.output
 
-    # Wait until execution completes
-    self.done.wait()
+  def run_framed(self, retried=False):
+    """
+    Executes code on a REPL worker that speaks the framed protocol (see repl_worker.py).
 
-    # Before you return, wait for the display to catch up?
-    # (I'm not sure why this works)
-    time.sleep(0.1)
+    The worker reports active lines itself, and sends its END frame only after
+    all of the execution's output, so there's nothing to inject into the code and nothing to wait for.
+    """
+    self.reset_output()
+    self.active_line = None
+    self.execution_id += 1
+    self.decoders = {
+      repl_worker.STDOUT: codecs.getincrementaldecoder("utf-8")(errors="replace"),
+      repl_worker.STDERR: codecs.getincrementaldecoder("utf-8")(errors="replace"),
+    }
+    self.partial_lines = {repl_worker.STDOUT: "", repl_worker.STDERR: ""}
 
-    # Return code output
-    return self.output
+    if self.debug_mode:
+      print("Running code:")
+      print(self.code)
+      print("---")
+
+    self.done = threading.Event()
+
+    request = {"id": self.execution_id, "code": self.code}
+
+    # Move a REPL we haven't used yet into our working directory
+    if self.needs_chdir():
+      request["cwd"] = self.workdir
+      self.worker.workdir = self.workdir
+
+    worker = self.worker
+    self.pool().begin_run(worker)
+    try:
+      try:
+        request = json.dumps(request)
+        self.proc.stdin.write(repl_worker.encode_frame(repl_worker.EXECUTE, request))
+        self.proc.stdin.flush()
+      except (BrokenPipeError, OSError):
+        # The worker died. Retire it and try again on a fresh one (run() leases it)
+        self.pool().retire(self.session_id)
+        self.proc = None
+        return self.retry_or_fail(retried)
+
+      self.worker.runs += 1
+
+      # Wait until execution completes (or the worker dies)
+      while not self.done.wait(0.5):
+        if self.proc.poll() is not None:
+          self.append_output("Process exited unexpectedly.")
+          self.update_active_block(force=True)
+          break
+
+      return self.output
+    finally:
+      self.pool().end_run(worker)
+
+  def needs_chdir(self):
+    return self.workdir is not None and getattr(self.worker, "workdir", None) != self.workdir
+
+  def handle_frame(self, kind, payload):
+    """
+    Handles each frame from our framed REPL worker.
+    """
+
+    if self.debug_mode:
+      print("Recieved frame:")
+      print(kind, payload)
+      print("---")
+
+    if kind == repl_worker.ACTIVE_LINE:
+      self.active_line = int(payload)
+      self.emit({"type": "active_line", "line": self.active_line})
+      self.update_active_block()
+
+    elif kind in (repl_worker.STDOUT, repl_worker.STDERR):
+      text = self.partial_lines[kind] + self.decoders[kind].decode(payload)
+      lines = text.split("\n")
+      self.partial_lines[kind] = lines.pop()
+      for line in lines:
+        self.append_output(line)
+      if lines:
+        self.update_active_block()
+
+    elif kind == repl_worker.END:
+      if json.loads(payload).get("id") != self.execution_id:
+        # Left over from an execution we stopped waiting for (like after CTRL-C)
+        return
+      for stream in self.partial_lines:
+        if self.partial_lines[stream]:
+          self.append_output(self.partial_lines[stream])
+          self.partial_lines[stream] = ""
+      self.active_line = None
+      self.emit({"type": "active_line", "line": None})
+      self.update_active_block(force=True)
+      self.done.set()
+
+  def append_output(self, line):
+    self.output_buffer.append(line)
+    # Blank lines aren't part of the output either
+    if line.strip():
+      self.emit({"type": "output", "content": line.strip()})
+
+  def emit(self, event):
+    if self.event_handler:
+      self.event_handler(event)
+
+  def interrupt(self):
+    """
+    Stops the code running now (from another thread).
+
+    Framed REPLs get a KeyboardInterrupt raised in the code and keep their state.
+    Other REPLs can't tell us when that's done, so they're retired and this run ends right away.
+    """
+    proc = self.proc
+    if proc is None or proc.poll() is not None:
+      return
+    if self.framed and hasattr(signal, "SIGINT"):
+      proc.send_signal(signal.SIGINT)
+    else:
+      self.pool().retire(self.session_id)
+      self.append_output("KeyboardInterrupt")
+      done = getattr(self, "done", None)
+      if done:
+        done.set()
 
   def add_active_line_prints(self, code):
     """
@@ -245,9 +465,6 @@ class CodeInterpreter:
     3) It really struggles with multiline stuff, so I've disabled that (but we really should fix and restore).
     """
 
-    if self.language == "python":
-      return add_active_line_prints_to_python(code)
-
     # Split the original code into lines
     code_lines = code.strip().split('\n')
 
@@ -288,162 +505,40 @@ class CodeInterpreter:
     code = "\n".join(modified_code_lines)
     return code
 
-  def save_and_display_stream(self, stream, is_error_stream):
-    # Handle each line of output
-    for line in iter(stream.readline, ''):
-
-      if self.debug_mode:
-        print("Recieved output line:")
-        print(line)
-        print("---")
-      
-      line = line.strip()
-
-      # Node's interactive REPL outputs a billion things
-      # So we clean it up:
-      if self.language == "javascript":
-        if "Welcome to Node.js" in line:
-          continue
-        if line in ["undefined", 'Type ".help" for more information.']:
-          continue
-        # Remove trailing ">"s
-        line = re.sub(r'^\s*(>\s*)+', '', line)
-
-      # Python's interactive REPL outputs a million things
-      # So we clean it up:
-      if self.language == "python":
-        if re.match(r'^(\s*>>>\s*|\s*\.\.\.\s*)', line):
-          continue
-
-      # Check if it's a message we added (like ACTIVE_LINE)
-      # Or if we should save it to self.output
-      if line.startswith("ACTIVE_LINE:"):
-        self.active_line = int(line.split(":")[1])
-      elif "END_OF_EXECUTION" in line:
-        self.done.set()
-        self.active_line = None
-      elif is_error_stream and "KeyboardInterrupt" in line:
-        raise KeyboardInterrupt
-      else:
-        self.output += "\n" + line
-        self.output = self.output.strip()
-
-      self.update_active_block()
-
-def truncate_output(data):
-  needs_truncation = False
-
-  # In the future, this will come from a config file
-  max_output_chars = 2000
-
-  message = f'Output truncated. Showing the last {max_output_chars} characters.\n\n'
-
-  # Remove previous truncation message if it exists
-  if data.startswith(message):
-    data = data[len(message):]
-    needs_truncation = True
-
-  # If data exceeds max length, truncate it and add message
-  if len(data) > max_output_chars or needs_truncation:
-    data = message + data[-max_output_chars:]
-
-  return data
-
-# Perhaps we should split the "add active line prints" processing to a new file?
-# Add active prints to python:
-
-class AddLinePrints(ast.NodeTransformer):
+  def save_and_display_line(self, line, is_error_stream):
     """
-    Transformer to insert print statements indicating the line number
-    before every executable line in the AST.
+    Handles each line of output from our REPL worker's `stdout` and `stderr` streams.
     """
 
-    def insert_print_statement(self, line_number):
-        """Inserts a print statement for a given line number."""
-        return ast.Expr(
-            value=ast.Call(
-                func=ast.Name(id='print', ctx=ast.Load()),
-                args=[ast.Constant(value=f"ACTIVE_LINE:{line_number}")],
-                keywords=[]
-            )
-        )
-
-    def process_body(self, body):
-        """Processes a block of statements, adding print calls."""
-        new_body = []
-
-        # In case it's not iterable:
-        if not isinstance(body, list):
-            body = [body]
+    if self.debug_mode:
+      print("Recieved output line:")
+      print(line)
+      print("---")
     
-        for sub_node in body:
-            if hasattr(sub_node, 'lineno'):
-                new_body.append(self.insert_print_statement(sub_node.lineno))
-            new_body.append(sub_node)
-
-        return new_body
-
-    def visit(self, node):
-        """Overridden visit to transform nodes."""
-        new_node = super().visit(node)
-        
-        # If node has a body, process it
-        if hasattr(new_node, 'body'):
-            new_node.body = self.process_body(new_node.body)
-        
-        # If node has an orelse block (like in for, while, if), process it
-        if hasattr(new_node, 'orelse') and new_node.orelse:
-            new_node.orelse = self.process_body(new_node.orelse)
-        
-        # Special case for Try nodes as they have multiple blocks
-        if isinstance(new_node, ast.Try):
-            for handler in new_node.handlers:
-                handler.body = self.process_body(handler.body)
-            if new_node.finalbody:
-                new_node.finalbody = self.process_body(new_node.finalbody)
-        
-        return new_node
-
-def add_active_line_prints_to_python(code):
-    """
-    Add print statements indicating line numbers to a python string.
-    """
-    tree = ast.parse(code)
-    transformer = AddLinePrints()
-    new_tree = transformer.visit(tree)
-    return ast.unparse(new_tree)
-
-def wrap_in_try_except(code):
-    # Add import traceback
-    code = "import traceback\n" + code
-
-    # Parse the input code into an AST
-    parsed_code = ast.parse(code)
-
-    # Wrap the entire code's AST in a single try-except block
-    try_except = ast.Try(
-        body=parsed_code.body,
-        handlers=[
-            ast.ExceptHandler(
-                type=ast.Name(id="Exception", ctx=ast.Load()),
-                name=None,
-                body=[
-                    ast.Expr(
-                        value=ast.Call(
-                            func=ast.Attribute(value=ast.Name(id="traceback", ctx=ast.Load()), attr="print_exc", ctx=ast.Load()),
-                            args=[],
-                            keywords=[]
-                        )
-                    ),
-                ]
-            )
-        ],
-        orelse=[],
-        finalbody=[]
-    )
-
-    # Assign the try-except block as the new body
-    parsed_code.body = [try_except]
-
-    # Convert the modified AST back to source code
-    return ast.unparse(parsed_code)
+    line = line.strip()
+
+    # Node's interactive REPL outputs a billion things
+    # So we clean it up:
+    if self.language == "javascript":
+      if "Welcome to Node.js" in line:
+        return
+      if line in ["undefined", 'Type ".help" for more information.']:
+        return
+      # Remove trailing ">"s
+      line = re.sub(r'^\s*(>\s*)+', '', line)
+
+    # Check if it's a message we added (like ACTIVE_LINE)
+    # Or if we should save it to the output
+    if line.startswith("ACTIVE_LINE:"):
+      self.active_line = int(line.split(":")[1])
+      self.emit({"type": "active_line", "line": self.active_line})
+    elif "END_OF_EXECUTION" in line:
+      self.done.set()
+      self.active_line = None
+      self.emit({"type": "active_line", "line": None})
+    elif is_error_stream and "KeyboardInterrupt" in line:
+      raise KeyboardInterrupt
+    else:
+      self.append_output(line)
+
+    self.update_active_block()
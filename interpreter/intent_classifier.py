@@ -2,10 +2,15 @@
 Intent Classifier - Classificador de Intenção Baseado em LLM
 Usa Ollama local para classificar intenções de forma robusta
 """
+import asyncio
 import json
 import os
+import re
+import time
 import logging
-from typing import Literal, TypedDict, Optional
+import threading
+from collections import OrderedDict
+from typing import Literal, TypedDict, Optional, List, Dict, Any
 
 logger = logging.getLogger(__name__)
 
@@ -61,11 +66,386 @@ Usuário: "Olá, você pode criar um script Python para mim?"
 JSON: {{"intent": "execution", "reasoning": "Mesmo com saudação, o usuário está pedindo para criar um script.", "action_type": "code", "confidence": 0.85}}
 """
 
+# Instrução para classificar várias mensagens numa única chamada (API em lote)
+BATCH_PROMPT = """Analise cada uma das mensagens do usuário abaixo e classifique a intenção de cada uma, independentemente.
+
+Mensagens (lista JSON, na ordem):
+{messages}
+
+Responda APENAS com um objeto JSON válido com uma classificação por mensagem, na mesma ordem:
+{{
+    "results": [
+        {{"index": 0, "intent": "execution" | "conversation", "reasoning": "explicação breve", "action_type": "code" | "web" | "file" | "search" | "general" | null, "confidence": 0.0-1.0}}
+    ]
+}}"""
+
+# Regras da classificação híbrida, compiladas uma única vez
+# Padrões de alta confiança para conversa (não precisa de LLM)
+CONVERSATION_PATTERNS = [re.compile(pattern) for pattern in [
+    r'^(oi|olá|hello|hi|hey)\s*$',
+    r'^(tudo bem|tudo bom|como vai|como está)\s*\??$',
+    r'^(obrigado|obrigada|thanks|thank you|valeu)\s*$',
+    r'^(tchau|até logo|bye|see you)\s*$',
+]]
+
+# Padrões de alta confiança para execução (não precisa de LLM)
+EXECUTION_PATTERNS = [re.compile(pattern) for pattern in [
+    r'(criar|escrever|fazer|executar|rodar)\s+(script|código|arquivo|programa)',
+    r'(abrir|abre)\s+(aplicativo|programa|arquivo|vs code|code)',
+    r'(instalar|baixar|executar)\s+[^\s]+',
+    r'```[\s\S]*```',  # Código em markdown
+    r'https?://',  # URL
+]]
+
+# Tempo (segundos) que lembramos qual modelo de classificação está instalado
+MODEL_PROBE_TTL = float(os.getenv("INTENT_MODEL_PROBE_TTL", "300"))
+# E que nenhum está (mais curto: logo alguém instala um)
+MODEL_MISS_TTL = float(os.getenv("INTENT_MODEL_MISS_TTL", "30"))
+
+# Timeout de conexão curto (Ollama fora do ar falha rápido), leitura longa (modelo carregando)
+REQUEST_TIMEOUT = (5, 60)
+
+# Contadores para métricas / benchmark
+stats = {
+    "llm_calls": 0,
+    "batch_calls": 0,
+    "model_probes": 0,
+}
+
+_session = None
+_known_good_models: Dict[tuple, tuple] = {}
+_known_good_lock = threading.Lock()
+
+
+class ClassificationCache:
+    """
+    Cache LRU com TTL de classificações, indexado pelo texto normalizado da mensagem,
+    pelo modelo classificador e pela URL do Ollama (trocar de modelo não reaproveita as respostas do anterior)
+    
+    Thread-safe: é compartilhado pelas chamadas síncronas e pelas threads da API assíncrona.
+    """
+    
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def key(self, message: str, model: Optional[str] = None, base_url: Optional[str] = None) -> tuple:
+        return (
+            model or os.getenv("INTENT_CLASSIFIER_MODEL"),
+            base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+            normalize_message(message),
+        )
+    
+    def get(self, message: str, model: Optional[str] = None, base_url: Optional[str] = None) -> Optional[IntentClassification]:
+        key = self.key(message, model, base_url)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[0])
+    
+    def set(self, message: str, classification: IntentClassification, model: Optional[str] = None, base_url: Optional[str] = None):
+        key = self.key(message, model, base_url)
+        with self.lock:
+            self.entries[key] = (dict(classification), time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+classification_cache = ClassificationCache(
+    max_size=int(os.getenv("INTENT_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("INTENT_CACHE_TTL", "3600")),
+)
+
+
+def normalize_message(message: str) -> str:
+    """
+    Chave do cache: sem diferença de maiúsculas nem de espaços
+    """
+    return " ".join(message.lower().split())
+
+
+def classifier_stats() -> Dict[str, Any]:
+    """
+    Chamadas ao LLM, sondagens de modelo e estatísticas do cache
+    """
+    return {**stats, "cache": classification_cache.stats()}
+
+
+def _get_session():
+    # Sessão HTTP compartilhada, reaproveita a conexão com o Ollama entre classificações
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
+
+
+def _classifier_models(model: Optional[str] = None) -> List[str]:
+    # Modelos de fallback para classificação de intenção (pequenos e rápidos)
+    # Prioridade: modelos leves e rápidos que seguem bem instruções JSON
+    # Ordem: do menor/mais rápido para o maior (último recurso)
+    intent_classifier_models = [
+        model,  # Modelo fornecido explicitamente
+        os.getenv("INTENT_CLASSIFIER_MODEL"),  # Modelo específico para classificação
+        "mistral:7b-instruct",  # RECOMENDADO: Leve, rápido, bom em JSON estruturado (4.4 GB instalado)
+        "phi3:mini",  # Mais rápido: modelo muito pequeno (2.2 GB instalado)
+        "qwen2.5-coder:7b",  # Alternativa rápida (4.7 GB instalado)
+        "qwen2.5:7b-instruct",  # Alternativa estável (4.7 GB instalado)
+        "llama3.1:8b",  # Alternativa estável (4.9 GB instalado)
+        "qwen2.5-coder:7b-instruct",  # Alternativa para código (4.7 GB instalado)
+        "llama3.2:3b",  # Modelo muito pequeno (se disponível)
+        "deepseek-coder:6.7b",  # Alternativa pequena (se disponível)
+        os.getenv("DEFAULT_MODEL"),  # Modelo padrão do sistema (último recurso, pode ser grande)
+    ]
+    
+    # Remover None e valores duplicados
+    intent_classifier_models = [m for m in intent_classifier_models if m]
+    return list(dict.fromkeys(intent_classifier_models))  # Remove duplicatas mantendo ordem
+
+
+def find_classifier_model(model: Optional[str] = None, base_url: Optional[str] = None) -> Optional[str]:
+    """
+    Retorna o primeiro modelo da lista de fallback que está instalado no Ollama.
+    
+    Consulta /api/tags uma vez e guarda o resultado por MODEL_PROBE_TTL segundos
+    (MODEL_MISS_TTL se nenhum está instalado), em vez de tentar os modelos um a um a cada classificação.
+    Retorna None se o Ollama não respondeu ou nenhum modelo da lista está instalado.
+    """
+    base_url = base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    key = (base_url, model)
+    
+    with _known_good_lock:
+        cached = _known_good_models.get(key)
+        if cached:
+            ttl = MODEL_PROBE_TTL if cached[0] else MODEL_MISS_TTL
+            if time.monotonic() - cached[1] < ttl:
+                return cached[0]
+    
+    import requests
+    stats["model_probes"] += 1
+    try:
+        response = _get_session().get(f"{base_url}/api/tags", timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        installed = {m.get("name") for m in response.json().get("models", [])}
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.warning(f"⚠️ Não foi possível listar os modelos do Ollama: {e}")
+        return None
+    
+    for candidate in _classifier_models(model):
+        # "phi3" e "phi3:latest" são o mesmo modelo
+        if candidate in installed or f"{candidate}:latest" in installed:
+            remember_classifier_model(candidate, model, base_url)
+            return candidate
+    remember_classifier_model(None, model, base_url)
+    return None
+
+
+def remember_classifier_model(found: Optional[str], model: Optional[str] = None, base_url: Optional[str] = None):
+    base_url = base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    with _known_good_lock:
+        _known_good_models[(base_url, model)] = (found, time.monotonic())
+
+
+def classifier_model_missing(model: Optional[str] = None, base_url: Optional[str] = None) -> bool:
+    """
+    Se a última sondagem (há menos de MODEL_MISS_TTL segundos) não achou nenhum modelo da lista instalado
+    """
+    base_url = base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    with _known_good_lock:
+        cached = _known_good_models.get((base_url, model))
+    return bool(cached) and cached[0] is None and time.monotonic() - cached[1] < MODEL_MISS_TTL
+
+
+def forget_classifier_model(model: Optional[str] = None, base_url: Optional[str] = None):
+    """
+    Esquece o modelo guardado (por exemplo, depois de um 404: ele foi removido)
+    """
+    base_url = base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    with _known_good_lock:
+        _known_good_models.pop((base_url, model), None)
+
+
+def _chat(base_url: str, attempt_model: str, user_prompt: str, num_predict: int):
+    """
+    Uma chamada (não streaming) ao /api/chat do Ollama, com saída em JSON
+    """
+    stats["llm_calls"] += 1
+    return _get_session().post(
+        f"{base_url}/api/chat",
+        json={
+            "model": attempt_model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": user_prompt}
+            ],
+            "format": "json",
+            "stream": False,
+            "options": {
+                "temperature": 0.1,  # Baixa temperatura para classificação mais consistente
+                "num_predict": num_predict,  # Resposta curta (apenas JSON)
+            }
+        },
+        timeout=REQUEST_TIMEOUT
+    )
+
+
+def _call_classifier(user_prompt: str, model: Optional[str], base_url: str, num_predict: int = 200) -> str:
+    """
+    Chama o modelo de classificação e retorna o conteúdo da resposta.
+    
+    Usa o modelo guardado por `find_classifier_model`. Só se não soubermos qual está instalado
+    (ou o guardado sumiu), tenta a lista de fallback um a um, como antes.
+    """
+    import requests
+    
+    known_model = find_classifier_model(model, base_url)
+    if known_model is None and classifier_model_missing(model, base_url):
+        # Todos dariam 404, nem tentar a lista
+        raise Exception("Erro ao chamar Ollama para classificação de intenção: nenhum modelo da lista está instalado")
+    if known_model:
+        response = _chat(base_url, known_model, user_prompt, num_predict)
+        if response.status_code == 200:
+            return response.json().get("message", {}).get("content", "{}")
+        if response.status_code != 404:
+            raise Exception(f"Erro ao chamar Ollama para classificação de intenção: Erro {response.status_code}: {response.text}")
+        # O modelo foi removido desde a sondagem
+        forget_classifier_model(model, base_url)
+    
+    # Tentar cada modelo até um funcionar
+    last_error = None
+    response = None
+    
+    for attempt_model in _classifier_models(model):
+        if attempt_model == known_model:
+            continue
+        try:
+            response = _chat(base_url, attempt_model, user_prompt, num_predict)
+            
+            if response.status_code == 200:
+                # Sucesso! Usar este modelo (e lembrar dele para as próximas)
+                remember_classifier_model(attempt_model, model, base_url)
+                logger.info(f"✅ Classificador usando modelo: {attempt_model}")
+                break
+            elif response.status_code == 404:
+                # Modelo não encontrado, tentar próximo
+                last_error = f"Modelo '{attempt_model}' não encontrado"
+                logger.warning(f"⚠️ Modelo '{attempt_model}' não disponível, tentando próximo...")
+                response = None  # Resetar response para próxima tentativa
+                continue
+            else:
+                last_error = f"Erro {response.status_code}: {response.text}"
+                logger.error(f"❌ Erro na chamada Ollama com modelo {attempt_model}: {response.status_code} - {response.text}")
+                response = None  # Resetar response para próxima tentativa
+                continue
+        except requests.exceptions.Timeout:
+            last_error = f"Timeout ao chamar modelo '{attempt_model}'"
+            logger.warning(f"⏱️ Timeout ao chamar Ollama com modelo {attempt_model}")
+            response = None
+            continue
+        except requests.exceptions.RequestException as e:
+            last_error = f"Erro de conexão: {str(e)}"
+            logger.warning(f"⚠️ Erro ao chamar Ollama com modelo {attempt_model}: {e}")
+            response = None
+            # Ollama fora do ar: os próximos modelos falhariam igual
+            if isinstance(e, requests.exceptions.ConnectionError):
+                break
+            continue
+    
+    # Se nenhum modelo funcionou, lançar erro
+    if response is None or response.status_code != 200:
+        logger.error(f"❌ Todos os modelos falharam. Último erro: {last_error}")
+        raise Exception(f"Erro ao chamar Ollama para classificação de intenção: {last_error}")
+    
+    return response.json().get("message", {}).get("content", "{}")
+
+
+def _extract_json(json_output: str, pattern: str) -> Any:
+    # Tentar extrair JSON da resposta (pode vir com markdown ou texto extra)
+    json_output = json_output.strip()
+    
+    # Remover markdown code blocks
+    if "```json" in json_output:
+        json_output = json_output.split("```json")[1].split("```")[0].strip()
+    elif json_output.startswith("```"):
+        json_output = json_output[3:]
+        if json_output.endswith("```"):
+            json_output = json_output[:-3]
+        json_output = json_output.strip()
+    
+    try:
+        return json.loads(json_output)
+    except json.JSONDecodeError:
+        # Tentar encontrar JSON em qualquer lugar da resposta
+        json_match = re.search(pattern, json_output, re.DOTALL)
+        if json_match:
+            return json.loads(json_match.group(0))
+        raise json.JSONDecodeError("JSON não encontrado na resposta", json_output, 0)
+
+
+def _normalize_classification(classification: Dict[str, Any]) -> IntentClassification:
+    # Validação e normalização
+    intent = classification.get('intent', 'conversation')
+    if intent not in ['execution', 'conversation']:
+        intent = 'conversation'
+    
+    action_type = classification.get('action_type')
+    if intent == 'conversation':
+        action_type = None
+    elif action_type not in ['code', 'web', 'file', 'search', 'general']:
+        action_type = 'general'
+    
+    confidence = classification.get('confidence', 0.8)
+    if not isinstance(confidence, (int, float)) or confidence < 0 or confidence > 1:
+        confidence = 0.8
+    
+    reasoning = classification.get('reasoning', 'Classificação automática')
+    
+    return {
+        "intent": intent,
+        "reasoning": reasoning,
+        "action_type": action_type,
+        "confidence": float(confidence)
+    }
+
+
+def _fallback_classification(reasoning: str) -> IntentClassification:
+    # Em caso de erro, o padrão é tratar como conversa para evitar execuções indesejadas
+    return {
+        "intent": "conversation",
+        "reasoning": reasoning,
+        "action_type": None,
+        "confidence": 0.5
+    }
+
 
 def classify_intent_llm(message: str, model: Optional[str] = None, base_url: Optional[str] = None) -> IntentClassification:
     """
     Classifica a intenção do usuário usando um LLM local (Ollama) com saída estruturada em JSON.
     
+    Resultados ficam no `classification_cache` (mensagens iguais, a menos de maiúsculas e espaços,
+    não chamam o LLM de novo). Respostas de fallback por erro não são guardadas.
+    
     Args:
         message: Mensagem do usuário para classificar
         model: Modelo Ollama a usar (padrão: do ambiente)
@@ -74,33 +454,15 @@ def classify_intent_llm(message: str, model: Optional[str] = None, base_url: Opt
     Returns:
         Classificação da intenção com intent, reasoning, action_type e confidence
     """
+    cached = classification_cache.get(message, model, base_url)
+    if cached:
+        return cached
+    
+    json_output = None
     try:
-        import requests
-        
-        # Configurar modelo e URL
+        # Configurar URL
         base_url = base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
         
-        # Modelos de fallback para classificação de intenção (pequenos e rápidos)
-        # Prioridade: modelos leves e rápidos que seguem bem instruções JSON
-        # Ordem: do menor/mais rápido para o maior (último recurso)
-        intent_classifier_models = [
-            model,  # Modelo fornecido explicitamente
-            os.getenv("INTENT_CLASSIFIER_MODEL"),  # Modelo específico para classificação
-            "mistral:7b-instruct",  # RECOMENDADO: Leve, rápido, bom em JSON estruturado (4.4 GB instalado)
-            "phi3:mini",  # Mais rápido: modelo muito pequeno (2.2 GB instalado)
-            "qwen2.5-coder:7b",  # Alternativa rápida (4.7 GB instalado)
-            "qwen2.5:7b-instruct",  # Alternativa estável (4.7 GB instalado)
-            "llama3.1:8b",  # Alternativa estável (4.9 GB instalado)
-            "qwen2.5-coder:7b-instruct",  # Alternativa para código (4.7 GB instalado)
-            "llama3.2:3b",  # Modelo muito pequeno (se disponível)
-            "deepseek-coder:6.7b",  # Alternativa pequena (se disponível)
-            os.getenv("DEFAULT_MODEL"),  # Modelo padrão do sistema (último recurso, pode ser grande)
-        ]
-        
-        # Remover None e valores duplicados
-        intent_classifier_models = [m for m in intent_classifier_models if m]
-        intent_classifier_models = list(dict.fromkeys(intent_classifier_models))  # Remove duplicatas mantendo ordem
-        
         # Prompt para o LLM
         user_prompt = f"""Analise a seguinte mensagem do usuário e classifique a intenção:
 
@@ -113,171 +475,98 @@ Responda APENAS com um objeto JSON válido seguindo o esquema:
     "action_type": "code" | "web" | "file" | "search" | "general" | null,
     "confidence": 0.0-1.0
 }}"""
-
-        # Tentar cada modelo até um funcionar
-        last_error = None
-        response = None
-        successful_model = None
-        
-        for attempt_model in intent_classifier_models:
-            if not attempt_model:
-                continue
-            try:
-                # Chamar Ollama
-                response = requests.post(
-                    f"{base_url}/api/chat",
-                    json={
-                        "model": attempt_model,
-                        "messages": [
-                            {"role": "system", "content": SYSTEM_PROMPT},
-                            {"role": "user", "content": user_prompt}
-                        ],
-                        "format": "json",
-                        "stream": False,
-                        "options": {
-                            "temperature": 0.1,  # Baixa temperatura para classificação mais consistente
-                            "num_predict": 200,  # Resposta curta (apenas JSON)
-                        }
-                    },
-                    timeout=60  # Timeout aumentado para modelos que podem demorar mais
-                )
-                
-                if response.status_code == 200:
-                    # Sucesso! Usar este modelo
-                    successful_model = attempt_model
-                    logger.info(f"✅ Classificador usando modelo: {attempt_model}")
-                    break
-                elif response.status_code == 404:
-                    # Modelo não encontrado, tentar próximo
-                    last_error = f"Modelo '{attempt_model}' não encontrado"
-                    logger.warning(f"⚠️ Modelo '{attempt_model}' não disponível, tentando próximo...")
-                    response = None  # Resetar response para próxima tentativa
-                    continue
-                else:
-                    last_error = f"Erro {response.status_code}: {response.text}"
-                    logger.error(f"❌ Erro na chamada Ollama com modelo {attempt_model}: {response.status_code} - {response.text}")
-                    response = None  # Resetar response para próxima tentativa
-                    continue
-            except requests.exceptions.Timeout:
-                last_error = f"Timeout ao chamar modelo '{attempt_model}'"
-                logger.warning(f"⏱️ Timeout ao chamar Ollama com modelo {attempt_model}")
-                response = None
-                continue
-            except requests.exceptions.RequestException as e:
-                last_error = f"Erro de conexão: {str(e)}"
-                logger.warning(f"⚠️ Erro ao chamar Ollama com modelo {attempt_model}: {e}")
-                response = None
-                continue
         
-        # Se nenhum modelo funcionou, lançar erro
-        if response is None or response.status_code != 200:
-            logger.error(f"❌ Todos os modelos falharam. Último erro: {last_error}")
-            raise Exception(f"Erro ao chamar Ollama para classificação de intenção: {last_error}")
-        
-        result = response.json()
-        json_output = result.get("message", {}).get("content", "{}")
-        
-        # Tentar extrair JSON da resposta (pode vir com markdown ou texto extra)
-        json_output = json_output.strip()
-        
-        # Remover markdown code blocks
-        if "```json" in json_output:
-            json_output = json_output.split("```json")[1].split("```")[0].strip()
-        elif json_output.startswith("```"):
-            json_output = json_output[3:]
-            if json_output.endswith("```"):
-                json_output = json_output[:-3]
-            json_output = json_output.strip()
+        json_output = _call_classifier(user_prompt, model, base_url)
         
         # Tentar extrair JSON se houver texto antes/depois
-        import re
         json_match = re.search(r'\{[^{}]*"intent"[^{}]*\}', json_output)
         if json_match:
             json_output = json_match.group(0)
         
-        # Parse JSON
-        try:
-            classification = json.loads(json_output)
-        except json.JSONDecodeError:
-            # Tentar encontrar JSON em qualquer lugar da resposta
-            json_match = re.search(r'\{.*"intent".*\}', json_output, re.DOTALL)
-            if json_match:
-                json_output = json_match.group(0)
-                classification = json.loads(json_output)
-            else:
-                raise json.JSONDecodeError("JSON não encontrado na resposta", json_output, 0)
-        
-        # Validação e normalização
-        intent = classification.get('intent', 'conversation')
-        if intent not in ['execution', 'conversation']:
-            intent = 'conversation'
-        
-        action_type = classification.get('action_type')
-        if intent == 'conversation':
-            action_type = None
-        elif action_type not in ['code', 'web', 'file', 'search', 'general']:
-            action_type = 'general'
-        
-        confidence = classification.get('confidence', 0.8)
-        if not isinstance(confidence, (int, float)) or confidence < 0 or confidence > 1:
-            confidence = 0.8
-        
-        reasoning = classification.get('reasoning', 'Classificação automática')
-        
-        return {
-            "intent": intent,
-            "reasoning": reasoning,
-            "action_type": action_type,
-            "confidence": float(confidence)
-        }
+        classification = _normalize_classification(_extract_json(json_output, r'\{.*"intent".*\}'))
+        classification_cache.set(message, classification, model, base_url)
+        return classification
 
     except json.JSONDecodeError as e:
         logger.error(f"Erro ao decodificar JSON da resposta do LLM: {e}")
-        logger.error(f"Resposta recebida: {json_output[:500] if 'json_output' in locals() else 'N/A'}")
+        logger.error(f"Resposta recebida: {json_output[:500] if json_output else 'N/A'}")
         # Fallback seguro
-        return {
-            "intent": "conversation",
-            "reasoning": "Erro ao decodificar resposta do LLM. Tratando como conversa por segurança.",
-            "action_type": None,
-            "confidence": 0.5
-        }
+        return _fallback_classification("Erro ao decodificar resposta do LLM. Tratando como conversa por segurança.")
     
     except Exception as e:
         logger.error(f"Erro na classificação LLM: {e}")
-        # Em caso de erro, o padrão é tratar como conversa para evitar execuções indesejadas
-        return {
-            "intent": "conversation",
-            "reasoning": f"Erro interno na chamada do LLM: {str(e)}",
-            "action_type": None,
-            "confidence": 0.5
-        }
+        return _fallback_classification(f"Erro interno na chamada do LLM: {str(e)}")
 
 
-def classify_intent_hybrid(message: str, use_llm_threshold: float = 0.7) -> IntentClassification:
+def classify_intents_llm_batch(messages: List[str], model: Optional[str] = None, base_url: Optional[str] = None) -> List[IntentClassification]:
     """
-    Classificação híbrida: usa regras rápidas primeiro, LLM apenas se necessário.
+    Classifica várias mensagens com uma única chamada ao LLM (síncrono).
     
-    Args:
-        message: Mensagem do usuário para classificar
-        use_llm_threshold: Confiança mínima das regras para usar LLM (padrão: 0.7)
+    Mensagens já no cache não vão para o LLM, e mensagens repetidas vão uma vez só.
+    Se a resposta em lote não tiver a classificação de alguma mensagem, ela é classificada sozinha.
     
     Returns:
-        Classificação da intenção
+        Uma classificação por mensagem, na mesma ordem
     """
-    # Detecção rápida baseada em regras
-    lower_message = message.lower().strip()
+    results: List[Optional[IntentClassification]] = [classification_cache.get(message, model, base_url) for message in messages]
     
-    # Padrões de alta confiança para conversa (não precisa de LLM)
-    conversation_patterns = [
-        r'^(oi|olá|hello|hi|hey)\s*$',
-        r'^(tudo bem|tudo bom|como vai|como está)\s*\??$',
-        r'^(obrigado|obrigada|thanks|thank you|valeu)\s*$',
-        r'^(tchau|até logo|bye|see you)\s*$',
-    ]
+    # Mensagens que faltam, sem repetição (pela chave do cache)
+    pending: Dict[str, str] = {}
+    for message, result in zip(messages, results):
+        if result is None:
+            pending.setdefault(normalize_message(message), message)
+    
+    if len(pending) == 1:
+        # Não vale o prompt de lote
+        message = next(iter(pending.values()))
+        classified = {normalize_message(message): classify_intent_llm(message, model, base_url)}
+    elif pending:
+        classified = _classify_batch(list(pending.values()), model, base_url)
+    else:
+        classified = {}
     
-    import re
-    for pattern in conversation_patterns:
-        if re.match(pattern, lower_message):
+    for i, message in enumerate(messages):
+        if results[i] is None:
+            key = normalize_message(message)
+            if key not in classified:
+                classified[key] = classify_intent_llm(message, model, base_url)
+            results[i] = classified[key]
+    return results
+
+
+def _classify_batch(messages: List[str], model: Optional[str], base_url: Optional[str]) -> Dict[str, IntentClassification]:
+    base_url = base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    stats["batch_calls"] += 1
+    
+    try:
+        user_prompt = BATCH_PROMPT.format(messages=json.dumps(messages, ensure_ascii=False))
+        json_output = _call_classifier(user_prompt, model, base_url, num_predict=120 * len(messages))
+        entries = _extract_json(json_output, r'\{.*"results".*\}').get("results", [])
+    except Exception as e:
+        logger.error(f"Erro na classificação LLM em lote: {e}")
+        return {}
+    
+    classified = {}
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            continue
+        index = entry.get("index", position)
+        if not isinstance(index, int) or not 0 <= index < len(messages):
+            continue
+        classification = _normalize_classification(entry)
+        classification_cache.set(messages[index], classification, model, base_url)
+        classified[normalize_message(messages[index])] = classification
+    return classified
+
+
+def classify_intent_rules(message: str) -> Optional[IntentClassification]:
+    """
+    Regras rápidas (regexes pré-compiladas). Retorna None se nenhuma regra decide.
+    """
+    lower_message = message.lower().strip()
+    
+    for pattern in CONVERSATION_PATTERNS:
+        if pattern.match(lower_message):
             return {
                 "intent": "conversation",
                 "reasoning": "Padrão de conversa detectado (regras)",
@@ -285,17 +574,8 @@ def classify_intent_hybrid(message: str, use_llm_threshold: float = 0.7) -> Inte
                 "confidence": 0.95
             }
     
-    # Padrões de alta confiança para execução (não precisa de LLM)
-    execution_patterns = [
-        r'(criar|escrever|fazer|executar|rodar)\s+(script|código|arquivo|programa)',
-        r'(abrir|abre)\s+(aplicativo|programa|arquivo|vs code|code)',
-        r'(instalar|baixar|executar)\s+[^\s]+',
-        r'```[\s\S]*```',  # Código em markdown
-        r'https?://',  # URL
-    ]
-    
-    for pattern in execution_patterns:
-        if re.search(pattern, lower_message):
+    for pattern in EXECUTION_PATTERNS:
+        if pattern.search(lower_message):
             action_type = 'code' if 'código' in lower_message or 'script' in lower_message or '```' in message else 'general'
             if 'http' in lower_message or 'url' in lower_message:
                 action_type = 'web'
@@ -309,10 +589,96 @@ def classify_intent_hybrid(message: str, use_llm_threshold: float = 0.7) -> Inte
                 "confidence": 0.90
             }
     
-    # Casos ambíguos ou complexos: usar LLM
+    return None
+
+
+def classify_intent_hybrid(message: str, use_llm_threshold: float = 0.7) -> IntentClassification:
+    """
+    Classificação híbrida: usa regras rápidas primeiro, LLM apenas se necessário.
+    
+    Args:
+        message: Mensagem do usuário para classificar
+        use_llm_threshold: Confiança mínima das regras para usar LLM (padrão: 0.7)
+    
+    Returns:
+        Classificação da intenção
+    """
+    # Detecção rápida baseada em regras
+    classification = classify_intent_rules(message)
+    if classification:
+        return classification
+    
+    # Casos ambíguos ou complexos: usar LLM (ou o cache)
     return classify_intent_llm(message)
 
 
+async def classify_intents_batch(messages: List[str], model: Optional[str] = None, base_url: Optional[str] = None) -> List[IntentClassification]:
+    """
+    Versão assíncrona e híbrida em lote: regras e cache primeiro, e todas as mensagens
+    ambíguas numa única chamada ao LLM (em uma thread, sem bloquear o event loop).
+    """
+    results = [classify_intent_rules(message) for message in messages]
+    ambiguous = [message for message, result in zip(messages, results) if result is None]
+    
+    if ambiguous:
+        classified = iter(await asyncio.to_thread(classify_intents_llm_batch, ambiguous, model, base_url))
+        results = [result or next(classified) for result in results]
+    return results
+
+
+class IntentBatcher:
+    """
+    Junta as mensagens que chegam quase ao mesmo tempo (de várias tasks) numa única chamada ao LLM.
+    
+    `classify` responde na hora para regras e cache. As outras mensagens esperam até `max_delay`
+    segundos, ou até juntar `max_batch`, e são classificadas juntas.
+    """
+    
+    def __init__(self, max_batch: int = 16, max_delay: float = 0.05, model: Optional[str] = None, base_url: Optional[str] = None):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.model = model
+        self.base_url = base_url
+        self.queue: List[tuple] = []
+        self.timer = None
+    
+    async def classify(self, message: str) -> IntentClassification:
+        classification = classify_intent_rules(message) or classification_cache.get(message, self.model, self.base_url)
+        if classification:
+            return classification
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.queue.append((message, future))
+        
+        if len(self.queue) >= self.max_batch:
+            self._flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_delay, self._flush)
+        
+        return await future
+    
+    def _flush(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.queue = self.queue, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+    
+    async def _run(self, batch: List[tuple]):
+        messages = [message for message, _ in batch]
+        try:
+            results = await asyncio.to_thread(classify_intents_llm_batch, messages, self.model, self.base_url)
+        except Exception as e:
+            logger.error(f"Erro na classificação em lote: {e}")
+            results = [_fallback_classification(f"Erro interno na chamada do LLM: {str(e)}")] * len(batch)
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
 if __name__ == '__main__':
     # Testes de exemplo
     import sys
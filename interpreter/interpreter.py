@@ -1,5 +1,5 @@
 from .cli import cli
-from .utils import merge_deltas, parse_partial_json
+from .utils import merge_deltas, PartialJSONParser, CodeFenceTracker
 from .message_block import MessageBlock
 from .code_block import CodeBlock
 from .code_interpreter import CodeInterpreter
@@ -74,7 +74,7 @@ Press `CTRL-C` to exit.
 
 class Interpreter:
 
-  def __init__(self, auto_run=False, local=False, model=None, debug_mode=False, use_ollama=None):
+  def __init__(self, auto_run=False, local=False, model=None, debug_mode=False, use_ollama=None, workdir=None):
     """
     Inicializa o Interpreter.
     
@@ -84,6 +84,7 @@ class Interpreter:
       model (str): Nome do modelo a usar (padrão: gpt-4 ou modelo do Ollama)
       debug_mode (bool): Se True, imprime informações de debug
       use_ollama (bool): Se True, força uso de Ollama. Se None, detecta automaticamente
+      workdir (str): Diretório onde o código é executado (padrão: diretório atual do processo)
     """
     self.messages = []
     self.temperature = 0.001
@@ -92,6 +93,12 @@ class Interpreter:
     self.local = local  # Parâmetro --local (Code-Llama)
     self.model = model or "gpt-4"
     self.debug_mode = debug_mode
+    self.workdir = workdir
+    # Called with every event of a response (see `emit`), like assistant deltas or code output.
+    # It's called from whatever thread runs chat(), and from the threads reading our REPLs.
+    self.event_handler = None
+    self.cancel_requested = False
+    self.running_code_interpreter = None
     self.use_ollama = False  # Flag para usar Ollama
     self.ollama_adapter = None  # Adaptador Ollama
 
@@ -161,7 +168,7 @@ class Interpreter:
 
     # Add user info
     username = getpass.getuser()
-    current_working_directory = os.getcwd()
+    current_working_directory = self.workdir or os.getcwd()
     operating_system = platform.system()
     
     info += f"\n\n[User Info]\nName: {username}\nCWD: {current_working_directory}\nOS: {operating_system}"
@@ -204,11 +211,43 @@ class Interpreter:
 
   def reset(self):
     self.messages = []
+    # Give the REPL workers back to their pools
+    for code_interpreter in self.code_interpreters.values():
+      code_interpreter.release()
     self.code_interpreters = {}
 
+  def set_workdir(self, workdir):
+    # Code interpreters move their REPLs there before their next run
+    self.workdir = workdir
+    for code_interpreter in self.code_interpreters.values():
+      code_interpreter.workdir = workdir
+
   def load(self, messages):
     self.messages = messages
 
+  def emit(self, event):
+    """
+    Sends an event to `event_handler`, if there is one. Events are dicts with a "type":
+    - delta: a piece of the assistant's message ("content") or of its function call ("arguments")
+    - code_start: the assistant started writing code
+    - code_run: code (with its "language") is about to run
+    - active_line: the line of code running now ("line", None when done)
+    - output: lines of output ("content")
+    - code_end: the code finished running
+    """
+    if self.event_handler:
+      self.event_handler(event)
+
+  def cancel(self):
+    """
+    Stops the response in progress (from another thread): the code running now is interrupted,
+    and we stop reading the LLM at its next chunk instead of going around again.
+    """
+    self.cancel_requested = True
+    code_interpreter = self.running_code_interpreter
+    if code_interpreter:
+      code_interpreter.interrupt()
+
   def chat(self, message=None, return_messages=False):
 
     # Connect to an LLM (an large language model)
@@ -269,6 +308,7 @@ class Interpreter:
     # Check if `message` was passed in by user
     if message:
       # If it was, we respond non-interactivley
+      self.cancel_requested = False
       self.messages.append({"role": "user", "content": message})
       self.respond()
       
@@ -379,15 +419,14 @@ class Interpreter:
     # Make LLM call
     if self.use_ollama and self.ollama_adapter:
       # Ollama (via adaptador)
-      # Ollama não suporta streaming nativo da mesma forma, então vamos fazer uma chamada única
+      # O adaptador converte o stream NDJSON do Ollama em chunks no formato da OpenAI
       try:
-        response_data = self.ollama_adapter.chat_completion(
+        response = self.ollama_adapter.chat_completion(
           messages=messages,
           functions=[function_schema],
           temperature=self.temperature,
+          stream=True,
         )
-        # Simular streaming convertendo resposta única em chunks
-        response = self._ollama_response_to_stream(response_data)
       except Exception as e:
         # Se Ollama falhar e estamos em modo local, levantar erro
         if self.local:
@@ -434,30 +473,44 @@ class Interpreter:
     llama_function_call_finished = False
     self.active_block = None
 
+    # Incremental parsers, so each delta costs O(len(delta)) instead of re-scanning the whole message
+    arguments_parser = PartialJSONParser()
+    fence_tracker = CodeFenceTracker()
+    first_block_closed = False
+
     for chunk in response:
 
+      # Someone called cancel(). Stop reading (closing the stream stops the LLM, too)
+      if self.cancel_requested:
+        if hasattr(response, "close"):
+          response.close()
+        self.end_active_block()
+        return
+
       delta = chunk["choices"][0]["delta"]
 
       # Accumulate deltas into the last message in messages
       self.messages[-1] = merge_deltas(self.messages[-1], delta)
 
+      # Feed the new pieces to the parsers
+      if isinstance(delta.get("content"), str):
+        fence_tracker.feed(delta["content"])
+        self.emit({"type": "delta", "content": delta["content"]})
+      if isinstance(delta.get("function_call"), dict) and isinstance(delta["function_call"].get("arguments"), str):
+        arguments_parser.feed(delta["function_call"]["arguments"])
+        self.emit({"type": "delta", "arguments": delta["function_call"]["arguments"]})
+
       # Check if we're in a function call
       if self.use_ollama:
         # Para Ollama, verificar se há function_call ou código em blocos markdown
-        condition = "function_call" in self.messages[-1] or (
-          "content" in self.messages[-1] and 
-          self.messages[-1]["content"].count("```") % 2 == 1
-        )
+        condition = "function_call" in self.messages[-1] or fence_tracker.in_code_block
       elif not self.local:
         condition = "function_call" in self.messages[-1]
       elif self.local:
         # Since Code-Llama can't call functions, we just check if we're in a code block.
         # This simply returns true if the number of "```" in the message is odd.
-        if "content" in self.messages[-1]:
-          condition = self.messages[-1]["content"].count("```") % 2 == 1
-        else:
-          # If it hasn't made "content" yet, we're certainly not in a function call.
-          condition = False
+        # (If it hasn't made "content" yet, we're certainly not in a function call.)
+        condition = fence_tracker.in_code_block
 
       if condition:
         # We are in a function call.
@@ -476,6 +529,7 @@ class Interpreter:
 
           # then create a new code block
           self.active_block = CodeBlock()
+          self.emit({"type": "code_start"})
 
         # Remember we're in a function_call
         in_function_call = True
@@ -486,17 +540,23 @@ class Interpreter:
           # Ollama: tentar parsear function_call ou código de blocos markdown
           if "function_call" in self.messages[-1] and "arguments" in self.messages[-1]["function_call"]:
             # Já temos function_call do adaptador
-            arguments = self.messages[-1]["function_call"]["arguments"]
-            new_parsed_arguments = parse_partial_json(arguments)
+            new_parsed_arguments = arguments_parser.value
             if new_parsed_arguments:
               self.messages[-1]["function_call"]["parsed_arguments"] = new_parsed_arguments
           elif "content" in self.messages[-1]:
-            # Tentar extrair código de blocos markdown
+            # Tentar extrair código do primeiro bloco markdown (mesmo ainda aberto, para exibir enquanto chega)
+            # Only the first block is run: parse it while it's open and once more when it closes
             content = self.messages[-1]["content"]
-            code_blocks = content.split("```")
-            if len(code_blocks) >= 3:
-              language = code_blocks[1].strip().split("\n")[0] or "python"
-              code = "\n".join(code_blocks[1].strip().split("\n")[1:]).strip("` \n")
+            first_block_open = len(fence_tracker.fences) == 1
+            if first_block_open or (fence_tracker.fences and not first_block_closed):
+              if first_block_open:
+                first_code_block = fence_tracker.current_block(content)
+              else:
+                first_code_block = fence_tracker.block(content, 0)
+                first_block_closed = True
+              language, _, code = first_code_block.strip().partition("\n")
+              language = language or "python"
+              code = code.strip("` \n")
               if code:
                 if "function_call" not in self.messages[-1]:
                   self.messages[-1]["function_call"] = {}
@@ -508,8 +568,7 @@ class Interpreter:
           # gpt-4
           # Parse arguments and save to parsed_arguments, under function_call
           if "arguments" in self.messages[-1]["function_call"]:
-            arguments = self.messages[-1]["function_call"]["arguments"]
-            new_parsed_arguments = parse_partial_json(arguments)
+            new_parsed_arguments = arguments_parser.value
             if new_parsed_arguments:
               # Only overwrite what we have if it's not None (which means it failed to parse)
               self.messages[-1]["function_call"][
@@ -519,14 +578,14 @@ class Interpreter:
           # Code-Llama
           # Parse current code block and save to parsed_arguments, under function_call
           if "content" in self.messages[-1]:
-            current_code_block = self.messages[-1]["content"].split("```")[-1]
+            current_code_block = fence_tracker.current_block(self.messages[-1]["content"])
             
             language = current_code_block.split("\n")[0]
             # Default to python if it just did a "```" then continued writing code
             if language == "" and "\n" in current_code_block:
               language = "python"
 
-            code = current_code_block.split("\n")[1:].strip("` \n")
+            code = "\n".join(current_code_block.split("\n")[1:]).strip("` \n")
             
             arguments = {"language": language, "code": code}
             
@@ -630,15 +689,22 @@ class Interpreter:
           language = self.messages[-1]["function_call"]["parsed_arguments"][
             "language"]
           if language not in self.code_interpreters:
-            self.code_interpreters[language] = CodeInterpreter(language, self.debug_mode)
+            self.code_interpreters[language] = CodeInterpreter(language, self.debug_mode, workdir=self.workdir)
           code_interpreter = self.code_interpreters[language]
 
-          # Let this Code Interpreter control the active_block
+          # Let this Code Interpreter control the active_block (and send us its events)
           code_interpreter.active_block = self.active_block
-          code_interpreter.run()
+          code_interpreter.event_handler = self.emit
+          self.emit({"type": "code_run", "language": language, "code": self.active_block.code})
+          self.running_code_interpreter = code_interpreter
+          try:
+            code_interpreter.run()
+          finally:
+            self.running_code_interpreter = None
 
           # End the active_block
           self.active_block.end()
+          self.emit({"type": "code_end", "language": language})
 
           # Append the output to messages
           # Explicitly tell it if there was no output (sometimes "" = hallucinates output)
@@ -648,7 +714,9 @@ class Interpreter:
             "content": self.active_block.output if self.active_block.output else "No output"
           })
 
-          # Go around again
+          # Go around again (unless we were cancelled while the code ran)
+          if self.cancel_requested:
+            return
           self.respond()
 
         if chunk["choices"][0]["finish_reason"] != "function_call":
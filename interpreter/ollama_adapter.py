@@ -5,11 +5,25 @@ Adapta o Open Interpreter para usar Ollama em vez de OpenAI
 import os
 import json
 import requests
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Iterator, Union
+
+from .utils import CodeFenceTracker
 
 # IMPORTANTE: Usar a mesma URL base que o AutoGen (llm_client.py)
 # OLLAMA_BASE_URL deve ser "http://localhost:11434" (sem /v1 ou /api)
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/").rstrip("/v1").rstrip("/api")
+def normalize_base_url(url: str) -> str:
+    """
+    Remove barra final e sufixos /v1 ou /api
+    (rstrip("/v1") removeria caracteres, não o sufixo: "http://host:11431" viraria "http://host:1143")
+    """
+    url = url.rstrip("/")
+    for suffix in ("/v1", "/api"):
+        if url.endswith(suffix):
+            url = url[:-len(suffix)]
+    return url
+
+
+OLLAMA_BASE_URL = normalize_base_url(os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"))
 DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "qwen2.5:14b")
 
 
@@ -20,9 +34,12 @@ class OllamaAdapter:
     
     def __init__(self, model: str = None, base_url: str = None):
         self.model = model or DEFAULT_MODEL
-        self.base_url = (base_url or OLLAMA_BASE_URL).rstrip('/').rstrip("/v1").rstrip("/api")
+        self.base_url = normalize_base_url(base_url or OLLAMA_BASE_URL)
         self.api_url = f"{self.base_url}/api"
         
+        # Sessão HTTP reutilizada entre chamadas (keep-alive), evita abrir uma conexão TCP por requisição
+        self.session = requests.Session()
+        
         # Log de confirmação (apenas se logging estiver configurado)
         import logging
         logger = logging.getLogger(__name__)
@@ -32,9 +49,14 @@ class OllamaAdapter:
         logger.info(f"   API URL: {self.api_url}")
         logger.info(f"   ✅ Mesma instância que AutoGen (llm_client.py)")
         
-    def chat_completion(self, messages: List[Dict[str, str]], functions: Optional[List[Dict]] = None, **kwargs) -> Dict[str, Any]:
+    def chat_completion(self, messages: List[Dict[str, str]], functions: Optional[List[Dict]] = None, stream: bool = False, **kwargs) -> Union[Dict[str, Any], Iterator[Dict[str, Any]]]:
         """
         Envia mensagens para Ollama e retorna resposta no formato OpenAI
+        
+        Se stream=True, retorna um iterador de chunks no formato de streaming da OpenAI
+        (`{"choices": [{"delta": {...}, "finish_reason": ...}]}`), gerados à medida que
+        os chunks NDJSON do Ollama chegam. A requisição é feita antes de retornar, então
+        erros de conexão são levantados aqui e não durante a iteração.
         """
         try:
             # Preparar mensagens para Ollama
@@ -57,7 +79,7 @@ class OllamaAdapter:
             payload = {
                 "model": self.model,
                 "messages": ollama_messages,
-                "stream": False,
+                "stream": stream,
                 "options": {
                     "temperature": kwargs.get("temperature", 0.7),
                     "top_p": kwargs.get("top_p", 0.9),
@@ -70,16 +92,21 @@ class OllamaAdapter:
                 payload["system"] = system_message
             
             # Fazer requisição para Ollama
-            response = requests.post(
+            response = self.session.post(
                 f"{self.api_url}/chat",
                 json=payload,
-                timeout=kwargs.get("timeout", 120)
+                timeout=kwargs.get("timeout", 120),
+                stream=stream,
             )
             
             if response.status_code != 200:
                 error_msg = response.text or f"HTTP {response.status_code}"
+                response.close()
                 raise Exception(f"Erro ao chamar Ollama: {error_msg}")
             
+            if stream:
+                return self._stream_chunks(response, functions)
+            
             result = response.json()
             
             # Converter resposta do Ollama para formato OpenAI
@@ -115,6 +142,72 @@ class OllamaAdapter:
         except Exception as e:
             raise Exception(f"Erro ao processar resposta do Ollama: {e}")
     
+    def _stream_chunks(self, response, functions: Optional[List[Dict]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Converte o stream NDJSON do Ollama em chunks de streaming no formato OpenAI
+        
+        Os blocos de código markdown são detectados incrementalmente: assim que o primeiro
+        bloco fecha (e há uma função run_code), emitimos um delta de function_call com
+        finish_reason "function_call" e paramos de ler, o que interrompe a geração no Ollama.
+        """
+        has_run_code = any(func.get("name") == "run_code" for func in functions or [])
+        fence_tracker = CodeFenceTracker()
+        content = ""
+        
+        try:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                
+                data = json.loads(line)
+                if data.get("error"):
+                    raise Exception(f"Erro ao chamar Ollama: {data['error']}")
+                
+                delta_content = data.get("message", {}).get("content", "")
+                if delta_content:
+                    delta = {"content": delta_content}
+                    if not content:
+                        # Como na OpenAI, o role vem apenas no primeiro delta
+                        delta["role"] = "assistant"
+                    content += delta_content
+                    fence_tracker.feed(delta_content)
+                    
+                    # Primeiro bloco de código fechado: é hora de executar
+                    # (o function_call vai no mesmo chunk que fecha o bloco)
+                    if has_run_code and len(fence_tracker.fences) >= 2:
+                        function_call = self._code_block_to_function_call(fence_tracker.block(content, 0))
+                        if function_call:
+                            delta["function_call"] = function_call
+                            yield {"choices": [{"delta": delta, "finish_reason": "function_call"}]}
+                            return
+                    
+                    yield {"choices": [{"delta": delta, "finish_reason": None}]}
+            
+            # O chunk com "done": true é o último; ler o stream até o fim devolve a conexão ao pool
+            yield {"choices": [{"delta": {}, "finish_reason": "stop"}]}
+        
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"Erro de conexão com Ollama: {e}")
+        finally:
+            response.close()
+    
+    def _code_block_to_function_call(self, code_block: str) -> Optional[Dict]:
+        """
+        Converte o conteúdo de um bloco markdown (sem as crases) em function call run_code
+        """
+        first_line, newline, code = code_block.partition("\n")
+        code = code.strip()
+        if not newline or not code:
+            return None
+        
+        return {
+            "name": "run_code",
+            "arguments": json.dumps({
+                "language": first_line.strip() or "python",
+                "code": code
+            })
+        }
+    
     def _parse_function_call(self, content: str, functions: List[Dict]) -> Optional[Dict]:
         """
         Tenta parsear código da resposta do Ollama como function call
@@ -148,7 +241,7 @@ class OllamaAdapter:
         Verifica se Ollama está disponível
         """
         try:
-            response = requests.get(f"{self.api_url}/tags", timeout=5)
+            response = self.session.get(f"{self.api_url}/tags", timeout=5)
             return response.status_code == 200
         except:
             return False
@@ -158,7 +251,7 @@ class OllamaAdapter:
         Lista modelos disponíveis no Ollama
         """
         try:
-            response = requests.get(f"{self.api_url}/tags", timeout=5)
+            response = self.session.get(f"{self.api_url}/tags", timeout=5)
             if response.status_code == 200:
                 data = response.json()
                 return [model["name"] for model in data.get("models", [])]
@@ -0,0 +1,153 @@
+from collections import deque
+import itertools
+import tempfile
+import atexit
+import os
+
+# Spill files that haven't been closed yet, deleted at exit at the latest
+spill_paths = set()
+
+
+@atexit.register
+def remove_spill_files():
+  for path in list(spill_paths):
+    try:
+      os.remove(path)
+    except OSError:
+      pass
+  spill_paths.clear()
+
+
+class OutputBuffer:
+  """
+  Collects the output lines of a code execution in bounded memory.
+
+  The first `head_chars` and the last `tail_chars` characters are kept, whatever is in between is dropped.
+  Appending a line is O(1), and `text()` only ever joins at most head_chars + tail_chars.
+
+  If `spill` is True, the full output is also written to a temporary file once it no longer fits,
+  so the caller can still page through all of it with `page()`. It's deleted by `close()`, or at exit.
+
+  Lines are stripped. Blank lines are kept, except at the start and the end of the output.
+  """
+
+  def __init__(self, head_chars=500, tail_chars=1500, spill=True):
+    self.head_chars = head_chars
+    self.tail_chars = tail_chars
+    self.spill = spill
+
+    self.head = []
+    self.head_size = 0
+    self.head_full = False
+    self.tail = deque()
+    self.tail_size = 0
+    self.omitted = 0
+    self.line_count = 0
+
+    self.spill_file = None
+    self._text = ""
+    self._dirty = False
+
+  @property
+  def truncated(self):
+    return self.omitted > 0
+
+  @property
+  def spill_path(self):
+    return self.spill_file.name if self.spill_file else None
+
+  def write(self, text):
+    lines = text.split("\n")
+    # A trailing newline ends the last line, it doesn't start a blank one
+    if lines[-1] == "":
+      lines.pop()
+    for line in lines:
+      self.append(line)
+
+  def append(self, line):
+    line = line.strip()
+    if not line and not self.line_count:
+      return
+
+    self.line_count += 1
+    self._dirty = True
+
+    if self.spill_file:
+      self.spill_file.write(line + "\n")
+
+    if not self.head_full:
+      if self.head_size + len(line) + 1 <= self.head_chars:
+        self.head.append(line)
+        self.head_size += len(line) + 1
+        return
+      self.head_full = True
+
+    self.tail.append(line)
+    self.tail_size += len(line) + 1
+
+    if self.tail_size > self.tail_chars:
+      if self.spill and not self.spill_file:
+        self._start_spilling()
+
+      while self.tail_size > self.tail_chars and len(self.tail) > 1:
+        dropped = self.tail.popleft()
+        self.tail_size -= len(dropped) + 1
+        self.omitted += len(dropped) + 1
+
+      # A single line longer than the whole tail, keep its end
+      if self.tail_size > self.tail_chars:
+        line = self.tail.pop()
+        kept = line[-(self.tail_chars - 1):]
+        self.tail.append(kept)
+        self.omitted += len(line) - len(kept)
+        self.tail_size = len(kept) + 1
+
+  def _start_spilling(self):
+    # Nothing was dropped yet, so everything we still hold is everything so far
+    self.spill_file = tempfile.NamedTemporaryFile(mode="w+", encoding="utf-8", prefix="interpreter-output-", suffix=".txt", delete=False)
+    spill_paths.add(self.spill_file.name)
+    for line in itertools.chain(self.head, self.tail):
+      self.spill_file.write(line + "\n")
+
+  def text(self):
+    if not self._dirty:
+      return self._text
+
+    if not self.truncated:
+      text = "\n".join(itertools.chain(self.head, self.tail)).strip()
+    else:
+      head = "\n".join(self.head).strip()
+      tail = "\n".join(self.tail).strip()
+      message = f"Output truncated. {self.omitted} characters omitted."
+      if self.spill_path:
+        message += f" Full output ({self.line_count} lines) saved to {self.spill_path}"
+      text = "\n\n".join(part for part in (head, message, tail) if part)
+
+    self._text = text
+    self._dirty = False
+    return text
+
+  def page(self, start=0, count=100):
+    """
+    Returns `count` lines of the full output, starting at line `start`.
+    """
+    if not self.spill_file:
+      lines = list(itertools.chain(self.head, self.tail))
+      return lines[start:start + count]
+
+    self.spill_file.flush()
+    with open(self.spill_file.name, encoding="utf-8") as f:
+      return [line.rstrip("\n") for line in itertools.islice(f, start, start + count)]
+
+  def close(self):
+    """
+    Deletes the spill file, if there is one.
+    """
+    if self.spill_file:
+      self.spill_file.close()
+      spill_paths.discard(self.spill_file.name)
+      try:
+        os.remove(self.spill_file.name)
+      except OSError:
+        pass
+      self.spill_file = None
@@ -0,0 +1,343 @@
+import subprocess
+import threading
+import logging
+import time
+import os
+
+from .repl_worker import read_frame, STDERR
+
+logger = logging.getLogger(__name__)
+
+
+def get_rss(pid):
+  """
+  Returns the resident memory of a process in bytes, or None if we can't tell.
+  """
+  try:
+    import psutil
+    return psutil.Process(pid).memory_info().rss
+  except ImportError:
+    pass
+  except Exception:
+    return None
+
+  # No psutil, read it straight from /proc (Linux only)
+  try:
+    with open(f"/proc/{pid}/statm") as f:
+      return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+  except (OSError, ValueError, AttributeError):
+    return None
+
+
+class ReplWorker:
+  """
+  A long-lived REPL subprocess (like `python -i` or `node -i`).
+
+  The worker owns the threads reading its `stdout` and `stderr`,
+  and hands everything to whoever is currently leasing it through `listener`:
+  - Plain REPLs call `listener(line, is_error_stream)` for every line.
+  - Framed REPLs (see repl_worker.py) call `listener(kind, payload)` for every frame.
+    Their own stderr (only used if the worker itself crashes) comes as STDERR frames.
+  """
+
+  def __init__(self, start_cmd, framed=False):
+    args = start_cmd if isinstance(start_cmd, list) else start_cmd.split()
+    self.framed = framed
+    self.proc = subprocess.Popen(args,
+                                 stdin=subprocess.PIPE,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE,
+                                 text=not framed,
+                                 bufsize=0)
+    self.listener = None
+    self.workdir = None
+    self.runs = 0
+    self.last_used = time.monotonic()
+    # Running code right now (never idle then, however long it takes)
+    self.busy = False
+    self.base_rss = None
+
+    if framed:
+      threading.Thread(target=self._read_frames, daemon=True).start()
+    else:
+      threading.Thread(target=self._read_stream, args=(self.proc.stdout, False), daemon=True).start()
+    threading.Thread(target=self._read_stream, args=(self.proc.stderr, True), daemon=True).start()
+
+  def _notify(self, *args):
+    listener = self.listener
+    # Output from a worker nobody is leasing (like a REPL banner) is dropped
+    if listener is None:
+      return
+    try:
+      listener(*args)
+    except BaseException:
+      # A misbehaving listener shouldn't stop us from reading (and the REPL from writing)
+      logger.exception("REPL output listener failed")
+
+  def _read_stream(self, stream, is_error_stream):
+    for line in iter(stream.readline, b'' if self.framed else ''):
+      if self.framed:
+        self._notify(STDERR, line)
+      else:
+        self._notify(line, is_error_stream)
+
+  def _read_frames(self):
+    while True:
+      frame = read_frame(self.proc.stdout)
+      if frame is None:
+        return
+      self._notify(*frame)
+
+  def is_alive(self):
+    return self.proc.poll() is None and not self.proc.stdin.closed
+
+  def rss(self):
+    return get_rss(self.proc.pid)
+
+  def memory_growth(self):
+    """
+    Bytes of memory gained since the worker was first leased.
+    """
+    rss = self.rss()
+    if rss is None or self.base_rss is None:
+      return 0
+    return rss - self.base_rss
+
+  def terminate(self):
+    self.listener = None
+    try:
+      self.proc.stdin.close()
+    except OSError:
+      pass
+    try:
+      self.proc.terminate()
+      self.proc.wait(timeout=1)
+    except subprocess.TimeoutExpired:
+      self.proc.kill()
+    except OSError:
+      pass
+
+
+class ReplPool:
+  """
+  Keeps pre-spawned REPL workers of one language warm, and leases them to sessions.
+
+  - A session keeps its worker (and so its REPL state) until it's released.
+    Released workers are retired, never handed to another session.
+  - `warm_size` spare workers are kept ready, refilled in the background.
+  - A leased worker is recycled when it died, ran `max_runs` times,
+    or grew more than `max_memory_growth` bytes. (0 disables either check.)
+  - Leases that weren't used for `idle_timeout` seconds are evicted. (0 disables it.)
+    A lease is in use from `begin_run` to `end_run`, so running code is never evicted.
+  """
+
+  def __init__(self, language, start_cmd, framed=False, warm_size=1, max_runs=0, max_memory_growth=0, idle_timeout=0, maintenance_interval=5):
+    self.language = language
+    self.start_cmd = start_cmd
+    self.framed = framed
+    self.warm_size = warm_size
+    self.max_runs = max_runs
+    self.max_memory_growth = max_memory_growth
+    self.idle_timeout = idle_timeout
+    self.maintenance_interval = maintenance_interval
+
+    self.spares = []
+    self.leases = {}
+    self.lock = threading.Lock()
+    self.closed = False
+
+    self.stats = {
+      "acquires": 0,
+      "warm_acquires": 0,
+      "acquire_latency_total": 0.0,
+      "acquire_latency_max": 0.0,
+      "spawn_count": 0,
+      "recycle_count": 0,
+      "idle_evictions": 0,
+    }
+
+    self._wake = threading.Event()
+    threading.Thread(target=self._maintain, daemon=True).start()
+
+  def spawn(self):
+    worker = ReplWorker(self.start_cmd, self.framed)
+    with self.lock:
+      self.stats["spawn_count"] += 1
+    return worker
+
+  def acquire(self, session_id):
+    """
+    Returns the worker leased to `session_id`, leasing a warm one if it has none (or it needed recycling).
+    """
+    start = time.monotonic()
+    warm = True
+
+    with self.lock:
+      worker = self.leases.get(session_id)
+      if worker is not None and not self._needs_recycling(worker):
+        worker.last_used = time.monotonic()
+        return worker
+
+      if worker is not None:
+        del self.leases[session_id]
+        self.stats["recycle_count"] += 1
+      retired = worker
+
+      worker = None
+      while self.spares:
+        spare = self.spares.pop()
+        if spare.is_alive():
+          worker = spare
+          break
+        spare.terminate()
+
+    if retired is not None:
+      retired.terminate()
+
+    if worker is None:
+      # Pool ran dry, pay for a cold start
+      warm = False
+      worker = self.spawn()
+
+    worker.last_used = time.monotonic()
+    worker.base_rss = worker.rss()
+
+    with self.lock:
+      self.leases[session_id] = worker
+      latency = time.monotonic() - start
+      self.stats["acquires"] += 1
+      self.stats["warm_acquires"] += warm
+      self.stats["acquire_latency_total"] += latency
+      self.stats["acquire_latency_max"] = max(self.stats["acquire_latency_max"], latency)
+
+    # Refill the spares we just used
+    self._wake.set()
+    return worker
+
+  def release(self, session_id):
+    """
+    Ends the session's lease. Its worker holds that session's state, so it's retired.
+    """
+    with self.lock:
+      worker = self.leases.pop(session_id, None)
+    if worker is not None:
+      worker.terminate()
+    self._wake.set()
+
+  def retire(self, session_id):
+    """
+    Forces the session's worker to be replaced on its next `acquire` (e.g. after a broken pipe).
+    """
+    with self.lock:
+      worker = self.leases.pop(session_id, None)
+      if worker is not None:
+        self.stats["recycle_count"] += 1
+    if worker is not None:
+      worker.terminate()
+
+  def begin_run(self, worker):
+    """
+    Marks the worker busy while it runs code, so it isn't evicted as idle.
+    """
+    with self.lock:
+      worker.busy = True
+      worker.last_used = time.monotonic()
+
+  def end_run(self, worker):
+    with self.lock:
+      worker.busy = False
+      worker.last_used = time.monotonic()
+
+  def _needs_recycling(self, worker):
+    if not worker.is_alive():
+      return True
+    if self.max_runs and worker.runs >= self.max_runs:
+      return True
+    if self.max_memory_growth and worker.memory_growth() > self.max_memory_growth:
+      return True
+    return False
+
+  def _maintain(self):
+    while not self.closed:
+      # Evict leases nobody used in a while
+      if self.idle_timeout:
+        now = time.monotonic()
+        with self.lock:
+          idle = [session_id for session_id, worker in self.leases.items()
+                  if not worker.busy and now - worker.last_used > self.idle_timeout]
+          evicted = [self.leases.pop(session_id) for session_id in idle]
+          self.stats["idle_evictions"] += len(evicted)
+        for worker in evicted:
+          worker.terminate()
+
+      # Drop dead spares, then top up to warm_size
+      with self.lock:
+        dead = [worker for worker in self.spares if not worker.is_alive()]
+        self.spares = [worker for worker in self.spares if worker.is_alive()]
+        missing = self.warm_size - len(self.spares)
+      for worker in dead:
+        worker.terminate()
+
+      for _ in range(max(missing, 0)):
+        try:
+          worker = self.spawn()
+        except Exception:
+          # Like if they don't have `node` installed. Sessions will see the error on a cold start.
+          logger.exception(f"Could not pre-spawn a {self.language} REPL")
+          break
+        with self.lock:
+          if self.closed:
+            worker.terminate()
+            break
+          self.spares.append(worker)
+
+      self._wake.wait(self.maintenance_interval)
+      self._wake.clear()
+
+  def metrics(self):
+    with self.lock:
+      metrics = dict(self.stats)
+      metrics["spares"] = len(self.spares)
+      metrics["leases"] = len(self.leases)
+    acquires = metrics["acquires"]
+    metrics["acquire_latency_avg"] = metrics["acquire_latency_total"] / acquires if acquires else 0.0
+    return metrics
+
+  def close(self):
+    with self.lock:
+      self.closed = True
+      workers = self.spares + list(self.leases.values())
+      self.spares = []
+      self.leases = {}
+    self._wake.set()
+    for worker in workers:
+      worker.terminate()
+
+
+# One pool per language, shared by every CodeInterpreter in this process
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(language, start_cmd, framed=False):
+  with pools_lock:
+    if language not in pools:
+      pools[language] = ReplPool(
+        language,
+        start_cmd,
+        framed=framed,
+        warm_size=int(os.getenv("INTERPRETER_POOL_WARM_SIZE", "1")),
+        max_runs=int(os.getenv("INTERPRETER_POOL_MAX_RUNS", "0")),
+        max_memory_growth=int(os.getenv("INTERPRETER_POOL_MAX_MEMORY_GROWTH_MB", "0")) * 1024 * 1024,
+        idle_timeout=float(os.getenv("INTERPRETER_POOL_IDLE_TIMEOUT", "1800")),
+      )
+    return pools[language]
+
+
+def pool_metrics():
+  """
+  Metrics (acquire latency, spawn count, etc.) for every pool, by language.
+  """
+  with pools_lock:
+    current = dict(pools)
+  return {language: pool.metrics() for language, pool in current.items()}
@@ -0,0 +1,257 @@
+"""
+Python REPL worker that speaks a framed protocol with the host (CodeInterpreter).
+
+Every message is a frame: 1 byte kind, 4 bytes big-endian payload length, then the payload.
+The host sends EXECUTE frames on the worker's stdin. The worker answers on its stdout
+with BEGIN, ACTIVE_LINE, STDOUT, STDERR and END frames. Anything the executed code writes
+to file descriptors 1 and 2 (prints, tracebacks, subprocesses) is captured through pipes and framed,
+so END is only sent once all of the execution's output went out before it.
+
+This file is run directly as a script (not imported from the package) by the REPL pool,
+so it must not import anything from `interpreter`.
+"""
+import traceback
+import threading
+import signal
+import struct
+import json
+import uuid
+import time
+import sys
+import os
+
+EXECUTE = b"X"
+BEGIN = b"B"
+ACTIVE_LINE = b"L"
+STDOUT = b"O"
+STDERR = b"R"
+END = b"E"
+
+HEADER = struct.Struct(">cI")
+
+# Filename we compile the code with, so the tracer can tell its lines from library code
+FILENAME = "<interpreter>"
+
+# Don't flood the host with active lines from tight loops
+ACTIVE_LINE_INTERVAL = 0.02
+
+
+def encode_frame(kind, payload):
+  if isinstance(payload, str):
+    payload = payload.encode("utf-8")
+  return HEADER.pack(kind, len(payload)) + payload
+
+
+def read_exactly(stream, size):
+  data = b""
+  while len(data) < size:
+    chunk = stream.read(size - len(data))
+    if not chunk:
+      return None
+    data += chunk
+  return data
+
+
+def read_frame(stream):
+  """
+  Reads one frame from a binary stream. Returns (kind, payload), or None at EOF.
+  """
+  header = read_exactly(stream, HEADER.size)
+  if header is None:
+    return None
+  kind, size = HEADER.unpack(header)
+  payload = read_exactly(stream, size) if size else b""
+  if payload is None:
+    return None
+  return kind, payload
+
+
+class FrameWriter:
+  """
+  Writes frames to a file descriptor. Shared by the main thread and the output pumps.
+  """
+
+  def __init__(self, fd):
+    self.fd = fd
+    self.lock = threading.Lock()
+
+  def send(self, kind, payload=b""):
+    data = encode_frame(kind, payload)
+    with self.lock:
+      while data:
+        written = os.write(self.fd, data)
+        data = data[written:]
+
+
+class OutputPump(threading.Thread):
+  """
+  Replaces a file descriptor (1 or 2) with a pipe, and turns whatever is written to it into frames.
+
+  `drain` writes a unique marker through the pipe and waits for it to come out the other end,
+  which tells us everything written before it has been framed.
+  """
+
+  def __init__(self, fd, kind, writer):
+    super().__init__(daemon=True)
+    self.fd = fd
+    self.kind = kind
+    self.writer = writer
+    self.marker = b"\x00DRAIN-" + uuid.uuid4().hex.encode() + b"\x00"
+    self.drained = threading.Event()
+
+    read_fd, write_fd = os.pipe()
+    os.dup2(write_fd, fd)
+    os.close(write_fd)
+    self.read_fd = read_fd
+
+  def run(self):
+    buffer = b""
+    while True:
+      data = os.read(self.read_fd, 65536)
+      if not data:
+        break
+      buffer += data
+
+      while True:
+        index = buffer.find(self.marker)
+        if index == -1:
+          break
+        if index:
+          self.writer.send(self.kind, buffer[:index])
+        buffer = buffer[index + len(self.marker):]
+        self.drained.set()
+
+      # Hold back only what could be the start of a marker
+      keep = 0
+      start = buffer.rfind(b"\x00", max(0, len(buffer) - len(self.marker)))
+      if start != -1 and self.marker.startswith(buffer[start:]):
+        keep = len(buffer) - start
+      if len(buffer) > keep:
+        self.writer.send(self.kind, buffer[:len(buffer) - keep])
+        buffer = buffer[len(buffer) - keep:]
+
+  def drain(self):
+    self.drained.clear()
+    os.write(self.fd, self.marker)
+    self.drained.wait()
+
+
+class Worker:
+
+  def __init__(self):
+    # Keep the real stdin / stdout for frames, then point fds 0, 1 and 2 elsewhere
+    self.requests = os.fdopen(os.dup(0), "rb", buffering=0)
+    self.writer = FrameWriter(os.dup(1))
+
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+
+    self.pumps = [OutputPump(1, STDOUT, self.writer), OutputPump(2, STDERR, self.writer)]
+    for pump in self.pumps:
+      pump.start()
+
+    self.namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+    self.last_line = None
+    self.last_line_time = 0
+
+  def trace(self, frame, event, arg):
+    # Only trace code that came from the host, not the libraries it calls
+    if frame.f_code.co_filename != FILENAME:
+      return None
+    return self.trace_lines
+
+  def trace_lines(self, frame, event, arg):
+    if event == "line" and frame.f_lineno != self.last_line:
+      now = time.monotonic()
+      if now - self.last_line_time >= ACTIVE_LINE_INTERVAL:
+        self.last_line = frame.f_lineno
+        self.last_line_time = now
+        self.writer.send(ACTIVE_LINE, str(frame.f_lineno))
+    return self.trace_lines
+
+  def execute(self, request):
+    self.writer.send(BEGIN, json.dumps({"id": request["id"]}))
+    self.last_line = None
+    self.last_line_time = 0
+    status = "ok"
+
+    try:
+      try:
+        # Sent the first time a session uses this worker
+        if request.get("cwd"):
+          os.chdir(request["cwd"])
+        code = compile(request["code"], FILENAME, "exec")
+        sys.settrace(self.trace)
+        try:
+          exec(code, self.namespace)
+        finally:
+          sys.settrace(None)
+      except KeyboardInterrupt:
+        status = "interrupted"
+        print_exception()
+      except BaseException:
+        # Including SystemExit, which would otherwise take the whole worker down
+        status = "error"
+        print_exception()
+    except KeyboardInterrupt:
+      # Another CTRL-C while printing the traceback
+      status = "interrupted"
+    finally:
+      self.finish(request["id"], status)
+
+  def finish(self, id, status):
+    """
+    Sends END once every byte written to stdout / stderr has been framed.
+
+    The host waits for END, so from here on a CTRL-C only marks the execution as interrupted.
+    """
+    self.late_interrupt = False
+    while True:
+      try:
+        signal.signal(signal.SIGINT, self.on_late_interrupt)
+        break
+      except KeyboardInterrupt:
+        status = "interrupted"
+
+    try:
+      sys.stdout.flush()
+      sys.stderr.flush()
+      for pump in self.pumps:
+        pump.drain()
+
+      if self.late_interrupt:
+        status = "interrupted"
+      self.writer.send(END, json.dumps({"id": id, "status": status}))
+    finally:
+      signal.signal(signal.SIGINT, signal.default_int_handler)
+
+  def on_late_interrupt(self, signum, frame):
+    self.late_interrupt = True
+
+  def serve(self):
+    while True:
+      try:
+        frame = read_frame(self.requests)
+        if frame is None:
+          return
+        kind, payload = frame
+        if kind == EXECUTE:
+          self.execute(json.loads(payload))
+      except KeyboardInterrupt:
+        # CTRL-C while idle (the whole process group gets it), nothing to interrupt
+        continue
+
+
+def print_exception():
+  """
+  Prints the current exception without the worker's own frames.
+  """
+  exc_type, exc_value, tb = sys.exc_info()
+  while tb is not None and tb.tb_frame.f_code.co_filename != FILENAME:
+    tb = tb.tb_next
+  traceback.print_exception(exc_type, exc_value, tb)
+
+
+if __name__ == "__main__":
+  Worker().serve()
@@ -5,20 +5,139 @@ Servidor WebSocket para usar o Open Interpreter de forma programática
 import asyncio
 import json
 import os
+import re
+import time
+import uuid
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional
 from websockets.server import serve
 from websockets.exceptions import ConnectionClosed
 import threading
 
 from .interpreter import Interpreter
+from .code_interpreter import warm_up
+from .repl_pool import pool_metrics
 
 logger = logging.getLogger(__name__)
 
+
+class ServerBusy(Exception):
+    """
+    Todas as vagas de execução e da fila estão ocupadas
+    """
+
+
+class InterpreterSession:
+    """
+    Sessão isolada: um Interpreter próprio (histórico, modelo, REPLs) e um diretório de trabalho próprio.
+    
+    Mensagens de uma mesma sessão são executadas uma de cada vez (`lock`),
+    sessões diferentes rodam em paralelo.
+    """
+    
+    def __init__(self, session_id: str, interpreter: Interpreter, workdir: Optional[str], implicit: bool):
+        self.session_id = session_id
+        self.interpreter = interpreter
+        self.workdir = workdir
+        # Sessões implícitas (sem session_id do cliente) pertencem a uma única conexão
+        self.implicit = implicit
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        # Execuções em andamento ou na fila
+        self.busy = 0
+        self.connections = 0
+        self.closed = False
+    
+    def is_idle(self, idle_timeout: float) -> bool:
+        if self.busy:
+            return False
+        if self.implicit and not self.connections:
+            return True
+        return bool(idle_timeout) and time.monotonic() - self.last_used > idle_timeout
+
+
+class EventStream:
+    """
+    Encaminha os eventos do Interpreter (emitidos na thread do escalonador) para o WebSocket,
+    na ordem e com número de sequência (`seq`).
+    
+    Quando o cliente lê mais devagar do que os eventos chegam, eventos seguidos do mesmo tipo
+    (deltas, output) são agrupados num frame só, então a fila não cresce com o número de tokens.
+    """
+    
+    # Tipos de evento que podem ser agrupados, e o campo que é concatenado
+    mergeable = {"delta": "", "output": "\n"}
+    
+    def __init__(self, websocket, session: InterpreterSession, request_id: Optional[str] = None):
+        self.websocket = websocket
+        self.session = session
+        self.request_id = request_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.seq = 0
+        self.closed = False
+        self.task = asyncio.create_task(self._pump())
+    
+    def push(self, event: Dict[str, Any]):
+        """
+        Enfileira um evento (pode ser chamado de qualquer thread)
+        """
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+    
+    async def send(self, frame: Dict[str, Any]):
+        if self.closed:
+            return
+        self.seq += 1
+        frame = {**frame, "seq": self.seq, "session_id": self.session.session_id}
+        if self.request_id is not None:
+            frame["request_id"] = self.request_id
+        try:
+            await self.websocket.send(json.dumps(frame))
+        except ConnectionClosed:
+            # Ninguém mais vai ler o resultado: parar a execução
+            self.closed = True
+            self.session.interpreter.cancel()
+    
+    async def _pump(self):
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            
+            for frame in self._merge(batch):
+                if frame is None:
+                    return
+                await self.send(frame)
+    
+    def _merge(self, batch):
+        merged = []
+        for event in batch:
+            if merged and event is not None and merged[-1] is not None:
+                last = merged[-1]
+                separator = self.mergeable.get(event["type"])
+                if separator is not None and last["type"] == event["type"] and last.keys() == event.keys():
+                    merged[-1] = dict(last, **{key: last[key] + separator + event[key] for key in event if key != "type"})
+                    continue
+            merged.append(event)
+        return merged
+    
+    async def close(self, frame: Dict[str, Any]):
+        """
+        Envia o que ainda está na fila e, por último, `frame`
+        """
+        self.push(None)
+        await self.task
+        await self.send(frame)
+
+
 class OpenInterpreterServer:
     """
     Servidor WebSocket para Open Interpreter
     Permite comunicação assíncrona com o Interpreter
+    
+    Cada cliente (ou cada session_id) tem sua própria sessão, e as sessões rodam em paralelo
+    até `max_concurrent_sessions`. O resto espera numa fila limitada.
     """
     
     def __init__(
@@ -31,6 +150,9 @@ class OpenInterpreterServer:
         debug_mode: bool = False,
         use_ollama: bool = True,
         workdir: Optional[str] = None,
+        max_concurrent_sessions: int = 4,
+        max_queued: int = 16,
+        session_idle_timeout: float = 1800,
     ):
         """
         Inicializa o servidor WebSocket
@@ -43,7 +165,10 @@ class OpenInterpreterServer:
             model: Modelo a usar (padrão: do ambiente)
             debug_mode: Modo debug
             use_ollama: Usar Ollama
-            workdir: Diretório de trabalho (sandbox)
+            workdir: Diretório de trabalho (sandbox). Cada sessão ganha um subdiretório próprio
+            max_concurrent_sessions: Máximo de sessões executando ao mesmo tempo
+            max_queued: Máximo de execuções esperando vaga (além disso o cliente recebe "busy")
+            session_idle_timeout: Segundos sem uso até a sessão ser encerrada (0 desativa)
         """
         self.host = host
         self.port = port
@@ -52,54 +177,241 @@ class OpenInterpreterServer:
         self.model = model or os.getenv("DEFAULT_MODEL", "deepseek-coder-v2-16b-q4_k_m-rtx")
         self.debug_mode = debug_mode
         self.use_ollama = use_ollama
-        self.workdir = workdir
+        self.workdir = os.path.abspath(workdir) if workdir else None
+        self.max_concurrent_sessions = max_concurrent_sessions
+        self.max_queued = max_queued
+        self.session_idle_timeout = session_idle_timeout
         
         # Criar diretório de trabalho se não existir
+        # (sem os.chdir: o cwd do processo é global, cada sessão passa o seu para os REPLs)
         if self.workdir:
             os.makedirs(self.workdir, exist_ok=True)
-            # Mudar para o diretório de trabalho
-            os.chdir(self.workdir)
             logger.info(f"Diretório de trabalho: {self.workdir}")
         
-        # Criar instância do Interpreter
-        self.interpreter = Interpreter(
-            auto_run=self.auto_run,
-            local=self.local,
-            model=self.model,
-            debug_mode=self.debug_mode,
-            use_ollama=self.use_ollama,
-        )
+        # Sessões por session_id, criadas sob demanda
+        self.sessions: Dict[str, InterpreterSession] = {}
+        self.sessions_lock = asyncio.Lock()
+        
+        # Escalonador: uma thread por vaga, execuções além disso esperam na fila
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent_sessions, thread_name_prefix="interpreter-session")
+        self.slots = asyncio.Semaphore(max_concurrent_sessions)
+        self.pending = 0
+        self.running = 0
         
-        logger.info(f"Open Interpreter Server inicializado: {host}:{port}, model={self.model}, auto_run={auto_run}, local={local}, workdir={workdir}")
+        # Pré-aquecer REPLs, para a primeira execução não pagar o tempo de inicialização
+        warm_up(["python", "shell"])
+        
+        logger.info(f"Open Interpreter Server inicializado: {host}:{port}, model={self.model}, auto_run={auto_run}, local={local}, workdir={workdir}, max_concurrent_sessions={max_concurrent_sessions}")
     
-    async def handle_client(self, websocket, path):
+    async def handle_client(self, websocket, path=None):
         """
         Manipula conexão de cliente WebSocket
+        
+        Cada mensagem é processada em uma task, então uma conexão pode usar várias sessões
+        (campo "session_id") em paralelo. Sem session_id, a conexão tem uma sessão só sua.
         """
         logger.info(f"Cliente conectado: {websocket.remote_address}")
+        connection_id = uuid.uuid4().hex
+        used_sessions = set()
+        tasks = set()
         
         try:
             async for message in websocket:
                 try:
                     data = json.loads(message)
-                    await self.process_message(websocket, data)
                 except json.JSONDecodeError:
                     await websocket.send(json.dumps({
                         "type": "error",
                         "error": "Mensagem JSON inválida"
                     }))
-                except Exception as e:
-                    logger.error(f"Erro ao processar mensagem: {e}")
-                    await websocket.send(json.dumps({
-                        "type": "error",
-                        "error": str(e)
-                    }))
+                    continue
+                
+                session_id = data.get("session_id") or connection_id
+                if session_id not in used_sessions:
+                    used_sessions.add(session_id)
+                    self._connect_session(session_id)
+                
+                task = asyncio.create_task(self._handle_message(websocket, data, session_id, session_id == connection_id))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
         except ConnectionClosed:
             logger.info(f"Cliente desconectado: {websocket.remote_address}")
         except Exception as e:
             logger.error(f"Erro na conexão: {e}")
+        finally:
+            # Sessões implícitas desta conexão são encerradas assim que ficarem ociosas
+            for session_id in used_sessions:
+                self._disconnect_session(session_id)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            await self._reap_idle_sessions()
     
-    async def process_message(self, websocket, data: Dict[str, Any]):
+    async def _handle_message(self, websocket, data: Dict[str, Any], session_id: str, implicit: bool):
+        try:
+            await self.process_message(websocket, data, session_id=session_id, implicit=implicit)
+        except ConnectionClosed:
+            pass
+        except ServerBusy as e:
+            await self._send_safely(websocket, {
+                "type": "busy",
+                "session_id": session_id,
+                "error": str(e),
+                "queued": self.pending - self.running,
+            })
+        except Exception as e:
+            logger.error(f"Erro ao processar mensagem: {e}")
+            await self._send_safely(websocket, {
+                "type": "error",
+                "session_id": session_id,
+                "error": str(e)
+            })
+    
+    async def _send_safely(self, websocket, payload: Dict[str, Any]):
+        try:
+            await websocket.send(json.dumps(payload))
+        except ConnectionClosed:
+            pass
+    
+    def _connect_session(self, session_id: str):
+        session = self.sessions.get(session_id)
+        if session:
+            session.connections += 1
+    
+    def _disconnect_session(self, session_id: str):
+        session = self.sessions.get(session_id)
+        if session and session.connections:
+            session.connections -= 1
+    
+    def _session_workdir(self, session_id: str, requested: Optional[str] = None) -> Optional[str]:
+        """
+        Diretório de trabalho de uma sessão: o pedido pelo cliente (se existir),
+        senão um subdiretório do workdir do servidor com o nome da sessão
+        """
+        if requested and os.path.isdir(requested):
+            return os.path.abspath(requested)
+        if not self.workdir:
+            return None
+        # O session_id vem do cliente, não pode escapar do workdir
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", session_id).lstrip(".")[:64] or "session"
+        workdir = os.path.join(self.workdir, name)
+        os.makedirs(workdir, exist_ok=True)
+        return workdir
+    
+    def _create_interpreter(self, workdir: Optional[str], model: Optional[str] = None) -> Interpreter:
+        return Interpreter(
+            auto_run=self.auto_run,
+            local=self.local,
+            model=model or self.model,
+            debug_mode=self.debug_mode,
+            use_ollama=self.use_ollama,
+            workdir=workdir,
+        )
+    
+    async def get_session(self, session_id: str, implicit: bool = False, workdir: Optional[str] = None) -> InterpreterSession:
+        """
+        Retorna a sessão, criando se ainda não existe
+        """
+        session = self.sessions.get(session_id)
+        if session:
+            return session
+        
+        async with self.sessions_lock:
+            session = self.sessions.get(session_id)
+            if session:
+                return session
+            
+            # O Interpreter verifica a conexão com o Ollama ao ser criado, fora do event loop
+            loop = asyncio.get_running_loop()
+            session_workdir = self._session_workdir(session_id, workdir)
+            interpreter = await loop.run_in_executor(None, self._create_interpreter, session_workdir)
+            
+            session = InterpreterSession(session_id, interpreter, session_workdir, implicit)
+            session.connections = 1
+            self.sessions[session_id] = session
+            logger.info(f"Sessão criada: {session_id} (workdir={session_workdir})")
+            return session
+    
+    async def run_in_session(self, session: InterpreterSession, func, *args):
+        """
+        Executa `func` numa thread do escalonador.
+        
+        Uma execução por sessão por vez, no máximo `max_concurrent_sessions` ao mesmo tempo,
+        e no máximo `max_queued` esperando vaga. Além disso levanta ServerBusy.
+        """
+        if session.closed:
+            raise RuntimeError(f"Sessão encerrada: {session.session_id}")
+        if self.pending >= self.max_concurrent_sessions + self.max_queued:
+            raise ServerBusy(f"Servidor ocupado: {self.running} execuções em andamento e {self.pending - self.running} na fila")
+        
+        self.pending += 1
+        session.busy += 1
+        try:
+            async with session.lock:
+                async with self.slots:
+                    self.running += 1
+                    session.last_used = time.monotonic()
+                    try:
+                        loop = asyncio.get_running_loop()
+                        return await loop.run_in_executor(self.executor, func, *args)
+                    finally:
+                        self.running -= 1
+        finally:
+            self.pending -= 1
+            session.busy -= 1
+            session.last_used = time.monotonic()
+    
+    async def close_session(self, session_id: str, only_if_idle: bool = False) -> bool:
+        """
+        Encerra a sessão e libera seus REPLs
+        
+        Uma sessão com execuções em andamento ou na fila não é encerrada: levanta ServerBusy
+        (com `only_if_idle`, que só encerra sessões ociosas, retorna False).
+        """
+        session = self.sessions.get(session_id)
+        if not session:
+            return False
+        if only_if_idle and not session.is_idle(self.session_idle_timeout):
+            return False
+        if session.busy:
+            raise ServerBusy(f"Sessão ocupada: {session.busy} execuções em andamento ou na fila")
+        
+        # Sem await entre a verificação e aqui: nenhuma execução começa nesta sessão depois disso
+        session.closed = True
+        del self.sessions[session_id]
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, session.interpreter.reset)
+        logger.info(f"Sessão encerrada: {session_id}")
+        return True
+    
+    async def _reap_idle_sessions(self):
+        idle = [session_id for session_id, session in list(self.sessions.items())
+                if session.is_idle(self.session_idle_timeout)]
+        for session_id in idle:
+            # Pode ter recebido uma mensagem enquanto outra sessão era encerrada
+            await self.close_session(session_id, only_if_idle=True)
+    
+    async def _reaper(self, interval: float = 30):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._reap_idle_sessions()
+            except Exception as e:
+                logger.error(f"Erro ao encerrar sessões ociosas: {e}")
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Sessões, execuções em andamento / na fila, e métricas dos pools de REPL
+        """
+        return {
+            "sessions": len(self.sessions),
+            "running": self.running,
+            "queued": self.pending - self.running,
+            "max_concurrent_sessions": self.max_concurrent_sessions,
+            "max_queued": self.max_queued,
+            "pools": pool_metrics(),
+        }
+    
+    async def process_message(self, websocket, data: Dict[str, Any], session_id: Optional[str] = None, implicit: bool = False):
         """
         Processa mensagem do cliente
         
@@ -107,28 +419,44 @@ class OpenInterpreterServer:
         """
         message_type = data.get("type", "message")
         
+        if message_type == "get_stats":
+            await websocket.send(json.dumps({
+                "type": "stats",
+                **self.stats(),
+            }))
+            return
+        
+        session_id = session_id or data.get("session_id") or uuid.uuid4().hex
+        session = await self.get_session(session_id, implicit=implicit, workdir=data.get("workdir"))
+        interpreter = session.interpreter
+        
         if message_type == "chat" or message_type == "prompt":
             # Enviar mensagem/prompt para o Interpreter
             # O Open Interpreter vai pensar e executar localmente usando seu modelo interno
             user_message = data.get("message") or data.get("prompt", "")
-            temperature = data.get("temperature", self.interpreter.temperature)
+            temperature = data.get("temperature", interpreter.temperature)
             max_tokens = data.get("max_tokens")
-            workdir = data.get("workdir") or self.workdir  # Usar workdir da mensagem ou do servidor
+            workdir = data.get("workdir")  # Usar workdir da mensagem ou o da sessão
+            
+            if data.get("stream"):
+                await self._stream_chat(websocket, session, data, user_message, temperature, workdir)
+                return
             
             # Enviar confirmação
             await websocket.send(json.dumps({
                 "type": "status",
                 "status": "processing",
+                "session_id": session.session_id,
                 "message": f"Open Interpreter pensando e executando: {user_message[:50]}...",
-                "model": self.model,
+                "model": interpreter.model,
             }))
             
-            # Processar mensagem (em thread separada para não bloquear)
+            # Processar mensagem (em thread do escalonador para não bloquear)
             # O Open Interpreter usa seu modelo interno para pensar e executar
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,
+            result = await self.run_in_session(
+                session,
                 self._process_chat,
+                session,
                 user_message,
                 temperature,
                 workdir
@@ -137,6 +465,7 @@ class OpenInterpreterServer:
             # Enviar resultado completo (resposta + output)
             await websocket.send(json.dumps({
                 "type": "response",
+                "session_id": session.session_id,
                 "response": result.get("response", ""),
                 "output": result.get("output", ""),
                 "code_executed": result.get("code_executed", ""),
@@ -148,7 +477,8 @@ class OpenInterpreterServer:
             # Enviar sinal de conclusão
             await websocket.send(json.dumps({
                 "type": "done",
-                "status": "completed",
+                "session_id": session.session_id,
+                "status": result.get("status", "completed"),
             }))
         
         elif message_type == "execute_code":
@@ -159,30 +489,33 @@ class OpenInterpreterServer:
             await websocket.send(json.dumps({
                 "type": "status",
                 "status": "executing",
+                "session_id": session.session_id,
                 "message": f"Executando código {language}..."
             }))
             
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,
+            result = await self.run_in_session(
+                session,
                 self._execute_code,
+                session,
                 code,
                 language
             )
             
             await websocket.send(json.dumps({
                 "type": "code_result",
+                "session_id": session.session_id,
                 "success": result.get("success", False),
                 "output": result.get("output", ""),
                 "error": result.get("error"),
             }))
         
         elif message_type == "reset":
-            # Resetar estado do Interpreter
-            self.interpreter.reset()
+            # Resetar estado do Interpreter da sessão (depois do que já está na fila dela)
+            await self.run_in_session(session, interpreter.reset)
             await websocket.send(json.dumps({
                 "type": "status",
                 "status": "reset",
+                "session_id": session.session_id,
                 "message": "Estado resetado"
             }))
         
@@ -190,76 +523,147 @@ class OpenInterpreterServer:
             # Retornar modelo atual
             await websocket.send(json.dumps({
                 "type": "model_info",
-                "model": self.interpreter.model,
-                "use_ollama": self.interpreter.use_ollama,
-                "local": self.interpreter.local,
+                "session_id": session.session_id,
+                "model": interpreter.model,
+                "use_ollama": interpreter.use_ollama,
+                "local": interpreter.local,
             }))
         
         elif message_type == "set_model":
-            # Alterar modelo (reinicializar interpreter)
+            # Alterar modelo (reinicializar o interpreter da sessão)
             new_model = data.get("model")
             if new_model:
-                self.model = new_model
-                self.interpreter = Interpreter(
-                    auto_run=self.auto_run,
-                    local=self.local,
-                    model=self.model,
-                    debug_mode=self.debug_mode,
-                    use_ollama=self.use_ollama,
-                )
+                await self.run_in_session(session, self._set_model, session, new_model)
                 await websocket.send(json.dumps({
                     "type": "status",
                     "status": "model_changed",
-                    "model": self.model,
+                    "session_id": session.session_id,
+                    "model": new_model,
                 }))
         
+        elif message_type == "cancel":
+            # Interromper a execução em andamento da sessão (o stream termina com status "cancelled")
+            interpreter.cancel()
+            await websocket.send(json.dumps({
+                "type": "status",
+                "status": "cancelling",
+                "session_id": session.session_id,
+            }))
+        
+        elif message_type == "close_session":
+            # Encerrar a sessão agora, sem esperar ficar ociosa
+            await self.close_session(session.session_id)
+            await websocket.send(json.dumps({
+                "type": "status",
+                "status": "session_closed",
+                "session_id": session.session_id,
+            }))
+        
         else:
             await websocket.send(json.dumps({
                 "type": "error",
+                "session_id": session.session_id,
                 "error": f"Tipo de mensagem desconhecido: {message_type}"
             }))
     
-    def _process_chat(self, message: str, temperature: float = None, sandbox: str = None) -> Dict[str, Any]:
+    async def _stream_chat(self, websocket, session: InterpreterSession, data: Dict[str, Any], user_message: str, temperature: float, workdir: Optional[str]):
         """
-        Processa mensagem de chat (executado em thread separada)
+        Modo streaming do chat: deltas do assistant, início de blocos de código, linha ativa e output
+        são enviados conforme acontecem (frames com `seq`), e o último frame ("done") traz um
+        resumo compacto em vez do histórico inteiro.
+        """
+        stream = EventStream(websocket, session, data.get("request_id"))
+        await stream.send({
+            "type": "status",
+            "status": "processing",
+            "model": session.interpreter.model,
+        })
+        
+        try:
+            result = await self.run_in_session(
+                session,
+                self._process_chat,
+                session,
+                user_message,
+                temperature,
+                workdir,
+                stream.push
+            )
+        except BaseException:
+            # ServerBusy (ou a task foi cancelada): não deixar o pump esperando para sempre
+            stream.push(None)
+            raise
+        
+        await stream.close({
+            "type": "done",
+            "status": result.pop("status"),
+            "summary": self._summarize(result),
+        })
+    
+    def _summarize(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Resumo de uma execução de chat: a resposta final, o último código e output, sem o histórico
+        """
+        return {
+            "success": result.get("success", True),
+            "response": result.get("response", ""),
+            "code_executed": result.get("code_executed", ""),
+            "output": result.get("output", ""),
+            "message_count": len(result.get("messages", [])),
+            "error": result.get("error"),
+        }
+    
+    def _set_model(self, session: InterpreterSession, model: str):
+        """
+        Troca o Interpreter da sessão por um com outro modelo (executado em thread do escalonador)
+        """
+        session.interpreter.reset()
+        session.interpreter = self._create_interpreter(session.workdir, model)
+    
+    def _process_chat(self, session: InterpreterSession, message: str, temperature: float = None, sandbox: str = None, event_handler=None) -> Dict[str, Any]:
+        """
+        Processa mensagem de chat (executado em thread do escalonador)
         O Open Interpreter pensa localmente e executa código
         
         Args:
+            session: Sessão do cliente
             message: Mensagem/prompt do AutoGen
             temperature: Temperatura para o modelo (opcional)
             sandbox: Diretório de execução (opcional)
+            event_handler: Recebe os eventos da resposta enquanto ela acontece (opcional)
         """
-        import os
-        original_cwd = os.getcwd()
+        interpreter = session.interpreter
+        interpreter.event_handler = event_handler
         
         try:
-            # Mudar para sandbox se especificado
-            if sandbox and os.path.exists(sandbox):
-                os.chdir(sandbox)
+            # Mudar o diretório da sessão se especificado (os REPLs mudam antes da próxima execução)
+            if sandbox and os.path.isdir(sandbox):
+                session.workdir = os.path.abspath(sandbox)
+                interpreter.set_workdir(session.workdir)
                 logger.info(f"Executando em sandbox: {sandbox}")
             
             # Ajustar temperatura se fornecida
             if temperature is not None:
-                self.interpreter.temperature = temperature
+                interpreter.temperature = temperature
             
             # Executar chat - Open Interpreter pensa e executa localmente
             # Ele vai interpretar a mensagem, gerar código, executar e retornar resultado
-            self.interpreter.chat(message, return_messages=False)
+            interpreter.chat(message, return_messages=False)
             
             # Extrair resposta e código executado
             response = ""
             output = ""
             code_executed = ""
             
-            if self.interpreter.messages:
+            if interpreter.messages:
                 # Pegar última mensagem do assistant (resposta pensada)
-                for msg in reversed(self.interpreter.messages):
+                for msg in reversed(interpreter.messages):
                     if msg.get("role") == "assistant" and msg.get("content"):
                         response = msg.get("content", "")
                         break
                 
                 # Pegar código executado e output
-                for msg in reversed(self.interpreter.messages):
+                for msg in reversed(interpreter.messages):
                     if msg.get("role") == "function" and msg.get("name") == "run_code":
                         output = msg.get("content", "")
                         # Tentar extrair código executado
@@ -271,15 +675,17 @@ class OpenInterpreterServer:
             
             return {
                 "success": True,
+                "status": "cancelled" if interpreter.cancel_requested else "completed",
                 "response": response,  # Resposta pensada do Open Interpreter
                 "output": output,  # Output da execução
                 "code_executed": code_executed,  # Código que foi executado
-                "messages": self.interpreter.messages,
+                "messages": interpreter.messages,
             }
         except Exception as e:
             logger.error(f"Erro ao processar chat: {e}")
             return {
                 "success": False,
+                "status": "error",
                 "response": "",
                 "output": "",
                 "code_executed": "",
@@ -287,24 +693,25 @@ class OpenInterpreterServer:
                 "error": str(e),
             }
         finally:
-            # Voltar para diretório original
-            os.chdir(original_cwd)
+            interpreter.event_handler = None
     
-    def _execute_code(self, code: str, language: str) -> Dict[str, Any]:
+    def _execute_code(self, session: InterpreterSession, code: str, language: str) -> Dict[str, Any]:
         """
-        Executa código diretamente (executado em thread separada)
+        Executa código diretamente (executado em thread do escalonador)
         """
+        interpreter = session.interpreter
+        
         try:
             # Criar mensagem para executar código
             message = f"Execute o seguinte código {language}:\n\n```{language}\n{code}\n```"
             
             # Executar
-            self.interpreter.chat(message, return_messages=False)
+            interpreter.chat(message, return_messages=False)
             
             # Extrair output
             output = ""
-            if self.interpreter.messages:
-                for msg in reversed(self.interpreter.messages):
+            if interpreter.messages:
+                for msg in reversed(interpreter.messages):
                     if msg.get("role") == "function" and msg.get("name") == "run_code":
                         output = msg.get("content", "")
                         break
@@ -324,9 +731,20 @@ class OpenInterpreterServer:
         """
         Inicia o servidor WebSocket
         """
-        async with serve(self.handle_client, self.host, self.port):
-            logger.info(f"Servidor WebSocket rodando em ws://{self.host}:{self.port}")
-            await asyncio.Future()  # Rodar indefinidamente
+        reaper = asyncio.create_task(self._reaper())
+        try:
+            async with serve(self.handle_client, self.host, self.port):
+                logger.info(f"Servidor WebSocket rodando em ws://{self.host}:{self.port}")
+                await asyncio.Future()  # Rodar indefinidamente
+        finally:
+            reaper.cancel()
+            for session_id, session in list(self.sessions.items()):
+                try:
+                    await self.close_session(session_id)
+                except ServerBusy:
+                    # Ainda executando: só interromper, sem resetar por baixo da execução
+                    session.interpreter.cancel()
+            self.executor.shutdown(wait=False)
     
     def run(self):
         """
@@ -364,6 +782,9 @@ pensa e executa localmente usando o modelo especificado.
     parser.add_argument("--allow-remote", action="store_true", help="Permitir conexões remotas (não recomendado)")
     parser.add_argument("--workdir", help="Diretório de trabalho (sandbox)")
     parser.add_argument("--ws", action="store_true", help="Alias para --server (modo WebSocket)")
+    parser.add_argument("--max-sessions", type=int, default=4, help="Máximo de sessões executando ao mesmo tempo (default: 4)")
+    parser.add_argument("--max-queued", type=int, default=16, help="Máximo de execuções na fila (default: 16)")
+    parser.add_argument("--session-idle-timeout", type=float, default=1800, help="Segundos até encerrar sessão ociosa (default: 1800, 0 desativa)")
     
     args = parser.parse_args()
     
@@ -380,6 +801,9 @@ pensa e executa localmente usando o modelo especificado.
         debug_mode=args.debug,
         use_ollama=True,
         workdir=args.workdir,
+        max_concurrent_sessions=args.max_sessions,
+        max_queued=args.max_queued,
+        session_idle_timeout=args.session_idle_timeout,
     )
     
     logger.info("=" * 60)
@@ -398,4 +822,3 @@ pensa e executa localmente usando o modelo especificado.
 
 if __name__ == "__main__":
     main()
-
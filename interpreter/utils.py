@@ -77,3 +77,304 @@ def parse_partial_json(s):
     except json.JSONDecodeError:
         # If we still can't parse the string as JSON, return None to indicate failure.
         return None
+
+
+# Characters that end a run of plain text inside a JSON string
+_STRING_SPECIALS = re.compile(r'["\\]')
+
+_ESCAPES = {
+    '"': '"',
+    '\\': '\\',
+    '/': '/',
+    'b': '\b',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+}
+
+_SCALAR_TERMINATORS = ' \t\r\n,}]'
+
+
+class PartialJSONParser:
+    """
+    Incremental version of `parse_partial_json`.
+
+    Feed it the streamed `arguments` deltas one at a time. The scanner state
+    (open containers, open string, pending escape) is kept between calls,
+    so every call only looks at the new characters instead of re-scanning
+    and re-parsing the whole string.
+
+    `value` follows the same rules as `parse_partial_json`: open strings and
+    containers are treated as closed, and it's None if nothing could be parsed
+    yet or the input turned out to be malformed.
+    """
+
+    def __init__(self):
+        # The root value lives in a one-element list so it can be treated like any other container
+        self._root = []
+        # Each frame is [container, key, state]. States: "key", "colon", "value", "comma"
+        self._stack = [[self._root, None, "value"]]
+        self.failed = False
+
+        # Open string (if any)
+        self._string = None  # List of decoded chunks not yet added to `_string_text`
+        self._string_text = ""
+        self._string_is_key = False
+        self._escape = None  # None, "" right after a backslash, or "u..." inside a \u escape
+
+        # Number or literal being read
+        self._scalar = ""
+        self._scalar_key = None
+
+    @property
+    def value(self):
+        if self.failed or not self._root:
+            return None
+        return self._root[0]
+
+    def feed(self, delta):
+        """
+        Consumes the next chunk of the JSON string and returns the current `value`.
+        """
+        if self.failed or not delta:
+            return self.value
+
+        i = 0
+        n = len(delta)
+        while i < n and not self.failed:
+            if self._string is not None:
+                i = self._feed_string(delta, i)
+                continue
+
+            char = delta[i]
+            i += 1
+
+            if self._scalar and char in _SCALAR_TERMINATORS:
+                self._commit_scalar()
+
+            if char in ' \t\r\n':
+                continue
+
+            frame = self._stack[-1]
+            container, key, state = frame
+
+            if char == '"':
+                if state == "key":
+                    self._string_is_key = True
+                elif state == "value":
+                    self._string_is_key = False
+                    frame[1] = self._assign(frame, "")
+                    frame[2] = "comma"
+                else:
+                    self.failed = True
+                    break
+                self._string = []
+                self._string_text = ""
+                self._escape = None
+
+            elif char == '{' or char == '[':
+                if state != "value":
+                    self.failed = True
+                    break
+                new_container = {} if char == '{' else []
+                frame[1] = self._assign(frame, new_container)
+                frame[2] = "comma"
+                self._stack.append([new_container, None, "key" if char == '{' else "value"])
+
+            elif char == '}' or char == ']':
+                expected = dict if char == '}' else list
+                # Closing is allowed right after a value or on an empty container
+                empty = not container and state in ("key", "value")
+                if len(self._stack) == 1 or not isinstance(container, expected) or not (state == "comma" or empty):
+                    self.failed = True
+                    break
+                self._stack.pop()
+
+            elif char == ':':
+                if state != "colon":
+                    self.failed = True
+                    break
+                frame[2] = "value"
+
+            elif char == ',':
+                if state != "comma" or len(self._stack) == 1:
+                    self.failed = True
+                    break
+                frame[2] = "key" if isinstance(container, dict) else "value"
+
+            else:
+                # Part of a number or a true / false / null literal
+                if state != "value" and not self._scalar:
+                    self.failed = True
+                    break
+                if not self._scalar:
+                    self._scalar_key = None
+                    frame[2] = "comma"
+                self._scalar += char
+
+        if self.failed:
+            return None
+
+        # Expose whatever we have of the open string and the pending scalar
+        if self._string is not None and not self._string_is_key and self._string:
+            self._string_text += "".join(self._string)
+            self._string = []
+            frame = self._stack[-1]
+            frame[0][frame[1]] = self._string_text
+        if self._scalar:
+            self._store_scalar()
+
+        return self.value
+
+    def _feed_string(self, delta, i):
+        """
+        Consumes string contents from delta[i:] and returns the new index.
+        """
+        if self._escape is not None:
+            char = delta[i]
+            if self._escape == "":
+                if char == 'u':
+                    self._escape = "u"
+                elif char in _ESCAPES:
+                    self._string.append(_ESCAPES[char])
+                    self._escape = None
+                else:
+                    self.failed = True
+            else:
+                self._escape += char
+                if len(self._escape) == 5:
+                    try:
+                        self._append_code_point(int(self._escape[1:], 16))
+                    except ValueError:
+                        self.failed = True
+                    self._escape = None
+            return i + 1
+
+        match = _STRING_SPECIALS.search(delta, i)
+        if match is None:
+            self._string.append(delta[i:])
+            return len(delta)
+
+        j = match.start()
+        if j > i:
+            self._string.append(delta[i:j])
+
+        if delta[j] == '\\':
+            self._escape = ""
+        else:
+            self._close_string()
+        return j + 1
+
+    def _append_code_point(self, code_point):
+        # Join surrogate pairs the way json.loads does
+        if 0xDC00 <= code_point <= 0xDFFF:
+            previous = self._string[-1] if self._string else self._string_text[-1:]
+            if previous and 0xD800 <= ord(previous[-1]) <= 0xDBFF:
+                high = ord(previous[-1])
+                combined = chr(0x10000 + ((high - 0xD800) << 10) + (code_point - 0xDC00))
+                if self._string:
+                    self._string[-1] = previous[:-1] + combined
+                else:
+                    self._string_text = self._string_text[:-1]
+                    self._string.append(combined)
+                return
+        self._string.append(chr(code_point))
+
+    def _close_string(self):
+        text = self._string_text + "".join(self._string)
+        self._string = None
+        self._string_text = ""
+        frame = self._stack[-1]
+        if self._string_is_key:
+            frame[1] = text
+            frame[2] = "colon"
+        else:
+            frame[0][frame[1]] = text
+
+    def _assign(self, frame, value):
+        """
+        Stores value in the frame's container and returns the key it was stored under.
+        """
+        container = frame[0]
+        if isinstance(container, dict):
+            container[frame[1]] = value
+            return frame[1]
+        container.append(value)
+        return len(container) - 1
+
+    def _store_scalar(self):
+        try:
+            value = json.loads(self._scalar)
+        except json.JSONDecodeError:
+            # Not a complete number or literal (yet)
+            return False
+        frame = self._stack[-1]
+        if self._scalar_key is None:
+            self._scalar_key = self._assign(frame, value)
+            frame[1] = self._scalar_key
+        else:
+            frame[0][self._scalar_key] = value
+        return True
+
+    def _commit_scalar(self):
+        if not self._store_scalar():
+            self.failed = True
+        self._scalar = ""
+        self._scalar_key = None
+
+
+class CodeFenceTracker:
+    """
+    Counts markdown code fences ("```") in streamed content without re-scanning it.
+
+    Equivalent to `content.count("```")`, but it also remembers where each fence ends,
+    so the current code block can be sliced out instead of re-splitting the content.
+    """
+
+    def __init__(self):
+        self.fences = []  # Offsets right after each "```"
+        self.length = 0
+        self._run = 0  # Backticks at the end of the content that aren't part of a fence yet
+
+    def feed(self, delta):
+        if not delta:
+            return self.in_code_block
+
+        if "`" not in delta:
+            self._run = 0
+        else:
+            for i, char in enumerate(delta):
+                if char == "`":
+                    self._run += 1
+                    if self._run == 3:
+                        self.fences.append(self.length + i + 1)
+                        self._run = 0
+                else:
+                    self._run = 0
+
+        self.length += len(delta)
+        return self.in_code_block
+
+    @property
+    def in_code_block(self):
+        return len(self.fences) % 2 == 1
+
+    def current_block(self, content):
+        """
+        Same as `content.split("```")[-1]`.
+        """
+        if not self.fences:
+            return content
+        return content[self.fences[-1]:]
+
+    def block(self, content, index):
+        """
+        Same as `content.split("```")[1 + 2 * index]`, or None if that block hasn't started.
+        """
+        start = 2 * index
+        if start >= len(self.fences):
+            return None
+        if start + 1 < len(self.fences):
+            return content[self.fences[start]:self.fences[start + 1] - 3]
+        return content[self.fences[start]:]
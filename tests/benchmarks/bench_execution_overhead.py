@@ -0,0 +1,135 @@
+"""
+Per-execution overhead of running code on a Python REPL, before and after the framed protocol.
+
+- before: `python -i`, an ACTIVE_LINE print injected before every line through the AST,
+  a try/except wrapper, a trailing END_OF_EXECUTION print and the fixed 0.1s sleep.
+  (Reproduced here, as CodeInterpreter no longer does this for Python.)
+- after: CodeInterpreter on the framed REPL worker (see interpreter/repl_worker.py).
+
+Usage:
+  PYTHONPATH=. python tests/benchmarks/bench_execution_overhead.py [repetitions]
+"""
+import ast
+import subprocess
+import statistics
+import sys
+import threading
+import time
+
+from interpreter.code_interpreter import CodeInterpreter
+
+
+snippets = {
+    "1 line": "x = 1",
+    "500 lines": "\n".join(
+        f"x{i} = {i} * 2" if i % 50 else f"print('line {i}')" for i in range(500)
+    ),
+}
+
+
+class Block:
+    """
+    Stands in for CodeBlock, without the terminal rendering.
+    """
+    code = ""
+    output = ""
+    active_line = None
+
+    def refresh(self):
+        pass
+
+
+class AddLinePrints(ast.NodeTransformer):
+
+    def process_body(self, body):
+        new_body = []
+        if not isinstance(body, list):
+            body = [body]
+        for sub_node in body:
+            if hasattr(sub_node, 'lineno'):
+                new_body.append(ast.Expr(value=ast.Call(
+                    func=ast.Name(id='print', ctx=ast.Load()),
+                    args=[ast.Constant(value=f"ACTIVE_LINE:{sub_node.lineno}")],
+                    keywords=[])))
+            new_body.append(sub_node)
+        return new_body
+
+    def visit(self, node):
+        new_node = super().visit(node)
+        if hasattr(new_node, 'body'):
+            new_node.body = self.process_body(new_node.body)
+        if hasattr(new_node, 'orelse') and new_node.orelse:
+            new_node.orelse = self.process_body(new_node.orelse)
+        return new_node
+
+
+def legacy_prepare(code):
+    code = ast.unparse(AddLinePrints().visit(ast.parse(code)))
+    tree = ast.parse("import traceback\n" + code)
+    tree.body = [ast.Try(
+        body=tree.body,
+        handlers=[ast.ExceptHandler(type=ast.Name(id="Exception", ctx=ast.Load()), name=None, body=[
+            ast.Expr(value=ast.Call(
+                func=ast.Attribute(value=ast.Name(id="traceback", ctx=ast.Load()), attr="print_exc", ctx=ast.Load()),
+                args=[], keywords=[]))])],
+        orelse=[], finalbody=[])]
+    code = ast.unparse(tree)
+    code = "\n".join(line for line in code.split("\n") if line.strip())
+    return code + '\n\nprint("END_OF_EXECUTION")'
+
+
+class LegacyRepl:
+
+    def __init__(self):
+        self.proc = subprocess.Popen([sys.executable, "-i", "-q", "-u"],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                     text=True, bufsize=0)
+        self.done = threading.Event()
+        threading.Thread(target=self.read, args=(self.proc.stdout,), daemon=True).start()
+        threading.Thread(target=self.read, args=(self.proc.stderr,), daemon=True).start()
+
+    def read(self, stream):
+        for line in iter(stream.readline, ''):
+            if "END_OF_EXECUTION" in line:
+                self.done.set()
+
+    def run(self, code):
+        self.done.clear()
+        self.proc.stdin.write(legacy_prepare(code) + "\n")
+        self.proc.stdin.flush()
+        self.done.wait()
+        time.sleep(0.1)
+
+
+def measure(run, code, repetitions):
+    run(code)  # Warm up
+    timings = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        run(code)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def framed_runner():
+    code_interpreter = CodeInterpreter("python", False)
+    code_interpreter.active_block = Block()
+
+    def run(code):
+        code_interpreter.active_block.code = code
+        code_interpreter.run()
+
+    return run
+
+
+if __name__ == "__main__":
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    legacy = LegacyRepl()
+    framed = framed_runner()
+
+    for name, code in snippets.items():
+        before = measure(legacy.run, code, repetitions)
+        after = measure(framed, code, repetitions)
+        print(f"{name}:")
+        print(f"  before: {before * 1000:8.2f} ms")
+        print(f"  after:  {after * 1000:8.2f} ms")
@@ -0,0 +1,85 @@
+"""
+Latency of intent classification: rule hits, cache hits and LLM calls, one by one and in a batch.
+
+The LLM is a stub Ollama server (see tests/test_intent_classifier.py) answering after a fixed latency,
+so the numbers show our overhead around it, and how many calls we make.
+
+- before: every ambiguous message is an LLM call, after walking the fallback list up to the installed model.
+  (Reproduced by clearing the cache and the known-good model before each call.)
+- after: the installed model is probed once, and repeated messages come from the cache.
+
+Usage:
+  PYTHONPATH=. python tests/benchmarks/bench_intent_classifier.py [latency_seconds]
+"""
+import asyncio
+import logging
+import statistics
+import sys
+import time
+
+from interpreter import intent_classifier
+from interpreter.intent_classifier import classify_intent_hybrid, classify_intents_batch
+from tests.test_intent_classifier import start_stub, reset_classifier
+
+
+rule_messages = ["oi", "obrigado", "criar script de backup", "abrir vs code"]
+ambiguous_messages = [f"quanto é {i} vezes {i + 1}?" for i in range(20)]
+
+
+def measure(function, messages):
+    timings = []
+    for message in messages:
+        start = time.perf_counter()
+        function(message)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.05
+    # The fallback walk logs every model it skips
+    logging.disable(logging.WARNING)
+    # The installed model is 4th on the fallback list
+    server, handler = start_stub(installed=["qwen2.5-coder:7b"], latency=latency)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    intent_classifier.os.environ["OLLAMA_BASE_URL"] = base_url
+    intent_classifier.os.environ.pop("INTENT_CLASSIFIER_MODEL", None)
+    intent_classifier.os.environ.pop("DEFAULT_MODEL", None)
+
+    reset_classifier()
+    print(f"LLM stub latency: {latency * 1000:.0f} ms\n")
+    print(f"{'case':<40}{'median ms':>12}{'LLM requests':>14}")
+
+    def row(name, function, messages):
+        before = len(handler.chat_models)
+        median = measure(function, messages)
+        print(f"{name:<40}{median:>12.3f}{len(handler.chat_models) - before:>14}")
+
+    row("rule hit", classify_intent_hybrid, rule_messages * 5)
+
+    def uncached(message):
+        reset_classifier()
+        intent_classifier.find_classifier_model = lambda model=None, base_url=None: None
+        try:
+            classify_intent_hybrid(message)
+        finally:
+            intent_classifier.find_classifier_model = find_classifier_model
+
+    find_classifier_model = intent_classifier.find_classifier_model
+    row("before: LLM call, fallback walk", uncached, ambiguous_messages)
+
+    reset_classifier()
+    row("after: LLM call, known-good model", classify_intent_hybrid, ambiguous_messages)
+    row("after: cache hit", classify_intent_hybrid, ambiguous_messages)
+
+    reset_classifier()
+    before = len(handler.chat_models)
+    start = time.perf_counter()
+    asyncio.run(classify_intents_batch(ambiguous_messages))
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{'after: batch of 20 (total)':<40}{elapsed:>12.2f}{len(handler.chat_models) - before:>14}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
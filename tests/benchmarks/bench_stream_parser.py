@@ -0,0 +1,101 @@
+"""
+Microbenchmark for parsing streamed function-call arguments and markdown fences.
+
+Replays a recorded stream and compares the old per-delta approach
+(`parse_partial_json` and `.count("```")` over the whole message) with
+`PartialJSONParser` / `CodeFenceTracker`.
+
+Usage:
+  PYTHONPATH=. python tests/benchmarks/bench_stream_parser.py [recording.jsonl]
+
+A recording has one streamed chunk per line, as received from the API
+(`{"choices": [{"delta": {...}}]}`) or just the delta itself. Without a
+recording, a ~20k-token stream of a long generated script is synthesized.
+"""
+import json
+import random
+import sys
+import time
+
+from interpreter.utils import parse_partial_json, PartialJSONParser, CodeFenceTracker
+
+
+def load_recording(path):
+    deltas = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                chunk = json.loads(line)
+                deltas.append(chunk["choices"][0]["delta"] if "choices" in chunk else chunk)
+    return deltas
+
+
+def synthesize(tokens=20000, seed=0):
+    rng = random.Random(seed)
+    words = ["for", "i", "in", "range", "(", ")", ":", "print", "x", "=", "+", "1", "\n", "    ", "'", "value", "#"]
+    code = "".join(rng.choice(words) + " " for _ in range(tokens))
+    arguments = json.dumps({"language": "python", "code": code})
+
+    # OpenAI streams roughly one token (~4 chars) per delta
+    deltas = [{"function_call": {"name": "run_code", "arguments": ""}}]
+    i = 0
+    while i < len(arguments):
+        size = rng.randint(1, 7)
+        deltas.append({"function_call": {"arguments": arguments[i:i + size]}})
+        i += size
+
+    # The markdown flavour (Code-Llama / Ollama) of the same stream
+    content = "Here is the script:\n```python\n" + code + "\n```\nDone."
+    content_deltas = []
+    i = 0
+    while i < len(content):
+        size = rng.randint(1, 7)
+        content_deltas.append({"content": content[i:i + size]})
+        i += size
+
+    return deltas, content_deltas
+
+
+def bench_old(deltas):
+    arguments = ""
+    content = ""
+    start = time.perf_counter()
+    for delta in deltas:
+        if "function_call" in delta:
+            arguments += delta["function_call"].get("arguments", "")
+            parse_partial_json(arguments)
+        if "content" in delta:
+            content += delta["content"]
+            content.count("```") % 2 == 1
+    return time.perf_counter() - start
+
+
+def bench_new(deltas):
+    parser = PartialJSONParser()
+    tracker = CodeFenceTracker()
+    start = time.perf_counter()
+    for delta in deltas:
+        if "function_call" in delta:
+            parser.feed(delta["function_call"].get("arguments", ""))
+        if "content" in delta:
+            tracker.feed(delta["content"])
+            tracker.in_code_block
+    return time.perf_counter() - start
+
+
+def report(name, deltas):
+    old = bench_old(deltas)
+    new = bench_new(deltas)
+    print(f"{name}: {len(deltas)} deltas")
+    print(f"  old: {old * 1000:10.1f} ms  ({old / len(deltas) * 1e6:8.1f} us/delta)")
+    print(f"  new: {new * 1000:10.1f} ms  ({new / len(deltas) * 1e6:8.1f} us/delta)")
+    print(f"  speedup: {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        report(sys.argv[1], load_recording(sys.argv[1]))
+    else:
+        function_call_deltas, content_deltas = synthesize()
+        report("function_call arguments (20k tokens)", function_call_deltas)
+        report("markdown content (20k tokens)", content_deltas)
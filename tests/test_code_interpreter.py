@@ -0,0 +1,155 @@
+import signal
+import threading
+
+import pytest
+
+from interpreter.code_interpreter import CodeInterpreter
+
+
+class Block:
+    """
+    Stands in for CodeBlock, recording the active lines it was refreshed with.
+    """
+    code = ""
+    output = ""
+    active_line = None
+
+    def __init__(self):
+        self.active_lines = []
+
+    def refresh(self):
+        self.active_lines.append(self.active_line)
+
+
+def run(code_interpreter, code):
+    code_interpreter.active_block.code = code
+    return code_interpreter.run()
+
+
+def make_code_interpreter():
+    code_interpreter = CodeInterpreter("python", False)
+    code_interpreter.active_block = Block()
+    return code_interpreter
+
+
+def test_python_output_and_state():
+    code_interpreter = make_code_interpreter()
+    try:
+        assert run(code_interpreter, "x = 41\nprint('hi')") == "hi"
+        assert run(code_interpreter, "print(x + 1)") == "42"
+        assert run(code_interpreter, "print('é😀')") == "é😀"
+    finally:
+        code_interpreter.release()
+
+
+def test_python_output_is_complete_at_end():
+    code_interpreter = make_code_interpreter()
+    try:
+        # Written straight to the file descriptors, by us and by a child process
+        output = run(code_interpreter, "import os, sys\nos.write(2, b'err\\n')\nos.system('echo child')\nprint('last', end='')")
+        assert output == "err\nchild\nlast"
+    finally:
+        code_interpreter.release()
+
+
+def test_python_errors():
+    code_interpreter = make_code_interpreter()
+    try:
+        output = run(code_interpreter, "x = 1\n1/0")
+        assert output.startswith("Traceback")
+        assert output.endswith("ZeroDivisionError: division by zero")
+        assert "repl_worker" not in output
+
+        assert "SyntaxError" in run(code_interpreter, "def f(:\n  pass")
+
+        # exit() doesn't take the REPL down
+        assert "SystemExit" in run(code_interpreter, "exit()")
+        assert run(code_interpreter, "print(x)") == "1"
+    finally:
+        code_interpreter.release()
+
+
+def test_python_active_lines():
+    code_interpreter = make_code_interpreter()
+    try:
+        run(code_interpreter, "import time\ntime.sleep(0.05)\ntime.sleep(0.05)\nprint('done')")
+        active_lines = [line for line in code_interpreter.active_block.active_lines if line is not None]
+        assert active_lines == sorted(active_lines)
+        assert {3, 4} <= set(active_lines)
+        assert code_interpreter.active_line is None
+    finally:
+        code_interpreter.release()
+
+
+def test_python_interrupt():
+    code_interpreter = make_code_interpreter()
+    try:
+        run(code_interpreter, "pass")
+        threading.Timer(0.3, lambda: code_interpreter.proc.send_signal(signal.SIGINT)).start()
+        assert run(code_interpreter, "import time\ntime.sleep(10)").endswith("KeyboardInterrupt")
+        assert run(code_interpreter, "print('still here')") == "still here"
+    finally:
+        code_interpreter.release()
+
+
+def test_python_interrupt_after_execution():
+    code_interpreter = make_code_interpreter()
+    try:
+        # CTRL-C while the worker flushes stdout, once the code is done
+        code = (
+            "import os, signal, sys\n"
+            "class Stdout:\n"
+            "  def __init__(self, stream): self.stream = stream\n"
+            "  def write(self, data): return self.stream.write(data)\n"
+            "  def flush(self):\n"
+            "    self.stream.flush()\n"
+            "    os.kill(os.getpid(), signal.SIGINT)\n"
+            "sys.stdout = Stdout(sys.stdout)\n"
+            "print('hi')"
+        )
+        outputs = []
+        thread = threading.Thread(target=lambda: outputs.append(run(code_interpreter, code)))
+        thread.start()
+        thread.join(10)
+        assert not thread.is_alive(), "The worker never sent END"
+        assert outputs == ["hi"]
+
+        assert run(code_interpreter, "sys.stdout = sys.stdout.stream") == ""
+        assert run(code_interpreter, "print('still here')") == "still here"
+    finally:
+        code_interpreter.release()
+
+
+def test_interrupt_stops_a_shell_run():
+    code_interpreter = CodeInterpreter("shell", False)
+    code_interpreter.active_block = Block()
+    try:
+        threading.Timer(0.5, code_interpreter.interrupt).start()
+        assert run(code_interpreter, "sleep 10").endswith("KeyboardInterrupt")
+        # It got a fresh REPL
+        assert run(code_interpreter, "echo still here") == "still here"
+    finally:
+        code_interpreter.release()
+
+
+@pytest.mark.parametrize("language", ["python", "shell"])
+def test_broken_pipe_is_retried_once(monkeypatch, language):
+    code_interpreter = CodeInterpreter(language, False)
+    code_interpreter.active_block = Block()
+    start_process = CodeInterpreter.start_process
+    starts = []
+
+    def start_dead_process(self):
+        # Every REPL we get dies before we write to it
+        start_process(self)
+        self.proc.kill()
+        self.proc.wait()
+        starts.append(self.proc)
+
+    monkeypatch.setattr(CodeInterpreter, "start_process", start_dead_process)
+    try:
+        output = run(code_interpreter, "print('hi')" if language == "python" else "echo hi")
+        assert "BrokenPipeError" in output
+        assert len(starts) == 2
+    finally:
+        code_interpreter.release()
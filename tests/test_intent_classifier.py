@@ -0,0 +1,195 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from interpreter import intent_classifier
+from interpreter.intent_classifier import (
+    ClassificationCache,
+    IntentBatcher,
+    classification_cache,
+    classify_intent_hybrid,
+    classify_intent_llm,
+    classify_intents_batch,
+)
+
+
+def classify(text):
+    if "faça" in text or "liste" in text:
+        return {"intent": "execution", "reasoning": "stub", "action_type": "code", "confidence": 0.9}
+    return {"intent": "conversation", "reasoning": "stub", "action_type": None, "confidence": 0.9}
+
+
+class StubClassifierHandler(BaseHTTPRequestHandler):
+    """
+    Ollama stand-in: /api/tags lists `installed`, /api/chat classifies after `latency` seconds.
+    """
+    protocol_version = "HTTP/1.1"
+    installed = ["phi3:mini"]
+    latency = 0.0
+    chat_models = []
+    tag_requests = 0
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        # Headers and body are separate writes, don't let Nagle hold the body back
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _reply(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        type(self).tag_requests += 1
+        self._reply(200, {"models": [{"name": name} for name in self.installed]})
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.chat_models.append(payload["model"])
+        if payload["model"] not in self.installed:
+            self._reply(404, {"error": "model not found"})
+            return
+
+        time.sleep(self.latency)
+        prompt = payload["messages"][-1]["content"]
+        if "Mensagens (lista JSON" in prompt:
+            messages = json.loads(prompt.split("na ordem):\n", 1)[1].split("\n", 1)[0])
+            content = {"results": [dict(classify(message), index=i) for i, message in enumerate(messages)]}
+        else:
+            content = classify(prompt.split('Mensagem: "', 1)[1].split('"\n', 1)[0])
+        self._reply(200, {"message": {"role": "assistant", "content": json.dumps(content)}, "done": True})
+
+
+def start_stub(installed=("phi3:mini",), latency=0.0):
+    handler = type("Handler", (StubClassifierHandler,), {"installed": list(installed), "latency": latency, "chat_models": [], "tag_requests": 0})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler
+
+
+def reset_classifier():
+    classification_cache.clear()
+    intent_classifier._known_good_models.clear()
+    for key in intent_classifier.stats:
+        intent_classifier.stats[key] = 0
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    reset_classifier()
+    monkeypatch.delenv("INTENT_CLASSIFIER_MODEL", raising=False)
+    monkeypatch.delenv("DEFAULT_MODEL", raising=False)
+    server, handler = start_stub()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    monkeypatch.setenv("OLLAMA_BASE_URL", base_url)
+    yield base_url, handler
+    server.shutdown()
+    reset_classifier()
+
+
+def test_cache_is_lru_with_ttl():
+    cache = ClassificationCache(max_size=2, ttl=0.2)
+    cache.set("A  b", {"intent": "conversation"})
+    cache.set("c", {"intent": "execution"})
+    # Keyed on normalized text
+    assert cache.get("a b") == {"intent": "conversation"}
+    cache.set("d", {"intent": "execution"})
+    # "c" was the least recently used
+    assert cache.get("c") is None
+    assert cache.get("a b") is not None
+    time.sleep(0.25)
+    assert cache.get("a b") is None
+
+
+def test_known_good_model_is_probed_once(stub):
+    base_url, handler = stub
+    assert classify_intent_llm("qual a capital da frança")["intent"] == "conversation"
+    assert classify_intent_llm("faça um gráfico das vendas")["intent"] == "execution"
+
+    # One /api/tags, then straight to the installed model, never walking the fallback list
+    assert handler.tag_requests == 1
+    assert handler.chat_models == ["phi3:mini", "phi3:mini"]
+
+
+def test_missing_model_is_remembered(stub, monkeypatch):
+    base_url, handler = stub
+    handler.installed.clear()
+    assert classify_intent_llm("qual a capital da frança")["confidence"] == 0.5
+    assert classify_intent_llm("faça um gráfico das vendas")["confidence"] == 0.5
+
+    # One /api/tags, and no walk through the fallback list
+    assert handler.tag_requests == 1
+    assert handler.chat_models == []
+
+    # Probed again once the miss expired
+    monkeypatch.setattr(intent_classifier, "MODEL_MISS_TTL", 0)
+    handler.installed.append("phi3:mini")
+    assert classify_intent_llm("faça um gráfico das vendas")["intent"] == "execution"
+    assert handler.tag_requests == 2
+
+
+def test_results_are_cached(stub):
+    base_url, handler = stub
+    first = classify_intent_hybrid("Qual a capital da França?")
+    assert classify_intent_hybrid("  qual a capital   da frança? ") == first
+    assert len(handler.chat_models) == 1
+    # Rules never reach the LLM
+    assert classify_intent_hybrid("oi")["confidence"] == 0.95
+    assert len(handler.chat_models) == 1
+
+
+def test_cache_is_per_model_and_base_url(stub, monkeypatch):
+    base_url, handler = stub
+    handler.installed.append("custom:1b")
+    classify_intent_llm("qual a capital da frança")
+    classify_intent_llm("qual a capital da frança", model="custom:1b")
+    monkeypatch.setenv("INTENT_CLASSIFIER_MODEL", "custom:1b")
+    classify_intent_llm("qual a capital da frança")
+    assert handler.chat_models == ["phi3:mini", "custom:1b"]
+
+    assert classification_cache.get("qual a capital da frança", base_url="http://127.0.0.1:1") is None
+    assert classification_cache.get("qual a capital da frança", base_url=base_url) is not None
+
+
+def test_errors_are_not_cached(stub, monkeypatch):
+    monkeypatch.setenv("OLLAMA_BASE_URL", "http://127.0.0.1:1")
+    assert classify_intent_llm("qual a capital da frança")["confidence"] == 0.5
+    assert classification_cache.stats()["size"] == 0
+
+
+def test_batch_classifies_ambiguous_messages_in_one_call(stub):
+    base_url, handler = stub
+    messages = ["oi", "liste os arquivos grandes", "qual a capital da frança", "Qual a capital da França", "faça um resumo"]
+    results = asyncio.run(classify_intents_batch(messages))
+
+    assert [result["intent"] for result in results] == ["conversation", "execution", "conversation", "conversation", "execution"]
+    assert results[0]["reasoning"] == "Padrão de conversa detectado (regras)"
+    assert len(handler.chat_models) == 1
+    assert intent_classifier.stats["batch_calls"] == 1
+
+    # Now all cached
+    asyncio.run(classify_intents_batch(messages))
+    assert len(handler.chat_models) == 1
+
+
+def test_batcher_groups_concurrent_messages(stub):
+    base_url, handler = stub
+
+    async def main():
+        batcher = IntentBatcher(max_delay=0.05)
+        return await asyncio.gather(*[batcher.classify(f"liste os arquivos da pasta {i}") for i in range(5)])
+
+    results = asyncio.run(main())
+    assert all(result["intent"] == "execution" for result in results)
+    assert len(handler.chat_models) == 1
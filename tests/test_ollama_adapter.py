@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from interpreter.ollama_adapter import OllamaAdapter
+from interpreter.interpreter import function_schema
+
+
+# Recorded Ollama /api/chat stream: (seconds since the previous chunk, content)
+recorded_text = [
+    (0.0, "Vou "),
+    (0.05, "listar os arquivos:\n"),
+    (0.05, "``"),
+    (0.05, "`python\nimport os\n"),
+    (0.05, "print(os.listdir('.'))\n`"),
+    (0.05, "``\nIsso vai"),
+    (0.05, " mostrar os arquivos."),
+]
+
+recorded_conversation = [
+    (0.0, "Olá"),
+    (0.3, "! Tudo"),
+    (0.3, " bem?"),
+]
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    recording = recorded_text
+    connections = set()
+    requests_served = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.connections.add(self.client_address)
+        body = json.dumps({"models": [{"name": "stub"}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.connections.add(self.client_address)
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests_served.append(payload)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        try:
+            for delay, text in self.recording:
+                time.sleep(delay)
+                self._write_chunk({"message": {"role": "assistant", "content": text}, "done": False})
+            self._write_chunk({"message": {"role": "assistant", "content": ""}, "done": True, "eval_count": 10})
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading (e.g. after a code block was closed)
+            self.close_connection = True
+
+    def _write_chunk(self, data):
+        line = json.dumps(data).encode() + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+
+def start_stub(recording):
+    handler = type("Handler", (StubOllamaHandler,), {"recording": recording, "connections": set(), "requests_served": []})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler
+
+
+def test_stream_yields_deltas_as_they_arrive():
+    server, handler = start_stub(recorded_conversation)
+    try:
+        adapter = OllamaAdapter(model="stub", base_url=f"http://127.0.0.1:{server.server_port}")
+
+        start = time.monotonic()
+        chunks = adapter.chat_completion([{"role": "user", "content": "oi"}], stream=True)
+        first = next(chunks)
+        time_to_first_token = time.monotonic() - start
+        rest = list(chunks)
+        total = time.monotonic() - start
+
+        assert handler.requests_served[0]["stream"] is True
+        assert first["choices"][0]["delta"] == {"role": "assistant", "content": "Olá"}
+        assert time_to_first_token < 0.3
+        assert total >= 0.6
+
+        content = first["choices"][0]["delta"]["content"] + "".join(
+            chunk["choices"][0]["delta"].get("content", "") for chunk in rest)
+        assert content == "Olá! Tudo bem?"
+        assert all("role" not in chunk["choices"][0]["delta"] for chunk in rest)
+        assert rest[-1]["choices"][0]["finish_reason"] == "stop"
+    finally:
+        server.shutdown()
+
+
+def test_stream_stops_at_closed_code_block():
+    server, handler = start_stub(recorded_text)
+    try:
+        adapter = OllamaAdapter(model="stub", base_url=f"http://127.0.0.1:{server.server_port}")
+        chunks = list(adapter.chat_completion([{"role": "user", "content": "ls"}], functions=[function_schema], stream=True))
+
+        last = chunks[-1]["choices"][0]
+        assert last["finish_reason"] == "function_call"
+        assert json.loads(last["delta"]["function_call"]["arguments"]) == {
+            "language": "python",
+            "code": "import os\nprint(os.listdir('.'))",
+        }
+        # Nothing after the closing fence's chunk was read
+        content = "".join(chunk["choices"][0]["delta"].get("content", "") for chunk in chunks)
+        assert "mostrar" not in content
+        assert all(chunk["choices"][0]["finish_reason"] is None for chunk in chunks[:-1])
+    finally:
+        server.shutdown()
+
+
+def test_session_is_kept_alive():
+    server, handler = start_stub(recorded_conversation[:1])
+    try:
+        adapter = OllamaAdapter(model="stub", base_url=f"http://127.0.0.1:{server.server_port}")
+        assert adapter.verify_connection()
+        for _ in range(3):
+            list(adapter.chat_completion([{"role": "user", "content": "oi"}], stream=True))
+        assert adapter.list_models() == ["stub"]
+        assert len(handler.connections) == 1
+    finally:
+        server.shutdown()
@@ -0,0 +1,55 @@
+import os
+
+from interpreter import output_buffer as output_buffer_module
+from interpreter.output_buffer import OutputBuffer
+
+
+def test_small_output_is_kept_whole():
+    output_buffer = OutputBuffer(head_chars=20, tail_chars=20)
+    output_buffer.write("\n  a\n\n b \n")
+    output_buffer.append("c")
+    output_buffer.append("")
+    assert output_buffer.text() == "a\n\nb\nc"
+    assert not output_buffer.truncated
+    assert output_buffer.spill_path is None
+
+
+def test_head_and_tail_are_kept():
+    output_buffer = OutputBuffer(head_chars=10, tail_chars=10)
+    for i in range(1000):
+        output_buffer.append(f"line {i}")
+    try:
+        text = output_buffer.text()
+        assert text.startswith("line 0\n\nOutput truncated.")
+        assert text.endswith("line 999")
+        assert output_buffer.head_size <= 10
+        assert output_buffer.tail_size <= 10
+
+        # Everything can still be paged through
+        assert output_buffer.page(0, 2) == ["line 0", "line 1"]
+        assert output_buffer.page(500, 1) == ["line 500"]
+        assert output_buffer.page(999, 5) == ["line 999"]
+        assert output_buffer.spill_path in text
+    finally:
+        path = output_buffer.spill_path
+        output_buffer.close()
+    assert not os.path.exists(path)
+
+
+def test_spill_files_are_removed_at_exit():
+    output_buffer = OutputBuffer(head_chars=10, tail_chars=10)
+    for i in range(100):
+        output_buffer.append(f"line {i}")
+    path = output_buffer.spill_path
+    assert path in output_buffer_module.spill_paths
+
+    output_buffer_module.remove_spill_files()
+    assert not os.path.exists(path)
+    output_buffer.close()
+
+
+def test_long_line_keeps_its_end():
+    output_buffer = OutputBuffer(head_chars=0, tail_chars=10, spill=False)
+    output_buffer.append("x" * 100 + "end")
+    assert output_buffer.text().endswith("\n\n" + "x" * 6 + "end")
+    assert output_buffer.omitted == 94
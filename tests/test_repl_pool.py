@@ -0,0 +1,93 @@
+import sys
+import time
+
+from interpreter.repl_pool import ReplPool
+
+
+start_cmd = sys.executable + " -i -q -u"
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_pool_keeps_spares_warm():
+    pool = ReplPool("python", start_cmd, warm_size=2)
+    try:
+        assert wait_for(lambda: pool.metrics()["spares"] == 2)
+
+        worker = pool.acquire("a")
+        assert worker.is_alive()
+        assert pool.metrics()["warm_acquires"] == 1
+
+        # The spare we used is replaced
+        assert wait_for(lambda: pool.metrics()["spares"] == 2)
+        assert pool.metrics()["spawn_count"] == 3
+    finally:
+        pool.close()
+
+
+def test_leases_are_per_session():
+    pool = ReplPool("python", start_cmd, warm_size=1)
+    try:
+        a = pool.acquire("a")
+        assert pool.acquire("a") is a
+        b = pool.acquire("b")
+        assert b is not a
+
+        # Released workers hold session state, so they're never reused
+        pool.release("a")
+        assert not wait_for(lambda: a.is_alive(), timeout=0.2)
+        assert pool.acquire("c") is not a
+    finally:
+        pool.close()
+
+
+def test_recycle_after_max_runs_and_death():
+    pool = ReplPool("python", start_cmd, warm_size=1, max_runs=2)
+    try:
+        worker = pool.acquire("a")
+        worker.runs = 2
+        recycled = pool.acquire("a")
+        assert recycled is not worker
+
+        recycled.proc.kill()
+        recycled.proc.wait()
+        assert pool.acquire("a") is not recycled
+        assert pool.metrics()["recycle_count"] == 2
+    finally:
+        pool.close()
+
+
+def test_idle_leases_are_evicted():
+    pool = ReplPool("python", start_cmd, warm_size=0, idle_timeout=0.1, maintenance_interval=0.05)
+    try:
+        worker = pool.acquire("a")
+        assert wait_for(lambda: pool.metrics()["idle_evictions"] == 1)
+        assert pool.metrics()["leases"] == 0
+        assert pool.metrics()["warm_acquires"] == 0
+        assert pool.acquire("a") is not worker
+    finally:
+        pool.close()
+
+
+def test_busy_leases_are_not_evicted():
+    pool = ReplPool("python", start_cmd, warm_size=0, idle_timeout=0.1, maintenance_interval=0.05)
+    try:
+        worker = pool.acquire("a")
+        pool.begin_run(worker)
+        # Running code for longer than idle_timeout
+        assert not wait_for(lambda: pool.metrics()["idle_evictions"], timeout=0.3)
+        assert pool.acquire("a") is worker
+
+        # Idle is measured from the end of the run
+        pool.end_run(worker)
+        assert not wait_for(lambda: pool.metrics()["idle_evictions"], timeout=0.05)
+        assert wait_for(lambda: pool.metrics()["idle_evictions"] == 1)
+    finally:
+        pool.close()
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+from interpreter.server import OpenInterpreterServer
+from test_code_interpreter import Block, run
+from interpreter.code_interpreter import CodeInterpreter
+
+
+class SlowInterpreter:
+    """
+    Stands in for Interpreter (which needs a model) and records where and when each chat ran.
+    """
+
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self.temperature = 0.001
+        self.model = "test"
+        self.use_ollama = False
+        self.local = True
+        self.messages = []
+        self.calls = []
+        self.event_handler = None
+        self.cancel_requested = False
+
+    def emit(self, event):
+        if self.event_handler:
+            self.event_handler(event)
+
+    def chat(self, message, return_messages=False):
+        self.cancel_requested = False
+        self.calls.append((message, time.monotonic(), threading.current_thread().name))
+        self.messages.append({"role": "user", "content": message})
+        content = f"{message} in {self.workdir}"
+        for word in content.split(" "):
+            self.emit({"type": "delta", "content": word + " "})
+        self.emit({"type": "code_start"})
+        for line in range(1, 4):
+            self.emit({"type": "active_line", "line": line})
+            self.emit({"type": "output", "content": f"line {line}"})
+            for _ in range(10):
+                if self.cancel_requested:
+                    return
+                time.sleep(0.01)
+        self.messages.append({"role": "assistant", "content": content})
+
+    def cancel(self):
+        self.cancel_requested = True
+
+    def set_workdir(self, workdir):
+        self.workdir = workdir
+
+    def reset(self):
+        self.messages = []
+
+
+class SlowServer(OpenInterpreterServer):
+
+    def _create_interpreter(self, workdir, model=None):
+        return SlowInterpreter(workdir)
+
+
+class FakeWebSocket:
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+def test_sessions_get_their_own_workdir_and_run_in_parallel(tmp_path):
+    async def main():
+        server = SlowServer(workdir=str(tmp_path), max_concurrent_sessions=2)
+        websocket = FakeWebSocket()
+        start = time.monotonic()
+        await asyncio.gather(
+            server.process_message(websocket, {"type": "chat", "message": "a"}, session_id="a"),
+            server.process_message(websocket, {"type": "chat", "message": "b"}, session_id="../b"),
+        )
+        return server, websocket, time.monotonic() - start
+
+    server, websocket, elapsed = asyncio.run(main())
+
+    assert elapsed < 0.55
+    responses = {frame["session_id"]: frame["response"] for frame in websocket.sent if frame["type"] == "response"}
+    assert responses["a"] == f"a in {tmp_path / 'a'}"
+    # Session ids can't escape the server's workdir
+    assert responses["../b"] == f"b in {tmp_path / '_b'}"
+    assert server.sessions["a"].interpreter is not server.sessions["../b"].interpreter
+
+
+def test_messages_of_one_session_run_in_order():
+    async def main():
+        server = SlowServer(max_concurrent_sessions=2)
+        websocket = FakeWebSocket()
+        await asyncio.gather(*[
+            server.process_message(websocket, {"type": "chat", "message": str(i)}, session_id="a")
+            for i in range(3)
+        ])
+        return server
+
+    server = asyncio.run(main())
+    calls = server.sessions["a"].interpreter.calls
+    assert [message for message, _, _ in calls] == ["0", "1", "2"]
+    # Never two at once
+    assert all(b[1] - a[1] >= 0.29 for a, b in zip(calls, calls[1:]))
+
+
+def test_full_queue_answers_busy():
+    async def main():
+        server = SlowServer(max_concurrent_sessions=1, max_queued=1)
+        websocket = FakeWebSocket()
+        await asyncio.gather(*[
+            server._handle_message(websocket, {"type": "chat", "message": str(i)}, str(i), False)
+            for i in range(3)
+        ])
+        return websocket
+
+    websocket = asyncio.run(main())
+    assert sum(frame["type"] == "response" for frame in websocket.sent) == 2
+    busy = [frame for frame in websocket.sent if frame["type"] == "busy"]
+    assert len(busy) == 1
+
+
+def test_idle_sessions_are_reaped():
+    async def main():
+        server = SlowServer(session_idle_timeout=0.1)
+        websocket = FakeWebSocket()
+        await server.process_message(websocket, {"type": "get_model"}, session_id="named")
+        await server.process_message(websocket, {"type": "get_model"}, session_id="conn", implicit=True)
+
+        # The connection that owned the implicit session went away
+        server._disconnect_session("conn")
+        await server._reap_idle_sessions()
+        assert set(server.sessions) == {"named"}
+
+        await asyncio.sleep(0.15)
+        await server._reap_idle_sessions()
+        return server
+
+    assert asyncio.run(main()).sessions == {}
+
+
+def test_busy_sessions_are_not_closed():
+    async def main():
+        server = SlowServer(session_idle_timeout=0.01)
+        websocket = FakeWebSocket()
+        chat = asyncio.create_task(server.process_message(websocket, {"type": "chat", "message": "hi"}, session_id="a"))
+        await asyncio.sleep(0.1)
+        session = server.sessions["a"]
+
+        await server._handle_message(websocket, {"type": "close_session"}, "a", False)
+        await server._reap_idle_sessions()
+        assert server.sessions == {"a": session}
+        assert session.interpreter.messages
+
+        await chat
+        await server.process_message(websocket, {"type": "close_session"}, session_id="a")
+        return server, session, websocket.sent
+
+    server, session, frames = asyncio.run(main())
+    assert [frame["type"] for frame in frames] == ["status", "busy", "response", "done", "status"]
+    assert frames[-1]["status"] == "session_closed"
+    assert server.sessions == {}
+    assert session.closed and session.interpreter.messages == []
+
+
+def test_code_interpreters_run_in_their_workdir(tmp_path):
+    a = CodeInterpreter("python", False, workdir=str(tmp_path))
+    b = CodeInterpreter("shell", False, workdir=str(tmp_path))
+    try:
+        for code_interpreter, code in ((a, "import os\nprint(os.getcwd())"), (b, "pwd")):
+            code_interpreter.active_block = Block()
+            assert run(code_interpreter, code).endswith(str(tmp_path))
+        # The process itself never moved
+        assert os.getcwd() != str(tmp_path)
+    finally:
+        a.release()
+        b.release()
+
+
+def test_shell_workdir_is_quoted(tmp_path):
+    workdir = tmp_path / "$HOME `x` é"
+    workdir.mkdir()
+    code_interpreter = CodeInterpreter("shell", False, workdir=str(workdir))
+    try:
+        code_interpreter.active_block = Block()
+        assert run(code_interpreter, "pwd") == str(workdir)
+    finally:
+        code_interpreter.release()
+
+
+def test_streaming_chat_sends_numbered_events_and_a_summary():
+    async def main():
+        server = SlowServer()
+        websocket = FakeWebSocket()
+        await server.process_message(websocket, {"type": "chat", "message": "hi", "stream": True, "request_id": "r1"}, session_id="a")
+        return websocket.sent
+
+    frames = asyncio.run(main())
+    assert [frame["seq"] for frame in frames] == list(range(1, len(frames) + 1))
+    assert all(frame["request_id"] == "r1" and frame["session_id"] == "a" for frame in frames)
+
+    # Deltas may be merged, but nothing is lost or reordered
+    assert "".join(frame["content"] for frame in frames if frame["type"] == "delta") == "hi in None "
+    assert [frame["line"] for frame in frames if frame["type"] == "active_line"] == [1, 2, 3]
+    assert "\n".join(frame["content"] for frame in frames if frame["type"] == "output") == "line 1\nline 2\nline 3"
+    types = [frame["type"] for frame in frames]
+    assert types.index("code_start") > types.index("delta")
+
+    done = frames[-1]
+    assert done["type"] == "done" and done["status"] == "completed"
+    assert done["summary"]["response"] == "hi in None"
+    assert done["summary"]["message_count"] == 2
+    assert "messages" not in done["summary"]
+
+
+def test_streaming_chat_can_be_cancelled():
+    async def main():
+        server = SlowServer()
+        websocket = FakeWebSocket()
+        chat = asyncio.create_task(server.process_message(websocket, {"type": "chat", "message": "hi", "stream": True}, session_id="a"))
+        await asyncio.sleep(0.1)
+        # Cancelling doesn't wait for the chat's turn in the session
+        await server.process_message(websocket, {"type": "cancel"}, session_id="a")
+        await chat
+        return websocket.sent
+
+    frames = asyncio.run(main())
+    assert {"type": "status", "status": "cancelling", "session_id": "a"} in frames
+    done = frames[-1]
+    assert done["type"] == "done" and done["status"] == "cancelled"
+    assert [frame["line"] for frame in frames if frame["type"] == "active_line"] != [1, 2, 3]
@@ -0,0 +1,62 @@
+import json
+import random
+
+from interpreter.utils import parse_partial_json, PartialJSONParser, CodeFenceTracker
+
+
+samples = [
+    json.dumps({"language": "python", "code": "print('hi')\nfor i in range(3):\n    print(\"a\\tb\", i)\n# é 😀"}),
+    json.dumps({"language": "shell", "code": "echo 😀"}, ensure_ascii=True),
+    json.dumps({"n": [1, 2.5e3, -3, True, None, {"x": False}], "e": {}, "l": []}),
+    '{"language": "python", "code": "line1\nline2"}',
+]
+
+
+def replay(s, cuts):
+    parser = PartialJSONParser()
+    previous = 0
+    for cut in cuts + [len(s)]:
+        value = parser.feed(s[previous:cut])
+        previous = cut
+        yield s[:cut], value
+
+
+def test_partial_json_parser_matches_parse_partial_json():
+    rng = random.Random(0)
+    for s in samples:
+        for _ in range(100):
+            cuts = sorted(rng.sample(range(1, len(s)), rng.randint(1, 20)))
+            for prefix, value in replay(s, cuts):
+                expected = parse_partial_json(prefix)
+                if expected:
+                    assert value == expected
+            assert value == parse_partial_json(s)
+
+
+def test_partial_json_parser_single_characters():
+    s = samples[0]
+    for prefix, value in replay(s, list(range(1, len(s)))):
+        expected = parse_partial_json(prefix)
+        if expected:
+            assert value == expected
+
+
+def test_partial_json_parser_malformed():
+    parser = PartialJSONParser()
+    parser.feed('{"a": 1}')
+    assert parser.feed("}") is None
+    assert parser.feed('{"b": 2}') is None
+
+
+def test_code_fence_tracker():
+    content = "hello ```python\nprint(1)\n``` more ````js\nx``"
+    tracker = CodeFenceTracker()
+    streamed = ""
+    for i in range(0, len(content), 2):
+        delta = content[i:i + 2]
+        streamed += delta
+        tracker.feed(delta)
+        blocks = streamed.split("```")
+        assert tracker.in_code_block == (streamed.count("```") % 2 == 1)
+        assert tracker.current_block(streamed) == blocks[-1]
+        assert tracker.block(streamed, 0) == (blocks[1] if len(blocks) > 1 else None)